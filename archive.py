@@ -0,0 +1,147 @@
+"""
+ZIP archives of generations, built in memory.
+
+Archives are deterministic (fixed timestamps, sorted entries), so the
+archive of a given {name: sha256} index is always the same bytes and
+archive_etag() of that index is a valid strong ETag. Small archives are
+kept in a byte-bounded LRU; big ones are streamed out entry by entry
+without ever touching a temp file.
+"""
+import collections
+import hashlib
+import os
+import threading
+import zipfile
+
+# Already-compressed formats gain nothing from deflate: store them.
+STORED_EXTENSIONS = frozenset({
+    ".png", ".jpg", ".jpeg", ".gif", ".webp", ".ico",
+    ".woff", ".woff2", ".zip", ".gz", ".br", ".mp3", ".mp4",
+})
+
+_FIXED_DATE = (1980, 1, 1, 0, 0, 0)
+
+
+def archive_etag(files):
+    """Strong ETag for the archive of a {name: sha256} index."""
+    h = hashlib.sha256()
+    for name in sorted(files):
+        h.update(f"{name}\0{files[name]}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def compression_for(name, levels=None, default_level=6):
+    """
+    (compress_type, compresslevel) for one entry.
+    - levels: optional {".ext": level or None}; None means store.
+    """
+    ext = os.path.splitext(name)[1].lower()
+    if levels and ext in levels:
+        level = levels[ext]
+    elif ext in STORED_EXTENSIONS:
+        level = None
+    else:
+        level = default_level
+    if level is None:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, level
+
+
+class _ChunkSink:
+    """Write-only, non-seekable file object that collects what zipfile writes."""
+
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._pos
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_zip(entries, levels=None, default_level=6):
+    """
+    Stream a ZIP archive. `entries` yields (name, bytes) pairs; the archive
+    is produced piece by piece, one entry at a time.
+    """
+    sink = _ChunkSink()
+    with zipfile.ZipFile(sink, "w") as zf:
+        for name, data in entries:
+            compress_type, level = compression_for(name, levels, default_level)
+            info = zipfile.ZipInfo(name, date_time=_FIXED_DATE)
+            info.compress_type = compress_type
+            info.external_attr = 0o644 << 16
+            zf.writestr(info, data, compresslevel=level)
+            chunk = sink.drain()
+            if chunk:
+                yield chunk
+    tail = sink.drain()
+    if tail:
+        yield tail
+
+
+def generation_entries(generation):
+    """(name, bytes) pairs of a generation, in a stable order."""
+    for name in sorted(generation.files):
+        yield name, generation.read(name)
+
+
+def iter_chunks(data, size=64 * 1024):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+class ArchiveCache:
+    """LRU of finished archives keyed by ETag, bounded by total bytes."""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._items = collections.OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get(self, etag):
+        with self._lock:
+            data = self._items.get(etag)
+            if data is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(etag)
+            self.hits += 1
+            return data
+
+    def put(self, etag, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._items.pop(etag, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._items[etag] = data
+            self._bytes += len(data)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._items.popitem(last=False)
+                self._bytes -= len(evicted)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "entries": len(self._items),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
@@ -0,0 +1,332 @@
+"""
+asyncio counterpart of upstream.UpstreamPool, for the ASGI server.
+
+AsyncUpstreamPool speaks just enough HTTP/1.1 over asyncio streams to
+POST to the chat-completions endpoint and read the answer (whole, or
+line by line for a stream), keeping connections alive between calls. A
+call in flight costs a coroutine and a socket, not a thread, so one
+process can wait on thousands of slow answers at once.
+
+Errors are the ones upstream.py raises (UpstreamError, UpstreamHTTPError),
+so retry.py and the router treat both clients alike. Cancelling the task
+running a call closes its connection; it is never pooled again.
+"""
+import asyncio
+import collections
+import socket
+import ssl
+import time
+import urllib.parse
+
+from upstream import DeadlineExceeded, UpstreamError, UpstreamHTTPError
+
+# Errors that mean "the server closed our idle keep-alive connection".
+_STALE_ERRORS = (
+    asyncio.IncompleteReadError,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+MAX_HEADER_LINES = 100
+
+
+def _wait_time(read_timeout, deadline):
+    """Timeout for the next read: read_timeout, less once the call's deadline nears."""
+    if deadline is None:
+        return read_timeout
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise DeadlineExceeded("OpenAI call ran past its deadline")
+    return min(read_timeout, left)
+
+
+def _timed_out(deadline):
+    if deadline is not None and time.monotonic() >= deadline:
+        return DeadlineExceeded("OpenAI call ran past its deadline")
+    return UpstreamError("OpenAI URLError: timed out")
+
+
+class _Connection:
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncResponse:
+    """Status, headers and the body of one answer, read on demand."""
+
+    def __init__(self, status, headers, conn, read_timeout, deadline=None):
+        self.status = status
+        self.headers = headers  # lower-cased names
+        self._conn = conn
+        self._timeout = read_timeout
+        self._deadline = deadline
+        self.will_close = headers.get("connection", "").lower() == "close"
+        self.complete = False
+
+    async def _read(self, coro):
+        try:
+            timeout = _wait_time(self._timeout, self._deadline)
+        except DeadlineExceeded:
+            coro.close()
+            raise
+        try:
+            return await asyncio.wait_for(coro, timeout)
+        except asyncio.TimeoutError as e:
+            raise _timed_out(self._deadline) from e
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            raise UpstreamError(f"OpenAI URLError: {e}") from e
+
+    async def chunks(self):
+        """Yield the body as it arrives (Content-Length, chunked or until close)."""
+        reader = self._conn.reader
+        if "chunked" in self.headers.get("transfer-encoding", "").lower():
+            while True:
+                size_line = await self._read(reader.readline())
+                try:
+                    size = int(size_line.split(b";", 1)[0].strip(), 16)
+                except ValueError:
+                    raise UpstreamError(f"OpenAI URLError: bad chunk size {size_line[:40]!r}") \
+                        from None
+                if size == 0:
+                    # Trailers (usually none) up to the blank line.
+                    while (await self._read(reader.readline())) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                yield await self._read(reader.readexactly(size))
+                await self._read(reader.readexactly(2))
+        elif "content-length" in self.headers:
+            remaining = int(self.headers["content-length"])
+            while remaining > 0:
+                data = await self._read(reader.read(min(remaining, 65536)))
+                if not data:
+                    raise UpstreamError("OpenAI URLError: connection closed mid-body")
+                remaining -= len(data)
+                yield data
+        else:
+            self.will_close = True
+            while True:
+                data = await self._read(reader.read(65536))
+                if not data:
+                    break
+                yield data
+        self.complete = True
+
+    async def read(self):
+        return b"".join([chunk async for chunk in self.chunks()])
+
+    async def lines(self):
+        """Yield the body line by line (bytes, newline included)."""
+        buffer = b""
+        async for chunk in self.chunks():
+            buffer += chunk
+            *complete, buffer = buffer.split(b"\n")
+            for line in complete:
+                yield line + b"\n"
+        if buffer:
+            yield buffer
+
+
+class AsyncUpstreamPool:
+    """
+    Keep-alive connections to one upstream base URL, for coroutines.
+    - max_connections: cap on connections in use at once (callers wait up
+      to acquire_timeout seconds for one); much higher than the threaded
+      pool's, since a waiting call costs no thread.
+    - connect_timeout / read_timeout / idle_timeout: as in UpstreamPool.
+    Must be used from a single event loop.
+    """
+
+    def __init__(self, url, max_connections=1000, connect_timeout=10.0,
+                 read_timeout=600.0, idle_timeout=60.0, acquire_timeout=30.0):
+        parts = urllib.parse.urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += "?" + parts.query
+
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+
+        self._ssl_context = ssl.create_default_context() if self.scheme == "https" else None
+        self._idle = collections.deque()
+        self._slots = None  # asyncio.Semaphore, created on the loop that uses it
+        self._in_use = 0
+        self._stats = collections.Counter()
+
+    # ------------------------------------------------------------------
+    # Connection management
+    # ------------------------------------------------------------------
+
+    async def _open(self):
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.host, self.port, ssl=self._ssl_context),
+                self.connect_timeout)
+        except (OSError, asyncio.TimeoutError) as e:
+            raise UpstreamError(f"OpenAI URLError: {e or 'connect timed out'}") from e
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._stats["connections_opened"] += 1
+        return _Connection(reader, writer)
+
+    async def _acquire(self):
+        """Return (connection, reused)."""
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_connections)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self._stats["acquire_timeouts"] += 1
+            raise UpstreamError(
+                f"Upstream pool exhausted ({self.max_connections} connections busy)") from None
+        self._in_use += 1
+        now = time.monotonic()
+        while self._idle:
+            conn = self._idle.pop()
+            if now - conn.last_used <= self.idle_timeout and not conn.reader.at_eof():
+                self._stats["hits"] += 1
+                return conn, True
+            conn.close()
+            self._stats["expired"] += 1
+        self._stats["misses"] += 1
+        try:
+            return await self._open(), False
+        except BaseException:
+            self._in_use -= 1
+            self._slots.release()
+            raise
+
+    def _release(self, conn, reusable):
+        if reusable:
+            conn.last_used = time.monotonic()
+            self._idle.append(conn)
+        else:
+            conn.close()
+            self._stats["discarded"] += 1
+        self._in_use -= 1
+        self._slots.release()
+
+    def close(self):
+        while self._idle:
+            self._idle.pop().close()
+
+    def stats(self):
+        stats = dict(self._stats)
+        stats["idle"] = len(self._idle)
+        stats["in_use"] = self._in_use
+        stats.setdefault("hits", 0)
+        stats.setdefault("misses", 0)
+        stats["max_connections"] = self.max_connections
+        return stats
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+
+    def _request_head(self, body, headers):
+        lines = [f"POST {self.path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 f"Content-Length: {len(body)}"]
+        lines += [f"{k}: {v}" for k, v in headers.items()
+                  if k.lower() not in ("host", "content-length")]
+        return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1")
+
+    async def _read_head(self, reader, deadline):
+        status_line = await asyncio.wait_for(reader.readline(),
+                                             _wait_time(self.read_timeout, deadline))
+        if not status_line:
+            raise asyncio.IncompleteReadError(b"", None)
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise UpstreamError(f"OpenAI URLError: bad status line {status_line[:80]!r}")
+        headers = {}
+        for _ in range(MAX_HEADER_LINES):
+            line = await asyncio.wait_for(reader.readline(),
+                                          _wait_time(self.read_timeout, deadline))
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        return int(parts[1]), parts[0], headers
+
+    async def _send(self, body, headers, timeout=None):
+        """
+        Send a POST and return (connection, AsyncResponse) with the status
+        already checked. A reused connection that turns out to be stale is
+        retried once on a fresh one.
+        - timeout: total seconds for the call, up to the last byte of the
+          body (each read still waits at most read_timeout); past it a read
+          raises DeadlineExceeded.
+        """
+        deadline = time.monotonic() + timeout if timeout else None
+        for attempt in range(2):
+            conn, reused = await self._acquire()
+            try:
+                conn.writer.write(self._request_head(body, headers) + body)
+                await conn.writer.drain()
+                status, version, resp_headers = await self._read_head(conn.reader, deadline)
+            except _STALE_ERRORS as e:
+                self._release(conn, False)
+                if reused and attempt == 0:
+                    self._stats["stale_retries"] += 1
+                    continue
+                raise UpstreamError(f"OpenAI URLError: {e or 'connection closed'}") from e
+            except asyncio.TimeoutError as e:
+                self._release(conn, False)
+                raise _timed_out(deadline) from e
+            except OSError as e:
+                self._release(conn, False)
+                raise UpstreamError(f"OpenAI URLError: {e}") from e
+            except BaseException:
+                self._release(conn, False)
+                raise
+
+            resp = AsyncResponse(status, resp_headers, conn, self.read_timeout, deadline)
+            resp.will_close = resp.will_close or version == "HTTP/1.0"
+            if status >= 400:
+                try:
+                    err_body = (await resp.read()).decode("utf-8", errors="ignore")
+                except UpstreamError:
+                    err_body = ""
+                except BaseException:
+                    self._release(conn, False)
+                    raise
+                self._release(conn, resp.complete and not resp.will_close)
+                raise UpstreamHTTPError(status, err_body, resp_headers)
+            return conn, resp
+        raise UpstreamError("OpenAI URLError: connection lost")  # pragma: no cover
+
+    async def post(self, body, headers, timeout=None):
+        """POST body (bytes) and return the full response body as bytes."""
+        conn, resp = await self._send(body, headers, timeout)
+        try:
+            data = await resp.read()
+        except BaseException:
+            self._release(conn, False)
+            raise
+        self._release(conn, not resp.will_close)
+        return data
+
+    async def stream_lines(self, body, headers, timeout=None):
+        """
+        POST body and yield the response line by line (bytes) as it arrives.
+        The connection goes back to the pool only if the body was read to
+        the end; closing the generator early (aclose()) discards it.
+        """
+        conn, resp = await self._send(body, headers, timeout)
+        try:
+            async for line in resp.lines():
+                yield line
+        finally:
+            self._release(conn, resp.complete and not resp.will_close)
@@ -0,0 +1,62 @@
+"""
+Fan-out helpers for batch forging.
+
+run_concurrently() runs one function over many items on a bounded thread
+pool and yields each outcome as soon as it finishes (completion order, not
+submission order), so the caller can stream results out while the slower
+items are still running. An item that raises is reported, not re-raised:
+one failure never aborts the rest of the batch.
+"""
+import concurrent.futures
+import re
+import time
+
+
+class BatchItem:
+    """Outcome of one item: result or error, plus timing."""
+
+    def __init__(self, index, item):
+        self.index = index
+        self.item = item
+        self.result = None
+        self.error = None
+        self.elapsed = 0.0
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def _timed(fn, outcome):
+    start = time.perf_counter()
+    try:
+        outcome.result = fn(outcome.item)
+    except Exception as e:
+        outcome.error = e
+    outcome.elapsed = time.perf_counter() - start
+    return outcome
+
+
+def run_concurrently(fn, items, concurrency=4):
+    """
+    Yield a BatchItem per entry of `items` as each fn(item) call completes,
+    with at most `concurrency` calls running at once. Closing the generator
+    early cancels the items that haven't started yet.
+    """
+    items = list(items)
+    if not items:
+        return
+    pool = concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, min(concurrency, len(items))), thread_name_prefix="forge-batch")
+    try:
+        futures = [pool.submit(_timed, fn, BatchItem(i, item)) for i, item in enumerate(items)]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def slugify(text, max_length=40):
+    """Short, filesystem-safe folder name for a prompt."""
+    slug = re.sub(r"[^a-z0-9]+", "-", text.lower()).strip("-")
+    return slug[:max_length].rstrip("-") or "item"
@@ -0,0 +1,447 @@
+"""
+Build step for the UI: turns each page's HTML_TEMPLATE into a static bundle.
+
+    python build_static.py                       # -> static/
+    python build_static.py --icons path/to/fontawesome-free --fonts fonts/
+
+For every page (main_ui.py, main.py) it writes, under content-hashed names:
+- <page>.<hash>.css: Tailwind's preflight and the utility classes the page
+  uses (utility_css, instead of the Play CDN compiling them in the
+  browser), then the page's own <style> blocks; with --icons, the Font
+  Awesome icons the page uses as CSS masks (and nothing else), with
+  --fonts, @font-face rules for its web fonts;
+- <page>.<hash>.js per inline script, comments and indentation stripped;
+- <page>.html, the page pointing at them;
+plus a .gz (and a .br with the brotli module installed) next to every
+text file, and manifest.json, which static_assets.StaticBundle loads at
+startup. Whatever can't be self-hosted (no --icons / --fonts, or an icon
+or font file missing) keeps its CDN link, so the page still renders.
+
+--icons takes an unpacked fontawesome-free package (svgs/solid/*.svg,
+svgs/brands/*.svg, ...). --fonts takes a directory of <Family>-<weight>
+.woff2/.woff/.ttf files named after the Google Fonts link, e.g.
+Inter-600.woff2 or JetBrainsMono-400.woff2; with fontTools installed they
+are subset to Latin.
+"""
+import argparse
+import ast
+import gzip
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+import urllib.parse
+
+from archive import STORED_EXTENSIONS
+from static_assets import STATIC_DIR, STATIC_URL, source_hash
+from utility_css import candidates, class_attributes, compile_css, parse_config
+
+try:
+    import brotli
+except ImportError:  # .br files are optional
+    brotli = None
+
+try:
+    from fontTools import subset as font_subset
+except ImportError:  # fonts are then copied whole
+    font_subset = None
+
+PAGES = {"main_ui": "main_ui.py", "main": "main.py"}
+
+TAILWIND_CDN = re.compile(r'\s*<script src="https://cdn\.tailwindcss\.com[^"]*"></script>')
+INLINE_SCRIPT = re.compile(r"\s*<script>(.*?)</script>", re.S)
+STYLE = re.compile(r"\s*<style>(.*?)</style>", re.S)
+LINK = re.compile(r'\s*<link\b[^>]*href="([^"]+)"[^>]*>')
+CSS_IMPORT = re.compile(r"@import url\(['\"]?([^'\")]+)['\"]?\);?")
+CSS_CLASS = re.compile(r"\.(-?[A-Za-z_][\w-]*)")
+
+FONT_AWESOME_HOST = "cdnjs.cloudflare.com/ajax/libs/font-awesome"
+GOOGLE_FONTS_HOST = "fonts.googleapis.com"
+ICON_STYLES = ("solid", "brands", "regular")
+# fa-* classes that style an icon rather than name one.
+ICON_MODIFIERS = frozenset({
+    "fa-solid", "fa-regular", "fa-brands", "fa-spin", "fa-pulse", "fa-fw", "fa-xs", "fa-sm",
+    "fa-lg", "fa-xl", "fa-2x", "fa-3x", "fa-beat", "fa-bounce", "fa-fade", "fa-shake",
+})
+ICON_CSS = (
+    ".fa-solid,.fa-regular,.fa-brands{display:inline-block;font-style:normal;line-height:1}"
+    ".fa-solid::before,.fa-regular::before,.fa-brands::before{content:\"\";display:inline-block;"
+    "width:var(--fa-w,1em);height:1em;vertical-align:-.125em;background-color:currentColor;"
+    "-webkit-mask:var(--fa-i) center/contain no-repeat;mask:var(--fa-i) center/contain no-repeat}"
+    ".fa-spin{animation:fa-spin 2s linear infinite}"
+    "@keyframes fa-spin{0%{transform:rotate(0)}to{transform:rotate(360deg)}}"
+)
+# Basic Latin, Latin-1 and the usual punctuation: Google's "latin" subset.
+LATIN = "U+0000-00FF,U+0131,U+0152-0153,U+02BB-02BC,U+02C6,U+02DA,U+02DC,U+2000-206F,U+20AC," \
+        "U+2122,U+2191,U+2193,U+2212,U+2215,U+FEFF,U+FFFD"
+FONT_FORMATS = {".woff2": "woff2", ".woff": "woff", ".ttf": "truetype", ".otf": "opentype"}
+MIMETYPES = {".css": "text/css; charset=utf-8", ".js": "text/javascript; charset=utf-8",
+             ".woff2": "font/woff2", ".woff": "font/woff", ".ttf": "font/ttf",
+             ".otf": "font/otf", ".svg": "image/svg+xml"}
+
+
+def read_template(source):
+    """The HTML_TEMPLATE string assigned at the top level of a module (not imported)."""
+    with open(source, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read(), source)
+    for node in tree.body:
+        if isinstance(node, ast.Assign) and any(
+                getattr(t, "id", None) == "HTML_TEMPLATE" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError(f"{source} has no HTML_TEMPLATE")
+
+
+def minify_css(css):
+    css = re.sub(r"/\*.*?\*/", "", css, flags=re.S)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};,>])\s*", r"\1", css)
+    css = re.sub(r":\s+", ":", css)
+    return css.replace(";}", "}").strip()
+
+
+def minify_js(js):
+    """
+    Drop comments, indentation and blank lines, keeping line breaks (no
+    reliance on semicolons) and everything inside strings, template
+    literals and regular expressions exactly as written.
+    """
+    out = []
+    i, n = 0, len(js)
+    templates = []  # per open template literal: None in its text, else brace depth in ${...}
+    last = ""       # last significant character outside strings / comments
+    space = False   # whitespace seen since the last emitted code character
+
+    def emit(piece):
+        nonlocal space
+        if space and out and out[-1] != "\n":
+            out.append(" ")
+        space = False
+        out.append(piece)
+
+    while i < n:
+        c = js[i]
+        if templates and templates[-1] is None:
+            # Inside template literal text: copy verbatim.
+            if c == "\\":
+                out.append(js[i:i + 2])
+                i += 2
+            elif c == "`":
+                templates.pop()
+                out.append(c)
+                last = c
+                i += 1
+            elif js.startswith("${", i):
+                templates[-1] = 0
+                out.append("${")
+                i += 2
+            else:
+                out.append(c)
+                i += 1
+            continue
+        if c == "\n":
+            space = False
+            if out and out[-1] != "\n":
+                out.append("\n")
+            i += 1
+        elif c in " \t\r":
+            space = True
+            i += 1
+        elif c in "'\"":
+            j = i + 1
+            while j < n and js[j] != c and js[j] != "\n":
+                j += 2 if js[j] == "\\" else 1
+            emit(js[i:j + 1])
+            last = c
+            i = j + 1
+        elif c == "`":
+            emit(c)
+            templates.append(None)
+            i += 1
+        elif js.startswith("//", i):
+            end = js.find("\n", i)
+            i = n if end < 0 else end
+        elif js.startswith("/*", i):
+            end = js.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+            space = True
+        elif c == "/" and (not last or last in "(,=:[!&|?{};+-*%<>~^" or
+                           re.search(r"\b(return|typeof|case|in|of)$", "".join(out[-12:]))):
+            # A regular expression literal.
+            j = i + 1
+            in_class = False
+            while j < n and js[j] != "\n":
+                if js[j] == "\\":
+                    j += 2
+                    continue
+                if js[j] == "[":
+                    in_class = True
+                elif js[j] == "]":
+                    in_class = False
+                elif js[j] == "/" and not in_class:
+                    break
+                j += 1
+            emit(js[i:j + 1])
+            last = "/"
+            i = j + 1
+        else:
+            if templates and c == "{":
+                templates[-1] += 1
+            elif templates and c == "}":
+                if templates[-1] == 0:
+                    templates[-1] = None  # back in the template text
+                else:
+                    templates[-1] -= 1
+            emit(c)
+            last = c
+            i += 1
+
+    return "".join(out).strip()
+
+
+def minify_html(html):
+    """Strip indentation and blank lines, outside <pre> / <textarea>."""
+    parts = re.split(r"(<(?:pre|textarea)\b.*?</(?:pre|textarea)>)", html, flags=re.S)
+    for k in range(0, len(parts), 2):
+        lines = (line.strip() for line in parts[k].split("\n"))
+        parts[k] = "\n".join(line for line in lines if line)
+    return "".join(parts)
+
+
+def svg_data_uri(svg):
+    svg = re.sub(r"<!--.*?-->", "", svg, flags=re.S).strip()
+    return "data:image/svg+xml," + urllib.parse.quote(svg, safe=" =:/;,'()")
+
+
+def icon_css(names, icons_dir):
+    """CSS for the named Font Awesome icons, plus the names not found."""
+    rules, missing = [ICON_CSS], []
+    for name in sorted(names):
+        icon = name[3:]
+        path = next((p for p in (os.path.join(icons_dir, "svgs", style, icon + ".svg")
+                                 for style in ICON_STYLES) if os.path.exists(p)),
+                    os.path.join(icons_dir, icon + ".svg"))
+        if not os.path.exists(path):
+            missing.append(name)
+            continue
+        with open(path, "r", encoding="utf-8") as f:
+            svg = f.read()
+        m = re.search(r'viewBox="[\d.]+ [\d.]+ ([\d.]+) ([\d.]+)"', svg)
+        width = float(m.group(1)) / float(m.group(2)) if m else 1.0
+        rules.append(f'.{name}{{--fa-i:url("{svg_data_uri(svg)}");--fa-w:{width:.4g}em}}')
+    return "".join(rules), missing
+
+
+def google_fonts(url):
+    """[(family, weight)] requested by a Google Fonts css2 URL."""
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(url).query)
+    wanted = []
+    for spec in query.get("family", []):
+        family, _, axes = spec.partition(":")
+        weights = axes.split("@", 1)[1].split(";") if "@" in axes else ["400"]
+        wanted += [(family.replace("+", " "), w) for w in weights]
+    return wanted
+
+
+def font_file(fonts_dir, family, weight):
+    base = os.path.join(fonts_dir, f"{family.replace(' ', '')}-{weight}")
+    return next((base + ext for ext in FONT_FORMATS if os.path.exists(base + ext)), None)
+
+
+def subset_font(path):
+    """(bytes, extension, unicode_range or None) of a font, Latin-only when possible."""
+    ext = os.path.splitext(path)[1]
+    if font_subset is None:
+        with open(path, "rb") as f:
+            return f.read(), ext, None
+    options = font_subset.Options()
+    options.flavor = "woff2" if brotli is not None else "woff"
+    font = font_subset.load_font(path, options)
+    subsetter = font_subset.Subsetter(options)
+    subsetter.populate(unicodes=font_subset.parse_unicodes(LATIN))
+    subsetter.subset(font)
+    out = os.path.join(os.path.dirname(path), ".subset.tmp")
+    try:
+        font_subset.save_font(font, out, options)
+        with open(out, "rb") as f:
+            return f.read(), "." + options.flavor, LATIN
+    finally:
+        if os.path.exists(out):
+            os.remove(out)
+
+
+class Bundle:
+    """Files being written to the output directory, and their manifest entries."""
+
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self.files = {}
+
+    def add(self, stem, ext, data):
+        """Write data under a content-hashed name; returns that name."""
+        digest = hashlib.sha256(data).hexdigest()
+        name = f"{stem}.{digest[:12]}{ext}"
+        entry = {"type": MIMETYPES.get(ext, "application/octet-stream"),
+                 "size": len(data), "etag": digest, "encodings": {}}
+        self._write(name, data)
+        if ext not in STORED_EXTENSIONS:
+            variants = {"gzip": (".gz", gzip.compress(data, 9, mtime=0))}
+            if brotli is not None:
+                variants["br"] = (".br", brotli.compress(data, quality=11))
+            for coding, (suffix, encoded) in variants.items():
+                if len(encoded) < len(data):
+                    self._write(name + suffix, encoded)
+                    entry["encodings"][coding] = name + suffix
+        self.files[name] = entry
+        return name
+
+    def _write(self, name, data):
+        with open(os.path.join(self.out_dir, name), "wb") as f:
+            f.write(data)
+
+
+def build_page(page, template, bundle, icons_dir=None, fonts_dir=None):
+    """Build one page into `bundle`; returns its manifest entry."""
+    html = TAILWIND_CDN.sub("", template)
+    config, css_parts, scripts = {}, [], []
+
+    def take_script(m):
+        if "tailwind.config" in m.group(1):
+            config.update(parse_config(m.group(1)))
+            return ""
+        scripts.append(m.group(1))
+        return f"\n<!--script:{len(scripts) - 1}-->"
+    html = INLINE_SCRIPT.sub(take_script, html)
+
+    font_urls = []
+
+    def take_style(m):
+        css = m.group(1)
+        font_urls.extend(u for u in CSS_IMPORT.findall(css) if GOOGLE_FONTS_HOST in u)
+        css_parts.append(CSS_IMPORT.sub(
+            lambda i: "" if GOOGLE_FONTS_HOST in i.group(1) else i.group(0), css))
+        return ""
+    html = STYLE.sub(take_style, html)
+
+    tokens = candidates(template)
+    page_classes = set(CSS_CLASS.findall("".join(css_parts)))
+    icon_names = {t for t in tokens if re.fullmatch(r"fa-[a-z0-9-]+", t)} - ICON_MODIFIERS
+    cdn = []
+    head_css = []
+
+    icon_link = next((m for m in LINK.finditer(html) if FONT_AWESOME_HOST in m.group(1)), None)
+    if icon_link is not None:
+        missing = ["--icons not given"]
+        if icons_dir:
+            rules, missing = icon_css(icon_names, icons_dir)
+        if missing:
+            cdn.append({"url": icon_link.group(1), "reason": f"icons missing: {missing}"})
+        else:
+            head_css.append(rules)
+            html = html.replace(icon_link.group(0), "")
+
+    imports = []
+    font_links = {m.group(1): m.group(0) for m in LINK.finditer(html)
+                  if GOOGLE_FONTS_HOST in m.group(1)}
+    for url in list(font_links) + font_urls:
+        wanted = google_fonts(url)
+        found = {fw: font_file(fonts_dir, *fw) for fw in wanted} if fonts_dir else {}
+        missing = [f"{f} {w}" for (f, w) in wanted if not found.get((f, w))]
+        if missing:
+            cdn.append({"url": url, "reason": f"fonts missing: {missing}" if fonts_dir
+                        else "--fonts not given"})
+            if url in font_urls:
+                # It was an @import in the page's CSS: keep it there.
+                imports.append(f"@import url('{url}');")
+            continue
+        for (family, weight), path in found.items():
+            data, ext, unicode_range = subset_font(path)
+            name = bundle.add(f"{family.replace(' ', '')}-{weight}", ext, data)
+            head_css.append(
+                f"@font-face{{font-family:'{family}';font-style:normal;font-weight:{weight};"
+                f"font-display:swap;src:url({STATIC_URL}{name}) format('{FONT_FORMATS[ext]}')"
+                + (f";unicode-range:{unicode_range}" if unicode_range else "") + "}")
+        if url in font_links:
+            html = html.replace(font_links[url], "")
+
+    utilities, compiled, _ = compile_css(tokens, config)
+    # @import has to come first; the page's own rules last, as before.
+    css = minify_css("\n".join(imports + [utilities] + head_css + css_parts))
+    assets = [bundle.add(page, ".css", css.encode("utf-8"))]
+    html = html.replace("</head>", f'<link rel="stylesheet" href="{STATIC_URL}{assets[0]}">\n</head>', 1)
+
+    for n, script in enumerate(scripts):
+        name = bundle.add(page if n == 0 else f"{page}-{n}", ".js",
+                          minify_js(script).encode("utf-8"))
+        assets.append(name)
+        html = html.replace(f"<!--script:{n}-->", f'<script src="{STATIC_URL}{name}"></script>')
+
+    html = minify_html(html)
+    with open(os.path.join(bundle.out_dir, f"{page}.html"), "w", encoding="utf-8") as f:
+        f.write(html)
+
+    unknown = class_attributes(template) - compiled - page_classes - icon_names - ICON_MODIFIERS
+    return {
+        "html": f"{page}.html",
+        "source_sha256": source_hash(template),
+        "assets": assets,
+        "bytes": len(html.encode("utf-8")) + sum(bundle.files[a]["size"] for a in assets),
+        "cdn": cdn,
+        "unstyled_classes": sorted(c for c in unknown
+                                   if re.fullmatch(r"[!-]?[A-Za-z][\w:/\[\]().,%#!-]*", c)),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Build the static UI bundle")
+    parser.add_argument("--out", default=STATIC_DIR, help="output directory")
+    parser.add_argument("--icons", metavar="DIR", help="unpacked fontawesome-free package")
+    parser.add_argument("--fonts", metavar="DIR", help="<Family>-<weight>.woff2 files")
+    parser.add_argument("--page", action="append", choices=sorted(PAGES),
+                        help="build only this page (repeatable)")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    manifest_path = os.path.join(args.out, "manifest.json")
+    previous = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path, "r", encoding="utf-8") as f:
+            previous = json.load(f)
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    bundle = Bundle(args.out)
+    pages = {}
+    for page in args.page or PAGES:
+        template = read_template(os.path.join(here, PAGES[page]))
+        pages[page] = build_page(page, template, bundle, args.icons, args.fonts)
+    # Pages not rebuilt this time keep their files.
+    for page, entry in previous.get("pages", {}).items():
+        if page not in pages:
+            pages[page] = entry
+            for name in entry["assets"]:
+                if name in previous.get("files", {}):
+                    bundle.files[name] = previous["files"][name]
+
+    # Drop the files of earlier builds that nothing points at any more.
+    keep = set(bundle.files) | {e for f in bundle.files.values() for e in f["encodings"].values()}
+    for name, entry in previous.get("files", {}).items():
+        for stale in [name] + list(entry.get("encodings", {}).values()):
+            if stale not in keep and os.path.exists(os.path.join(args.out, stale)):
+                os.remove(os.path.join(args.out, stale))
+
+    manifest = {"version": 1, "built_at": int(time.time()), "pages": pages, "files": bundle.files}
+    with open(manifest_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+
+    for page, entry in pages.items():
+        print(f"{page}: {entry['bytes']} bytes in {len(entry['assets'])} assets", file=sys.stderr)
+        for item in entry["cdn"]:
+            print(f"  still from CDN: {item['url']} ({item['reason']})", file=sys.stderr)
+        if entry["unstyled_classes"]:
+            print(f"  classes without CSS: {' '.join(entry['unstyled_classes'])}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,235 @@
+"""
+Content-addressed cache for model answers.
+
+Keys are the SHA-256 of the canonical JSON request payload (model, system
+prompt + messages, sampling parameters), so identical requests map to the
+same entry. Two tiers:
+- memory: LRU bounded by total stored bytes,
+- disk: one JSON file per key under `directory`, survives restarts; the
+  oldest files are removed once it holds more than `max_disk_bytes` or
+  `max_disk_entries` (files left by earlier runs are counted at startup).
+Both honour a TTL; entries can be invalidated one by one or all at once.
+"""
+import collections
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+
+
+def cache_key(payload):
+    """Stable hash of a request payload dict."""
+    canonical = json.dumps(payload, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """
+    - max_memory_bytes: size budget for the in-memory LRU tier.
+    - directory: disk tier location (None disables the disk tier).
+    - max_disk_bytes / max_disk_entries: disk tier budget (0 / None = no cap).
+    - ttl: seconds an entry stays valid (0 / None = forever).
+    """
+
+    def __init__(self, max_memory_bytes=32 * 1024 * 1024, directory=None, ttl=24 * 3600,
+                 max_disk_bytes=512 * 1024 * 1024, max_disk_entries=None):
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self.ttl = ttl
+        self.max_disk_bytes = max_disk_bytes
+        self.max_disk_entries = max_disk_entries
+        self._memory = collections.OrderedDict()  # key -> (expires, blob)
+        self._memory_bytes = 0
+        self._disk = collections.OrderedDict()  # key -> file size, oldest write first
+        self._disk_bytes = 0
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            self._scan_disk()
+
+    # ------------------------------------------------------------------
+
+    def get(self, key):
+        """Return the cached value for key, or None."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                expires, blob = entry
+                if expires and expires < now:
+                    self._drop_memory_locked(key)
+                else:
+                    self._memory.move_to_end(key)
+                    self._stats["memory_hits"] += 1
+                    return json.loads(blob)
+
+        record = self._read_disk(key)
+        if record is not None:
+            if record["expires"] and record["expires"] < now:
+                self._remove_disk(key)
+            else:
+                blob = json.dumps(record["value"]).encode("utf-8")
+                with self._lock:
+                    self._stats["disk_hits"] += 1
+                    self._put_memory_locked(key, record["expires"], blob)
+                return record["value"]
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, key, value):
+        expires = time.time() + self.ttl if self.ttl else 0
+        blob = json.dumps(value).encode("utf-8")
+        with self._lock:
+            self._put_memory_locked(key, expires, blob)
+            self._stats["stores"] += 1
+        self._write_disk(key, {"expires": expires, "value": value})
+
+    def invalidate(self, key):
+        """Drop one entry from both tiers. Returns True if it existed."""
+        with self._lock:
+            found = self._drop_memory_locked(key)
+        return self._remove_disk(key) or found
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            self._disk.clear()
+            self._disk_bytes = 0
+        removed = 0
+        if self.directory:
+            for root, _, names in os.walk(self.directory):
+                for name in names:
+                    if name.endswith(".json"):
+                        os.remove(os.path.join(root, name))
+                        removed += 1
+        return removed
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+            stats["memory_bytes"] = self._memory_bytes
+            stats["disk_entries"] = len(self._disk)
+            stats["disk_bytes"] = self._disk_bytes
+        stats["max_memory_bytes"] = self.max_memory_bytes
+        stats["max_disk_bytes"] = self.max_disk_bytes
+        stats["max_disk_entries"] = self.max_disk_entries
+        return stats
+
+    # ------------------------------------------------------------------
+    # Memory tier
+    # ------------------------------------------------------------------
+
+    def _put_memory_locked(self, key, expires, blob):
+        if len(blob) > self.max_memory_bytes:
+            return
+        self._drop_memory_locked(key)
+        self._memory[key] = (expires, blob)
+        self._memory_bytes += len(blob)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, (_, old) = self._memory.popitem(last=False)
+            self._memory_bytes -= len(old)
+            self._stats["evictions"] += 1
+
+    def _drop_memory_locked(self, key):
+        entry = self._memory.pop(key, None)
+        if entry is None:
+            return False
+        self._memory_bytes -= len(entry[1])
+        return True
+
+    # ------------------------------------------------------------------
+    # Disk tier
+    # ------------------------------------------------------------------
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], key + ".json")
+
+    def _scan_disk(self):
+        """Index the files already on disk, oldest first."""
+        found = []
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                if not name.endswith(".json"):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                found.append((st.st_mtime, name[:-len(".json")], st.st_size))
+        found.sort()
+        with self._lock:
+            for _, key, size in found:
+                self._disk[key] = size
+                self._disk_bytes += size
+        self._evict_disk()
+
+    def _over_disk_budget_locked(self):
+        return ((self.max_disk_bytes and self._disk_bytes > self.max_disk_bytes)
+                or (self.max_disk_entries and len(self._disk) > self.max_disk_entries))
+
+    def _evict_disk(self):
+        """Remove the oldest files until the disk tier fits its budget."""
+        while True:
+            with self._lock:
+                if not self._disk or not self._over_disk_budget_locked():
+                    return
+                key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                self._stats["disk_evictions"] += 1
+            try:
+                os.remove(self._path(key))
+            except OSError:
+                pass
+
+    def _forget_disk(self, key):
+        with self._lock:
+            size = self._disk.pop(key, None)
+            if size is not None:
+                self._disk_bytes -= size
+
+    def _read_disk(self, key):
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk(self, key, record):
+        if not self.directory:
+            return
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file and rename so readers never see half a file.
+        fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump(record, f)
+                size = f.tell()
+            os.replace(tmp, path)
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+        with self._lock:
+            self._disk_bytes += size - self._disk.pop(key, 0)
+            self._disk[key] = size
+        self._evict_disk()
+
+    def _remove_disk(self, key):
+        if not self.directory:
+            return False
+        self._forget_disk(key)
+        try:
+            os.remove(self._path(key))
+            return True
+        except OSError:
+            return False
@@ -0,0 +1,217 @@
+"""
+Token-budgeted conversation history for /forge prompts.
+
+Every assistant turn in a session is the complete extension JSON, so a
+prompt that re-sends the whole history grows by a full copy of the
+extension per turn. compact() keeps the newest assistant turn verbatim
+(it holds the latest version of every file) and replaces each older one
+with a short reference:
+
+    [Earlier version 3f2a9c1e, superseded by the latest one below]
+    Analysis: Adds a dark-mode toggle to the popup.
+    Files: manifest.json 4a1b2c3d (412 B), popup.html 9e8f7a6b (1.2 KB), ...
+
+If the prompt is still over budget, the oldest exchanges are dropped and
+their requests listed in one note after the system prompt.
+
+Everything is a pure function of the history, so workers agree on it and
+the prompt prefix stays byte-identical from one turn to the next: a
+reference never changes once written, and histories are only cut at
+"anchor" user turns (picked by a hash of their text, about one in
+`cut_every`), so the start of the window moves in steps rather than on
+every turn. Upstream prompt caching keeps hitting in between.
+"""
+import collections
+import hashlib
+import json
+import re
+import threading
+
+MEMO_SIZE = 4096  # superseded turns whose reference and size are remembered
+MESSAGE_OVERHEAD = 4  # role + separators per chat message
+REPLY_OVERHEAD = 3  # priming of the assistant's reply
+ANALYSIS_CHARS = 300
+REQUEST_CHARS = 160
+
+_PIECES = re.compile(r"[A-Za-z]+|\d+|\s+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """
+    Rough BPE token count without a tokenizer: words cost one token per
+    ~5 letters, digits one per 3, runs of whitespace one, and every other
+    character one. Errs high on code and JSON, which is the safe side for
+    a budget.
+    """
+    tokens = 0
+    for piece in _PIECES.findall(text):
+        first = piece[0]
+        if first.isalpha():
+            tokens += (len(piece) + 4) // 5
+        elif first.isdigit():
+            tokens += (len(piece) + 2) // 3
+        else:
+            tokens += 1
+    return tokens
+
+
+def message_tokens(message):
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def prompt_tokens(messages):
+    """Estimated prompt tokens of a chat-completions message list."""
+    return sum(message_tokens(m) for m in messages) + REPLY_OVERHEAD
+
+
+def _digest(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:8]
+
+
+def _size(n):
+    return f"{n} B" if n < 1024 else f"{n / 1024:.1f} KB"
+
+
+def _clip(text, limit):
+    text = " ".join(text.split())
+    return text if len(text) <= limit else text[:limit - 1] + "…"
+
+
+def compact_reference(content):
+    """Short, deterministic stand-in for one superseded assistant turn."""
+    header = f"[Earlier version {_digest(content)}, superseded by the latest one below]"
+    try:
+        result = json.loads(content)
+    except ValueError:
+        result = None
+    if not isinstance(result, dict):
+        return f"{header}\n{_clip(content, ANALYSIS_CHARS)} ({len(content)} chars)"
+
+    files = {}
+    if result.get("manifest"):
+        files["manifest.json"] = json.dumps(result["manifest"], indent=2)
+    for name, text in (result.get("files") or {}).items():
+        files[name] = text if isinstance(text, str) else json.dumps(text)
+    if result.get("readme"):
+        files["README.md"] = result["readme"]
+    listing = ", ".join(f"{name} {_digest(text)} ({_size(len(text.encode('utf-8')))})"
+                        for name, text in files.items())
+    lines = [header]
+    if result.get("analysis"):
+        lines.append(f"Analysis: {_clip(str(result['analysis']), ANALYSIS_CHARS)}")
+    lines.append(f"Files: {listing or 'none'}")
+    return "\n".join(lines)
+
+
+def dropped_note(requests):
+    """The note that stands in for exchanges cut from the start of the window."""
+    lines = [f"{len(requests)} earlier request(s) in this conversation are omitted; "
+             "their results are superseded by the latest version below. The most recent were:"]
+    lines += [f"- {_clip(text, REQUEST_CHARS)}" for text in requests[-10:]]
+    return {"role": "system", "content": "\n".join(lines)}
+
+
+class Compactor:
+    """
+    - budget: target for the estimated prompt tokens of a whole request
+      (what doesn't fit is cut; the latest extension and the newest
+      exchange are always kept, so a single huge extension may exceed it).
+    - cut_every: about one user turn in this many is a cut anchor; higher
+      means fewer prefix changes but coarser cuts.
+    """
+
+    def __init__(self, budget=32000, cut_every=4):
+        self.budget = budget
+        self.cut_every = max(1, cut_every)
+        self._lock = threading.Lock()
+        self._memo = collections.OrderedDict()  # sha256 -> (reference, tokens)
+        self._stats = {"prompts": 0, "compacted": 0, "dropped": 0,
+                       "tokens_in": 0, "tokens_out": 0}
+
+    def _reference(self, content):
+        """(compact reference, estimated tokens of the original) for an old turn."""
+        key = hashlib.sha256(content.encode("utf-8")).digest()
+        with self._lock:
+            entry = self._memo.get(key)
+            if entry is not None:
+                self._memo.move_to_end(key)
+                return entry
+        entry = (compact_reference(content), estimate_tokens(content) + MESSAGE_OVERHEAD)
+        with self._lock:
+            self._memo[key] = entry
+            while len(self._memo) > MEMO_SIZE:
+                self._memo.popitem(last=False)
+        return entry
+
+    @staticmethod
+    def _anchor(message, every):
+        return int(_digest(message["content"]), 16) % every == 0
+
+    def compact(self, history, reserved=()):
+        """
+        Compacted copy of `history` (user / assistant dicts, oldest first),
+        possibly starting with a system note about dropped turns.
+        - reserved: the other messages of the request (system prompt, mode
+          instructions), counted against the budget.
+        """
+        reserved_tokens = sum(message_tokens(m) for m in reserved) + REPLY_OVERHEAD
+        latest = max((i for i, m in enumerate(history) if m["role"] == "assistant"), default=-1)
+        messages = []
+        tokens_in = reserved_tokens
+        for i, m in enumerate(history):
+            if m["role"] == "assistant" and i != latest:
+                reference, tokens = self._reference(m["content"])
+                messages.append({"role": "assistant", "content": reference})
+                tokens_in += tokens
+            else:
+                messages.append(m)
+                tokens_in += message_tokens(m)
+        costs = [message_tokens(m) for m in messages]
+        suffix = [0] * (len(messages) + 1)
+        for i in range(len(messages) - 1, -1, -1):
+            suffix[i] = suffix[i + 1] + costs[i]
+
+        # Where the window may start: the beginning or a user turn, never
+        # after the exchange that produced the latest version.
+        last_start = max(latest - 1, 0) if latest >= 0 else len(messages) - 1
+        users = [i for i, m in enumerate(messages[:last_start + 1]) if m["role"] == "user"]
+
+        def dropped(i):
+            return dropped_note([m["content"] for m in history[:i] if m["role"] == "user"])
+
+        def fits(i):
+            extra = message_tokens(dropped(i)) if i else 0
+            return suffix[i] + reserved_tokens + extra <= self.budget
+
+        start = 0
+        if users and not fits(0):
+            # Earliest anchor that fits; if the anchors are too far apart,
+            # denser ones (half the spacing each time), down to every user turn.
+            start = users[-1]
+            every = self.cut_every
+            while every:
+                fitting = [i for i in users if self._anchor(messages[i], every) and fits(i)]
+                if fitting:
+                    start = fitting[0]
+                    break
+                every //= 2
+        note = dropped(start) if start else None
+
+        out = ([note] if note else []) + messages[start:]
+        with self._lock:
+            self._stats["prompts"] += 1
+            self._stats["compacted"] += sum(1 for i, m in enumerate(history[start:], start)
+                                            if m["role"] == "assistant" and i != latest)
+            self._stats["dropped"] += start
+            self._stats["tokens_in"] += tokens_in
+            self._stats["tokens_out"] += prompt_tokens(out) - REPLY_OVERHEAD + reserved_tokens
+        return out
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        stats["budget"] = self.budget
+        stats["cut_every"] = self.cut_every
+        stats["saved_ratio"] = round(1 - stats["tokens_out"] / stats["tokens_in"], 3) \
+            if stats["tokens_in"] else 0.0
+        return stats
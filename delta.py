@@ -0,0 +1,182 @@
+"""
+Delta refinement: on follow-up turns the model sends only what changed.
+
+The answer carries a "patch" instead of the full { manifest, files, readme }
+object:
+
+    {
+      "analysis": "...",
+      "patch": {
+        "files":    {"popup.html": "<full new content>"},   # new / rewritten files
+        "diffs":    {"popup.js": "@@ -3,4 +3,4 @@ ..."},       # unified diffs
+        "delete":   ["old.js"],
+        "manifest": {...},                                   # only if it changed
+        "readme":   "..."                                    # only if it changed
+      }
+    }
+
+apply_patch() merges that onto the previous generation's files and
+validate_result() checks the merged extension is still well formed; both
+raise PatchError so the caller can fall back to a full regeneration.
+"""
+import copy
+import re
+
+REFINE_PROMPT = """
+REFINEMENT MODE (this turn only):
+The current extension is the latest version in the conversation above.
+Do NOT repeat unchanged files. Return a single JSON object:
+{
+    "analysis": "Brief summary of the change.",
+    "patch": {
+        "files": { "<name>": "<full new content>" },
+        "diffs": { "<name>": "<unified diff against the current version>" },
+        "delete": ["<name>"],
+        "manifest": { ...full Manifest V3, ONLY if it changed... },
+        "readme": "...ONLY if it changed..."
+    }
+}
+Prefer "diffs" for small edits to large files and "files" for new or mostly
+rewritten files. Omit every key you don't need.
+"""
+
+_HUNK_HEADER = re.compile(r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@")
+
+
+class PatchError(ValueError):
+    """A patch (or the extension it produced) can't be used."""
+
+
+def _parse_hunks(diff):
+    hunks = []
+    current = None
+    for line in diff.splitlines():
+        m = _HUNK_HEADER.match(line)
+        if m:
+            current = {"old_start": int(m.group(1)),
+                       "old_count": int(m.group(2) or 1), "lines": []}
+            hunks.append(current)
+            continue
+        if current is None:
+            continue  # "--- a/x", "+++ b/x" and other preamble
+        if line.startswith("\\"):
+            # "\ No newline at end of file" applies to the previous line.
+            if current["lines"]:
+                tag, text, _ = current["lines"][-1]
+                current["lines"][-1] = (tag, text, False)
+            continue
+        tag, text = (line[:1], line[1:]) if line else (" ", "")
+        if tag not in " +-":
+            raise PatchError(f"Bad diff line: {line[:60]!r}")
+        current["lines"].append((tag, text, True))
+    if not hunks:
+        raise PatchError("Diff has no hunks")
+    return hunks
+
+
+def _find_block(lines, block, hint, lower):
+    """Index where `block` (stripped lines) occurs in `lines`, nearest `hint`."""
+    if not block:
+        return max(lower, min(hint, len(lines)))
+    stripped = [line.rstrip("\r\n") for line in lines]
+    size = len(block)
+    last = len(lines) - size
+    for delta in range(0, max(last, 0) + 1):
+        for start in (hint - delta, hint + delta) if delta else (hint,):
+            if lower <= start <= last and stripped[start:start + size] == block:
+                return start
+    return None
+
+
+def apply_unified_diff(original, diff):
+    """Apply a unified diff to `original`, tolerating shifted line numbers."""
+    lines = original.splitlines(keepends=True)
+    out = []
+    pos = 0
+    for hunk in _parse_hunks(diff):
+        old_block = [text for tag, text, _ in hunk["lines"] if tag in " -"]
+        # "-3,0" inserts after line 3; otherwise old_start is the 1-based first line.
+        hint = hunk["old_start"] if hunk["old_count"] == 0 else hunk["old_start"] - 1
+        start = _find_block(lines, old_block, hint, pos)
+        if start is None:
+            raise PatchError(f"Hunk at line {hunk['old_start']} does not apply")
+        out.extend(lines[pos:start])
+        k = start
+        for tag, text, newline in hunk["lines"]:
+            if tag == " ":
+                out.append(lines[k])  # keep the original line ending
+                k += 1
+            elif tag == "-":
+                k += 1
+            else:
+                out.append(text + ("\n" if newline else ""))
+        pos = start + len(old_block)
+    out.extend(lines[pos:])
+    return "".join(out)
+
+
+def apply_patch(base, patch):
+    """
+    Merge a patch onto `base` (a full { analysis, manifest, files, readme }
+    dict) and return the new full dict. `base` is not modified.
+    """
+    if not isinstance(patch, dict):
+        raise PatchError("patch must be an object")
+    result = copy.deepcopy(base)
+    files = result.setdefault("files", {})
+
+    for name in patch.get("delete") or []:
+        if name not in files:
+            raise PatchError(f"Cannot delete missing file {name}")
+        del files[name]
+
+    for name, content in (patch.get("files") or {}).items():
+        if not isinstance(content, str):
+            raise PatchError(f"File {name} must be a string")
+        files[name] = content
+
+    for name, diff in (patch.get("diffs") or {}).items():
+        if name == "manifest.json" and "manifest" in result:
+            raise PatchError("Send manifest changes as a full manifest, not a diff")
+        if name not in files:
+            raise PatchError(f"Diff for missing file {name}")
+        if not isinstance(diff, str):
+            raise PatchError(f"Diff for {name} must be a string")
+        files[name] = apply_unified_diff(files[name], diff)
+
+    if "manifest" in patch:
+        result["manifest"] = patch["manifest"]
+    if "readme" in patch:
+        result["readme"] = patch["readme"]
+    return result
+
+
+def validate_result(result):
+    """Basic shape checks on a full extension dict; raises PatchError."""
+    if not isinstance(result, dict):
+        raise PatchError("Result must be an object")
+    manifest = result.get("manifest")
+    if not isinstance(manifest, dict) or not manifest:
+        raise PatchError("Result has no manifest")
+    if manifest.get("manifest_version", 3) != 3:
+        raise PatchError("manifest_version must be 3")
+    files = result.get("files")
+    if not isinstance(files, dict) or not files:
+        raise PatchError("Result has no files")
+    for name, content in files.items():
+        if not isinstance(content, str):
+            raise PatchError(f"File {name} must be a string")
+    return result
+
+
+def resolve_answer(answer, base):
+    """
+    Turn a refinement-mode answer into a full extension dict.
+    Returns (result, mode) with mode "delta" or "full" (the model ignored
+    refinement mode and sent everything, which is fine too).
+    """
+    if isinstance(answer, dict) and "patch" in answer:
+        result = apply_patch(base, answer["patch"])
+        result["analysis"] = answer.get("analysis", "")
+        return validate_result(result), "delta"
+    return validate_result(answer), "full"
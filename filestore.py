@@ -0,0 +1,541 @@
+"""
+Content-addressed file store with one directory per generation.
+
+Every file body is stored once under blobs/<sha[:2]>/<sha> and hardlinked
+into generations/<generation_id>/<name>, so a file that did not change
+between refinement turns costs neither disk space nor a write. Each
+generation also has a small JSON record (generations/<id>.json) listing
+its files, which is enough to re-create the directory at any time.
+
+    root/
+      blobs/ab/ab12...          read-only file bodies
+      blobs/ab/ab12....stored   when a blob was last stored again (see blob_grace)
+      generations/<id>/...      materialised extension (hardlinks)
+      generations/<id>.json     {"id", "created", "session_id", "files": {name: sha}, "meta"}
+      workspaces/<name>/...     stable, incrementally synced copy of a generation
+
+gc() enforces a maximum age and a disk quota, oldest generations first.
+"""
+import codecs
+import contextlib
+import hashlib
+import json
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import uuid
+
+
+def safe_relpath(name):
+    """Normalise a generated file name; reject absolute or escaping paths."""
+    norm = os.path.normpath(name.replace("\\", "/")).replace(os.sep, "/")
+    if not name or os.path.isabs(norm) or norm == ".." or norm.startswith("../") \
+            or norm == "." or ":" in norm.split("/")[0]:
+        raise ValueError(f"Unsafe file name: {name!r}")
+    return norm
+
+
+INDEX_NAME = ".forge_index.json"
+TMP_DIR = "tmp"  # under blobs/: blobs still being written (see BlobWriter)
+STORED_SUFFIX = ".stored"  # next to a blob: touched when it's stored again
+
+
+def diff_files(old, new):
+    """Compare two {name: sha} maps into added / changed / removed / unchanged."""
+    return {
+        "added": sorted(name for name in new if name not in old),
+        "changed": sorted(name for name in new if name in old and old[name] != new[name]),
+        "removed": sorted(name for name in old if name not in new),
+        "unchanged": sorted(name for name in new if old.get(name) == new[name]),
+    }
+
+
+def _atomic_write(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+class Generation:
+    def __init__(self, store, record):
+        self.store = store
+        self.id = record["id"]
+        self.created = record["created"]
+        self.session_id = record.get("session_id")
+        self.files = record["files"]  # name -> sha256
+        self.meta = record.get("meta") or {}
+
+    @property
+    def path(self):
+        return os.path.abspath(os.path.join(self.store.generations_dir, self.id))
+
+    def read(self, name):
+        """Bytes of one file of this generation (straight from the blob)."""
+        return self.store.read_blob(self.files[name])
+
+    def binary_files(self):
+        """{name: sha} of the files that aren't UTF-8 text (icons, uploaded assets)."""
+        binary = {}
+        for name, sha in self.files.items():
+            decoder = codecs.getincrementaldecoder("utf-8")()
+            try:
+                with open(self.store.blob_path(sha), "rb") as f:
+                    for chunk in iter(lambda: f.read(65536), b""):
+                        decoder.decode(chunk)
+                decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                binary[name] = sha
+        return binary
+
+    def size(self):
+        """Total bytes of this generation's files."""
+        return sum(os.path.getsize(self.store.blob_path(sha)) for sha in self.files.values())
+
+    def to_dict(self):
+        return {
+            "generation_id": self.id,
+            "created": self.created,
+            "session_id": self.session_id,
+            "files": sorted(self.files),
+            "meta": self.meta,
+        }
+
+
+class GenerationWriter:
+    """
+    Builds one generation file by file (so streaming callers can add files
+    as they arrive); commit() records it, abort() throws it away.
+    """
+
+    def __init__(self, store, gen_id, session_id=None):
+        self.store = store
+        self.id = gen_id
+        self.session_id = session_id
+        self.files = {}
+        self.path = os.path.abspath(os.path.join(store.generations_dir, gen_id))
+        os.makedirs(self.path)
+
+    def add(self, name, data):
+        """Store `data` (bytes or str) as `name`; returns the normalised name."""
+        name = safe_relpath(name)
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        return self._link(name, self.store.put_blob(data), data)
+
+    def link(self, name, sha):
+        """Add `name` as a blob already in the store (e.g. from an earlier generation)."""
+        return self._link(safe_relpath(name), sha)
+
+    def open(self, name):
+        """
+        A binary file object for `name`, written straight to the blob store
+        (so a big upload never sits in memory); it's added by close().
+        """
+        return _GenerationFile(self, safe_relpath(name), self.store.open_blob())
+
+    def _link(self, name, sha, data=None):
+        self.files[name] = sha  # (referenced from here on, so GC leaves it)
+        dest = os.path.join(self.path, name)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        if os.path.lexists(dest):
+            os.remove(dest)
+        self.store.link_blob(sha, dest, data)
+        return name
+
+    def commit(self, meta=None):
+        record = {
+            "id": self.id,
+            "created": time.time(),
+            "session_id": self.session_id,
+            "files": self.files,
+            "meta": meta or {},
+        }
+        _atomic_write(self.store.record_path(self.id), json.dumps(record).encode("utf-8"))
+        self.store.writer_done(self)
+        return Generation(self.store, record)
+
+    def abort(self):
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.store.writer_done(self)
+
+
+class BlobWriter:
+    """
+    A blob written in pieces: hashed while it goes to a temporary file,
+    which close() moves under its sha256 (and returns that).
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.size = 0
+        self._hash = hashlib.sha256()
+        tmp_dir = os.path.join(store.blobs_dir, TMP_DIR)
+        os.makedirs(tmp_dir, exist_ok=True)
+        fd, self._tmp = tempfile.mkstemp(dir=tmp_dir, suffix=".tmp")
+        self._file = os.fdopen(fd, "wb")
+
+    def write(self, data):
+        self._hash.update(data)
+        self._file.write(data)
+        self.size += len(data)
+
+    def close(self):
+        self._file.close()
+        sha = self._hash.hexdigest()
+        path = self.store.blob_path(sha)
+        if os.path.exists(path):
+            os.remove(self._tmp)
+            self.store.blob_stored(path)
+            return sha
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(self._tmp, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        os.replace(self._tmp, path)
+        return sha
+
+    def discard(self):
+        self._file.close()
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(self._tmp)
+
+
+class _GenerationFile:
+    """GenerationWriter.open(): a BlobWriter that adds itself on close()."""
+
+    def __init__(self, writer, name, blob):
+        self.writer = writer
+        self.name = name
+        self._blob = blob
+
+    def write(self, data):
+        self._blob.write(data)
+
+    def close(self):
+        self.writer._link(self.name, self._blob.close())
+
+    def discard(self):
+        self._blob.discard()
+
+
+class FileStore:
+    """
+    - root: store directory.
+    - max_bytes: disk quota for blob bytes (None = unlimited).
+    - max_age: seconds after which generations are collected (None = never).
+    - blob_grace: unreferenced blobs younger than this are left alone, since
+      another process sharing the store may be writing a generation that
+      uses them. A blob stored again counts as new: its <sha>.stored
+      sidecar is touched, not the blob, whose inode is shared with
+      workspace files that must keep their mtime.
+    """
+
+    def __init__(self, root, max_bytes=None, max_age=None, blob_grace=0.0):
+        self.root = root
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.generations_dir = os.path.join(root, "generations")
+        self.workspaces_dir = os.path.join(root, "workspaces")
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.blob_grace = blob_grace
+        self._lock = threading.Lock()
+        self._writers = {}
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.generations_dir, exist_ok=True)
+        os.makedirs(self.workspaces_dir, exist_ok=True)
+
+    # ------------------------------------------------------------------
+    # Blobs
+    # ------------------------------------------------------------------
+
+    def blob_path(self, sha):
+        return os.path.join(self.blobs_dir, sha[:2], sha)
+
+    def put_blob(self, data):
+        sha = hashlib.sha256(data).hexdigest()
+        path = self.blob_path(sha)
+        if os.path.exists(path):
+            self.blob_stored(path)
+            return sha
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        _atomic_write(path, data)
+        os.chmod(path, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+        return sha
+
+    def blob_stored(self, path):
+        """Restart an existing blob's grace period (a no-op without blob_grace)."""
+        if not self.blob_grace:
+            return
+        marker = path + STORED_SUFFIX
+        try:
+            with open(marker, "ab"):
+                pass
+            os.utime(marker)
+        except OSError:
+            pass  # collected just now; link_blob() stores it again
+
+    def _blob_age(self, path, now):
+        """Seconds since the blob at `path` was last stored."""
+        try:
+            stored = os.path.getmtime(path + STORED_SUFFIX)
+        except OSError:
+            stored = 0.0
+        return now - max(os.path.getmtime(path), stored)
+
+    def open_blob(self):
+        """A BlobWriter, for a blob too big to hold in memory."""
+        return BlobWriter(self)
+
+    def read_blob(self, sha):
+        with open(self.blob_path(sha), "rb") as f:
+            return f.read()
+
+    def link_blob(self, sha, dest, data=None):
+        """Hardlink a blob to dest (falls back to a copy across devices)."""
+        src = self.blob_path(sha)
+        try:
+            os.link(src, dest)
+            return
+        except FileNotFoundError:
+            # Collected between put and link: store it again.
+            if data is None:
+                raise
+            self.put_blob(data)
+        except OSError:
+            pass
+        try:
+            os.link(src, dest)
+        except OSError:
+            shutil.copyfile(src, dest)
+
+    # ------------------------------------------------------------------
+    # Generations
+    # ------------------------------------------------------------------
+
+    def record_path(self, gen_id):
+        return os.path.join(self.generations_dir, gen_id + ".json")
+
+    def begin(self, session_id=None):
+        gen_id = f"{int(time.time() * 1000):013d}-{uuid.uuid4().hex[:8]}"
+        writer = GenerationWriter(self, gen_id, session_id)
+        with self._lock:
+            self._writers[gen_id] = writer
+        return writer
+
+    def writer_done(self, writer):
+        with self._lock:
+            self._writers.pop(writer.id, None)
+
+    def get(self, gen_id):
+        try:
+            safe_relpath(gen_id)
+            with open(self.record_path(gen_id), "r", encoding="utf-8") as f:
+                return Generation(self, json.load(f))
+        except (OSError, ValueError):
+            return None
+
+    def list(self, session_id=None):
+        """Generations (oldest first), optionally only one session's."""
+        generations = []
+        for name in sorted(os.listdir(self.generations_dir)):
+            if not name.endswith(".json"):
+                continue
+            gen = self.get(name[:-len(".json")])
+            if gen is not None and (session_id is None or gen.session_id == session_id):
+                generations.append(gen)
+        return generations
+
+    def materialize(self, gen_id):
+        """Make sure the generation's directory exists; returns the Generation."""
+        gen = self.get(gen_id)
+        if gen is None:
+            return None
+        for name, sha in gen.files.items():
+            dest = os.path.join(gen.path, name)
+            if os.path.exists(dest):
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            self.link_blob(sha, dest)
+        return gen
+
+    def remove(self, gen_id):
+        """Delete a generation's directory, record and sibling artifacts (<id>.*)."""
+        shutil.rmtree(os.path.join(self.generations_dir, gen_id), ignore_errors=True)
+        for name in os.listdir(self.generations_dir):
+            if name.startswith(gen_id + "."):
+                try:
+                    os.remove(os.path.join(self.generations_dir, name))
+                except OSError:
+                    pass
+
+    # ------------------------------------------------------------------
+    # Workspaces
+    # ------------------------------------------------------------------
+
+    def workspace_path(self, name):
+        return os.path.abspath(os.path.join(self.workspaces_dir, safe_relpath(name)))
+
+    def sync(self, target, files):
+        """
+        Bring directory `target` in line with `files` ({name: sha}) touching
+        only what differs from the index left there by the previous sync:
+        new / changed files are swapped in atomically, vanished ones are
+        deleted, identical ones keep their inode and mtime.
+        Returns the diff_files() report.
+        """
+        os.makedirs(target, exist_ok=True)
+        index_path = os.path.join(target, INDEX_NAME)
+        try:
+            with open(index_path, "r", encoding="utf-8") as f:
+                old = json.load(f)
+        except (OSError, ValueError):
+            old = {}
+
+        changes = diff_files(old, files)
+
+        for name in changes["added"] + changes["changed"]:
+            self._swap_in(files[name], os.path.join(target, name))
+        for name in changes["unchanged"]:
+            dest = os.path.join(target, name)
+            if not os.path.exists(dest):
+                # Deleted by hand since the last sync: restore it.
+                self._swap_in(files[name], dest)
+        for name in changes["removed"]:
+            dest = os.path.join(target, name)
+            try:
+                os.remove(dest)
+            except OSError:
+                continue
+            # Prune directories left empty.
+            folder = os.path.dirname(dest)
+            while os.path.abspath(folder) != os.path.abspath(target):
+                try:
+                    os.rmdir(folder)
+                except OSError:
+                    break
+                folder = os.path.dirname(folder)
+
+        _atomic_write(index_path, json.dumps(files, sort_keys=True).encode("utf-8"))
+        return changes
+
+    def _swap_in(self, sha, dest):
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        tmp = dest + ".forge-tmp"
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        self.link_blob(sha, tmp)
+        os.replace(tmp, dest)
+
+    def remove_workspace(self, name):
+        shutil.rmtree(self.workspace_path(name), ignore_errors=True)
+
+    # ------------------------------------------------------------------
+    # Garbage collection
+    # ------------------------------------------------------------------
+
+    def gc(self, keep=(), keep_workspaces=()):
+        """
+        Drop generations older than max_age, then the oldest ones until the
+        referenced blobs fit in max_bytes, then every unreferenced blob.
+        Generations in `keep` and ones still being written are spared.
+        Workspaces not in `keep_workspaces` and idle past max_age go too.
+        Returns {"generations": n_removed, "blobs": n_removed, "bytes": total}.
+        """
+        keep = set(keep)
+        now = time.time()
+
+        if self.max_age:
+            keep_workspaces = set(keep_workspaces)
+            for name in os.listdir(self.workspaces_dir):
+                index_path = os.path.join(self.workspaces_dir, name, INDEX_NAME)
+                try:
+                    idle = now - os.path.getmtime(index_path)
+                except OSError:
+                    idle = self.max_age + 1
+                if name not in keep_workspaces and idle > self.max_age:
+                    self.remove_workspace(name)
+
+        generations = self.list()
+        sizes = {}
+
+        def blob_size(sha):
+            if sha not in sizes:
+                try:
+                    sizes[sha] = os.path.getsize(self.blob_path(sha))
+                except OSError:
+                    sizes[sha] = 0
+            return sizes[sha]
+
+        removed = 0
+        alive = []
+        for gen in generations:
+            if self.max_age and now - gen.created > self.max_age and gen.id not in keep:
+                self.remove(gen.id)
+                removed += 1
+            else:
+                alive.append(gen)
+
+        def referenced():
+            shas = set()
+            for gen in alive:
+                shas.update(gen.files.values())
+            return shas
+
+        if self.max_bytes:
+            total = sum(blob_size(sha) for sha in referenced())
+            for gen in list(alive):
+                if total <= self.max_bytes:
+                    break
+                if gen.id in keep:
+                    continue
+                alive.remove(gen)
+                self.remove(gen.id)
+                removed += 1
+                total = sum(blob_size(sha) for sha in referenced())
+
+        live = referenced()
+        with self._lock:
+            for writer in self._writers.values():
+                live.update(writer.files.values())
+            # Writers that committed since the listing above (writer_done()
+            # needs the lock, so none can slip through from here on).
+            listed = {gen.id for gen in generations}
+            for gen in self.list():
+                if gen.id not in listed:
+                    live.update(gen.files.values())
+            blobs_removed = 0
+            for sub in os.listdir(self.blobs_dir):
+                sub_dir = os.path.join(self.blobs_dir, sub)
+                for sha in os.listdir(sub_dir):
+                    path = os.path.join(sub_dir, sha)
+                    if sha.endswith(STORED_SUFFIX):
+                        # Left behind by a blob collected elsewhere.
+                        if not os.path.exists(path[:-len(STORED_SUFFIX)]):
+                            with contextlib.suppress(OSError):
+                                if now - os.path.getmtime(path) >= self.blob_grace:
+                                    os.remove(path)
+                        continue
+                    if sha in live or sha.endswith(".tmp"):
+                        continue
+                    try:
+                        if self.blob_grace and self._blob_age(path, now) < self.blob_grace:
+                            continue
+                        os.remove(path)
+                    except FileNotFoundError:
+                        continue  # collected by another process
+                    with contextlib.suppress(FileNotFoundError):
+                        os.remove(path + STORED_SUFFIX)
+                    blobs_removed += 1
+
+        return {
+            "generations": removed,
+            "blobs": blobs_removed,
+            "bytes": sum(blob_size(sha) for sha in live),
+        }
@@ -0,0 +1,635 @@
+"""
+Streaming, size-bounded reader for /save uploads.
+
+A saved extension used to arrive as one JSON body that was parsed whole
+(request.json), so a big upload sat in memory several times over, and a
+file could only be text. Ingestor.read() parses the body as it streams in
+and writes file contents to disk as they are decoded; only the small
+values (manifest, analysis, readme) and a bounded amount of text are kept
+in memory, so peak memory doesn't grow with the payload.
+
+Two body formats:
+
+- application/json: { "manifest": {...}, "files": {...}, "readme": "..." }
+  where a "files" value is text, a data: URI with base64 data
+  ("data:image/png;base64,iVBOR..."), or {"base64": "iVBOR..."}.
+- multipart/form-data: a "data" part with that JSON object, plus one part
+  per binary asset, stored under its filename (which may hold a path,
+  e.g. "icons/icon16.png"); Content-Transfer-Encoding: base64 is decoded.
+  Other parts without a filename are taken as top-level values
+  ("manifest" as JSON, anything else as text).
+
+Text files go into Payload.result["files"] while they fit the inline
+budget (the caller expands and validates them); binary assets, and text
+past the budget, are written through open_file(name) -> a binary file
+object and listed in Payload.assets. Every limit breach raises
+PayloadTooLarge (HTTP 413), anything malformed IngestError (400).
+"""
+import binascii
+import collections
+import json
+import re
+import threading
+
+CHUNK = 64 * 1024
+MAX_NAME_BYTES = 1024
+MAX_HEADER_BYTES = 16 * 1024  # of one multipart part's headers
+DATA_URI_SNIFF = 256  # bytes of a "files" string that may still be a data: URI prefix
+
+_WHITESPACE = b" \t\r\n"
+_ESCAPES = {ord('"'): b'"', ord("\\"): b"\\", ord("/"): b"/", ord("b"): b"\b",
+            ord("f"): b"\f", ord("n"): b"\n", ord("r"): b"\r", ord("t"): b"\t"}
+_SCALAR = re.compile(rb"[-+0-9.eEa-z]+")
+_PARAM = re.compile(r';\s*([\w-]+)\s*=\s*("(?:[^"\\]|\\.)*"|[^;]*)')
+
+
+class IngestError(ValueError):
+    """A malformed upload."""
+    status = 400
+
+
+class PayloadTooLarge(IngestError):
+    """An upload over one of the size limits."""
+    status = 413
+
+
+class UploadTimeout(IngestError):
+    """The client stopped sending an upload part way through."""
+    status = 408
+
+
+def _size(n):
+    return f"{n} B" if n < 1024 else f"{n / 1024:.0f} KB" if n < 1024 * 1024 \
+        else f"{n / (1024 * 1024):.0f} MB"
+
+
+def header_params(value):
+    """("form-data", {"name": ..., "filename": ...}) from a header value."""
+    value = value or ""
+    main = value.split(";", 1)[0].strip().lower()
+    params = {}
+    for key, raw in _PARAM.findall(value):
+        raw = raw.strip()
+        if raw.startswith('"'):
+            raw = re.sub(r"\\(.)", r"\1", raw[1:-1])
+        params[key.lower()] = raw
+    return main, params
+
+
+class Payload:
+    def __init__(self):
+        self.result = {"files": {}}  # { manifest, files (text), readme, ... }
+        self.assets = {}  # name -> bytes, written through open_file()
+        self.received = 0  # body bytes read
+
+
+# ----------------------------------------------------------------------
+# Byte sources
+# ----------------------------------------------------------------------
+
+class _Source:
+    """Buffered reads from a stream, at most `limit` bytes in all."""
+
+    def __init__(self, stream, limit=None):
+        self._stream = stream
+        self._limit = limit
+        self.buf = b""
+        self.pos = 0
+        self.received = 0
+
+    def fill(self):
+        """Read more into the buffer (dropping what was consumed); False at the end."""
+        data = self._stream.read(CHUNK)
+        if not data:
+            return False
+        self.received += len(data)
+        if self._limit and self.received > self._limit:
+            raise PayloadTooLarge(f"Upload is over the {_size(self._limit)} limit")
+        self.buf = self.buf[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def ensure(self, n):
+        """At least n unread bytes buffered, or IngestError."""
+        while len(self.buf) - self.pos < n:
+            if not self.fill():
+                raise IngestError("Upload ended too early")
+
+    def read(self, n=CHUNK):
+        """Up to n unread bytes (b"" at the end), like a file's read()."""
+        if self.pos >= len(self.buf) and not self.fill():
+            return b""
+        data = self.buf[self.pos:self.pos + n]
+        self.pos += len(data)
+        return data
+
+
+class _Part:
+    """
+    One multipart part's body, as a stream: reads stop at the boundary
+    delimiter, which is consumed (and whether it closed the body noted).
+    """
+
+    def __init__(self, source, delimiter):
+        self._source = source
+        self._delimiter = delimiter  # b"\r\n--" + boundary
+        self.done = False
+        self.last = False
+
+    def read(self, n=CHUNK):
+        source = self._source
+        keep = len(self._delimiter) - 1
+        while not self.done:
+            found = source.buf.find(self._delimiter, source.pos)
+            if found >= 0:
+                end = min(found, source.pos + n)
+                data = source.buf[source.pos:end]
+                source.pos = end
+                if end == found:
+                    source.pos += len(self._delimiter)
+                    source.ensure(2)
+                    self.last = source.buf[source.pos:source.pos + 2] == b"--"
+                    self.done = True
+                if data:
+                    return data
+                continue
+            # Everything but a possible start of the delimiter can go.
+            safe = len(source.buf) - keep
+            if safe > source.pos:
+                end = min(safe, source.pos + n)
+                data = source.buf[source.pos:end]
+                source.pos = end
+                return data
+            if not source.fill():
+                raise IngestError("Multipart body ended inside a part")
+        return b""
+
+
+# ----------------------------------------------------------------------
+# Decoding file contents
+# ----------------------------------------------------------------------
+
+class _Base64:
+    """Streaming base64 decoder in front of write(bytes)."""
+
+    def __init__(self, write):
+        self._write = write
+        self._rest = b""
+
+    def write(self, data):
+        data = self._rest + data.translate(None, _WHITESPACE)
+        cut = len(data) - len(data) % 4
+        self._rest = data[cut:]
+        if cut:
+            self._decode(data[:cut])
+
+    def close(self):
+        if self._rest:
+            raise IngestError("Truncated base64 data")
+
+    def _decode(self, data):
+        try:
+            self._write(binascii.a2b_base64(data, strict_mode=True))
+        except binascii.Error as e:
+            raise IngestError(f"Invalid base64 data: {e}") from None
+
+
+class _File:
+    """
+    One entry of "files" being received: text kept inline while the budget
+    allows, else (and for binary data) written through open_file().
+    """
+
+    def __init__(self, ingest, name, binary=False, base64=True, sniff=False):
+        self.ingest = ingest
+        self.name = name
+        self.size = 0
+        self.binary = False
+        self._inline = bytearray()
+        self._file = None
+        self._decoder = None
+        self._head = bytearray() if sniff else None  # a data: URI prefix?
+        if binary:
+            self._binary(base64)
+
+    def _binary(self, base64=True):
+        self.binary = True
+        if base64:
+            self._decoder = _Base64(self._emit)
+
+    def write(self, data):
+        if self._head is not None:
+            self._head += data
+            if len(self._head) < DATA_URI_SNIFF and b"," not in self._head \
+                    and b"data:".startswith(bytes(self._head[:5])):
+                return
+            self._sniffed()
+            return
+        if self._decoder is not None:
+            self._decoder.write(data)
+        else:
+            self._emit(data)
+
+    def _sniffed(self):
+        head, self._head = bytes(self._head), None
+        prefix, comma, rest = head.partition(b",")
+        if comma and prefix.startswith(b"data:") and prefix.endswith(b";base64"):
+            self._binary()
+            self.write(rest)
+        else:
+            self.write(head)
+
+    def _emit(self, data):
+        """Decoded content: check the limits, then keep it or write it out."""
+        ingest = self.ingest
+        self.size += len(data)
+        ingest.total += len(data)
+        if ingest.max_file and self.size > ingest.max_file:
+            raise PayloadTooLarge(f"{self.name} is over the {_size(ingest.max_file)} per-file limit")
+        if ingest.max_total and ingest.total > ingest.max_total:
+            raise PayloadTooLarge(f"Files are over the {_size(ingest.max_total)} total limit")
+        if self._file is None and not self.binary and ingest.inline_room() >= len(data):
+            self._inline += data
+            ingest.inline += len(data)
+            return
+        if self._file is None:
+            self._file = ingest.open(self.name)
+            if self._inline:
+                ingest.inline -= len(self._inline)
+                self._file.write(bytes(self._inline))
+                self._inline = bytearray()
+        self._file.write(data)
+
+    def close(self):
+        if self._head is not None:
+            self._sniffed()
+        if self._decoder is not None:
+            self._decoder.close()
+        payload = self.ingest.payload
+        payload.result["files"].pop(self.name, None)
+        payload.assets.pop(self.name, None)
+        if self._file is not None or self.binary:
+            if self._file is None:
+                self._file = self.ingest.open(self.name)  # an empty asset
+            self._file.close()
+            self._file = None
+            payload.assets[self.name] = self.size
+            return
+        try:
+            payload.result["files"][self.name] = self._inline.decode("utf-8")
+        except UnicodeDecodeError:
+            raise IngestError(f"{self.name} is not UTF-8 text; send it as base64") from None
+
+    def discard(self):
+        if self._file is not None:
+            getattr(self._file, "discard", self._file.close)()
+            self._file = None
+
+
+# ----------------------------------------------------------------------
+# JSON
+# ----------------------------------------------------------------------
+
+class _JSON:
+    """Pull parser for the upload's JSON object, over a _Source."""
+
+    def __init__(self, source, ingest):
+        self.src = source
+        self.ingest = ingest
+
+    def _peek(self):
+        src = self.src
+        while True:
+            while src.pos < len(src.buf) and src.buf[src.pos] in _WHITESPACE:
+                src.pos += 1
+            if src.pos < len(src.buf):
+                return src.buf[src.pos]
+            if not src.fill():
+                return None
+
+    def _expect(self, char):
+        if self._peek() != ord(char):
+            found = self._peek()
+            raise IngestError(f"Malformed JSON: expected {char!r}, found "
+                              f"{'the end' if found is None else repr(chr(found))}")
+        self.src.pos += 1
+
+    def _members(self):
+        """Yield the keys of an object, leaving the reader at each value."""
+        self._expect("{")
+        if self._peek() == ord("}"):
+            self.src.pos += 1
+            return
+        while True:
+            key = self._text(MAX_NAME_BYTES, "A key")
+            self._expect(":")
+            yield key
+            if self._peek() == ord(","):
+                self.src.pos += 1
+                continue
+            self._expect("}")
+            return
+
+    def _string(self, write):
+        """Decode a JSON string into write(bytes) pieces."""
+        self._expect('"')
+        src = self.src
+        while True:
+            if src.pos >= len(src.buf) and not src.fill():
+                raise IngestError("Malformed JSON: unterminated string")
+            buf, i = src.buf, src.pos
+            quote = buf.find(b'"', i)
+            slash = buf.find(b"\\", i, quote if quote >= 0 else len(buf))
+            end = slash if slash >= 0 else quote if quote >= 0 else len(buf)
+            if end > i:
+                write(buf[i:end])
+            src.pos = end
+            if end == len(buf):
+                continue
+            if end == quote:
+                src.pos += 1
+                return
+            src.ensure(2)
+            code = src.buf[src.pos + 1]
+            if code != ord("u"):
+                if code not in _ESCAPES:
+                    raise IngestError(f"Malformed JSON: bad escape \\{chr(code)}")
+                write(_ESCAPES[code])
+                src.pos += 2
+                continue
+            src.ensure(6)
+            point = self._hex(src.pos + 2)
+            src.pos += 6
+            if 0xD800 <= point < 0xDC00:
+                try:
+                    src.ensure(6)
+                except IngestError:
+                    pass
+                if src.buf[src.pos:src.pos + 2] == b"\\u":
+                    low = self._hex(src.pos + 2)
+                    if 0xDC00 <= low < 0xE000:
+                        point = 0x10000 + ((point - 0xD800) << 10) + (low - 0xDC00)
+                        src.pos += 6
+            write(chr(point).encode("utf-8", "surrogatepass"))
+
+    def _hex(self, at):
+        try:
+            return int(self.src.buf[at:at + 4], 16)
+        except ValueError:
+            raise IngestError("Malformed JSON: bad \\u escape") from None
+
+    def _text(self, limit, what):
+        out = bytearray()
+
+        def write(data):
+            out.extend(data)
+            if len(out) > limit:
+                raise PayloadTooLarge(f"{what} is over the {_size(limit)} limit")
+
+        self._string(write)
+        return out.decode("utf-8", "replace")
+
+    def value(self, limit, what):
+        """Any JSON value as a Python object, at most `limit` bytes of it."""
+        start = self.src.received - (len(self.src.buf) - self.src.pos)
+        value = self._value(lambda: self._check(start, limit, what), limit, what)
+        self._check(start, limit, what)
+        return value
+
+    def _check(self, start, limit, what):
+        if self.src.received - (len(self.src.buf) - self.src.pos) - start > limit:
+            raise PayloadTooLarge(f"{what} is over the {_size(limit)} limit")
+
+    def _value(self, check, limit, what):
+        char = self._peek()
+        if char == ord("{"):
+            out = {}
+            for key in self._members():
+                out[key] = self._value(check, limit, what)
+                check()
+            return out
+        if char == ord("["):
+            self.src.pos += 1
+            out = []
+            if self._peek() == ord("]"):
+                self.src.pos += 1
+                return out
+            while True:
+                out.append(self._value(check, limit, what))
+                check()
+                if self._peek() == ord(","):
+                    self.src.pos += 1
+                    continue
+                self._expect("]")
+                return out
+        if char == ord('"'):
+            return self._text(limit, what)
+        if char is None:
+            raise IngestError("Malformed JSON: the body ended early")
+        src = self.src
+        while True:
+            match = _SCALAR.match(src.buf, src.pos)
+            end = match.end() if match else src.pos
+            if end < len(src.buf) or not src.fill():
+                break
+        try:
+            value = json.loads(src.buf[src.pos:end])
+        except ValueError:
+            raise IngestError(f"Malformed JSON near {src.buf[src.pos:src.pos + 20]!r}") from None
+        src.pos = end
+        return value
+
+    def document(self):
+        """Read the top-level object into the payload."""
+        ingest = self.ingest
+        for key in self._members():
+            if key == "files":
+                self._files()
+            else:
+                ingest.payload.result[key] = self.value(ingest.max_value, key)
+        if self._peek() is not None:
+            raise IngestError("Malformed JSON: data after the object")
+
+    def _files(self):
+        if self._peek() == ord("n"):  # "files": null
+            self.value(8, "files")
+            return
+        for name in self._members():
+            char = self._peek()
+            if char == ord('"'):
+                self.ingest.receive(name, self._string, sniff=True)
+            elif char == ord("{"):
+                found = False
+                for key in self._members():
+                    if key != "base64" or found:
+                        raise IngestError(f'{name}: a file object holds just {{"base64": ...}}')
+                    found = True
+                    self.ingest.receive(name, self._string, binary=True)
+                if not found:
+                    raise IngestError(f'{name}: a file object holds just {{"base64": ...}}')
+            else:
+                raise IngestError(f"{name}: a file is a string or {{\"base64\": ...}}")
+
+
+# ----------------------------------------------------------------------
+
+class _Ingest:
+    """State of one upload being read."""
+
+    def __init__(self, ingestor, open_file):
+        self.max_file = ingestor.max_file
+        self.max_total = ingestor.max_total
+        self.max_files = ingestor.max_files
+        self.max_inline = ingestor.max_inline
+        self.max_value = ingestor.max_value
+        self.open_file = open_file
+        self.payload = Payload()
+        self.total = 0  # decoded file bytes
+        self.inline = 0  # of which kept in memory
+        self.files = 0
+
+    def inline_room(self):
+        return self.max_inline - self.inline
+
+    def open(self, name):
+        try:
+            return self.open_file(name)
+        except ValueError as e:  # e.g. an unsafe file name
+            raise IngestError(str(e)) from None
+
+    def receive(self, name, read, binary=False, base64=True, sniff=False):
+        """Receive one file: read(write) feeds its content to a _File."""
+        self.files += 1
+        if self.max_files and self.files > self.max_files:
+            raise PayloadTooLarge(f"Upload has more than {self.max_files} files")
+        entry = _File(self, name, binary=binary, base64=base64, sniff=sniff)
+        try:
+            read(entry.write)
+            entry.close()
+        except BaseException:
+            entry.discard()
+            raise
+        return entry
+
+    def multipart(self, source, boundary):
+        delimiter = b"\r\n--" + boundary.encode("latin-1")
+        # The first delimiter has no CRLF in front of it when there's no preamble.
+        source.buf, source.pos = b"\r\n", 0
+        part = _Part(source, delimiter)
+        while part.read():
+            pass  # the preamble
+        while not part.last:
+            source.ensure(2)
+            if source.buf[source.pos:source.pos + 2] != b"\r\n":
+                raise IngestError("Malformed multipart body")
+            source.pos += 2
+            headers = self._part_headers(source)
+            part = _Part(source, delimiter)
+            _, disposition = header_params(headers.get("content-disposition"))
+            name = disposition.get("name", "")
+            encoding = headers.get("content-transfer-encoding", "").strip().lower()
+            filename = disposition.get("filename")
+            if filename:
+                def read(write, part=part):
+                    for data in iter(part.read, b""):
+                        write(data)
+                self.receive(filename, read, binary=True, base64=encoding == "base64")
+            elif name in ("data", "manifest"):
+                parser = _JSON(_Source(part), self)
+                if name == "data":
+                    parser.document()
+                else:
+                    self.payload.result["manifest"] = parser.value(self.max_value, "manifest")
+                while part.read():
+                    pass
+            else:
+                value = bytearray()
+                for data in iter(part.read, b""):
+                    value += data
+                    if len(value) > self.max_value:
+                        raise PayloadTooLarge(f"{name} is over the {_size(self.max_value)} limit")
+                self.payload.result[name] = value.decode("utf-8", "replace")
+
+    @staticmethod
+    def _part_headers(source):
+        while True:
+            end = source.buf.find(b"\r\n\r\n", source.pos)
+            if end >= 0:
+                break
+            if len(source.buf) - source.pos > MAX_HEADER_BYTES:
+                raise PayloadTooLarge("Multipart part headers are too large")
+            if not source.fill():
+                raise IngestError("Multipart body ended inside part headers")
+        raw = source.buf[source.pos:end].decode("utf-8", "replace")
+        source.pos = end + 4
+        headers = {}
+        for line in raw.split("\r\n"):
+            key, sep, value = line.partition(":")
+            if sep:
+                headers[key.strip().lower()] = value.strip()
+        return headers
+
+
+class Ingestor:
+    """
+    - max_body: request body bytes (as sent, so base64 counts 4/3).
+    - max_file / max_total: decoded bytes per file / of all files.
+    - max_files: entries of "files" plus multipart file parts.
+    - max_inline: text file bytes kept in memory (for skeleton expansion
+      and validation); text past it is written out like an asset.
+    - max_value: bytes of each other value (manifest, readme, analysis).
+    """
+
+    def __init__(self, max_body=256 * 1024 * 1024, max_file=16 * 1024 * 1024,
+                 max_total=128 * 1024 * 1024, max_files=1000, max_inline=8 * 1024 * 1024,
+                 max_value=1024 * 1024):
+        self.max_body = max_body
+        self.max_file = max_file
+        self.max_total = max_total
+        self.max_files = max_files
+        self.max_inline = max_inline
+        self.max_value = max_value
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+
+    def read(self, stream, content_type, open_file):
+        """
+        Parse an upload from `stream` (anything with read(n)); returns its
+        Payload. open_file(name) gives a binary file object for an asset
+        (closed when it's complete; its discard(), if any, is called
+        instead when the upload fails).
+        """
+        ingest = _Ingest(self, open_file)
+        source = _Source(stream, self.max_body)
+        kind, params = header_params(content_type)
+        try:
+            if kind == "multipart/form-data":
+                if not params.get("boundary"):
+                    raise IngestError("Multipart upload without a boundary")
+                ingest.multipart(source, params["boundary"])
+            else:
+                _JSON(source, ingest).document()
+        except IngestError as e:
+            self._count(rejected=1, too_large=int(isinstance(e, PayloadTooLarge)))
+            raise
+        payload = ingest.payload
+        payload.received = source.received
+        self._count(uploads=1, received_bytes=source.received,
+                    text_bytes=ingest.inline,
+                    asset_bytes=sum(payload.assets.values()), assets=len(payload.assets),
+                    multipart=int(kind == "multipart/form-data"))
+        return payload
+
+    def _count(self, **counts):
+        with self._lock:
+            self._stats.update(counts)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        for name in ("uploads", "multipart", "rejected", "too_large", "received_bytes",
+                     "text_bytes", "asset_bytes", "assets"):
+            stats.setdefault(name, 0)
+        stats["limits"] = {"body": self.max_body, "file": self.max_file, "total": self.max_total,
+                           "files": self.max_files, "inline": self.max_inline}
+        return stats
@@ -0,0 +1,179 @@
+"""
+Background job queue for long-running forges.
+
+A fixed pool of worker threads drains a bounded FIFO queue. submit()
+returns immediately with a Job (or raises QueueFull when the queue is at
+its depth limit, so the caller can answer with backpressure instead of
+tying up a request thread). Finished jobs are kept around for a while so
+clients can poll their status and fetch the result.
+
+The ASGI server runs its jobs as tasks on the event loop instead
+(submit_async()): a job waiting on the upstream then holds no thread.
+"""
+import asyncio
+import collections
+import queue
+import threading
+import time
+import uuid
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFull(RuntimeError):
+    """Raised by JobQueue.submit() when max_queue jobs are already waiting."""
+
+
+class Job:
+    def __init__(self, fn, args, kwargs):
+        self.id = uuid.uuid4().hex
+        self.state = QUEUED
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.result = None
+        self.error = None
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        return self._done.wait(timeout)
+
+    def to_dict(self):
+        now = time.time()
+        started = self.started or now
+        info = {
+            "job_id": self.id,
+            "state": self.state,
+            "created_at": self.created,
+            "queued_ms": int((started - self.created) * 1000),
+            "run_ms": int(((self.finished or now) - self.started) * 1000) if self.started else 0,
+        }
+        if self.error is not None:
+            info["error"] = self.error
+        return info
+
+
+class JobQueue:
+    """
+    - workers: number of worker threads running jobs.
+    - max_queue: jobs allowed to wait; submit() beyond this raises QueueFull.
+    - result_ttl: seconds finished jobs (and their results) are kept.
+    """
+
+    def __init__(self, workers=4, max_queue=64, result_ttl=3600.0):
+        self.workers = workers
+        self.max_queue = max_queue
+        self.result_ttl = result_ttl
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._jobs = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._threads = []
+        self._running = 0
+        self._tasks = set()  # submit_async() jobs in progress
+        self._stats = collections.Counter()
+
+    def _ensure_workers(self):
+        if self._threads:
+            return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"forge-job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, fn, *args, **kwargs):
+        job = Job(fn, args, kwargs)
+        with self._lock:
+            self._ensure_workers()
+            self._prune_locked()
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                self._stats["rejected"] += 1
+                raise QueueFull(f"Job queue is full ({self.max_queue} waiting)") from None
+            self._jobs[job.id] = job
+            self._stats["submitted"] += 1
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def submit_async(self, fn, *args, limit=None, **kwargs):
+        """
+        submit() for a coroutine function: the job runs right away as a task
+        on the running event loop and is polled like any other. Raises
+        QueueFull when `limit` such jobs are already running.
+        """
+        job = Job(fn, args, kwargs)
+        with self._lock:
+            self._prune_locked()
+            if limit is not None and len(self._tasks) >= limit:
+                self._stats["rejected"] += 1
+                raise QueueFull(f"Too many jobs running ({limit})")
+            self._jobs[job.id] = job
+            self._stats["submitted"] += 1
+        task = asyncio.get_running_loop().create_task(self._run_async(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    def _worker(self):
+        while True:
+            job = self._queue.get()
+            self._begin(job)
+            try:
+                job.result = job._fn(*job._args, **job._kwargs)
+                job.state = DONE
+            except Exception as e:
+                job.error = str(e)
+                job.state = FAILED
+            finally:
+                self._end(job)
+                self._queue.task_done()
+
+    async def _run_async(self, job):
+        self._begin(job)
+        try:
+            job.result = await job._fn(*job._args, **job._kwargs)
+            job.state = DONE
+        except Exception as e:
+            job.error = str(e)
+            job.state = FAILED
+        finally:
+            self._end(job)
+
+    def _begin(self, job):
+        with self._lock:
+            self._running += 1
+        job.state = RUNNING
+        job.started = time.time()
+
+    def _end(self, job):
+        job.finished = time.time()
+        job._fn = job._args = job._kwargs = None
+        with self._lock:
+            self._running -= 1
+            self._stats[job.state] += 1
+        job._done.set()
+
+    def _prune_locked(self):
+        cutoff = time.time() - self.result_ttl
+        for job_id, job in list(self._jobs.items()):
+            if job.finished is not None and job.finished < cutoff:
+                del self._jobs[job_id]
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["queued"] = self._queue.qsize()
+            stats["running"] = self._running
+            stats["tracked"] = len(self._jobs)
+        stats["workers"] = self.workers
+        stats["max_queue"] = self.max_queue
+        return stats
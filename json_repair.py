@@ -0,0 +1,377 @@
+"""
+Tolerant extraction and repair of the model's JSON answer.
+
+Models wrap the object in ```json fences, add prose around it, leave
+trailing commas, put raw newlines inside file strings, or get cut off at
+max_tokens. parse_answer() finds the object in the text and, when a plain
+json.loads() of it fails, rewrites it in one pass:
+
+- text before the first "{" and after the root object closes is dropped,
+- trailing commas and // or /* */ comments are removed, missing commas
+  between members are added,
+- raw control characters inside strings are escaped and invalid escapes
+  (\\' , \\x) are made literal,
+- Python literals (True / False / None) become JSON ones,
+- on truncation the member being written is dropped and every open
+  object / array is closed.
+
+The RepairReport says what was done and, crucially, which values were
+lost, so the caller can tell which files came through intact.
+"""
+import json
+import re
+
+# Inside a string: the characters that need attention.
+_STRING_SPECIAL = re.compile(r'["\\\x00-\x1f]')
+_LITERAL = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null|True|False|None")
+_PY_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+_VALID_ESCAPES = frozenset('"\\/bfnrtu')
+_WHITESPACE = " \t\r\n"
+
+# Repairs that only strip text around the object, leaving its values alone.
+WRAPPER_REPAIRS = frozenset({"leading_text", "trailing_text"})
+
+_decoder = json.JSONDecoder()
+
+
+class JSONRepairError(ValueError):
+    """The text holds no recoverable JSON object."""
+
+
+class RepairReport:
+    """
+    What parse_answer() had to do.
+    - repairs: {kind: count} of fixes applied (empty for clean input).
+    - truncated: the text ended before the root object closed.
+    - dropped: paths of members lost to truncation, e.g. ("files", "popup.js").
+    - incomplete: paths of containers that were closed artificially.
+    """
+
+    def __init__(self):
+        self.repairs = {}
+        self.truncated = False
+        self.dropped = []
+        self.incomplete = []
+
+    def note(self, kind):
+        self.repairs[kind] = self.repairs.get(kind, 0) + 1
+
+    @property
+    def repaired(self):
+        return bool(self.repairs) or self.truncated
+
+    def intact_files(self, result):
+        """Names in result["files"] that came through complete."""
+        files = result.get("files") if isinstance(result, dict) else None
+        if not isinstance(files, dict):
+            return []
+        lost = {path[1] for path in self.dropped if len(path) > 1 and path[0] == "files"}
+        return sorted(name for name in files if name not in lost)
+
+    def to_dict(self, result=None):
+        data = {
+            "repairs": dict(self.repairs),
+            "truncated": self.truncated,
+            "dropped": [_format_path(path) for path in self.dropped],
+            "incomplete": [_format_path(path) for path in self.incomplete],
+        }
+        if result is not None:
+            data["intact_files"] = self.intact_files(result)
+        return data
+
+
+def _format_path(path):
+    return "/".join(str(p) for p in path) or "(root)"
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "key", "index", "expect", "member_start")
+
+    def __init__(self, kind, path, member_start):
+        self.kind = kind  # "{" or "["
+        self.path = path
+        self.key = None
+        self.index = 0
+        # object: key -> colon -> value -> comma; array: value -> comma
+        self.expect = "key" if kind == "{" else "value"
+        self.member_start = member_start
+
+    def member_path(self):
+        return self.path + ((self.key,) if self.kind == "{" else (self.index,))
+
+
+def _closes_string(text, j, is_key):
+    """
+    Whether the quote at text[j] ends the string, judged by what follows:
+    a quote followed by anything but a delimiter was meant literally
+    (e.g. <div class="x"> inside a file).
+    """
+    n = len(text)
+    k = j + 1
+    while k < n and text[k] in _WHITESPACE:
+        k += 1
+    if k >= n:
+        # Can't tell; treating the value as unfinished is the safe side.
+        return False
+    nxt = text[k]
+    if is_key:
+        return nxt in ':"}'
+    if nxt in ",}]":
+        return True
+    # Next member on a new line without the comma between them.
+    return nxt == '"' and "\n" in text[j + 1:k]
+
+
+def _scan_string(text, i, out, report, is_key=False):
+    """
+    Copy the string starting at text[i] == '"' into out, repairing it.
+    Returns (end_index, value, closed).
+    """
+    pieces = []
+    n = len(text)
+    i += 1
+    while True:
+        m = _STRING_SPECIAL.search(text, i)
+        if m is None:
+            pieces.append(text[i:])
+            value = "".join(pieces)
+            out.append('"' + value + '"')
+            return n, value, False
+        j = m.start()
+        if j > i:
+            pieces.append(text[i:j])
+        c = text[j]
+        if c == '"':
+            if not _closes_string(text, j, is_key):
+                report.note("unescaped_quote")
+                pieces.append('\\"')
+                i = j + 1
+                continue
+            body = "".join(pieces)
+            out.append('"' + body + '"')
+            # Only keys are needed decoded; file contents stay as they are.
+            return j + 1, (json.loads('"' + body + '"') if is_key else None), True
+        if c == "\\":
+            if j + 1 >= n:
+                value = "".join(pieces)
+                out.append('"' + value + '"')
+                return n, value, False
+            nxt = text[j + 1]
+            if nxt in _VALID_ESCAPES:
+                if nxt == "u" and not re.match(r"[0-9a-fA-F]{4}", text[j + 2:j + 6]):
+                    report.note("invalid_escape")
+                    pieces.append("\\\\u")
+                else:
+                    pieces.append(text[j:j + 2])
+            elif nxt == "'":
+                report.note("invalid_escape")
+                pieces.append("'")
+            else:
+                report.note("invalid_escape")
+                pieces.append("\\\\")
+                i = j + 1
+                continue
+            i = j + 2
+            continue
+        # Raw control character inside a string.
+        report.note("control_character")
+        pieces.append(_CONTROL_ESCAPES.get(c) or "\\u%04x" % ord(c))
+        i = j + 1
+
+
+def repair_json(text, report=None):
+    """
+    Rewrite `text` (starting at or before the root "{") into valid JSON.
+    Returns (json_text, report).
+    """
+    report = report or RepairReport()
+    out = []
+    stack = []
+    n = len(text)
+    i = text.find("{")
+    if i < 0:
+        raise JSONRepairError("No JSON object found in the model output")
+    if text[:i].strip():
+        report.note("leading_text")
+
+    def value_done():
+        if stack:
+            stack[-1].expect = "comma"
+
+    def drop_trailing_comma():
+        if out and out[-1] == ",":
+            out.pop()
+            return True
+        return False
+
+    while i < n:
+        c = text[i]
+        if c in _WHITESPACE:
+            i += 1
+            continue
+        top = stack[-1] if stack else None
+
+        if top is not None and top.expect == "comma" and c not in ",}]:/":
+            # Two members with nothing between them.
+            report.note("missing_comma")
+            out.append(",")
+            top.expect = "key" if top.kind == "{" else "value"
+            top.member_start = len(out)
+            if top.kind == "[":
+                top.index += 1
+
+        if c in "{[":
+            if top is not None and top.expect not in ("value",):
+                if top.expect == "colon":
+                    report.note("missing_colon")
+                    out.append(":")
+                else:
+                    report.note("unexpected_token")
+                    i += 1
+                    continue
+            path = top.member_path() if top is not None else ()
+            out.append(c)
+            stack.append(_Frame(c, path, len(out)))
+            i += 1
+        elif c in "}]":
+            if top is None:
+                break
+            if drop_trailing_comma():
+                report.note("trailing_comma")
+            if top.expect in ("colon", "value") and top.kind == "{":
+                # "key" or "key": with no value before the brace.
+                report.note("dangling_key")
+                del out[top.member_start:]
+                drop_trailing_comma()
+            closer = "}" if top.kind == "{" else "]"
+            if c != closer:
+                report.note("mismatched_bracket")
+            out.append(closer)
+            stack.pop()
+            i += 1
+            if not stack:
+                break
+            value_done()
+        elif c == '"':
+            is_key = top is not None and top.kind == "{" and top.expect == "key"
+            i, value, closed = _scan_string(text, i, out, report, is_key)
+            if not closed:
+                break  # truncated inside a string
+            if is_key:
+                top.key = value
+                top.expect = "colon"
+            elif top is not None and top.expect == "colon":
+                report.note("missing_colon")
+                out.insert(len(out) - 1, ":")
+                value_done()
+            else:
+                value_done()
+        elif c == ":":
+            if top is not None and top.expect == "colon":
+                out.append(":")
+                top.expect = "value"
+            else:
+                report.note("unexpected_token")
+            i += 1
+        elif c == ",":
+            if top is not None and top.expect == "comma":
+                out.append(",")
+                top.expect = "key" if top.kind == "{" else "value"
+                top.member_start = len(out)
+                if top.kind == "[":
+                    top.index += 1
+            else:
+                report.note("extra_comma")
+            i += 1
+        elif c == "/" and text.startswith("//", i):
+            report.note("comment")
+            end = text.find("\n", i)
+            i = n if end < 0 else end + 1
+        elif c == "/" and text.startswith("/*", i):
+            report.note("comment")
+            end = text.find("*/", i + 2)
+            i = n if end < 0 else end + 2
+        else:
+            m = _LITERAL.match(text, i)
+            if m and top is not None and top.expect == "value":
+                literal = m.group()
+                if literal in _PY_LITERALS:
+                    report.note("python_literal")
+                    literal = _PY_LITERALS[literal]
+                out.append(literal)
+                value_done()
+                i = m.end()
+            else:
+                report.note("stray_character")
+                i += 1
+
+    if stack:
+        report.truncated = True
+        _close_truncated(stack, out, report)
+    elif i < n and text[i:].strip().strip("`").strip():
+        report.note("trailing_text")
+
+    return "".join(out), report
+
+
+def _close_truncated(stack, out, report):
+    """Drop the member being written in each open container and close it."""
+    while stack:
+        top = stack.pop()
+        if top.expect != "comma" and len(out) > top.member_start:
+            if top.expect != "key":  # a partial key has no name worth reporting
+                report.dropped.append(top.member_path())
+            del out[top.member_start:]
+        if out and out[-1] == ",":
+            out.pop()
+        out.append("}" if top.kind == "{" else "]")
+        report.incomplete.append(top.path)
+        if stack:
+            stack[-1].expect = "comma"
+
+
+def extract_json_text(content):
+    """
+    The part of the model output where the JSON object starts: the first
+    "{". A ```json fence or prose before it is a wrapper; fences after it
+    are inside string values (a README, a code sample) and stay as they are.
+    """
+    start = content.find("{")
+    if start < 0:
+        raise JSONRepairError("No JSON object found in the model output")
+    return content[start:], bool(content[:start].strip())
+
+
+def parse_answer(content):
+    """
+    Parse the model's answer into a dict, repairing it if needed.
+    Returns (result, report); raises JSONRepairError if nothing usable is
+    left.
+    """
+    report = RepairReport()
+    text, wrapped = extract_json_text(content)
+
+    # Fast path: valid JSON, possibly with text around it.
+    try:
+        result, end = _decoder.raw_decode(text)
+    except ValueError:
+        pass
+    else:
+        if isinstance(result, dict):
+            if wrapped:
+                report.note("leading_text")
+            if text[end:].strip().strip("`").strip():
+                report.note("trailing_text")
+            return result, report
+
+    repaired, report = repair_json(text, report)
+    try:
+        result = json.loads(repaired)
+    except ValueError as e:
+        raise JSONRepairError(f"Could not repair the model output: {e}") from e
+    if not isinstance(result, dict):
+        raise JSONRepairError("The model output is not a JSON object")
+    if wrapped:
+        report.note("leading_text")
+    return result, report
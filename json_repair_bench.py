@@ -0,0 +1,191 @@
+"""
+Fuzz / benchmark corpus for json_repair.
+
+Builds realistic ChromeForge answers (100 KB+ by default), damages them
+the way models do (fences, prose, trailing commas, raw newlines,
+unescaped quotes, truncation, ...) and checks that parse_answer()
+recovers every file it claims to be intact, byte for byte. Prints a JSON
+report with per-mutation pass rates and parse throughput.
+
+    python json_repair_bench.py --cases 500 --size 150000
+    python json_repair_bench.py --save corpus/      # keep the cases
+    python json_repair_bench.py --corpus corpus/    # re-run saved cases
+"""
+import argparse
+import json
+import os
+import random
+import time
+
+from json_repair import JSONRepairError, parse_answer
+
+
+def make_answer(rng, size):
+    """A valid answer whose files add up to about `size` bytes."""
+    names = ["popup.html", "styles.css", "popup.js", "content.js", "background.js", "icon.svg"]
+    names += [f"lib/module{i}.js" for i in range(rng.randint(0, 6))]
+    per_file = max(200, size // len(names))
+    files = {}
+    for name in names:
+        lines = []
+        while sum(len(line) + 1 for line in lines) < per_file:
+            lines.append(rng.choice([
+                '  <div class="card" data-id="%d">Hello, "world"</div>' % rng.randint(0, 999),
+                "  const re = /\\d+\\s*/g; // it's a regex",
+                "  .glass { backdrop-filter: blur(%dpx); }" % rng.randint(1, 20),
+                "\tconsole.log(`tab\\tseparated ${x}`);",
+                "  chrome.runtime.sendMessage({type: 'PING', n: %d});" % rng.randint(0, 99),
+                "  // unicode: café ☃",
+            ]))
+        files[name] = "\n".join(lines) + "\n"
+    return {
+        "analysis": "Generated for the benchmark.",
+        "manifest": {"manifest_version": 3, "name": "Bench", "version": "1.0.0",
+                     "permissions": ["storage", "activeTab"]},
+        "files": files,
+        "readme": "# Bench\n\nNothing to see.\n",
+    }
+
+
+_NL, _TAB = "\x00nl\x00", "\x00tab\x00"
+
+
+def _mark_whitespace(expected):
+    """Answer with newlines/tabs in file contents swapped for sentinels."""
+    marked = dict(expected)
+    marked["files"] = {name: content.replace("\n", _NL).replace("\t", _TAB)
+                       for name, content in expected["files"].items()}
+    return marked
+
+
+def _raw_newlines(text):
+    # The sentinels come out of json.dumps as \u0000 escapes; put the raw
+    # characters there, as a model forgetting to escape them would.
+    return text.replace(json.dumps(_NL)[1:-1], "\n").replace(json.dumps(_TAB)[1:-1], "\t")
+
+
+def _unescaped_quotes(text):
+    return text.replace('class=\\"card\\"', 'class="card"')
+
+
+def _trailing_commas(text):
+    return text.replace('"\n  }', '",\n  }').replace("]\n", "],\n", 1)
+
+
+def _python_literals(text):
+    return text.replace('"manifest_version": 3', '"manifest_version": 3, "beta": True')
+
+
+MUTATIONS = {
+    "clean": lambda text, rng: text,
+    "fence": lambda text, rng: "```json\n" + text + "\n```",
+    "prose": lambda text, rng: "Here is your extension:\n\n" + text + "\n\nEnjoy!",
+    "trailing_commas": lambda text, rng: _trailing_commas(text),
+    "raw_newlines": lambda text, rng: _raw_newlines(text),
+    "unescaped_quotes": lambda text, rng: _unescaped_quotes(text),
+    "python_literals": lambda text, rng: _python_literals(text),
+    "truncated": lambda text, rng: text[:rng.randint(len(text) // 4, len(text) - 1)],
+    "fence_truncated": lambda text, rng: ("```json\n" + text)[:rng.randint(len(text) // 2, len(text))],
+    "everything": lambda text, rng: "```json\n" + _trailing_commas(_unescaped_quotes(
+        _raw_newlines(text)))[:rng.randint(len(text) // 2, len(text))],
+}
+
+
+def check(case_text, expected):
+    """(ok, seconds, detail) for one damaged answer."""
+    start = time.perf_counter()
+    try:
+        result, report = parse_answer(case_text)
+    except JSONRepairError as e:
+        return False, time.perf_counter() - start, f"error: {e}"
+    elapsed = time.perf_counter() - start
+
+    intact = report.intact_files(result)
+    wrong = [name for name in intact if result["files"][name] != expected["files"].get(name)]
+    if wrong:
+        return False, elapsed, f"claimed intact but differ: {wrong}"
+    if not report.truncated and set(intact) != set(expected["files"]):
+        return False, elapsed, f"lost files without truncation: {set(expected['files']) - set(intact)}"
+    return True, elapsed, f"{len(intact)}/{len(expected['files'])} files intact"
+
+
+def generate_corpus(cases, size, seed):
+    rng = random.Random(seed)
+    corpus = []
+    names = list(MUTATIONS)
+    for n in range(cases):
+        expected = make_answer(rng, size)
+        mutation = names[n % len(names)]
+        raw = mutation in ("raw_newlines", "everything")
+        text = json.dumps(_mark_whitespace(expected) if raw else expected, indent=2)
+        corpus.append((f"{n:04d}-{mutation}", mutation, MUTATIONS[mutation](text, rng), expected))
+    return corpus
+
+
+def load_corpus(directory):
+    corpus = []
+    for name in sorted(os.listdir(directory)):
+        if not name.endswith(".txt"):
+            continue
+        case_id = name[:-4]
+        with open(os.path.join(directory, name), "r", encoding="utf-8") as f:
+            text = f.read()
+        with open(os.path.join(directory, case_id + ".expected.json"), "r", encoding="utf-8") as f:
+            expected = json.load(f)
+        corpus.append((case_id, case_id.split("-", 1)[-1], text, expected))
+    return corpus
+
+
+def save_corpus(corpus, directory):
+    os.makedirs(directory, exist_ok=True)
+    for case_id, _, text, expected in corpus:
+        with open(os.path.join(directory, case_id + ".txt"), "w", encoding="utf-8") as f:
+            f.write(text)
+        with open(os.path.join(directory, case_id + ".expected.json"), "w", encoding="utf-8") as f:
+            json.dump(expected, f)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="json_repair fuzz / benchmark corpus")
+    parser.add_argument("--cases", type=int, default=200)
+    parser.add_argument("--size", type=int, default=120_000, help="approximate answer size in bytes")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--corpus", metavar="DIR", help="run a saved corpus instead of generating one")
+    parser.add_argument("--save", metavar="DIR", help="write the generated corpus here")
+    parser.add_argument("--verbose", action="store_true", help="include every failure in the report")
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus) if args.corpus else \
+        generate_corpus(args.cases, args.size, args.seed)
+    if args.save:
+        save_corpus(corpus, args.save)
+
+    by_mutation = {}
+    failures = []
+    for case_id, mutation, text, expected in corpus:
+        ok, elapsed, detail = check(text, expected)
+        stats = by_mutation.setdefault(mutation, {"cases": 0, "passed": 0, "seconds": 0.0, "bytes": 0})
+        stats["cases"] += 1
+        stats["passed"] += ok
+        stats["seconds"] += elapsed
+        stats["bytes"] += len(text)
+        if not ok:
+            failures.append({"case": case_id, "detail": detail})
+
+    for stats in by_mutation.values():
+        stats["mb_per_s"] = round(stats["bytes"] / 1e6 / stats["seconds"], 2) if stats["seconds"] else None
+        stats["mean_ms"] = round(stats["seconds"] * 1000.0 / stats["cases"], 3)
+        del stats["seconds"]
+
+    report = {
+        "cases": len(corpus),
+        "passed": sum(s["passed"] for s in by_mutation.values()),
+        "mutations": by_mutation,
+        "failures": failures if args.verbose else failures[:10],
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if not failures else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,203 @@
+"""
+Incremental extraction of the ChromeForge JSON answer.
+
+The model streams its { analysis, manifest, files, readme } object a few
+characters at a time. ExtensionStreamParser scans the text as it arrives
+and hands back every interesting value (manifest, readme, each entry of
+"files", ...) as soon as its closing quote / brace has been seen, so the
+server can write files long before the whole answer is in.
+"""
+import json
+import re
+
+_STRING_SPECIAL = re.compile(r'["\\]')
+_WHITESPACE = " \t\r\n"
+
+_PRE, _BODY, _DONE = range(3)
+
+
+def default_watch(path):
+    """
+    Which values to emit: every top-level value except the "files"
+    container itself, plus every entry inside "files".
+    """
+    if len(path) == 1:
+        return path[0] != "files"
+    return len(path) == 2 and path[0] == "files"
+
+
+class _Frame:
+    __slots__ = ("kind", "path", "key", "index", "expect")
+
+    def __init__(self, kind, path):
+        self.kind = kind  # "object" or "array"
+        self.path = path
+        self.key = None
+        self.index = 0
+        self.expect = "key" if kind == "object" else "value"
+
+    def child_path(self):
+        return self.path + ((self.key,) if self.kind == "object" else (self.index,))
+
+
+class ExtensionStreamParser:
+    """
+    Feed model output chunks in with feed(); it returns a list of
+    (path, value) tuples for every watched value completed by that chunk.
+    Anything before the first "{" (e.g. a ```json fence) and anything after
+    the root object closes is ignored.
+    """
+
+    def __init__(self, watch=default_watch):
+        self._watch = watch
+        self._chunks = []
+        self._state = _PRE
+        self._stack = []
+
+        self._in_string = False
+        self._string_is_key = False
+        self._escape = False
+        self._in_scalar = False
+
+        self._key_pieces = []
+        self._key_start = None
+
+        self._cap_pieces = []
+        self._cap_start = None
+        self._cap_depth = None
+        self._cap_path = None
+
+    @property
+    def done(self):
+        """True once the root object has been closed."""
+        return self._state == _DONE
+
+    @property
+    def text(self):
+        """Everything fed so far."""
+        return "".join(self._chunks)
+
+    def feed(self, chunk):
+        self._chunks.append(chunk)
+        events = []
+        i = 0
+        n = len(chunk)
+
+        while i < n:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                    i += 1
+                    continue
+                m = _STRING_SPECIAL.search(chunk, i)
+                if m is None:
+                    break
+                j = m.start()
+                if chunk[j] == "\\":
+                    if j + 1 >= n:
+                        self._escape = True
+                        break
+                    i = j + 2
+                    continue
+                self._in_string = False
+                self._end_string(chunk, j, events)
+                i = j + 1
+                continue
+
+            c = chunk[i]
+
+            if self._state != _BODY:
+                if self._state == _PRE and c == "{":
+                    self._stack.append(_Frame("object", ()))
+                    self._state = _BODY
+                i += 1
+                continue
+
+            if c in _WHITESPACE:
+                self._end_scalar(chunk, i, events)
+                i += 1
+                continue
+
+            frame = self._stack[-1]
+
+            if c == '"':
+                self._end_scalar(chunk, i, events)
+                self._in_string = True
+                if frame.kind == "object" and frame.expect == "key":
+                    self._string_is_key = True
+                    self._key_pieces = []
+                    self._key_start = i + 1
+                else:
+                    self._string_is_key = False
+                    self._begin_value(frame, i)
+            elif c in "{[":
+                self._begin_value(frame, i)
+                kind = "object" if c == "{" else "array"
+                self._stack.append(_Frame(kind, frame.child_path()))
+            elif c in "}]":
+                self._end_scalar(chunk, i, events)
+                self._stack.pop()
+                if self._cap_start is not None and len(self._stack) == self._cap_depth:
+                    self._finish_capture(chunk, i + 1, events)
+                if not self._stack:
+                    self._state = _DONE
+            elif c == ":":
+                frame.expect = "value"
+            elif c == ",":
+                self._end_scalar(chunk, i, events)
+                if frame.kind == "object":
+                    frame.expect = "key"
+                else:
+                    frame.index += 1
+            elif not self._in_scalar:
+                # number / true / false / null
+                self._in_scalar = True
+                self._begin_value(frame, i)
+            i += 1
+
+        # Carry partially captured text over into the next chunk.
+        if self._key_start is not None:
+            self._key_pieces.append(chunk[self._key_start:])
+            self._key_start = 0
+        if self._cap_start is not None:
+            self._cap_pieces.append(chunk[self._cap_start:])
+            self._cap_start = 0
+
+        return events
+
+    # ------------------------------------------------------------------
+
+    def _begin_value(self, frame, start):
+        if self._cap_start is not None:
+            return
+        path = frame.child_path()
+        if self._watch(path):
+            self._cap_pieces = []
+            self._cap_start = start
+            self._cap_depth = len(self._stack)
+            self._cap_path = path
+
+    def _end_string(self, chunk, end, events):
+        if self._string_is_key:
+            raw = "".join(self._key_pieces) + chunk[self._key_start:end]
+            self._stack[-1].key = json.loads('"' + raw + '"')
+            self._key_pieces = []
+            self._key_start = None
+            self._string_is_key = False
+        elif self._cap_start is not None and len(self._stack) == self._cap_depth:
+            self._finish_capture(chunk, end + 1, events)
+
+    def _end_scalar(self, chunk, end, events):
+        if not self._in_scalar:
+            return
+        self._in_scalar = False
+        if self._cap_start is not None and len(self._stack) == self._cap_depth:
+            self._finish_capture(chunk, end, events)
+
+    def _finish_capture(self, chunk, end, events):
+        raw = "".join(self._cap_pieces) + chunk[self._cap_start:end]
+        events.append((self._cap_path, json.loads(raw)))
+        self._cap_pieces = []
+        self._cap_start = None
+        self._cap_depth = None
+        self._cap_path = None
@@ -0,0 +1,297 @@
+"""
+End-to-end load test for ChromeForge.
+
+N simulated users each run a session against a running server: one forge,
+then a mix of refinements, downloads and saves. Latencies are recorded per
+endpoint and the report (p50/p95/p99, throughput, error rates) is printed
+as JSON, so runs can be diffed or checked in CI.
+
+Against a server you started yourself (ideally pointed at mock_openai.py):
+
+    python loadtest.py --url http://127.0.0.1:5000 --users 20 --iterations 10
+
+Fully self-contained (starts the mock upstream and the app in-process):
+
+    python loadtest.py --spawn --users 20 --iterations 10 --mock-latency lognormal:0,0.5
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+
+PROMPTS = [
+    "Highlight every phone number on the page in yellow",
+    "Add a popup that counts the words on the current tab",
+    "Block autoplaying videos and show a badge with how many were blocked",
+    "Dark mode toggle for any website, remembered per domain",
+    "Copy all links on the page to the clipboard as markdown",
+]
+REFINEMENTS = [
+    "Make the popup text bigger",
+    "Change the accent colour to orange",
+    "Add a keyboard shortcut for the main action",
+]
+SAVE_BODY = {
+    "manifest": {"manifest_version": 3, "name": "Load test", "version": "1.0.0",
+                 "action": {"default_popup": "popup.html"}},
+    "files": {"popup.html": "<h1>Load test</h1>", "popup.js": "console.log('hi');\n"},
+    "readme": "# Load test\n",
+}
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return None
+    rank = max(1, int(round(pct / 100.0 * len(sorted_values))))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+class Recorder:
+    """Thread-safe per-endpoint latency and status collection."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples = {}  # endpoint -> list of (seconds, status or error name)
+
+    def add(self, endpoint, seconds, outcome):
+        with self._lock:
+            self._samples.setdefault(endpoint, []).append((seconds, outcome))
+
+    def report(self, wall_seconds):
+        with self._lock:
+            samples = {k: list(v) for k, v in self._samples.items()}
+        endpoints = {}
+        total = errors = 0
+        for endpoint, items in sorted(samples.items()):
+            latencies = sorted(s for s, _ in items)
+            outcomes = {}
+            for _, outcome in items:
+                outcomes[str(outcome)] = outcomes.get(str(outcome), 0) + 1
+            failed = sum(n for o, n in outcomes.items() if not is_success(o))
+            total += len(items)
+            errors += failed
+            endpoints[endpoint] = {
+                "requests": len(items),
+                "errors": failed,
+                "error_rate": round(failed / len(items), 4),
+                "throughput_rps": round(len(items) / wall_seconds, 3) if wall_seconds else None,
+                "latency_ms": {
+                    "min": ms(latencies[0]),
+                    "p50": ms(percentile(latencies, 50)),
+                    "p95": ms(percentile(latencies, 95)),
+                    "p99": ms(percentile(latencies, 99)),
+                    "max": ms(latencies[-1]),
+                    "mean": ms(sum(latencies) / len(latencies)),
+                },
+                "outcomes": outcomes,
+            }
+        return {
+            "wall_seconds": round(wall_seconds, 3),
+            "requests": total,
+            "errors": errors,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "throughput_rps": round(total / wall_seconds, 3) if wall_seconds else None,
+            "endpoints": endpoints,
+        }
+
+
+def ms(seconds):
+    return None if seconds is None else round(seconds * 1000.0, 2)
+
+
+def is_success(outcome):
+    return outcome in ("200", "202", "304")
+
+
+class User:
+    """One simulated browser: its own session id and ETag memory."""
+
+    def __init__(self, base_url, recorder, args):
+        self.base_url = base_url.rstrip("/")
+        self.recorder = recorder
+        self.args = args
+        self.session_id = uuid.uuid4().hex
+        self.etag = None
+        self.has_generation = False
+
+    def request(self, endpoint, method="GET", body=None, headers=None):
+        """Send one request; returns (status or None on a transport error, body)."""
+        req_headers = {"X-Session-Id": self.session_id}
+        req_headers.update(headers or {})
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            req_headers["Content-Type"] = "application/json"
+        req = urllib.request.Request(self.base_url + endpoint, data=data,
+                                     headers=req_headers, method=method)
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.args.timeout) as resp:
+                payload = resp.read()  # include the full transfer in the latency
+                status = resp.status
+                etag = resp.headers.get("ETag")
+        except urllib.error.HTTPError as e:
+            e.read()
+            status, payload, etag = e.code, b"", None
+        except Exception as e:
+            self.recorder.add(endpoint, time.perf_counter() - start, type(e).__name__)
+            return None, b""
+        outcome = str(status)
+        if status == 200 and self.args.stream and endpoint == "/forge" and b"event: error" in payload:
+            outcome = "stream_error"
+        self.recorder.add(endpoint, time.perf_counter() - start, outcome)
+        if endpoint == "/download" and etag:
+            self.etag = etag
+        return status, payload
+
+    def forge(self, prompt):
+        body = {"prompt": prompt, "no_cache": not self.args.allow_cache}
+        if self.args.stream:
+            body["stream"] = True
+        status, _ = self.request("/forge", "POST", body)
+        if status == 200:
+            self.has_generation = True
+            self.etag = None
+
+    def download(self):
+        headers = {"If-None-Match": self.etag} if self.etag and self.args.conditional else None
+        self.request("/download", headers=headers)
+
+    def save(self):
+        status, _ = self.request("/save", "POST", SAVE_BODY)
+        if status == 200:
+            self.has_generation = True
+            self.etag = None
+
+    def run(self, iterations, deadline, mix):
+        self.forge(random.choice(PROMPTS))
+        actions, weights = zip(*mix.items())
+        for _ in range(iterations):
+            if deadline and time.time() >= deadline:
+                break
+            action = random.choices(actions, weights)[0]
+            if action == "forge":
+                self.forge(random.choice(REFINEMENTS))
+            elif action == "download" and self.has_generation:
+                self.download()
+            elif action == "save":
+                self.save()
+            if self.args.think_time:
+                time.sleep(random.uniform(0, self.args.think_time))
+
+
+def parse_mix(spec):
+    """Parse "forge:2,download:5,save:1" into {"forge": 2.0, ...}."""
+    mix = {}
+    for item in spec.split(","):
+        name, _, weight = item.partition(":")
+        if name.strip() not in ("forge", "download", "save"):
+            raise ValueError(f"Unknown action in mix: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def spawn_stack(args):
+    """
+    Start mock_openai and the ChromeForge app in this process on free ports.
+    Returns (base_url, mock_config, shutdown).
+    """
+    import mock_openai
+    from werkzeug.serving import make_server
+
+    mock_args = mock_openai.build_parser().parse_args([
+        "--port", "0",
+        "--latency", args.mock_latency,
+        "--error-rate", str(args.mock_error_rate),
+        "--disconnect-rate", str(args.mock_disconnect_rate),
+    ])
+    mock = mock_openai.make_server(mock_args)
+    threading.Thread(target=mock.serve_forever, daemon=True).start()
+
+    # The app reads its configuration at import time.
+    store = tempfile.mkdtemp(prefix="forge-loadtest-")
+    os.environ["OPENAI_API_URL"] = f"http://127.0.0.1:{mock.server_port}/v1/chat/completions"
+    os.environ.setdefault("OPENAI_API_KEY", "loadtest")
+    os.environ["FORGE_STORE_DIR"] = os.path.join(store, "store")
+    os.environ["CACHE_DIR"] = os.path.join(store, "cache")
+    import main_ui
+
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)  # keep stdout pure JSON
+    app_server = make_server("127.0.0.1", 0, main_ui.app, threaded=True)
+    threading.Thread(target=app_server.serve_forever, daemon=True).start()
+
+    def shutdown():
+        app_server.shutdown()
+        mock.shutdown()
+
+    return f"http://127.0.0.1:{app_server.server_port}", mock.RequestHandlerClass.config, shutdown
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="ChromeForge end-to-end load test")
+    parser.add_argument("--url", default="http://127.0.0.1:5000", help="server under test")
+    parser.add_argument("--spawn", action="store_true",
+                        help="start mock upstream + app in-process instead of using --url")
+    parser.add_argument("--users", type=int, default=10, help="concurrent simulated users")
+    parser.add_argument("--iterations", type=int, default=10, help="actions per user after the first forge")
+    parser.add_argument("--duration", type=float, default=0, help="stop after this many seconds (0 = no limit)")
+    parser.add_argument("--mix", default="forge:2,download:5,save:1", help="weighted action mix")
+    parser.add_argument("--think-time", type=float, default=0, help="max random pause between actions")
+    parser.add_argument("--stream", action="store_true", help="use streaming /forge")
+    parser.add_argument("--allow-cache", action="store_true", help="don't send no_cache on /forge")
+    parser.add_argument("--conditional", action="store_true", help="send If-None-Match on /download")
+    parser.add_argument("--timeout", type=float, default=300)
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--mock-latency", default="fixed:0.2", help="with --spawn: mock latency spec")
+    parser.add_argument("--mock-error-rate", type=float, default=0.0)
+    parser.add_argument("--mock-disconnect-rate", type=float, default=0.0)
+    args = parser.parse_args(argv)
+
+    mix = parse_mix(args.mix)
+    base_url, mock_config, shutdown = args.url, None, None
+    if args.spawn:
+        base_url, mock_config, shutdown = spawn_stack(args)
+
+    recorder = Recorder()
+    deadline = time.time() + args.duration if args.duration else None
+    users = [User(base_url, recorder, args) for _ in range(args.users)]
+    threads = [threading.Thread(target=u.run, args=(args.iterations, deadline, mix), daemon=True)
+               for u in users]
+
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - start
+
+    report = recorder.report(wall)
+    report["config"] = {
+        "url": base_url, "users": args.users, "iterations": args.iterations,
+        "duration": args.duration, "mix": mix, "stream": args.stream,
+        "allow_cache": args.allow_cache, "conditional": args.conditional,
+    }
+    if mock_config is not None:
+        report["mock"] = dict(mock_config.stats)
+        report["config"]["mock_latency"] = args.mock_latency
+    if shutdown:
+        shutdown()
+
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    return 1 if report["requests"] == 0 else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
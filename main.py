@@ -1,13 +1,22 @@
 import os
 import json
+import shutil
 import sys
-from flask import Flask, render_template_string, request, jsonify
+import tempfile
+from flask import Flask, Response, request, jsonify
+from filestore import safe_relpath
+from ingest import IngestError, Ingestor
+from static_assets import StaticBundle
 
 # ==========================================
 # CONFIGURATION
 # ==========================================
 OUTPUT_DIR = "generated_extension"
-app = Flask(__name__)
+# /save: JSON, or multipart with binary assets (see ingest.py), written as it streams in
+ingestor = Ingestor(max_body=int(os.environ.get("INGEST_MAX_BODY_BYTES", str(256 * 1024 * 1024))),
+                    max_file=int(os.environ.get("INGEST_MAX_FILE_BYTES", str(16 * 1024 * 1024))),
+                    max_total=int(os.environ.get("INGEST_MAX_TOTAL_BYTES", str(128 * 1024 * 1024))))
+app = Flask(__name__, static_folder=None)  # /static is the prebuilt bundle
 
 # ==========================================
 # 1. THE WEB INTERFACE
@@ -292,37 +301,70 @@ HTML_TEMPLATE = """
 # ==========================================
 # 2. FLASK BACKEND
 # ==========================================
+static_bundle = StaticBundle()  # build_static.py output; the template (CDN) without one
+INDEX_PAGE = static_bundle.page("main", HTML_TEMPLATE)
+
+def asset_response(asset):
+    status, headers, body = asset.respond(request.headers.get('Accept-Encoding'), request.headers.get('If-None-Match'))
+    return Response(body, status=status, headers=headers)
+
 @app.route('/')
-def index(): return render_template_string(HTML_TEMPLATE)
+def index(): return asset_response(INDEX_PAGE)
+
+@app.route('/static/<path:filename>')
+def static_file(filename):
+    asset = static_bundle.get(filename)
+    if asset is None: return jsonify({"status": "error", "message": "Not found"}), 404
+    return asset_response(asset)
+
+def open_output_file(directory, name):
+    path = os.path.join(directory, safe_relpath(name))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return open(path, "wb")
+
+def replace_output_dir(staging):
+    """Swap a fully written staging directory in for OUTPUT_DIR."""
+    if not os.path.exists(OUTPUT_DIR):
+        os.rename(staging, OUTPUT_DIR)
+        return
+    old = staging + ".old"
+    os.rename(OUTPUT_DIR, old)
+    os.rename(staging, OUTPUT_DIR)
+    shutil.rmtree(old, ignore_errors=True)
 
 @app.route('/save', methods=['POST'])
 def save_files():
+    # Written next to OUTPUT_DIR and swapped in at the end, so a rejected
+    # upload (too large, malformed) leaves the last saved extension alone.
+    out = tempfile.mkdtemp(prefix=".generated_extension-", dir=os.path.dirname(os.path.abspath(OUTPUT_DIR)))
+    os.chmod(out, 0o755)
     try:
-        data = request.json
-        if os.path.exists(OUTPUT_DIR):
-            import shutil
-            shutil.rmtree(OUTPUT_DIR)
-        os.makedirs(OUTPUT_DIR)
+        # Binary assets (base64 / multipart) are written as they're decoded; text comes back here.
+        data = ingestor.read(request.stream, request.content_type, lambda name: open_output_file(out, name)).result
 
         manifest = data.get('manifest', {})
         if 'icons' not in manifest: manifest['icons'] = {"16": "icon.png", "48": "icon.png", "128": "icon.png"}
-        with open(os.path.join(OUTPUT_DIR, "manifest.json"), "w") as f: json.dump(manifest, f, indent=2)
+        with open(os.path.join(out, "manifest.json"), "w") as f: json.dump(manifest, f, indent=2)
 
         files = data.get('files', {})
         for filename, content in files.items():
-            path = os.path.join(OUTPUT_DIR, filename)
+            path = os.path.join(out, safe_relpath(filename))
+            os.makedirs(os.path.dirname(path), exist_ok=True)
             if filename.endswith(".svg"):
                 with open(path, "w") as f: f.write(content)
-                if "icon.png" not in files:
-                    with open(os.path.join(OUTPUT_DIR, "icon.png"), "wb") as f: f.write(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01\x00\x00\x05\x00\x01\r\n-\xb4\x00\x00\x00\x00IEND\xaeB`\x82')
+                if "icon.png" not in files and not os.path.exists(os.path.join(out, "icon.png")):
+                    with open(os.path.join(out, "icon.png"), "wb") as f: f.write(b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89\x00\x00\x00\nIDATx\x9cc\x00\x01\x00\x00\x05\x00\x01\r\n-\xb4\x00\x00\x00\x00IEND\xaeB`\x82')
             else:
                 with open(path, "w", encoding="utf-8") as f: f.write(content)
 
         if 'readme' in data:
-            with open(os.path.join(OUTPUT_DIR, "README.md"), "w") as f: f.write(data['readme'])
+            with open(os.path.join(out, "README.md"), "w") as f: f.write(data['readme'])
 
+        replace_output_dir(out)
         return jsonify({"status": "success", "path": os.path.abspath(OUTPUT_DIR)})
+    except IngestError as e: return jsonify({"status": "error", "message": str(e)}), e.status
     except Exception as e: return jsonify({"status": "error", "message": str(e)}), 500
+    finally: shutil.rmtree(out, ignore_errors=True)
 
 if __name__ == '__main__':
     app.run(debug=True, port=5000)
\ No newline at end of file
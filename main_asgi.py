@@ -0,0 +1,837 @@
+"""
+ChromeForge on asyncio: main_ui.py's API as a plain ASGI application.
+
+    uvicorn main_asgi:app        (or hypercorn main_asgi:app, daphne, ...)
+
+Under Flask every /forge turn holds a worker thread for as long as the
+model takes to answer. Here the route handlers are coroutines and the
+upstream call goes through aupstream.AsyncUpstreamPool, so a turn waiting
+on the model costs a socket and a coroutine: one process can keep
+thousands of slow generations in flight. File writes, zipping and
+launching Chrome block, so they run in a small thread pool
+(ASGI_EXECUTOR_WORKERS) instead of on the event loop.
+
+The rest is main_ui's: sessions, the file store, the response cache, the
+model router, the metrics, the steps of a turn (this module only awaits
+the model between them, and runs them in the executor) and the request /
+response contract of /forge (JSON, {"async": true} jobs and server-sent
+events), /save, /download, /generations and /launch, plus /, /static,
+/jobs and /metrics. Serve a process with one app or the other, not both:
+their state is in memory.
+"""
+import asyncio
+import concurrent.futures
+import contextlib
+import functools
+import http.cookies
+import io
+import json
+import os
+import time
+
+from aupstream import AsyncUpstreamPool
+from delta import PatchError, resolve_answer, validate_result
+from ingest import IngestError, UploadTimeout
+from jobs import DONE, FAILED, QueueFull
+from main_ui import (CACHE_ENABLED, COALESCE, FORGE_RACE, FORGES, FORGES_IN_FLIGHT, INDEX_PAGE,
+                     JOB_RETRY_AFTER, OPENAI_API_URL, RACE_MODELS, RACE_PARALLELISM, ROUTED,
+                     ROUTING_KEY, SESSION_COOKIE, SESSION_HEADER, STAGE_SECONDS,
+                     UPSTREAM_CONNECT_TIMEOUT, UPSTREAM_READ_TIMEOUT, VALIDATION, ExtensionFixer,
+                     ForgeError, StreamedTurn, app as flask_app, archive_bytes,
+                     begin_stream_turn, begin_turn,
+                     cached_result, check_extension, count_upstream_errors, current_workspace,
+                     download_target, end_turn, finish_turn, flight_key, forge_messages,
+                     generations_listing, ingest_extension, job_queue,
+                     launch_chrome_with_extension, line_deltas, model_router, parse_completion,
+                     publish_upload, record_stream_event, record_turn, refined_result,
+                     refinement_base, replay_events, response_cache, rollback_to, sessions,
+                     sse_event, static_bundle, stream_archive, turn_refines, upstream_flights,
+                     upstream_request, upstream_retrier)
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import REGISTRY, CallbackMetric
+from singleflight import Abandoned
+from static_assets import etag_matches
+
+try:
+    import uvicorn
+except ImportError:  # any ASGI server will do; uvicorn is only for `python main_asgi.py`
+    uvicorn = None
+
+# ==========================================
+# CONFIGURATION
+# ==========================================
+
+# Connections the async client may hold open at once: one per waiting call.
+ASGI_UPSTREAM_CONNECTIONS = int(os.environ.get("ASGI_UPSTREAM_CONNECTIONS", "1000"))
+# Threads for blocking work (file writes, zipping, Chrome), not for upstream waits.
+ASGI_EXECUTOR_WORKERS = int(os.environ.get("ASGI_EXECUTOR_WORKERS", "16"))
+ASGI_MAX_JOBS = int(os.environ.get("ASGI_MAX_JOBS", "1000"))  # {"async": true} turns running
+# Read up front for every route but /save, which streams under the INGEST_* limits.
+ASGI_MAX_BODY = int(os.environ.get("ASGI_MAX_BODY", str(64 * 1024 * 1024)))
+STREAMED_BODIES = {"/save"}
+# Threads that read /save bodies. Each waits on its client between chunks,
+# so they're a pool of their own: slow uploads queue here instead of
+# holding up the executor every route relies on.
+ASGI_INGEST_WORKERS = int(os.environ.get("ASGI_INGEST_WORKERS", "4"))
+# Seconds an upload may go without sending more of its body (then 408).
+ASGI_BODY_READ_TIMEOUT = float(os.environ.get("ASGI_BODY_READ_TIMEOUT", "30"))
+
+executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=ASGI_EXECUTOR_WORKERS, thread_name_prefix="asgi-io")
+ingest_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=ASGI_INGEST_WORKERS, thread_name_prefix="asgi-ingest")
+
+async_upstream_pool = AsyncUpstreamPool(
+    OPENAI_API_URL,
+    max_connections=ASGI_UPSTREAM_CONNECTIONS,
+    connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+    read_timeout=UPSTREAM_READ_TIMEOUT,
+)
+
+CallbackMetric(
+    "chromeforge_async_upstream_in_use", "Async upstream connections in use (calls waiting).",
+    lambda: async_upstream_pool.stats()["in_use"])
+
+
+async def offload(fn, *args, **kwargs):
+    """Run a blocking call in the executor and await its result."""
+    return await asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(fn, *args, **kwargs))
+
+
+async def iterate_offloaded(iterator):
+    """Drain a blocking iterator from the executor, one item per hop."""
+    done = object()
+    while True:
+        item = await offload(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+async def _try_lock(lock):
+    """lock.acquire(blocking=False) from the executor (a SessionDB lock writes its lease)."""
+    future = asyncio.get_running_loop().run_in_executor(
+        executor, functools.partial(lock.acquire, blocking=False))
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # Cancelled while the executor may still take it: give it back then.
+        def give_back(f):
+            if not f.cancelled() and f.exception() is None and f.result():
+                executor.submit(lock.release)
+        future.add_done_callback(give_back)
+        raise
+
+
+@contextlib.asynccontextmanager
+async def holding(session):
+    """
+    session.lock without blocking the event loop. It's the same lock the
+    threaded paths take (and what SessionManager checks before evicting).
+    """
+    delay = 0.005
+    while not await _try_lock(session.lock):
+        await asyncio.sleep(delay)
+        delay = min(delay * 2, 0.1)
+    try:
+        yield
+    finally:
+        # Shielded: the lock must go back even if this task is being cancelled.
+        await asyncio.shield(offload(session.lock.release))
+
+
+# ==========================================
+# OPENAI BACKEND (ASYNC)
+# ==========================================
+
+async def call_openai_json(messages, model=None):
+    """main_ui.call_openai_json() over the async client (cancel the task to abort)."""
+    data, headers = upstream_request(messages, model)
+    with STAGE_SECONDS.time(stage="upstream"), count_upstream_errors():
+        resp_data = await upstream_retrier.call_async(
+            lambda timeout: async_upstream_pool.post(data, headers, timeout))
+    # Repairing a long malformed answer is CPU work: keep it off the loop.
+    return await offload(parse_completion, resp_data.decode("utf-8"))
+
+
+async def open_openai_stream(messages, model=None):
+    """main_ui.open_openai_stream(): the response lines once the first has arrived."""
+    data, headers = upstream_request(messages, model, stream=True)
+
+    async def open_stream(timeout):
+        lines = async_upstream_pool.stream_lines(data, headers, timeout)
+        try:
+            first = await lines.__anext__()
+        except StopAsyncIteration:
+            first = None
+        return first, lines
+
+    with count_upstream_errors():
+        first, lines = await upstream_retrier.call_async(open_stream, hedge=False)
+    return chain_lines(first, lines)
+
+
+async def chain_lines(first, lines):
+    try:
+        if first is not None:
+            yield first
+            async for line in lines:
+                yield line
+    finally:
+        await lines.aclose()
+
+
+async def stream_openai_content(messages, model=None):
+    """main_ui.stream_openai_content(): (async deltas, RoutingDecision)."""
+    lines, routing = await model_router.run_async(
+        lambda m: open_openai_stream(messages, m), model, timed=False)
+    ROUTED.inc(model=routing.model, reason=routing.reason)
+    return iter_stream_content(lines), routing
+
+
+async def iter_stream_content(lines):
+    with STAGE_SECONDS.time(stage="upstream"), count_upstream_errors():
+        try:
+            async for raw_line in lines:
+                for delta in line_deltas(raw_line):
+                    yield delta
+        finally:
+            await lines.aclose()
+
+
+async def routed_call(messages, model=None):
+    result, routing = await model_router.run_async(
+        lambda m: call_openai_json(messages, m), model)
+    ROUTED.inc(model=routing.model, reason=routing.reason)
+    if routing.reason != "override" and routing.model != model_router.models[0]:
+        flask_app.logger.warning("Routed to %s (%s): %s", routing.model, routing.reason,
+                                 routing.attempts)
+    return result, routing
+
+
+async def raced_call(messages, accept=validate_result):
+    result, routing = await model_router.race_async(
+        lambda m: call_openai_json(messages, m), RACE_MODELS, RACE_PARALLELISM, accept)
+    ROUTED.inc(model=routing.model, reason=routing.reason)
+    return result, routing
+
+
+async def generate_extension(messages, bypass_cache=False, model=None, race=False,
+                             accept=validate_result):
+    """main_ui.generate_extension(), awaiting the upstream call."""
+    key, result = await offload(cached_result, messages, bypass_cache, model)
+    if result is not None:
+        return result, True
+    if COALESCE:
+        # The call runs in its own task: a client that hangs up doesn't
+        # cancel it for the others waiting on it.
+        (result, routing), shared = await upstream_flights.do_async(
+            flight_key(key, model, race), lambda: fresh_answer(messages, key, model, race, accept))
+    else:
+        (result, routing), shared = await fresh_answer(messages, key, model, race, accept), False
+    result[ROUTING_KEY] = dict(routing.to_dict(), coalesced=shared)
+    return result, False
+
+
+async def fresh_answer(messages, key, model=None, race=False, accept=validate_result):
+    """main_ui.fresh_answer(): (ai_result, routing)."""
+    if race and model is None:
+        result, routing = await raced_call(messages, accept)
+    else:
+        result, routing = await routed_call(messages, model)
+    if CACHE_ENABLED:
+        await offload(response_cache.put, key, result)
+    return result, routing
+
+
+async def fix_extension(ai_result, report, bypass_cache=False, model=None):
+    """main_ui.fix_extension(), awaiting the fix calls: (result, report)."""
+    fixer = ExtensionFixer(ai_result, report)
+    messages = fixer.messages()
+    while messages is not None:
+        try:
+            answer, _ = await generate_extension(messages, bypass_cache, model)
+        except Exception as e:
+            fixer.failed(e)
+        else:
+            await offload(fixer.apply, answer)
+        messages = fixer.messages()
+    return fixer.outcome()
+
+
+async def validate_and_fix(ai_result, bypass_cache=False, model=None):
+    if not VALIDATION:
+        return ai_result
+    report = await offload(check_extension, ai_result)
+    return (await fix_extension(ai_result, report, bypass_cache, model))[0]
+
+
+# ==========================================
+# FORGE TURNS
+# ==========================================
+
+async def forge_turn(session, prompt, bypass_cache=False, allow_delta=True, model=None,
+                     race=False):
+    """main_ui.forge_turn() as a coroutine: the JSON body, or raises ForgeError."""
+    with FORGES_IN_FLIGHT.track_inprogress(), STAGE_SECONDS.time(stage="forge"):
+        async with holding(session):
+            opening = not await offload(getattr, session, "generation_id")
+            try:
+                body = await _forge_turn_locked(session, prompt, bypass_cache, allow_delta,
+                                                model, race)
+            except ForgeError:
+                FORGES.inc(outcome="error", mode="none")
+                raise
+        await offload(record_turn, prompt, body, opening)
+        return body
+
+
+async def _forge_turn_locked(session, prompt, bypass_cache, allow_delta, model=None,
+                             race=False):
+    warm, base = await offload(begin_turn, session, prompt, allow_delta)
+    try:
+        base = base or await offload(refinement_base, session, allow_delta)
+        ai_result, cached, mode = await run_generation(session, base, bypass_cache, model, race)
+        ai_result = await validate_and_fix(ai_result, bypass_cache, model)
+    except Exception as e:
+        raise ForgeError(str(e)) from e
+    return await offload(end_turn, session, ai_result, cached, mode, warm)
+
+
+async def run_generation(session, base, bypass_cache=False, model=None, race=False):
+    """main_ui.run_generation(): (ai_result, cached, mode)."""
+    if base is not None:
+        try:
+            answer, cached = await generate_extension(
+                await offload(forge_messages, session, refine=True), bypass_cache, model, race,
+                lambda a: resolve_answer(a, base))
+            ai_result, mode = refined_result(answer, base)
+            return ai_result, cached, mode
+        except PatchError as e:
+            flask_app.logger.warning("Delta refinement failed, regenerating in full: %s", e)
+
+    ai_result, cached = await generate_extension(await offload(forge_messages, session),
+                                                 bypass_cache, model, race)
+    return ai_result, cached, ("fallback" if base is not None else "full")
+
+
+async def forge_stream_events(session, prompt, bypass_cache=False, allow_delta=True, model=None,
+                              race=False):
+    """main_ui.forge_stream_events() as an async generator of SSE events."""
+    started = time.monotonic()
+
+    def elapsed_ms():
+        return int((time.monotonic() - started) * 1000)
+
+    with FORGES_IN_FLIGHT.track_inprogress(), STAGE_SECONDS.time(stage="forge"):
+        async with holding(session):
+            opening = not await offload(getattr, session, "generation_id")
+            events = _forge_stream_turn(session, prompt, bypass_cache, allow_delta, model, race,
+                                        elapsed_ms)
+            try:
+                async for event in events:
+                    await offload(record_stream_event, event, prompt, opening)
+                    yield event
+            finally:
+                await events.aclose()
+
+
+async def _forge_stream_turn(session, prompt, bypass_cache, allow_delta, model, race, elapsed_ms):
+    if await offload(turn_refines, session, prompt, allow_delta):
+        yield sse_event("status", {"message": "refining"})
+        try:
+            body = await _forge_turn_locked(session, prompt, bypass_cache, allow_delta, model,
+                                            race)
+        except ForgeError as e:
+            yield sse_event("error", {"message": str(e)})
+            return
+        for event in replay_events(body, elapsed_ms):
+            yield event
+        return
+
+    messages = await offload(begin_stream_turn, session, prompt)
+
+    key, ai_result = await offload(cached_result, messages, bypass_cache, model)
+    if ai_result is not None:
+        try:
+            ai_result = await validate_and_fix(ai_result, bypass_cache, model)
+            body = await offload(finish_turn, session, ai_result, True, "full")
+        except ForgeError as e:
+            yield sse_event("error", {"message": str(e)})
+            return
+        for event in replay_events(body, elapsed_ms):
+            yield event
+        return
+
+    flight = None
+    while COALESCE:
+        flight, leading = upstream_flights.begin_async(flight_key(key, model))
+        if leading:
+            break
+        yield sse_event("status", {"message": "coalesced"})
+        try:
+            ai_result, routing = await upstream_flights.wait_async(flight)
+        except Abandoned:
+            continue
+        except Exception as e:
+            yield sse_event("error", {"message": str(e)})
+            return
+        try:
+            ai_result[ROUTING_KEY] = dict(routing.to_dict(), coalesced=True)
+            ai_result = await validate_and_fix(ai_result, bypass_cache, model)
+            body = await offload(finish_turn, session, ai_result, False, "full")
+        except Exception as e:
+            yield sse_event("error", {"message": str(e)})
+            return
+        for event in replay_events(body, elapsed_ms):
+            yield event
+        return
+
+    turn = None
+    try:
+        turn = await offload(StreamedTurn, session, key, elapsed_ms)
+        yield sse_event("status", {"message": "streaming"})
+
+        deltas, routing = await stream_openai_content(messages, model)
+        yield sse_event("status", {"message": "model", "model": routing.model,
+                                   "reason": routing.reason})
+        async for delta in deltas:
+            completed = turn.parse(delta)
+            if completed:
+                for event in await offload(turn.write, completed):
+                    yield event
+
+        for event in await offload(turn.finish):
+            yield event
+        if flight is not None:
+            upstream_flights.finish_async(flight, await offload(turn.shared_answer, routing))
+            flight = None
+        if VALIDATION:
+            report, events = await offload(turn.check)
+            for event in events:
+                yield event
+            ai_result, _ = await fix_extension(turn.ai_result, report, bypass_cache, model)
+            for event in await offload(turn.apply_fixes, ai_result):
+                yield event
+    except BaseException as e:
+        # Not offloaded: this may run while the task is being cancelled.
+        if turn is not None:
+            turn.abort()
+        if flight is not None:
+            if isinstance(e, Exception):
+                upstream_flights.finish_async(flight, error=e)
+            else:
+                upstream_flights.abandon_async(flight)
+        if not isinstance(e, Exception):
+            raise
+        yield sse_event("error", {"message": str(e)})
+        return
+
+    for event in await offload(turn.commit, routing):
+        yield event
+
+
+# ==========================================
+# ASGI PLUMBING
+# ==========================================
+
+class Request:
+    """What a handler sees of one HTTP request (body already read, except on
+    STREAMED_BODIES routes, where stream() hands it out as it arrives)."""
+
+    def __init__(self, scope, body, receive=None):
+        self.method = scope["method"]
+        self.path = scope["path"]
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1")
+                        for k, v in scope.get("headers", [])}
+        self.body = body
+        self._receive = receive
+        cookie = http.cookies.SimpleCookie()
+        try:
+            cookie.load(self.headers.get("cookie", ""))
+        except http.cookies.CookieError:
+            pass
+        self.cookies = {name: morsel.value for name, morsel in cookie.items()}
+        self.forge_session = None
+
+    def header(self, name, default=""):
+        return self.headers.get(name.lower(), default)
+
+    def json(self):
+        """The body as a JSON object, or None (like get_json(silent=True))."""
+        try:
+            data = json.loads(self.body or b"null")
+        except ValueError:
+            return None
+        return data if isinstance(data, dict) else None
+
+    def stream(self):
+        """The body as a file object for blocking code running in a thread."""
+        if self._receive is None:
+            return io.BytesIO(self.body or b"")
+        return BodyStream(self._receive, asyncio.get_running_loop(), ASGI_BODY_READ_TIMEOUT)
+
+    async def session(self):
+        """The Session for this request (created on first use)."""
+        if self.forge_session is None:
+            session_id = self.header(SESSION_HEADER) or self.cookies.get(SESSION_COOKIE)
+            self.forge_session, _ = await offload(sessions.get, session_id)
+        return self.forge_session
+
+
+class Response:
+    """Status, headers and a body: bytes, or an async iterator of bytes / str."""
+
+    def __init__(self, body=b"", status=200, headers=None, content_type=None):
+        self.body = body
+        self.status = status
+        self.headers = dict(headers or {})
+        if content_type:
+            self.headers["Content-Type"] = content_type
+
+    async def send(self, send):
+        headers = [(k.lower().encode("latin-1"), str(v).encode("latin-1"))
+                   for k, v in self.headers.items()]
+        if isinstance(self.body, (bytes, str)):
+            body = self.body.encode("utf-8") if isinstance(self.body, str) else self.body
+            if "Content-Length" not in self.headers:
+                headers.append((b"content-length", str(len(body)).encode("ascii")))
+            await send({"type": "http.response.start", "status": self.status,
+                        "headers": headers})
+            await send({"type": "http.response.body", "body": body})
+            return
+        await send({"type": "http.response.start", "status": self.status, "headers": headers})
+        try:
+            async for chunk in self.body:
+                if isinstance(chunk, str):
+                    chunk = chunk.encode("utf-8")
+                await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": b""})
+        finally:
+            aclose = getattr(self.body, "aclose", None)
+            if aclose is not None:
+                await aclose()
+
+
+def jsonify(obj, status=200, headers=None):
+    return Response(json.dumps(obj), status, headers, "application/json")
+
+
+def error(message, status):
+    return jsonify({"status": "error", "message": message}, status)
+
+
+def asset_response(request, asset):
+    """Response for a static_assets.Asset: precompressed variant, ETag / 304."""
+    status, headers, body = asset.respond(request.header("Accept-Encoding"),
+                                          request.header("If-None-Match"))
+    return Response(body, status, headers)
+
+
+# ==========================================
+# ROUTES
+# ==========================================
+
+async def index(request):
+    return asset_response(request, INDEX_PAGE)
+
+
+async def static_file(request, filename):
+    asset = static_bundle.get(filename)
+    if asset is None:
+        return error("Not found", 404)
+    return asset_response(request, asset)
+
+
+async def forge(request):
+    """Same contract as main_ui.forge()."""
+    payload = request.json() or {}
+    prompt = (payload.get("prompt") or "").strip()
+
+    if not prompt:
+        return error("Prompt is required", 400)
+
+    session = await request.session()
+    bypass_cache = bool(payload.get("no_cache")) or \
+        "no-cache" in request.header("Cache-Control")
+    allow_delta = not payload.get("full")
+    model = payload.get("model") or None
+    if model is not None and model not in model_router.models:
+        return error(f"Unknown model; choose from {model_router.models}", 400)
+    race = bool(payload.get("race", FORGE_RACE))
+
+    wants_stream = payload.get("stream") or "text/event-stream" in request.header("Accept")
+    if wants_stream:
+        return Response(
+            forge_stream_events(session, prompt, bypass_cache, allow_delta, model, race),
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+            content_type="text/event-stream; charset=utf-8",
+        )
+
+    if payload.get("async"):
+        try:
+            job = job_queue.submit_async(forge_turn, session, prompt, bypass_cache, allow_delta,
+                                         model, race, limit=ASGI_MAX_JOBS)
+        except QueueFull as e:
+            return jsonify({"status": "error", "message": str(e)}, 503,
+                           {"Retry-After": str(JOB_RETRY_AFTER)})
+        return jsonify({
+            "status": "queued",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "result_url": f"/jobs/{job.id}/result",
+            "session_id": session.id,
+        }, 202)
+
+    try:
+        return jsonify(await forge_turn(session, prompt, bypass_cache, allow_delta, model, race))
+    except ForgeError as e:
+        return error(str(e), e.status)
+
+
+async def save_files(request):
+    """
+    Same as main_ui.save_files(). The body isn't read up front: the Ingestor
+    pulls it from receive() chunk by chunk in ingest_executor, so uploads are
+    held to the INGEST_* limits rather than buffered whole.
+    """
+    try:
+        session = await request.session()
+        generation, data = await asyncio.get_running_loop().run_in_executor(
+            ingest_executor, ingest_extension, request.stream(),
+            request.header("content-type"), session.id)
+        async with holding(session):
+            body = await offload(publish_upload, session, generation, data)
+        return jsonify(body)
+    except IngestError as e:
+        return error(str(e), e.status)
+    except Exception as e:
+        return error(str(e), 500)
+
+
+async def download(request):
+    """Same as main_ui.download(); the ZIP is built (or streamed) from the executor."""
+    try:
+        generation, etag, headers = await offload(download_target, await request.session())
+    except Exception as e:
+        return error(str(e), 400)
+
+    headers["ETag"] = f'"{etag}"'
+    if etag_matches(request.header("If-None-Match"), etag):
+        return Response(b"", 304, headers)
+
+    data = await offload(archive_bytes, generation, etag)
+    if data is not None:
+        return Response(data, headers=headers, content_type="application/zip")
+    # Too big to hold in memory: stream it out entry by entry.
+    return Response(iterate_offloaded(stream_archive(generation)), headers=headers,
+                    content_type="application/zip")
+
+
+async def launch(request):
+    try:
+        session = await request.session()
+        await offload(lambda: launch_chrome_with_extension(current_workspace(session)))
+        return jsonify({"status": "success"})
+    except Exception as e:
+        return error(str(e), 400)
+
+
+async def list_generations(request):
+    return jsonify(await offload(generations_listing, await request.session()))
+
+
+async def rollback_generation(request, gen_id):
+    """Same as main_ui.rollback_generation()."""
+    session = await request.session()
+    async with holding(session):
+        body = await offload(rollback_to, session, gen_id)
+    if body is None:
+        return error("Unknown generation", 404)
+    return jsonify(body)
+
+
+async def job_status(request, job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return error("Unknown job", 404)
+    return jsonify(job.to_dict())
+
+
+async def job_result(request, job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return error("Unknown job", 404)
+    if job.state == FAILED:
+        return jsonify({"status": "error", "message": job.error, "job": job.to_dict()}, 500)
+    if job.state != DONE:
+        return jsonify({"status": job.state, "job": job.to_dict()}, 202, {"Retry-After": "1"})
+    return jsonify(job.result)
+
+
+async def metrics(request):
+    # Some gauges read the session database: render off the loop.
+    return Response(await offload(REGISTRY.render), content_type=METRICS_CONTENT_TYPE)
+
+
+async def upstream_stats(request):
+    return jsonify({"pool": async_upstream_pool.stats(), "retry": upstream_retrier.stats()})
+
+
+async def coalescing_stats(request):
+    return jsonify(upstream_flights.stats())
+
+
+ROUTES = {
+    "/": {"GET": index},
+    "/forge": {"POST": forge},
+    "/save": {"POST": save_files},
+    "/download": {"GET": download},
+    "/generations": {"GET": list_generations},
+    "/launch": {"POST": launch},
+    "/metrics": {"GET": metrics},
+    "/stats/upstream": {"GET": upstream_stats},
+    "/stats/coalescing": {"GET": coalescing_stats},
+}
+
+
+def resolve(method, path):
+    """(handler, status): handler(request) answers it, else status is 404 / 405."""
+    if path.startswith("/static/"):
+        methods, args = {"GET": static_file}, (path[len("/static/"):],)
+    elif path.startswith("/generations/") and path.endswith("/rollback"):
+        gen_id = path[len("/generations/"):-len("/rollback")]
+        if not gen_id or "/" in gen_id:
+            return None, 404
+        methods, args = {"POST": rollback_generation}, (gen_id,)
+    elif path.startswith("/jobs/"):
+        job_id, _, rest = path[len("/jobs/"):].partition("/")
+        if rest not in ("", "result"):
+            return None, 404
+        methods, args = {"GET": job_result if rest else job_status}, (job_id,)
+    elif path in ROUTES:
+        methods, args = ROUTES[path], ()
+    else:
+        return None, 404
+    if method == "HEAD":
+        method = "GET"
+    if method not in methods:
+        return None, 405
+    return (lambda request: methods[method](request, *args)), None
+
+
+async def read_body(receive):
+    """The request body, or None once it passes ASGI_MAX_BODY (or the client left)."""
+    body = bytearray()
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return None
+        body += message.get("body", b"")
+        if len(body) > ASGI_MAX_BODY:
+            return None
+        if not message.get("more_body"):
+            return bytes(body)
+
+
+class BodyStream:
+    """
+    A request body as a blocking file object, for code running in a thread:
+    each read() waits on the event loop for the next http.request message,
+    so at most one chunk is held here at a time. A client that sends
+    nothing for `timeout` seconds gets UploadTimeout (408).
+    """
+
+    def __init__(self, receive, loop, timeout=None):
+        self._receive = receive
+        self._loop = loop
+        self._timeout = timeout
+        self._chunk = memoryview(b"")
+        self._more = True
+
+    def _next(self):
+        future = asyncio.run_coroutine_threadsafe(self._receive(), self._loop)
+        try:
+            message = future.result(self._timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            self._more = False
+            raise UploadTimeout(f"No upload data received for {self._timeout:g}s") from None
+        if message["type"] == "http.disconnect":
+            self._more = False
+            raise ConnectionError("Client disconnected during upload")
+        self._chunk = memoryview(message.get("body", b""))
+        self._more = bool(message.get("more_body"))
+
+    def read(self, size=-1):
+        while not self._chunk and self._more:
+            self._next()
+        if size is None or size < 0:
+            parts = [bytes(self._chunk)]
+            while self._more:
+                self._next()
+                parts.append(bytes(self._chunk))
+            self._chunk = memoryview(b"")
+            return b"".join(parts)
+        data, self._chunk = bytes(self._chunk[:size]), self._chunk[size:]
+        return data
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            async_upstream_pool.close()
+            executor.shutdown(wait=False)
+            ingest_executor.shutdown(wait=False)
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def app(scope, receive, send):
+    """The ASGI entry point."""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] != "http":
+        return
+
+    handler, status = resolve(scope["method"], scope["path"])
+    streamed = handler is not None and scope["path"] in STREAMED_BODIES
+    body = b"" if streamed else await read_body(receive)
+    if body is None:
+        response = error("Request body too large", 413)
+    elif handler is None:
+        response = error("Not found" if status == 404 else "Method not allowed", status)
+    else:
+        request = Request(scope, body, receive if streamed else None)
+        try:
+            response = await handler(request)
+        except Exception as e:
+            flask_app.logger.exception("Unhandled error on %s", scope["path"])
+            response = error(str(e), 500)
+        remember_session(request, response)
+    if scope["method"] == "HEAD":
+        if isinstance(response.body, bytes):
+            response.headers.setdefault("Content-Length", str(len(response.body)))
+        response.body = b""
+    await response.send(send)
+
+
+def remember_session(request, response):
+    session = request.forge_session
+    if session is not None:
+        response.headers[SESSION_HEADER] = session.id
+        if request.cookies.get(SESSION_COOKIE) != session.id:
+            response.headers["Set-Cookie"] = \
+                f"{SESSION_COOKIE}={session.id}; HttpOnly; Path=/; SameSite=Lax"
+
+
+if __name__ == "__main__":
+    if uvicorn is None:
+        raise SystemExit("Serve this with an ASGI server, e.g. `uvicorn main_asgi:app` "
+                         "(pip install uvicorn).")
+    uvicorn.run(app, host="127.0.0.1", port=int(os.environ.get("PORT", "5000")))
@@ -1,24 +1,372 @@
 import os
 import json
+import contextlib
+import copy
+import itertools
 import shutil
 import platform
 import subprocess
-import urllib.request
-import urllib.error
 import socket
-from flask import Flask, render_template_string, request, jsonify, send_file
+import threading
+import time
+from flask import (Flask, Response, g, request, jsonify,
+                   stream_with_context)
+
+from archive import ArchiveCache, archive_etag, generation_entries, iter_chunks, iter_zip
+from batch import run_concurrently, slugify
+from cache import ResponseCache, cache_key
+from compaction import Compactor, prompt_tokens
+from delta import REFINE_PROMPT, PatchError, resolve_answer, validate_result
+from filestore import FileStore, Generation
+from ingest import IngestError, Ingestor
+from jobs import DONE, FAILED, JobQueue, QueueFull
+from json_repair import WRAPPER_REPAIRS, parse_answer
+from json_stream import ExtensionStreamParser
+from sessiondb import SessionDB
+from sessions import SessionManager
+from similarity import PromptIndex
+from singleflight import Abandoned, SingleFlight
+from skeletons import SkeletonLibrary
+from static_assets import StaticBundle
+from validation import Problem, Validator, apply_fix, fix_messages
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from metrics import REGISTRY, CallbackMetric, Counter, Gauge, Histogram
+from retry import HedgePolicy, Retrier, RetryPolicy
+from router import STATE_VALUES, ModelRouter
+from upstream import UpstreamCancelled, UpstreamError, UpstreamHTTPError, UpstreamPool
 
 # ==========================================
 # CONFIGURATION
 # ==========================================
-OUTPUT_DIR = "generated_extension"
-OPENAI_MODEL = "gpt-5"  # GPT-5 ONLY
-OPENAI_API_URL = "https://api.openai.com/v1/chat/completions"
+STORE_DIR = os.environ.get("FORGE_STORE_DIR", ".forge_store")
+OPENAI_MODEL = os.environ.get("OPENAI_MODEL", "gpt-5")  # preferred model
+OPENAI_API_URL = os.environ.get("OPENAI_API_URL", "https://api.openai.com/v1/chat/completions")
+
+# Shared keep-alive connection pool to the OpenAI endpoint
+UPSTREAM_POOL_SIZE = int(os.environ.get("UPSTREAM_POOL_SIZE", "8"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_READ_TIMEOUT = float(os.environ.get("UPSTREAM_READ_TIMEOUT", "600"))
+UPSTREAM_WARMUP = int(os.environ.get("UPSTREAM_WARMUP", "0"))  # connections to pre-open
+
+# Retries (429 / 5xx / connection errors) within a total deadline, and
+# optional hedging: a second identical request once the first is slower
+# than UPSTREAM_HEDGE_PERCENTILE of recent calls (or UPSTREAM_HEDGE_AFTER s)
+UPSTREAM_DEADLINE = float(os.environ.get("UPSTREAM_DEADLINE", "600"))
+UPSTREAM_MAX_ATTEMPTS = int(os.environ.get("UPSTREAM_MAX_ATTEMPTS", "4"))
+UPSTREAM_BACKOFF_BASE = float(os.environ.get("UPSTREAM_BACKOFF_BASE", "0.5"))
+UPSTREAM_BACKOFF_MAX = float(os.environ.get("UPSTREAM_BACKOFF_MAX", "20"))
+UPSTREAM_HEDGE = os.environ.get("UPSTREAM_HEDGE", "0") != "0"
+UPSTREAM_HEDGE_PERCENTILE = float(os.environ.get("UPSTREAM_HEDGE_PERCENTILE", "95"))
+UPSTREAM_HEDGE_MIN_SAMPLES = int(os.environ.get("UPSTREAM_HEDGE_MIN_SAMPLES", "20"))
+UPSTREAM_HEDGE_MIN_DELAY = float(os.environ.get("UPSTREAM_HEDGE_MIN_DELAY", "5"))
+UPSTREAM_HEDGE_AFTER = float(os.environ["UPSTREAM_HEDGE_AFTER"]) \
+    if os.environ.get("UPSTREAM_HEDGE_AFTER") else None
+
+# Model routing: candidates in order of preference, each with a circuit
+# breaker. "priority" sends traffic to the first healthy model, "latency"
+# to the fastest one (weighted by its error rate).
+OPENAI_MODELS = [m.strip() for m in os.environ.get("OPENAI_MODELS", f"{OPENAI_MODEL},gpt-4o").split(",")
+                 if m.strip()]
+ROUTER_STRATEGY = os.environ.get("ROUTER_STRATEGY", "priority")
+ROUTER_FALLBACK = os.environ.get("ROUTER_FALLBACK", "1") != "0"  # try the next model on failure
+ROUTER_WINDOW = int(os.environ.get("ROUTER_WINDOW", "50"))
+ROUTER_CONSECUTIVE_FAILURES = int(os.environ.get("ROUTER_CONSECUTIVE_FAILURES", "3"))
+ROUTER_FAILURE_RATE = float(os.environ.get("ROUTER_FAILURE_RATE", "0.5"))
+ROUTER_COOLDOWN = float(os.environ.get("ROUTER_COOLDOWN", "30"))
+
+# Racing: send a turn to several models at once and keep the first answer
+# that parses and validates (costs up to RACE_PARALLELISM calls per turn).
+# FORGE_RACE=1 races every non-streamed turn; {"race": true} asks per request.
+FORGE_RACE = os.environ.get("FORGE_RACE", "0") == "1"
+RACE_MODELS = [m.strip() for m in os.environ.get("RACE_MODELS", ",".join(OPENAI_MODELS)).split(",")
+               if m.strip()]
+RACE_PARALLELISM = int(os.environ.get("RACE_PARALLELISM", "2"))
+
+# Identical upstream calls in flight at the same time (same model and
+# messages) share one call; the others wait for its answer
+COALESCE = os.environ.get("COALESCE", "1") != "0"
+
+# Follow-up turns ask for a patch instead of the whole extension
+DELTA_REFINEMENT = os.environ.get("DELTA_REFINEMENT", "1") != "0"
+
+# History compaction: older assistant turns become short references and the
+# oldest exchanges are cut once a prompt would exceed COMPACTION_BUDGET
+# (estimated tokens); about one user turn in COMPACTION_CUT_EVERY may start
+# the window, so the prompt prefix (and upstream prompt caching) stays put
+COMPACTION = os.environ.get("COMPACTION", "1") != "0"
+COMPACTION_BUDGET = int(os.environ.get("COMPACTION_BUDGET", "32000"))
+COMPACTION_CUT_EVERY = int(os.environ.get("COMPACTION_CUT_EVERY", "4"))
+
+# Warm starts: a session's first prompt that is close enough (Jaccard over
+# normalised words >= SIMILARITY_THRESHOLD) to an earlier one starts from
+# that earlier generation as a delta refinement instead of from scratch
+SIMILARITY = os.environ.get("SIMILARITY", "1") != "0"
+SIMILARITY_THRESHOLD = float(os.environ.get("SIMILARITY_THRESHOLD", "0.5"))
+SIMILARITY_INDEX = os.environ.get("SIMILARITY_INDEX",
+                                  os.path.join(STORE_DIR, "prompt_index.jsonl"))  # "" = memory only
+SIMILARITY_MAX_ENTRIES = int(os.environ.get("SIMILARITY_MAX_ENTRIES", "100000"))
+
+# Skeletons: shared boilerplate (manifest frame, popup <head>, glass theme,
+# chrome.storage helpers) the model references instead of writing out; the
+# references are expanded when the files are written. SKELETONS=0 stops
+# offering them (references in earlier answers are still expanded)
+SKELETONS = os.environ.get("SKELETONS", "1") != "0"
+SKELETON_DIR = os.environ.get("SKELETON_DIR",
+                              os.path.join(os.path.dirname(os.path.abspath(__file__)), "skeletons"))
+
+# Post-generation checks (manifest, references, JS / CSS / HTML syntax) and
+# how many targeted fix calls a turn may spend on the files that fail them
+VALIDATION = os.environ.get("VALIDATION", "1") != "0"
+VALIDATION_WORKERS = int(os.environ.get("VALIDATION_WORKERS", "4"))
+VALIDATION_JS_CHECKER = os.environ.get("VALIDATION_JS_CHECKER", "node")  # "" = built-in scanner
+VALIDATION_FIX_ROUNDS = int(os.environ.get("VALIDATION_FIX_ROUNDS", "1"))
+
+# Generation store: per-generation dirs over content-addressed blobs
+STORE_MAX_BYTES = int(os.environ.get("STORE_MAX_BYTES", str(512 * 1024 * 1024)))
+STORE_MAX_AGE = float(os.environ.get("STORE_MAX_AGE", str(14 * 24 * 3600)))
+STORE_GC_INTERVAL = float(os.environ.get("STORE_GC_INTERVAL", "60"))
+# With several workers sharing the store, unreferenced blobs younger than
+# this may belong to another worker's unfinished generation
+STORE_BLOB_GRACE = float(os.environ.get("STORE_BLOB_GRACE", "3600"))
+
+# /download archives: in-memory cache, per-extension compression
+ZIP_CACHE_BYTES = int(os.environ.get("ZIP_CACHE_BYTES", str(64 * 1024 * 1024)))
+ZIP_MEMORY_LIMIT = int(os.environ.get("ZIP_MEMORY_LIMIT", str(16 * 1024 * 1024)))  # bigger -> streamed
+ZIP_DEFAULT_LEVEL = int(os.environ.get("ZIP_DEFAULT_LEVEL", "6"))
+# Per-extension overrides, e.g. ZIP_LEVELS=".js:9,.svg:9,.png:store"
+ZIP_LEVELS = {
+    ext.strip().lower(): (None if level.strip() == "store" else int(level))
+    for ext, level in (
+        item.split(":", 1) for item in os.environ.get("ZIP_LEVELS", "").split(",") if ":" in item
+    )
+}
+
+# /save uploads are read as they stream in (JSON, or multipart with binary
+# assets) and files written to disk as they're decoded; text files are kept
+# in memory (for skeleton expansion and validation) up to
+# INGEST_MAX_INLINE_BYTES in all, the rest goes straight to disk
+INGEST_MAX_BODY_BYTES = int(os.environ.get("INGEST_MAX_BODY_BYTES", str(256 * 1024 * 1024)))
+INGEST_MAX_FILE_BYTES = int(os.environ.get("INGEST_MAX_FILE_BYTES", str(16 * 1024 * 1024)))
+INGEST_MAX_TOTAL_BYTES = int(os.environ.get("INGEST_MAX_TOTAL_BYTES", str(128 * 1024 * 1024)))
+INGEST_MAX_FILES = int(os.environ.get("INGEST_MAX_FILES", "1000"))
+INGEST_MAX_INLINE_BYTES = int(os.environ.get("INGEST_MAX_INLINE_BYTES", str(8 * 1024 * 1024)))
+
+# Response cache (memory LRU + on-disk tier)
+CACHE_ENABLED = os.environ.get("CACHE_ENABLED", "1") != "0"
+CACHE_DIR = os.environ.get("CACHE_DIR", ".forge_cache")
+CACHE_TTL = float(os.environ.get("CACHE_TTL", str(7 * 24 * 3600)))
+CACHE_MEMORY_BYTES = int(os.environ.get("CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))
+CACHE_DISK_BYTES = int(os.environ.get("CACHE_DISK_BYTES", str(512 * 1024 * 1024)))
+CACHE_DISK_ENTRIES = int(os.environ.get("CACHE_DISK_ENTRIES", "0"))
+
+# Background forge jobs ({"async": true})
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_MAX_QUEUE = int(os.environ.get("JOB_MAX_QUEUE", "32"))
+JOB_RESULT_TTL = float(os.environ.get("JOB_RESULT_TTL", "3600"))
+JOB_RETRY_AFTER = 30  # seconds suggested to clients when the queue is full
+
+# Batch forging (/forge/batch)
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+BATCH_MAX_PROMPTS = int(os.environ.get("BATCH_MAX_PROMPTS", "50"))
+
+# Per-browser conversation memory, keyed by cookie / header
+SESSION_COOKIE = "cf_session"
+SESSION_HEADER = "X-Session-Id"
+MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "1000"))
+# (with compaction, the token budget bounds prompts; this only bounds storage)
+MAX_SESSION_TURNS = int(os.environ.get("MAX_SESSION_TURNS", "200" if COMPACTION else "20"))
+SESSION_IDLE_TTL = float(os.environ.get("SESSION_IDLE_TTL", "3600"))
+# Sessions, turns and generation metadata in SQLite (WAL), shared by every
+# worker process and kept across restarts; "" keeps them in memory (one
+# worker only). A turn's worker renews its session's lease while the turn
+# runs; other workers take the session over SESSION_LEASE_TTL seconds after
+# the renewals stop (at once if the worker died on this host).
+SESSION_DB = os.environ.get("SESSION_DB", os.path.join(STORE_DIR, "sessions.db"))
+SESSION_LEASE_TTL = float(os.environ.get("SESSION_LEASE_TTL", "60"))
+SESSION_DB_BUSY_TIMEOUT = float(os.environ.get("SESSION_DB_BUSY_TIMEOUT", "10"))
+
+app = Flask(__name__, static_folder=None)  # /static is the prebuilt bundle
+
+if SESSION_DB:
+    sessions = SessionDB(
+        SESSION_DB,
+        max_sessions=MAX_SESSIONS,
+        max_turns=MAX_SESSION_TURNS,
+        idle_ttl=SESSION_IDLE_TTL,
+        lease_ttl=SESSION_LEASE_TTL,
+        busy_timeout=SESSION_DB_BUSY_TIMEOUT,
+    )
+else:
+    sessions = SessionManager(
+        max_sessions=MAX_SESSIONS,
+        max_turns=MAX_SESSION_TURNS,
+        idle_ttl=SESSION_IDLE_TTL,
+    )
+
+file_store = FileStore(STORE_DIR, max_bytes=STORE_MAX_BYTES, max_age=STORE_MAX_AGE,
+                       blob_grace=STORE_BLOB_GRACE if SESSION_DB else 0.0)
+
+job_queue = JobQueue(
+    workers=JOB_WORKERS,
+    max_queue=JOB_MAX_QUEUE,
+    result_ttl=JOB_RESULT_TTL,
+)
+
+archive_cache = ArchiveCache(max_bytes=ZIP_CACHE_BYTES)
+ingestor = Ingestor(
+    max_body=INGEST_MAX_BODY_BYTES,
+    max_file=INGEST_MAX_FILE_BYTES,
+    max_total=INGEST_MAX_TOTAL_BYTES,
+    max_files=INGEST_MAX_FILES,
+    max_inline=INGEST_MAX_INLINE_BYTES,
+)
+static_bundle = StaticBundle()  # build_static.py output (STATIC_DIR)
+validator = Validator(workers=VALIDATION_WORKERS, js_checker=VALIDATION_JS_CHECKER)
 
-# Simple in-memory context for the current server session
-conversation_history = []  # list of {"role": "user"/"assistant", "content": "..."}
+upstream_flights = SingleFlight()
 
-app = Flask(__name__)
+skeleton_library = SkeletonLibrary(SKELETON_DIR)
+
+prompt_index = PromptIndex(SIMILARITY_INDEX or None, max_entries=SIMILARITY_MAX_ENTRIES) \
+    if SIMILARITY else None
+
+compactor = Compactor(budget=COMPACTION_BUDGET, cut_every=COMPACTION_CUT_EVERY)
+
+model_router = ModelRouter(
+    OPENAI_MODELS,
+    strategy=ROUTER_STRATEGY,
+    window=ROUTER_WINDOW,
+    fallback=ROUTER_FALLBACK,
+    consecutive_failures=ROUTER_CONSECUTIVE_FAILURES,
+    failure_rate=ROUTER_FAILURE_RATE,
+    cooldown=ROUTER_COOLDOWN,
+)
+
+response_cache = ResponseCache(
+    max_memory_bytes=CACHE_MEMORY_BYTES,
+    directory=CACHE_DIR,
+    max_disk_bytes=CACHE_DISK_BYTES,
+    max_disk_entries=CACHE_DISK_ENTRIES,
+    ttl=CACHE_TTL,
+)
+
+upstream_pool = UpstreamPool(
+    OPENAI_API_URL,
+    max_connections=UPSTREAM_POOL_SIZE,
+    connect_timeout=UPSTREAM_CONNECT_TIMEOUT,
+    read_timeout=UPSTREAM_READ_TIMEOUT,
+)
+
+upstream_retrier = Retrier(
+    RetryPolicy(
+        max_attempts=UPSTREAM_MAX_ATTEMPTS,
+        base_delay=UPSTREAM_BACKOFF_BASE,
+        max_delay=UPSTREAM_BACKOFF_MAX,
+        deadline=UPSTREAM_DEADLINE,
+    ),
+    HedgePolicy(
+        percentile=UPSTREAM_HEDGE_PERCENTILE,
+        min_samples=UPSTREAM_HEDGE_MIN_SAMPLES,
+        min_delay=UPSTREAM_HEDGE_MIN_DELAY,
+        after=UPSTREAM_HEDGE_AFTER,
+    ) if UPSTREAM_HEDGE else None,
+)
+
+
+# ==========================================
+# METRICS (exposed at /metrics)
+# ==========================================
+
+STAGE_SECONDS = Histogram(
+    "chromeforge_stage_seconds", "Latency of each forge stage.", ["stage"])
+UPSTREAM_ERRORS = Counter(
+    "chromeforge_upstream_errors_total", "Failed upstream calls by HTTP status.", ["code"])
+PARSE_FAILURES = Counter(
+    "chromeforge_parse_failures_total", "Model answers that could not be parsed as JSON.")
+JSON_REPAIRS = Counter(
+    "chromeforge_json_repairs_total", "Fixes applied to malformed model answers.", ["kind"])
+TOKENS = Counter(
+    "chromeforge_tokens_total", "Tokens reported in the API usage field.", ["kind"])
+ROUTED = Counter(
+    "chromeforge_routed_total", "Answered upstream calls by model and routing reason.",
+    ["model", "reason"])
+VALIDATION_PROBLEMS = Counter(
+    "chromeforge_validation_problems_total", "Problems found in generated extensions.",
+    ["check", "severity"])
+VALIDATION_FIXES = Counter(
+    "chromeforge_validation_fixes_total", "Targeted fix calls by outcome.", ["outcome"])
+PROMPT_TOKENS = Histogram(
+    "chromeforge_prompt_tokens", "Estimated prompt tokens of forge turns.",
+    buckets=(500, 1000, 2000, 4000, 8000, 16000, 32000, 64000, 128000))
+WARM_STARTS = Counter(
+    "chromeforge_warm_starts_total", "Turns started from a similar earlier generation.",
+    ["mode"])
+FORGES_IN_FLIGHT = Gauge(
+    "chromeforge_forges_in_flight", "Forge turns currently running.")
+FORGES = Counter(
+    "chromeforge_forges_total", "Finished forge turns by outcome and refinement mode.",
+    ["outcome", "mode"])
+CallbackMetric(
+    "chromeforge_sessions", "Live sessions.", lambda: sessions.stats()["sessions"])
+CallbackMetric(
+    "chromeforge_history_messages", "Messages stored across all session histories.",
+    lambda: sessions.stats()["turns"])
+CallbackMetric(
+    "chromeforge_coalesced_requests_total",
+    "Upstream calls made (leader) and requests that shared one already in flight (follower).",
+    lambda: {("leader",): upstream_flights.stats()["leaders"],
+             ("follower",): upstream_flights.stats()["coalesced"]},
+    type="counter", labelnames=["role"])
+CallbackMetric(
+    "chromeforge_coalesced_in_flight", "Distinct upstream calls that others can join.",
+    lambda: upstream_flights.stats()["in_flight"])
+CallbackMetric(
+    "chromeforge_skeleton_expansions_total", "Skeleton references expanded into written files.",
+    lambda: {(ref,): n for ref, n in skeleton_library.stats()["expansions"].items()},
+    type="counter", labelnames=["skeleton"])
+CallbackMetric(
+    "chromeforge_ingest_bytes_total", "Bytes received by /save, and how they were stored.",
+    lambda: {(kind,): ingestor.stats()[f"{kind}_bytes"] for kind in ("received", "text", "asset")},
+    type="counter", labelnames=["kind"])
+CallbackMetric(
+    "chromeforge_upstream_pool_total", "Upstream pool connection reuse.",
+    lambda: {(k,): upstream_pool.stats().get(k, 0) for k in ("hits", "misses")},
+    type="counter", labelnames=["result"])
+CallbackMetric(
+    "chromeforge_response_cache_total", "Response cache lookups.",
+    lambda: {(k,): response_cache.stats().get(k, 0)
+             for k in ("memory_hits", "disk_hits", "misses")},
+    type="counter", labelnames=["result"])
+CallbackMetric(
+    "chromeforge_upstream_retries_total", "Upstream calls retried, by reason.",
+    lambda: {(reason,): n for reason, n in upstream_retrier.stats()["retries"].items()},
+    type="counter", labelnames=["reason"])
+CallbackMetric(
+    "chromeforge_upstream_hedges_total", "Hedged upstream requests and which one won.",
+    lambda: {(k,): upstream_retrier.stats()[k] for k in ("hedges", "hedge_wins", "primary_wins")},
+    type="counter", labelnames=["result"])
+CallbackMetric(
+    "chromeforge_upstream_attempts_total", "Upstream attempts (first tries and retries; hedges are counted apart).",
+    lambda: upstream_retrier.stats()["attempts"], type="counter")
+CallbackMetric(
+    "chromeforge_model_calls_total", "Upstream calls per model, by outcome.",
+    lambda: {(model, outcome): m["failures"] if outcome == "error" else m["calls"] - m["failures"]
+             for model, m in model_router.stats()["models"].items()
+             for outcome in ("success", "error")},
+    type="counter", labelnames=["model", "outcome"])
+CallbackMetric(
+    "chromeforge_model_breaker_state", "Circuit breaker per model (0 closed, 1 half-open, 2 open).",
+    lambda: {(model, ): STATE_VALUES[m["state"]]
+             for model, m in model_router.stats()["models"].items()},
+    labelnames=["model"])
+CallbackMetric(
+    "chromeforge_model_latency_p50_seconds", "Median latency of recent calls per model.",
+    lambda: {(model, ): m["p50_ms"] / 1000.0
+             for model, m in model_router.stats()["models"].items() if m["p50_ms"] is not None},
+    labelnames=["model"])
+CallbackMetric(
+    "chromeforge_jobs_queued", "Async forge jobs waiting for a worker.",
+    lambda: job_queue.stats()["queued"])
 
 
 # ==========================================
@@ -58,14 +406,40 @@ JSON STRUCTURE:
     "readme": "..."
 }
 """
+if SKELETONS and len(skeleton_library):
+    SYSTEM_PROMPT += "\n" + skeleton_library.prompt()
+
+
+def build_openai_payload(messages, model=None):
+    """The chat-completions request body (also the response cache key input)."""
+    return {
+        "model": model or OPENAI_MODEL,
+        "messages": messages,
+        # Old code did not specify temperature, default is 1.0 -> we keep that.
+        "temperature": 1.0,
+        "response_format": {"type": "json_object"},
+    }
 
 
-def call_openai_json(messages):
+def call_openai_json(messages, model=None, cancel=None):
     """
     Call OpenAI Chat Completions API and return a parsed JSON object
     from the assistant's message content (response_format=json_object).
-    Uses GPT-5 ONLY (no fallback).
+    Uses `model` (default OPENAI_MODEL); see routed_call() for routing.
+    `cancel` (a CancelToken) lets another thread abort the call.
     """
+    data, headers = upstream_request(messages, model)
+    with STAGE_SECONDS.time(stage="upstream"), count_upstream_errors():
+        resp_data = upstream_retrier.call(
+            lambda timeout, token: upstream_pool.post(data, headers, timeout, token),
+            cancel=cancel,
+        ).decode("utf-8")
+
+    return parse_completion(resp_data)
+
+
+def upstream_request(messages, model=None, stream=False):
+    """(body, headers) of the chat-completions POST for these messages."""
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         raise RuntimeError(
@@ -73,47 +447,319 @@ def call_openai_json(messages):
             "Export it before running the server."
         )
 
-    payload = {
-        "model": OPENAI_MODEL,
-        "messages": messages,
-        # Old code did not specify temperature, default is 1.0 -> we keep that.
-        "temperature": 1.0,
-        "response_format": {"type": "json_object"},
+    payload = build_openai_payload(messages, model)
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
     }
+    if stream:
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        headers["Accept"] = "text/event-stream"
+    return json.dumps(payload).encode("utf-8"), headers
 
-    data = json.dumps(payload).encode("utf-8")
-    req = urllib.request.Request(
-        OPENAI_API_URL,
-        data=data,
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        },
-    )
-
-    try:
-        with urllib.request.urlopen(req, timeout=600) as resp:
-            resp_data = resp.read().decode("utf-8")
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8", errors="ignore")
-        raise RuntimeError(f"OpenAI HTTPError {e.code}: {body}") from e
-    except urllib.error.URLError as e:
-        raise RuntimeError(f"OpenAI URLError: {e.reason}") from e
 
+def parse_completion(resp_data):
+    """The parsed answer (see parse_model_content) of a non-streamed completion body."""
     try:
-        parsed = json.loads(resp_data)
-        content = parsed["choices"][0]["message"]["content"].strip()
-        # In case the model wraps JSON in ```json ... ```
-        if content.startswith("```"):
-            # Remove first ```... line
-            content = content.split("```", 2)[1]
-        return json.loads(content)
+        with STAGE_SECONDS.time(stage="parse"):
+            parsed = json.loads(resp_data)
+            record_usage(parsed.get("usage"))
+            content = parsed["choices"][0]["message"]["content"]
+            return parse_model_content(content)
     except Exception as e:
+        PARSE_FAILURES.inc()
         raise RuntimeError(
             f"Failed to parse OpenAI response as JSON: {e}\nRaw: {resp_data[:400]}"
         ) from e
 
 
+@contextlib.contextmanager
+def count_upstream_errors():
+    """Count upstream failures by HTTP status ("connection" for network errors)."""
+    try:
+        yield
+    except UpstreamCancelled:
+        raise  # we hung up (a lost race), not the upstream
+    except UpstreamHTTPError as e:
+        UPSTREAM_ERRORS.inc(code=e.status)
+        raise
+    except UpstreamError:
+        UPSTREAM_ERRORS.inc(code="connection")
+        raise
+
+
+def record_usage(usage):
+    """Add the API "usage" block to the token counters."""
+    if not usage:
+        return
+    TOKENS.inc(usage.get("prompt_tokens") or 0, kind="prompt")
+    TOKENS.inc(usage.get("completion_tokens") or 0, kind="completion")
+    details = usage.get("prompt_tokens_details") or {}
+    TOKENS.inc(details.get("cached_tokens") or 0, kind="cached")
+
+
+# Key under which a repaired answer carries its RepairReport (never sent
+# back to the model: finish_turn() pops it before storing the turn).
+REPAIR_KEY = "_repair"
+# Same for the model routing decision of a fresh (non-cached) answer.
+ROUTING_KEY = "_routing"
+# And for the validation report of the extension as written.
+VALIDATION_KEY = "_validation"
+# And for the earlier generation a turn started from.
+WARM_START_KEY = "_warm_start"
+ANNOTATION_KEYS = (REPAIR_KEY, ROUTING_KEY, VALIDATION_KEY, WARM_START_KEY)
+
+
+def pop_annotations(ai_result):
+    """Remove the server-side annotations; {"repair": ..., "routing": ..., ...}."""
+    return {key.lstrip("_"): ai_result.pop(key) for key in ANNOTATION_KEYS if key in ai_result}
+
+
+def parse_model_content(content):
+    """
+    Turn the assistant's message content into the { manifest, files, readme }
+    dict. Fences, surrounding prose, trailing commas, raw newlines and a
+    truncated tail are repaired (see json_repair); a repaired answer gets
+    the report under REPAIR_KEY so the caller can tell which files are intact.
+    """
+    result, report = parse_answer(content)
+    if report.repaired:
+        for kind, count in report.repairs.items():
+            JSON_REPAIRS.inc(count, kind=kind)
+        if report.truncated:
+            JSON_REPAIRS.inc(kind="truncated")
+        result[REPAIR_KEY] = report.to_dict(result)
+        app.logger.warning("Repaired model answer: %s", result[REPAIR_KEY])
+    return result
+
+
+def open_openai_stream(messages, model=None):
+    """
+    Same request as call_openai_json(), but with stream=True. Returns the
+    response lines once the first one has arrived (retries are only safe
+    until then: after that the caller has already used part of the answer).
+    """
+    data, headers = upstream_request(messages, model, stream=True)
+
+    def open_stream(timeout, cancel):
+        lines = upstream_pool.stream_lines(data, headers, timeout, cancel)
+        first = next(lines, None)
+        return itertools.chain([first] if first is not None else [], lines)
+
+    with count_upstream_errors():
+        return upstream_retrier.call(open_stream, hedge=False)
+
+
+def stream_openai_content(messages, model=None):
+    """
+    Open a streamed call on the model the router picks (or `model`).
+    Returns (deltas, routing): deltas yields the assistant's content
+    chunks as they arrive over server-sent events.
+    """
+    lines, routing = model_router.run(lambda m: open_openai_stream(messages, m), model,
+                                      timed=False)
+    ROUTED.inc(model=routing.model, reason=routing.reason)
+    return iter_stream_content(lines), routing
+
+
+def iter_stream_content(lines):
+    """Content deltas from the raw SSE lines of a streamed completion."""
+    with STAGE_SECONDS.time(stage="upstream"), count_upstream_errors():
+        # Read through [DONE] to the end of the body so the connection can go
+        # back to the pool.
+        for raw_line in lines:
+            yield from line_deltas(raw_line)
+
+
+def line_deltas(raw_line):
+    """Content deltas in one SSE line of a streamed completion (usage is recorded)."""
+    line = raw_line.decode("utf-8").strip()
+    if not line.startswith("data:"):
+        return []
+    event = line[len("data:"):].strip()
+    if event == "[DONE]":
+        return []
+    try:
+        chunk = json.loads(event)
+    except ValueError:
+        return []
+    record_usage(chunk.get("usage"))
+    deltas = []
+    for choice in chunk.get("choices") or []:
+        delta = (choice.get("delta") or {}).get("content")
+        if delta:
+            deltas.append(delta)
+    return deltas
+
+
+def cached_result(messages, bypass_cache=False, model=None):
+    """Return (cache_key, cached_result_or_None) for this request."""
+    # Keyed on the requested model: an answer from a fallback model is
+    # still an answer to this request.
+    key = cache_key(build_openai_payload(messages, model))
+    if bypass_cache or not CACHE_ENABLED:
+        return key, None
+    return key, response_cache.get(key)
+
+
+def routed_call(messages, model=None):
+    """
+    call_openai_json() on the model the router picks (or `model`, a
+    per-request override), falling back to the next one on failure.
+    Returns (ai_result, RoutingDecision).
+    """
+    result, routing = model_router.run(lambda m: call_openai_json(messages, m), model)
+    ROUTED.inc(model=routing.model, reason=routing.reason)
+    if routing.reason != "override" and routing.model != model_router.models[0]:
+        app.logger.warning("Routed to %s (%s): %s", routing.model, routing.reason,
+                           routing.attempts)
+    return result, routing
+
+
+def raced_call(messages, accept=validate_result):
+    """
+    call_openai_json() on up to RACE_PARALLELISM of RACE_MODELS at once;
+    the first answer accept() doesn't reject wins, the others are cancelled.
+    Returns (ai_result, RoutingDecision).
+    """
+    result, routing = model_router.race(
+        lambda m, cancel: call_openai_json(messages, m, cancel),
+        RACE_MODELS, RACE_PARALLELISM, accept)
+    ROUTED.inc(model=routing.model, reason=routing.reason)
+    return result, routing
+
+
+def generate_extension(messages, bypass_cache=False, model=None, race=False,
+                       accept=validate_result):
+    """
+    routed_call() behind the response cache and request coalescing.
+    - bypass_cache: skip the lookup (the fresh answer is still stored).
+    - model: per-request model override.
+    - race: use raced_call() instead (ignored when a model is given);
+      accept validates each answer, raising to reject it.
+    Returns (ai_result, cached); a fresh answer carries its routing
+    decision under ROUTING_KEY ("coalesced": whether it came from an
+    identical call already in flight).
+    """
+    key, result = cached_result(messages, bypass_cache, model)
+    if result is not None:
+        return result, True
+    if COALESCE:
+        (result, routing), shared = upstream_flights.do(
+            flight_key(key, model, race), lambda: fresh_answer(messages, key, model, race, accept))
+    else:
+        (result, routing), shared = fresh_answer(messages, key, model, race, accept), False
+    result[ROUTING_KEY] = dict(routing.to_dict(), coalesced=shared)
+    return result, False
+
+
+def flight_key(key, model=None, race=False):
+    """Coalescing key of a generate_extension() call (its cache key, and how it's made)."""
+    return f"{key}:race" if race and model is None else key
+
+
+def fresh_answer(messages, key, model=None, race=False, accept=validate_result):
+    """routed_call() or raced_call(), stored in the response cache: (ai_result, routing)."""
+    if race and model is None:
+        result, routing = raced_call(messages, accept)
+    else:
+        result, routing = routed_call(messages, model)
+    if CACHE_ENABLED:
+        response_cache.put(key, result)
+    return result, routing
+
+
+def check_extension(ai_result):
+    """
+    Run the validator over a full result dict, as it will be written (with
+    its skeletons expanded); returns its ValidationReport.
+    """
+    with STAGE_SECONDS.time(stage="validate"):
+        unknown = []
+        report = validator.validate(skeleton_library.expand(ai_result, unknown))
+        report.problems += [Problem(name, "skeleton", message) for name, message in unknown]
+    for problem in report.problems:
+        VALIDATION_PROBLEMS.inc(check=problem.check, severity=problem.severity)
+    return report
+
+
+class ExtensionFixer:
+    """
+    The fix loop of fix_extension() without the model call, so the threaded
+    and the ASGI server drive it the same way: while messages() returns a
+    request, send it to the model and pass the answer to apply() (or the
+    error to failed()); then outcome() is (result, report).
+    """
+
+    def __init__(self, ai_result, report):
+        self.notes = {key: ai_result[key] for key in ANNOTATION_KEYS if key in ai_result}
+        self.result = {k: v for k, v in ai_result.items() if k not in self.notes}
+        self.report = report
+        self.rounds = 0
+        self.done = False
+
+    def messages(self):
+        """Messages asking for the next fix, or None once there's nothing (left) to try."""
+        if self.done or self.report.ok or self.rounds >= VALIDATION_FIX_ROUNDS:
+            return None
+        self.rounds += 1
+        return fix_messages(SYSTEM_PROMPT, self.result, self.report)
+
+    def apply(self, answer):
+        """Merge a fix answer in, unless it doesn't reduce the errors (that ends the loop)."""
+        try:
+            fixed = apply_fix(self.result, answer, self.report)
+        except Exception as e:
+            self.failed(e)
+            return
+        fixed_report = check_extension(fixed)
+        if len(fixed_report.errors) >= len(self.report.errors):
+            VALIDATION_FIXES.inc(outcome="failed")
+            self.done = True
+            return
+        self.result, self.report = fixed, fixed_report
+        VALIDATION_FIXES.inc(outcome="fixed" if self.report.ok else "improved")
+
+    def failed(self, error):
+        VALIDATION_FIXES.inc(outcome="failed")
+        app.logger.warning("Fixing %s failed: %s", self.report.failing_files(), error)
+        self.done = True
+
+    def outcome(self):
+        result = dict(self.result, **self.notes)
+        result[VALIDATION_KEY] = dict(self.report.to_dict(), fix_rounds=self.rounds)
+        return result, self.report
+
+
+def fix_extension(ai_result, report, bypass_cache=False, model=None):
+    """
+    While `report` has errors (at most VALIDATION_FIX_ROUNDS times), ask the
+    model to fix just the failing files and merge its patch in. A fix that
+    doesn't reduce the errors is dropped. Returns (result, report); the
+    result carries the final report under VALIDATION_KEY. `ai_result`
+    itself is not modified.
+    """
+    fixer = ExtensionFixer(ai_result, report)
+    messages = fixer.messages()
+    while messages is not None:
+        try:
+            answer, _ = generate_extension(messages, bypass_cache, model)
+        except Exception as e:
+            fixer.failed(e)
+        else:
+            fixer.apply(answer)
+        messages = fixer.messages()
+    return fixer.outcome()
+
+
+def validate_and_fix(ai_result, bypass_cache=False, model=None):
+    """check_extension() + fix_extension(); returns the result to write."""
+    if not VALIDATION:
+        return ai_result
+    return fix_extension(ai_result, check_extension(ai_result), bypass_cache, model)[0]
+
+
 # ==========================================
 # EXTENSION FILE HANDLING (OLD BACKEND BEHAVIOR)
 # ==========================================
@@ -125,71 +771,240 @@ PNG_ICON_BYTES = (
 )
 
 
-def write_extension(data):
+def write_manifest(writer, manifest):
+    """Write manifest.json (its skeleton expanded), adding default icons if missing."""
+    manifest = skeleton_library.expand_manifest(manifest)
+    # Old backend: if icons not present, add defaults
+    if 'icons' not in manifest:
+        manifest['icons'] = {"16": "icon.png", "48": "icon.png", "128": "icon.png"}
+
+    writer.add("manifest.json", json.dumps(manifest, indent=2))
+    return ["manifest.json"]
+
+
+def write_extension_file(writer, filename, content, has_png_icon):
     """
-    This is effectively your OLD /save backend behavior, turned into a helper.
-    - data is the JSON from GPT-5: { manifest, files, readme }
-    - returns (abs_path, written_files_list)
+    Write one entry of the model's "files" dict into the generation.
+    - has_png_icon: whether the model supplies its own icon.png; if not,
+      an .svg icon also drops the 1x1 PNG placeholder next to it.
+    Returns the list of file names written.
     """
-    if os.path.exists(OUTPUT_DIR):
-        shutil.rmtree(OUTPUT_DIR)
-    os.makedirs(OUTPUT_DIR, exist_ok=True)
-
     written_files = []
+    if filename.endswith(".svg") and not has_png_icon:
+        # Same as OLD code
+        written_files.append(writer.add("icon.png", PNG_ICON_BYTES))
+
+    content = skeleton_library.expand_file(filename, content)
+    written_files.append(writer.add(filename, content))
+    return written_files
 
-    manifest = data.get('manifest', {})
-    # Old backend: if icons not present, add defaults
-    if 'icons' not in manifest:
-        manifest['icons'] = {"16": "icon.png", "48": "icon.png", "128": "icon.png"}
 
-    # manifest.json
-    manifest_path = os.path.join(OUTPUT_DIR, "manifest.json")
-    with open(manifest_path, "w", encoding="utf-8") as f:
-        json.dump(manifest, f, indent=2)
-    written_files.append("manifest.json")
+def write_readme(writer, readme):
+    writer.add("README.md", readme)
+    return ["README.md"]
+
+
+def write_result(writer, data):
+    """Write manifest, files and readme of a result dict; returns the names written."""
+    written_files = []
+    written_files += write_manifest(writer, data.get('manifest', {}))
 
-    # files
     files = data.get('files', {})
+    # (An uploaded icon.png may already be in the writer: see ingest_extension().)
+    has_png_icon = "icon.png" in files or "icon.png" in writer.files
     for filename, content in files.items():
-        path = os.path.join(OUTPUT_DIR, filename)
-        folder = os.path.dirname(path)
-        if folder:
-            os.makedirs(folder, exist_ok=True)
-
-        if filename.endswith(".svg"):
-            # Same as OLD code
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(content)
-            if "icon.png" not in files:
-                with open(os.path.join(OUTPUT_DIR, "icon.png"), "wb") as f:
-                    f.write(PNG_ICON_BYTES)
-                written_files.append("icon.png")
+        written_files += write_extension_file(writer, filename, content, has_png_icon)
+
+    if 'readme' in data:
+        written_files += write_readme(writer, data['readme'])
+    return written_files
+
+
+def write_fixes(writer, before, after):
+    """Write what a fix changed between two result dicts; returns the names written."""
+    written_files = []
+    if after.get("manifest") != before.get("manifest"):
+        written_files += write_manifest(writer, after.get("manifest", {}))
+    files = after.get("files", {})
+    old_files = before.get("files", {})
+    for filename, content in files.items():
+        if old_files.get(filename) != content:
+            written_files += write_extension_file(writer, filename, content,
+                                                  "icon.png" in files or "icon.png" in writer.files)
+    return written_files
+
+
+def carry_assets(writer, parent):
+    """
+    Link the binary files of `parent` (the generation a turn refines) into
+    `writer`. The model only ever sees the text files, so uploaded images
+    would otherwise be lost on the next turn. Call it before writing the
+    result, so the result's own files win. Returns the names linked.
+    """
+    if parent is None:
+        return []
+    return [writer.link(name, sha) for name, sha in sorted(parent.binary_files().items())]
+
+
+def write_extension(data, session_id=None, parent=None):
+    """
+    This is effectively your OLD /save backend behavior, turned into a helper.
+    - data is the JSON from GPT-5: { manifest, files, readme }
+    - every call creates a new generation directory in the file store
+    - parent: generation whose binary assets carry over (see carry_assets())
+    - returns (generation, written_files_list)
+    """
+    with STAGE_SECONDS.time(stage="write"):
+        writer = file_store.begin(session_id)
+        try:
+            written_files = carry_assets(writer, parent)
+            written_files += write_result(writer, data)
+        except BaseException:
+            writer.abort()
+            raise
+
+        generation = writer.commit({"analysis": data.get("analysis", "")})
+    collect_garbage()
+    return generation, sorted(set(written_files))
+
+
+def ingest_extension(stream, content_type, session_id=None):
+    """
+    write_extension() for an upload read from `stream` (see ingest.py):
+    binary assets go straight into the generation as they're decoded, then
+    the rest is written. Returns (generation, result) where result holds
+    the text files, and the assets as None (enough for check_extension()).
+    Raises IngestError for a malformed or too large upload.
+    """
+    with STAGE_SECONDS.time(stage="write"):
+        writer = file_store.begin(session_id)
+        try:
+            payload = ingestor.read(stream, content_type, writer.open)
+            data = payload.result
+            try:
+                write_result(writer, data)
+            except ValueError as e:  # an unsafe file name, an unknown skeleton, ...
+                raise IngestError(str(e)) from e
+        except BaseException:
+            writer.abort()
+            raise
+        generation = writer.commit({"analysis": data.get("analysis", "")})
+    collect_garbage()
+    files = dict(data.get("files") or {})
+    files.update(dict.fromkeys(name for name in payload.assets if name not in files))
+    return generation, dict(data, files=files)
+
+
+def generation_as_result(generation):
+    """
+    Rebuild a { analysis, manifest, files, readme } dict from a stored
+    generation (text files only; binary assets are left out, and carried
+    over by carry_assets()). Skeleton text goes back to references, as the
+    model wrote it.
+    """
+    result = {"analysis": generation.meta.get("analysis", ""), "files": {}}
+    for name in sorted(generation.files):
+        try:
+            text = generation.read(name).decode("utf-8")
+        except UnicodeDecodeError:
+            continue
+        if name == "manifest.json":
+            result["manifest"] = json.loads(text)
+        elif name == "README.md":
+            result["readme"] = text
         else:
-            with open(path, "w", encoding="utf-8") as f:
-                f.write(content)
+            result["files"][name] = text
+    return skeleton_library.collapse(result) if SKELETONS else result
 
-        written_files.append(filename)
 
-    # README
-    if 'readme' in data:
-        readme_path = os.path.join(OUTPUT_DIR, "README.md")
-        with open(readme_path, "w", encoding="utf-8") as f:
-            f.write(data['readme'])
-        written_files.append("README.md")
+def warm_start(session, prompt, allow_delta=True):
+    """
+    For a session with no extension yet: (generation, Match) of the
+    earlier generation whose prompt is most like this one, or None.
+    """
+    if not (SIMILARITY and DELTA_REFINEMENT and allow_delta) or session.generation_id:
+        return None
+    for match in prompt_index.query(prompt, SIMILARITY_THRESHOLD):
+        generation = file_store.get(match.generation_id)
+        if generation is not None:
+            return generation, match
+        prompt_index.remove(match.generation_id)  # collected by file store GC
+    return None
+
+
+def start_from(session, generation, match):
+    """
+    Put an earlier generation into the session's history, as if it had
+    been forged there, so this turn refines it. Returns it as a result dict.
+    """
+    base = generation_as_result(generation)
+    session.append("user", f"Start from the extension made earlier for a similar request: "
+                           f"{match.prompt}")
+    session.append("assistant", json.dumps(base))
+    return base
+
+
+def remember_prompt(prompt, generation_id):
+    """Index a session's opening prompt for later warm starts."""
+    if SIMILARITY:
+        prompt_index.add(prompt, generation_id)
+
+
+_last_gc = 0.0
+_gc_lock = threading.Lock()
 
-    return os.path.abspath(OUTPUT_DIR), sorted(set(written_files))
 
+def collect_garbage(force=False):
+    """Run file store GC at most every STORE_GC_INTERVAL seconds."""
+    global _last_gc
+    with _gc_lock:
+        if not force and time.monotonic() - _last_gc < STORE_GC_INTERVAL:
+            return None
+        _last_gc = time.monotonic()
+    result = file_store.gc(keep=sessions.generation_ids(), keep_workspaces=sessions.ids())
+    if SESSION_DB and STORE_MAX_AGE:
+        sessions.forget_generations(before=time.time() - STORE_MAX_AGE)
+    return result
 
-def make_zip():
+
+def parent_generation(session):
+    """The session's current generation, which a new turn builds on (or None)."""
+    return file_store.get(session.generation_id) if session.generation_id else None
+
+
+def publish_generation(session, generation):
     """
-    Create a ZIP of the generated_extension folder.
-    Returns the absolute path to the zip file.
+    Make `generation` the session's current one and sync it into the
+    session's workspace: a stable directory where only changed files are
+    rewritten (so unpacked-extension reloaders don't churn).
+    Returns (workspace_path, changes) with added/changed/removed/unchanged.
     """
-    if not os.path.isdir(OUTPUT_DIR):
-        raise RuntimeError("No generated_extension directory to zip.")
-    zip_base = os.path.abspath("generated_extension")
-    zip_path = shutil.make_archive(zip_base, 'zip', OUTPUT_DIR)
-    return zip_path
+    session.generation_id = generation.id
+    if SESSION_DB:
+        sessions.record_generation(generation)
+    workspace = file_store.workspace_path(session.id)
+    with STAGE_SECONDS.time(stage="sync"):
+        changes = file_store.sync(workspace, generation.files)
+    return workspace, changes
+
+
+def current_workspace(session):
+    """The session's workspace directory, re-synced if it went missing."""
+    generation = current_generation(session)
+    workspace = file_store.workspace_path(session.id)
+    if not os.path.isdir(workspace):
+        file_store.sync(workspace, generation.files)
+    return workspace
+
+
+def current_generation(session):
+    """The session's current generation (re-materialised if needed)."""
+    if not session.generation_id:
+        raise RuntimeError("No generated extension yet. Generate first.")
+    generation = file_store.materialize(session.generation_id)
+    if generation is None:
+        raise RuntimeError("The current generation is no longer available. Generate again.")
+    return generation
 
 
 # ==========================================
@@ -230,17 +1045,17 @@ def find_chrome_executable():
     return None
 
 
-def launch_chrome_with_extension():
+def launch_chrome_with_extension(extension_dir):
     chrome_path = find_chrome_executable()
     if not chrome_path:
         raise RuntimeError(
             "Could not locate Chrome/Chromium. "
             "Set CHROME_PATH to the chrome executable if you want auto-launch."
         )
-    if not os.path.isdir(OUTPUT_DIR):
-        raise RuntimeError("generated_extension does not exist. Generate first.")
+    if not os.path.isdir(extension_dir):
+        raise RuntimeError(f"{extension_dir} does not exist. Generate first.")
 
-    abs_ext = os.path.abspath(OUTPUT_DIR)
+    abs_ext = os.path.abspath(extension_dir)
     args = [
         chrome_path,
         f"--load-extension={abs_ext}",
@@ -477,6 +1292,30 @@ HTML_TEMPLATE = """
             div.innerHTML = "C:\\\\Users\\\\Dev\\\\ChromeForge> " + text;
         }
 
+        async function readEvents(res, onEvent) {
+            // Minimal server-sent events reader over a fetch() body.
+            const reader = res.body.getReader();
+            const decoder = new TextDecoder();
+            let buffer = "";
+            while (true) {
+                const { value, done } = await reader.read();
+                if (done) break;
+                buffer += decoder.decode(value, { stream: true });
+                let sep;
+                while ((sep = buffer.indexOf("\\n\\n")) !== -1) {
+                    const block = buffer.substring(0, sep);
+                    buffer = buffer.substring(sep + 2);
+                    let event = "message";
+                    let dataLines = [];
+                    for (const line of block.split("\\n")) {
+                        if (line.startsWith("event:")) event = line.substring(6).trim();
+                        else if (line.startsWith("data:")) dataLines.push(line.substring(5).trim());
+                    }
+                    if (dataLines.length) onEvent(event, JSON.parse(dataLines.join("\\n")));
+                }
+            }
+        }
+
         async function startForge() {
             const text = promptInput.value.trim();
             if (!text) {
@@ -500,8 +1339,8 @@ HTML_TEMPLATE = """
             try {
                 const res = await fetch("/forge", {
                     method: "POST",
-                    headers: { "Content-Type": "application/json" },
-                    body: JSON.stringify({ prompt: text })
+                    headers: { "Content-Type": "application/json", "Accept": "text/event-stream" },
+                    body: JSON.stringify({ prompt: text, stream: true })
                 });
 
                 if (!res.ok) {
@@ -509,27 +1348,37 @@ HTML_TEMPLATE = """
                     throw new Error(`HTTP ${res.status}: ${errText}`);
                 }
 
-                const data = await res.json();
-                if (data.status !== "success") {
-                    throw new Error(data.message || "Unknown error from backend");
-                }
-
-                if (data.analysis) {
-                    logToTerminal(`[AI_ANALYSIS] ${data.analysis}`, "text-cyan-300");
-                }
-
-                if (Array.isArray(data.files)) {
-                    logToTerminal(">> WRITING_SOURCE_FILES...", "text-yellow-400");
-                    fileIcons.innerHTML = "";
-                    for (const file of data.files) {
-                        addFileIcon(file);
-                        logToTerminal(`   + created generated_extension/${file}`, "text-slate-300");
-                        await delay(60);
+                fileIcons.innerHTML = "";
+                let data = null;
+                let wroteAny = false;
+
+                await readEvents(res, (event, payload) => {
+                    if (event === "analysis" && payload.analysis) {
+                        logToTerminal(`[AI_ANALYSIS] ${payload.analysis}`, "text-cyan-300");
+                    } else if (event === "file") {
+                        if (!wroteAny) {
+                            logToTerminal(">> WRITING_SOURCE_FILES...", "text-yellow-400");
+                            wroteAny = true;
+                        }
+                        addFileIcon(payload.file);
+                        logToTerminal(`   + created ${payload.file} (${(payload.elapsed_ms / 1000).toFixed(1)}s)`, "text-slate-300");
+                        filePreview.classList.remove('hidden');
+                    } else if (event === "error") {
+                        throw new Error(payload.message || "Unknown error from backend");
+                    } else if (event === "done") {
+                        data = payload;
                     }
-                    filePreview.classList.remove('hidden');
+                });
+
+                if (!data || data.status !== "success") {
+                    throw new Error("Stream ended before the build finished");
                 }
 
                 logToTerminal(">> BUILD_SUCCESSFUL", "text-green-400 font-bold");
+                if (data.changes) {
+                    const c = data.changes;
+                    logToTerminal(`   ${c.added.length} added, ${c.changed.length} changed, ${c.removed.length} removed, ${c.unchanged.length} unchanged`, "text-slate-400");
+                }
                 if (data.path) {
                     logToTerminal(`Directory ready at: ${data.path}`, "text-slate-400");
                 }
@@ -571,6 +1420,10 @@ HTML_TEMPLATE = """
 </html>
 """
 
+# Rendered once: the prebuilt page (local CSS / JS) when build_static.py has
+# run for this template, else the template as is, with its CDN links.
+INDEX_PAGE = static_bundle.page("main_ui", HTML_TEMPLATE)
+
 
 # ==========================================
 # FLASK ROUTES
@@ -578,85 +1431,963 @@ HTML_TEMPLATE = """
 
 @app.route("/")
 def index():
-    return render_template_string(HTML_TEMPLATE)
+    return asset_response(INDEX_PAGE)
+
+
+@app.route("/static/<path:filename>")
+def static_file(filename):
+    """Prebuilt assets: content-hashed names, so cached for a year (immutable)."""
+    asset = static_bundle.get(filename)
+    if asset is None:
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    return asset_response(asset)
+
+
+def asset_response(asset):
+    """Response for a static_assets.Asset: precompressed variant, ETag / 304."""
+    status, headers, body = asset.respond(request.headers.get("Accept-Encoding"),
+                                          request.headers.get("If-None-Match"))
+    return Response(body, status=status, headers=headers)
+
+
+def current_session():
+    """The Session for this request (created on first use)."""
+    if "forge_session" not in g:
+        session_id = request.headers.get(SESSION_HEADER) or request.cookies.get(SESSION_COOKIE)
+        g.forge_session, _ = sessions.get(session_id)
+    return g.forge_session
+
+
+@app.after_request
+def remember_session(response):
+    session = g.get("forge_session")
+    if session is not None:
+        response.headers[SESSION_HEADER] = session.id
+        if request.cookies.get(SESSION_COOKIE) != session.id:
+            response.set_cookie(SESSION_COOKIE, session.id, httponly=True, samesite="Lax")
+    return response
+
+
+FORGE_TIP = (
+    "Tip: You can now send another prompt to refine this extension "
+    '(e.g. "change the popup text", "highlight links instead of phone numbers"). '
+    "ChromeForge remembers this session."
+)
 
 
 @app.route("/forge", methods=["POST"])
 def forge():
     """
     Main forge endpoint:
-    - Uses GPT-5 with your ORIGINAL system prompt.
-    - Keeps contextual memory (conversation_history).
+    - Uses the routed model (OPENAI_MODELS, GPT-5 first) with your ORIGINAL system prompt.
+    - Keeps contextual memory per session (cookie or X-Session-Id header).
     - Writes extension using OLD backend behavior.
+    - With {"stream": true} (or Accept: text/event-stream) answers with
+      server-sent events and writes files as they are generated.
+    - Identical requests are answered from the response cache; send
+      {"no_cache": true} (or Cache-Control: no-cache) to force a fresh call.
+    - Follow-up turns ask the model for a patch of the previous generation
+      (delta refinement); {"full": true} forces a full regeneration. A
+      session's first prompt that resembles an earlier one starts from that
+      earlier generation the same way (reported under "warm_start").
+    - With {"async": true} the turn is queued and a job id comes back at
+      once (202); poll /jobs/<id> and fetch /jobs/<id>/result.
+    - The model router picks the model (see OPENAI_MODELS); {"model": "..."}
+      pins one of the configured models for this turn. {"race": true}
+      (default FORGE_RACE) sends the turn to several models at once and keeps
+      the first valid answer; streamed full turns are never raced.
+    - The answer is validated before it is written (see validation.py); files
+      that fail are sent back to the model alone, with their errors, and the
+      report comes back under "validation".
     """
-    global conversation_history
     payload = request.get_json(silent=True) or {}
     prompt = (payload.get("prompt") or "").strip()
 
     if not prompt:
         return jsonify({"status": "error", "message": "Prompt is required"}), 400
 
-    # Build messages with memory (same idea as OLD frontend: system + full history)
-    conversation_history.append({"role": "user", "content": prompt})
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}] + conversation_history
+    session = current_session()
+    bypass_cache = bool(payload.get("no_cache")) or \
+        "no-cache" in request.headers.get("Cache-Control", "")
+    allow_delta = not payload.get("full")
+    model = payload.get("model") or None
+    if model is not None and model not in model_router.models:
+        return jsonify({"status": "error",
+                        "message": f"Unknown model; choose from {model_router.models}"}), 400
+    race = bool(payload.get("race", FORGE_RACE))
+
+    wants_stream = payload.get("stream") or \
+        "text/event-stream" in request.headers.get("Accept", "")
+    if wants_stream:
+        return Response(
+            stream_with_context(forge_stream_events(session, prompt, bypass_cache, allow_delta,
+                                                    model, race)),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    if payload.get("async"):
+        try:
+            job = job_queue.submit(forge_turn, session, prompt, bypass_cache, allow_delta, model,
+                                   race)
+        except QueueFull as e:
+            resp = jsonify({"status": "error", "message": str(e)})
+            resp.headers["Retry-After"] = str(JOB_RETRY_AFTER)
+            return resp, 503
+        return jsonify({
+            "status": "queued",
+            "job_id": job.id,
+            "status_url": f"/jobs/{job.id}",
+            "result_url": f"/jobs/{job.id}/result",
+            "session_id": session.id,
+        }), 202
 
     try:
-        ai_result = call_openai_json(messages)
+        return jsonify(forge_turn(session, prompt, bypass_cache, allow_delta, model, race))
+    except ForgeError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status
+
+
+class ForgeError(RuntimeError):
+    """A forge turn failed; status is the HTTP code to answer with."""
+
+    def __init__(self, message, status=500):
+        super().__init__(message)
+        self.status = status
+
+
+def forge_turn(session, prompt, bypass_cache=False, allow_delta=True, model=None, race=False):
+    """
+    One blocking /forge turn for a session: call the model, remember the
+    answer, write the extension. Returns the JSON response body; raises
+    ForgeError on failure. Runs on the request thread or a job worker.
+    """
+    # One turn at a time per session, so concurrent tabs can't interleave.
+    with FORGES_IN_FLIGHT.track_inprogress(), STAGE_SECONDS.time(stage="forge"):
+        with session.lock:
+            opening = not session.generation_id
+            try:
+                body = _forge_turn_locked(session, prompt, bypass_cache, allow_delta, model,
+                                          race)
+            except ForgeError:
+                FORGES.inc(outcome="error", mode="none")
+                raise
+        record_turn(prompt, body, opening)
+        return body
+
+
+def _forge_turn_locked(session, prompt, bypass_cache, allow_delta, model=None, race=False):
+    # Build messages with memory (same idea as OLD frontend: system + full history)
+    warm, base = begin_turn(session, prompt, allow_delta)
+    try:
+        ai_result, cached, mode = run_generation(
+            session, base or refinement_base(session, allow_delta), bypass_cache, model, race)
+        ai_result = validate_and_fix(ai_result, bypass_cache, model)
     except Exception as e:
-        return jsonify({"status": "error", "message": str(e)}), 500
+        raise ForgeError(str(e)) from e
+    return end_turn(session, ai_result, cached, mode, warm)
+
+
+# The steps of a turn that don't talk to the model. main_asgi runs the same
+# ones (from its executor), so the two servers only differ in how they wait.
+
+def begin_turn(session, prompt, allow_delta=True):
+    """
+    Start a turn (session lock held): warm-start a new session if an
+    earlier prompt is close enough, then record this prompt. Returns
+    (warm, base): the warm start's (generation, Match) and its result
+    dict, or (None, None).
+    """
+    warm = warm_start(session, prompt, allow_delta)
+    base = start_from(session, *warm) if warm else None
+    session.append("user", prompt)
+    return warm, base
+
+
+def begin_stream_turn(session, prompt):
+    """Start a streamed full turn (session lock held): record the prompt, return the messages."""
+    session.append("user", prompt)
+    return forge_messages(session)
+
+
+def end_turn(session, ai_result, cached, mode, warm=None):
+    """Note a warm start on the answer, then finish_turn() (building on its generation)."""
+    if warm:
+        WARM_STARTS.inc(mode=mode)
+        ai_result[WARM_START_KEY] = warm[1].to_dict()
+    return finish_turn(session, ai_result, cached, mode, warm[0] if warm else None)
+
+
+def record_turn(prompt, body, opening):
+    """Count a finished turn; a session's opening prompt is indexed for warm starts."""
+    if opening:
+        remember_prompt(prompt, body["generation_id"])
+    FORGES.inc(outcome="cached" if body["cached"] else "success", mode=body["refinement"])
+
+
+def record_stream_event(event, prompt, opening):
+    """record_turn() for a streamed turn, from the SSE events it sends."""
+    if event.startswith("event: done"):
+        record_turn(prompt, json.loads(event.split("data: ", 1)[1]), opening)
+    elif event.startswith("event: error"):
+        FORGES.inc(outcome="error", mode="none")
+
 
+def turn_refines(session, prompt, allow_delta=True):
+    """Whether this turn runs in refinement mode (so isn't streamed file by file)."""
+    return refinement_base(session, allow_delta) is not None or \
+        warm_start(session, prompt, allow_delta) is not None
+
+
+def refined_result(answer, base):
+    """A refinement answer applied to `base`: (ai_result, mode), annotations kept."""
+    ai_result, mode = resolve_answer(answer, base)
+    for key in ANNOTATION_KEYS:
+        if key in answer:
+            ai_result[key] = answer[key]
+    return ai_result, mode
+
+
+def forge_messages(session, refine=False):
+    """System prompt + (compacted) session history (+ the refinement-mode instruction)."""
+    head = [{"role": "system", "content": SYSTEM_PROMPT}]
+    # Appended last so the cacheable prefix is the same as a full turn's.
+    tail = [{"role": "system", "content": REFINE_PROMPT}] if refine else []
+    history = session.messages()
+    if COMPACTION:
+        history = compactor.compact(history, reserved=head + tail)
+    messages = head + history + tail
+    PROMPT_TOKENS.observe(prompt_tokens(messages))
+    return messages
+
+
+def refinement_base(session, allow_delta=True):
+    """
+    The session's current extension as a full result dict when this turn
+    can run in delta refinement mode, else None.
+    """
+    if not (DELTA_REFINEMENT and allow_delta and session.generation_id):
+        return None
+    generation = file_store.get(session.generation_id)
+    if generation is None:
+        return None
+    return generation_as_result(generation)
+
+
+def run_generation(session, base, bypass_cache=False, model=None, race=False):
+    """
+    Ask the model for this turn. With a refinement `base` the model is asked
+    for a patch, which is applied and validated; if that fails the turn is
+    regenerated in full. Returns (ai_result, cached, mode) where mode is
+    "full", "delta" or "fallback".
+    """
+    if base is not None:
+        try:
+            # (A race only accepts answers that apply; if none did, its last
+            # PatchError lands here too.)
+            answer, cached = generate_extension(forge_messages(session, refine=True), bypass_cache,
+                                                model, race, lambda a: resolve_answer(a, base))
+            ai_result, mode = refined_result(answer, base)
+            return ai_result, cached, mode
+        except PatchError as e:
+            app.logger.warning("Delta refinement failed, regenerating in full: %s", e)
+
+    ai_result, cached = generate_extension(forge_messages(session), bypass_cache, model, race)
+    return ai_result, cached, ("fallback" if base is not None else "full")
+
+
+def finish_turn(session, ai_result, cached, mode, parent=None):
+    """
+    Remember the answer, write + publish the generation, build the response.
+    - parent: generation this turn builds on (default: the session's current one).
+    """
+    notes = pop_annotations(ai_result)
     # Store assistant result in memory (JSON string, same as old code)
-    conversation_history.append({"role": "assistant", "content": json.dumps(ai_result)})
+    session.append("assistant", json.dumps(ai_result))
 
     try:
-        path, files = write_extension(ai_result)
+        parent = parent or parent_generation(session)
+        generation, files = write_extension(ai_result, session.id, parent)
+        path, changes = publish_generation(session, generation)
     except Exception as e:
-        return jsonify({"status": "error", "message": f"Failed to save files: {e}"}), 500
+        raise ForgeError(f"Failed to save files: {e}") from e
+
+    return forge_response(session, ai_result, generation, files, path, changes, cached, mode,
+                          notes)
 
-    tip = (
-        "Tip: You can now send another prompt to refine this extension "
-        '(e.g. "change the popup text", "highlight links instead of phone numbers"). '
-        "ChromeForge remembers this session."
-    )
 
-    return jsonify({
+def forge_response(session, ai_result, generation, files, path, changes, cached, mode,
+                   notes=None):
+    body = {
         "status": "success",
         "analysis": ai_result.get("analysis", ""),
         "files": files,
+        "changes": changes,
         "path": path,
-        "tip": tip,
-    })
+        "generation_id": generation.id,
+        "tip": FORGE_TIP,
+        "session_id": session.id,
+        "cached": cached,
+        "refinement": mode,
+    }
+    # "repair": which files survived a malformed / truncated answer;
+    # "routing": which model answered, and what was tried before it.
+    body.update(notes or {})
+    return body
+
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    return jsonify(job.to_dict())
+
+
+@app.route("/jobs/<job_id>/result")
+def job_result(job_id):
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"status": "error", "message": "Unknown job"}), 404
+    if job.state == FAILED:
+        return jsonify({"status": "error", "message": job.error, "job": job.to_dict()}), 500
+    if job.state != DONE:
+        resp = jsonify({"status": job.state, "job": job.to_dict()})
+        resp.headers["Retry-After"] = "1"
+        return resp, 202
+    return jsonify(job.result)
+
+
+@app.route("/forge/batch", methods=["POST"])
+def forge_batch():
+    """
+    Forge many prompts at once, independently of any session.
+    Body: {"prompts": ["...", {"prompt": "...", "name": "..."}, ...],
+           "context": "shared instructions for every prompt",
+           "concurrency": 4, "no_cache": false, "model": null, "race": false}
+    Streams back one ZIP with a folder per prompt, written as each prompt
+    finishes, and batch_manifest.json (per-item status) at the end. Each
+    answer is validated and fixed like a /forge turn's (its report is in
+    the item's status). A failed prompt gets an ERROR.txt instead of
+    files; the rest carry on.
+    """
+    payload = request.get_json(silent=True) or {}
+    try:
+        items = batch_items(payload.get("prompts"))
+        concurrency = max(1, min(int(payload.get("concurrency") or BATCH_CONCURRENCY),
+                                 BATCH_CONCURRENCY))
+    except (TypeError, ValueError) as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+    model = payload.get("model") or None
+    if model is not None and model not in model_router.models:
+        return jsonify({"status": "error",
+                        "message": f"Unknown model; choose from {model_router.models}"}), 400
+
+    race = bool(payload.get("race", FORGE_RACE))
+    context = (payload.get("context") or "").strip()
+    bypass_cache = bool(payload.get("no_cache")) or \
+        "no-cache" in request.headers.get("Cache-Control", "")
+
+    return Response(
+        iter_zip(batch_entries(items, context, bypass_cache, concurrency, model, race),
+                 ZIP_LEVELS, ZIP_DEFAULT_LEVEL),
+        mimetype="application/zip",
+        headers={"Content-Disposition": "attachment; filename=forge_batch.zip",
+                 "Cache-Control": "no-store", "X-Accel-Buffering": "no"},
+    )
+
+
+def batch_items(prompts):
+    """Validate /forge/batch prompts into [{"prompt", "name"}] with unique names."""
+    if not isinstance(prompts, list) or not prompts:
+        raise ValueError("prompts must be a non-empty list")
+    if len(prompts) > BATCH_MAX_PROMPTS:
+        raise ValueError(f"At most {BATCH_MAX_PROMPTS} prompts per batch")
+    items = []
+    for i, entry in enumerate(prompts, 1):
+        if isinstance(entry, str):
+            entry = {"prompt": entry}
+        prompt = (entry.get("prompt") or "").strip() if isinstance(entry, dict) else ""
+        if not prompt:
+            raise ValueError(f"Prompt {i} is empty")
+        name = f"{i:03d}-{slugify(entry.get('name') or prompt)}"
+        items.append({"prompt": prompt, "name": name})
+    return items
+
+
+def batch_messages(prompt, context):
+    """System prompt (+ shared batch context) + this item's prompt."""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if context:
+        # Shared by every item, so it stays part of the cacheable prefix.
+        messages.append({"role": "system", "content": f"Shared context for this batch:\n{context}"})
+    messages.append({"role": "user", "content": prompt})
+    return messages
+
+
+def forge_batch_item(item, context, bypass_cache, model=None, race=False):
+    """Generate and store one batch prompt. Returns (generation, files, cached, notes)."""
+    with FORGES_IN_FLIGHT.track_inprogress(), STAGE_SECONDS.time(stage="forge"):
+        try:
+            ai_result, cached = generate_extension(batch_messages(item["prompt"], context),
+                                                   bypass_cache, model, race)
+            ai_result = validate_and_fix(ai_result, bypass_cache, model)
+            notes = pop_annotations(ai_result)
+            generation, files = write_extension(ai_result)
+        except Exception:
+            FORGES.inc(outcome="error", mode="batch")
+            raise
+    FORGES.inc(outcome="cached" if cached else "success", mode="batch")
+    return generation, files, cached, notes
+
+
+def batch_entries(items, context, bypass_cache, concurrency, model=None, race=False):
+    """(name, bytes) ZIP entries for a batch, in completion order."""
+    started = time.time()
+    statuses = []
+    outcomes = run_concurrently(
+        lambda item: forge_batch_item(item, context, bypass_cache, model, race),
+        items, concurrency)
+    for outcome in outcomes:
+        item = outcome.item
+        status = {
+            "index": outcome.index,
+            "name": item["name"],
+            "prompt": item["prompt"],
+            "elapsed_ms": round(outcome.elapsed * 1000.0, 1),
+        }
+        if outcome.ok:
+            generation, files, cached, notes = outcome.result
+            status.update(status="success", generation_id=generation.id,
+                          files=files, cached=cached, **notes)
+            for name, data in generation_entries(generation):
+                yield f"{item['name']}/{name}", data
+        else:
+            status.update(status="error", error=str(outcome.error))
+            yield f"{item['name']}/ERROR.txt", f"{outcome.error}\n".encode("utf-8")
+        statuses.append(status)
+
+    statuses.sort(key=lambda s: s["index"])
+    succeeded = sum(1 for s in statuses if s["status"] == "success")
+    manifest = {
+        "status": "success" if succeeded == len(statuses) else
+                  ("partial" if succeeded else "error"),
+        "succeeded": succeeded,
+        "failed": len(statuses) - succeeded,
+        "context": context,
+        "elapsed_ms": round((time.time() - started) * 1000.0, 1),
+        "items": statuses,
+    }
+    yield "batch_manifest.json", json.dumps(manifest, indent=2).encode("utf-8")
+
+
+def sse_event(event, data):
+    """Format one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def forge_stream_events(session, prompt, bypass_cache=False, allow_delta=True, model=None,
+                        race=False):
+    """
+    Streaming variant of /forge (holds the session lock while it runs):
+    - reads the model's answer with stream=True,
+    - writes each file into a new generation the moment its JSON value closes,
+    - yields SSE events: "file" per written file, "analysis", then "done"
+      (or "error").
+    """
+    started = time.monotonic()
+
+    def elapsed_ms():
+        return int((time.monotonic() - started) * 1000)
+
+    with FORGES_IN_FLIGHT.track_inprogress(), STAGE_SECONDS.time(stage="forge"):
+        with session.lock:
+            opening = not session.generation_id
+            for event in _forge_stream_turn(session, prompt, bypass_cache, allow_delta, model,
+                                            race, elapsed_ms):
+                record_stream_event(event, prompt, opening)
+                yield event
+
+
+def _forge_stream_turn(session, prompt, bypass_cache, allow_delta, model, race, elapsed_ms):
+    if turn_refines(session, prompt, allow_delta):
+        # Patches are small: run the turn in one go, then report it.
+        yield sse_event("status", {"message": "refining"})
+        try:
+            body = _forge_turn_locked(session, prompt, bypass_cache, allow_delta, model, race)
+        except ForgeError as e:
+            yield sse_event("error", {"message": str(e)})
+            return
+        yield from replay_events(body, elapsed_ms)
+        return
+
+    messages = begin_stream_turn(session, prompt)
+
+    key, ai_result = cached_result(messages, bypass_cache, model)
+    if ai_result is not None:
+        # Cache hit: write everything at once and replay it as events.
+        try:
+            ai_result = validate_and_fix(ai_result, bypass_cache, model)
+            body = finish_turn(session, ai_result, True, "full")
+        except ForgeError as e:
+            yield sse_event("error", {"message": str(e)})
+            return
+        yield from replay_events(body, elapsed_ms)
+        return
+
+    flight = None
+    while COALESCE:
+        flight, leading = upstream_flights.begin(flight_key(key, model))
+        if leading:
+            break
+        # The same request is being answered right now (streamed or not):
+        # wait for that answer instead of paying for a second one.
+        yield sse_event("status", {"message": "coalesced"})
+        try:
+            ai_result, routing = flight.wait()
+        except Abandoned:
+            continue  # its client left before the answer was in: start over
+        except Exception as e:
+            yield sse_event("error", {"message": str(e)})
+            return
+        try:
+            ai_result[ROUTING_KEY] = dict(routing.to_dict(), coalesced=True)
+            body = finish_turn(session, validate_and_fix(ai_result, bypass_cache, model),
+                               False, "full")
+        except Exception as e:
+            yield sse_event("error", {"message": str(e)})
+            return
+        yield from replay_events(body, elapsed_ms)
+        return
+
+    turn = None
+    try:
+        turn = StreamedTurn(session, key, elapsed_ms)
+        yield sse_event("status", {"message": "streaming"})
+
+        deltas, routing = stream_openai_content(messages, model)
+        yield sse_event("status", {"message": "model", "model": routing.model,
+                                   "reason": routing.reason})
+        for delta in deltas:
+            completed = turn.parse(delta)
+            if completed:
+                yield from turn.write(completed)
+
+        yield from turn.finish()
+        if flight is not None:
+            upstream_flights.finish(flight, turn.shared_answer(routing))
+            flight = None
+        if VALIDATION:
+            report, events = turn.check()
+            yield from events
+            ai_result, _ = fix_extension(turn.ai_result, report, bypass_cache, model)
+            yield from turn.apply_fixes(ai_result)
+    except BaseException as e:
+        if turn is not None:
+            turn.abort()
+        if flight is not None:
+            if isinstance(e, Exception):
+                upstream_flights.finish(flight, error=e)
+            else:
+                upstream_flights.abandon(flight)
+        if not isinstance(e, Exception):
+            raise
+        yield sse_event("error", {"message": str(e)})
+        return
+
+    yield from turn.commit(routing)
+
+
+class StreamedTurn:
+    """
+    The writing side of a streamed full turn: files go into a new generation
+    as their JSON values close in the model's answer. Both servers use it;
+    the methods that return events return lists, and every one but parse()
+    touches the disk (main_asgi runs those in its executor).
+    - key: the turn's response cache key (the answer is stored on commit).
+    """
+
+    def __init__(self, session, key, elapsed_ms):
+        self.session = session
+        self.key = key
+        self.elapsed_ms = elapsed_ms
+        self.parser = ExtensionStreamParser()
+        self.parent = parent_generation(session)
+        self.writer = file_store.begin(session.id)
+        self.written_files = carry_assets(self.writer, self.parent)
+        self.has_manifest = False
+        self.chunks = []
+        self.incremental = True
+        self.answer = self.ai_result = None
+
+    def _file_events(self, names):
+        self.written_files += names
+        return [sse_event("file", {"file": name, "elapsed_ms": self.elapsed_ms()})
+                for name in names]
+
+    def parse(self, delta):
+        """Feed one content delta; returns the (path, value) pairs it completed."""
+        self.chunks.append(delta)
+        if not self.incremental:
+            return ()
+        try:
+            return self.parser.feed(delta)
+        except ValueError:
+            # Malformed JSON: stop writing early, repair the whole answer at the end.
+            self.incremental = False
+            return ()
+
+    def write(self, completed):
+        """Write what parse() completed; returns the events for it."""
+        events = []
+        for path, value in completed:
+            if path == ("manifest",):
+                self.has_manifest = True
+                names = write_manifest(self.writer, value)
+            elif path == ("readme",):
+                names = write_readme(self.writer, value)
+            elif path[0] == "files":
+                # An icon.png arriving after the .svg simply overwrites
+                # the placeholder, so only earlier files matter here.
+                names = write_extension_file(self.writer, path[1], value,
+                                             "icon.png" in self.writer.files)
+            else:
+                if path == ("analysis",):
+                    events.append(sse_event("analysis", {"analysis": value}))
+                continue
+            events += self._file_events(names)
+        return events
+
+    def finish(self):
+        """Parse (and if need be repair) the whole answer once the stream ends."""
+        self.answer = self.ai_result = parse_model_content("".join(self.chunks))
+        repair = self.ai_result.get(REPAIR_KEY)
+        if not self.incremental or (repair and set(repair["repairs"]) - WRAPPER_REPAIRS):
+            # What was written early may differ from the repaired answer:
+            # start the generation over from it.
+            self.writer.abort()
+            self.writer = file_store.begin(self.session.id)
+            rewritten = carry_assets(self.writer, self.parent)
+            rewritten += write_result(self.writer, self.ai_result)
+            events = [sse_event("file", {"file": name, "elapsed_ms": self.elapsed_ms()})
+                      for name in rewritten if name not in self.written_files]
+            self.written_files = rewritten
+            return events
+        if not self.has_manifest:
+            return self._file_events(write_manifest(self.writer,
+                                                    self.ai_result.get("manifest", {})))
+        return []
+
+    def shared_answer(self, routing):
+        """
+        (answer, routing) once finish() has parsed the answer, for identical
+        requests coalesced onto this one; a copy, as the turn goes on to
+        change its own.
+        """
+        return copy.deepcopy(self.answer), routing
+
+    def check(self):
+        """Validate the answer: (report, events)."""
+        report = check_extension(self.ai_result)
+        if report.ok:
+            return report, []
+        return report, [sse_event("status", {"message": "fixing",
+                                             "files": report.failing_files()})]
+
+    def apply_fixes(self, ai_result):
+        """Write what fixing changed (`ai_result` becomes the turn's result)."""
+        names = write_fixes(self.writer, self.answer, ai_result)
+        self.ai_result = ai_result
+        return self._file_events(names)
+
+    def abort(self):
+        self.writer.abort()
+
+    def commit(self, routing):
+        """Record and publish the generation, remember the answer: the closing events."""
+        try:
+            generation = self.writer.commit({"analysis": self.ai_result.get("analysis", "")})
+            path, changes = publish_generation(self.session, generation)
+        except Exception as e:
+            return [sse_event("error", {"message": f"Failed to save files: {e}"})]
+        collect_garbage()
+
+        if CACHE_ENABLED:
+            response_cache.put(self.key, self.answer)  # the model's answer, before fixes
+
+        ai_result = self.ai_result
+        notes = pop_annotations(ai_result)
+        notes["routing"] = routing.to_dict()
+        # Store assistant result in memory (JSON string, same as old code)
+        self.session.append("assistant", json.dumps(ai_result))
+
+        body = forge_response(self.session, ai_result, generation,
+                              sorted(set(self.written_files)), path, changes, False, "full",
+                              notes)
+        body["elapsed_ms"] = self.elapsed_ms()
+        return [sse_event("done", body)]
+
+
+def replay_events(body, elapsed_ms):
+    """SSE events for a turn that finished without streaming."""
+    if body.get("analysis"):
+        yield sse_event("analysis", {"analysis": body["analysis"]})
+    changes = body.get("changes") or {}
+    touched = set(changes.get("added", [])) | set(changes.get("changed", []))
+    for name in body["files"]:
+        if not changes or name in touched:
+            yield sse_event("file", {"file": name, "elapsed_ms": elapsed_ms()})
+    body = dict(body, elapsed_ms=elapsed_ms())
+    yield sse_event("done", body)
 
 
 # Optional: keep /save for compatibility with your OLD backend contract
+# (the same JSON body; or multipart with binary assets, see ingest.py)
 @app.route("/save", methods=["POST"])
 def save_files():
     try:
-        data = request.json or {}
-        path, _ = write_extension(data)
-        return jsonify({"status": "success", "path": path})
+        session = current_session()
+        # Read (however slowly it arrives) before taking the session's lock.
+        generation, data = ingest_extension(request.stream, request.content_type, session.id)
+        with session.lock:
+            body = publish_upload(session, generation, data)
+        return jsonify(body)
+    except IngestError as e:
+        return jsonify({"status": "error", "message": str(e)}), e.status
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 500
 
 
+def publish_upload(session, generation, data):
+    """
+    Make an uploaded generation (see ingest_extension()) the session's
+    current one (session lock held). Returns the /save response body.
+    """
+    path, changes = publish_generation(session, generation)
+    body = {"status": "success", "path": path, "changes": changes,
+            "generation_id": generation.id, "files": sorted(generation.files)}
+    if VALIDATION:
+        # Saved as sent; the report says whether Chrome is likely to load it.
+        body["validation"] = check_extension(data).to_dict()
+    return body
+
+
+def download_target(session):
+    """
+    (generation, etag, headers) for /download of the session's current
+    generation; raises RuntimeError if there is none. The ETag is the
+    hash of its files, so If-None-Match can be answered before zipping.
+    """
+    generation = current_generation(session)
+    headers = {
+        "Content-Disposition": "attachment; filename=generated_extension.zip",
+        "Cache-Control": "private, no-cache",
+    }
+    return generation, archive_etag(generation.files), headers
+
+
+def archive_bytes(generation, etag):
+    """
+    The generation's ZIP from the archive cache, or built and cached; None
+    when it's too big to hold in memory (stream_archive() it instead).
+    """
+    data = archive_cache.get(etag)
+    if data is None and generation.size() <= ZIP_MEMORY_LIMIT:
+        with STAGE_SECONDS.time(stage="zip"):
+            data = b"".join(iter_zip(generation_entries(generation), ZIP_LEVELS, ZIP_DEFAULT_LEVEL))
+        archive_cache.put(etag, data)
+    return data
+
+
+def stream_archive(generation):
+    """The generation's ZIP, built entry by entry as it is read."""
+    return iter_zip(generation_entries(generation), ZIP_LEVELS, ZIP_DEFAULT_LEVEL)
+
+
 @app.route("/download")
 def download():
+    """
+    ZIP of the session's current generation, built in memory and cached by
+    content hash. The ETag is that hash, so If-None-Match gets a 304.
+    """
     try:
-        zip_path = make_zip()
+        generation, etag, headers = download_target(current_session())
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 400
-    return send_file(zip_path, mimetype="application/zip",
-                     as_attachment=True, download_name="generated_extension.zip")
+
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304, headers=headers)
+        resp.set_etag(etag)
+        return resp
+
+    data = archive_bytes(generation, etag)
+    if data is not None:
+        resp = Response(iter_chunks(data), mimetype="application/zip", headers=headers)
+        resp.content_length = len(data)
+    else:
+        # Too big to hold in memory: stream it out entry by entry.
+        resp = Response(stream_archive(generation), mimetype="application/zip",
+                        headers=headers)
+    resp.set_etag(etag)
+    return resp
 
 
 @app.route("/launch", methods=["POST"])
 def launch():
     try:
-        launch_chrome_with_extension()
+        launch_chrome_with_extension(current_workspace(current_session()))
         return jsonify({"status": "success"})
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 400
 
 
+def session_generations(session):
+    """The session's generations, oldest first (from the session DB's index if there is one)."""
+    if not SESSION_DB:
+        return file_store.list(session.id)
+    generations, gone = [], []
+    for record in sessions.generations(session.id):
+        if os.path.exists(file_store.record_path(record["id"])):
+            generations.append(Generation(file_store, record))
+        else:
+            gone.append(record["id"])  # collected by file store GC
+    if gone:
+        sessions.forget_generations(gone)
+    return generations
+
+
+def generations_listing(session):
+    """The /generations response body: the session's generations and its current one."""
+    return {
+        "current": session.generation_id,
+        "generations": [gen.to_dict() for gen in session_generations(session)],
+    }
+
+
+def rollback_to(session, gen_id):
+    """
+    Make generation `gen_id` the session's current one again (session lock
+    held) and tell the model about it. Returns the response body, or None
+    for an unknown generation (another session's counts as unknown).
+    """
+    generation = file_store.get(gen_id)
+    if generation is None or generation.session_id != session.id:
+        return None
+    generation = file_store.materialize(gen_id)
+    path, changes = publish_generation(session, generation)
+    session.append("user", f"Roll back to the extension from generation {generation.id}.")
+    session.append("assistant", json.dumps(generation_as_result(generation)))
+    return {
+        "status": "success",
+        "generation_id": generation.id,
+        "path": path,
+        "files": sorted(generation.files),
+        "changes": changes,
+    }
+
+
+@app.route("/generations")
+def list_generations():
+    return jsonify(generations_listing(current_session()))
+
+
+@app.route("/generations/<gen_id>/rollback", methods=["POST"])
+def rollback_generation(gen_id):
+    """
+    Make an earlier generation current again (its directory is re-created
+    from the blob store if it was removed) and tell the model about it so
+    the next refinement starts from that version.
+    """
+    session = current_session()
+    with session.lock:
+        body = rollback_to(session, gen_id)
+    if body is None:
+        return jsonify({"status": "error", "message": "Unknown generation"}), 404
+    return jsonify(body)
+
+
+@app.route("/cache", methods=["DELETE"])
+def clear_cache():
+    return jsonify({"status": "success", "removed": response_cache.clear()})
+
+
+@app.route("/cache/<key>", methods=["DELETE"])
+def invalidate_cache(key):
+    return jsonify({"status": "success", "removed": response_cache.invalidate(key)})
+
+
+@app.route("/stats/cache")
+def cache_stats():
+    return jsonify(response_cache.stats())
+
+
+@app.route("/metrics")
+def metrics():
+    return Response(REGISTRY.render(), mimetype=METRICS_CONTENT_TYPE)
+
+
+@app.route("/stats/archives")
+def archive_stats():
+    return jsonify(archive_cache.stats())
+
+
+@app.route("/stats/jobs")
+def jobs_stats():
+    return jsonify(job_queue.stats())
+
+
+@app.route("/stats/coalescing")
+def coalescing_stats():
+    return jsonify(upstream_flights.stats())
+
+
+@app.route("/stats/similarity")
+def similarity_stats():
+    return jsonify(prompt_index.stats() if SIMILARITY else {"enabled": False})
+
+
+@app.route("/stats/ingest")
+def ingest_stats():
+    return jsonify(ingestor.stats())
+
+
+@app.route("/stats/skeletons")
+def skeleton_stats():
+    return jsonify(dict(skeleton_library.stats(), enabled=SKELETONS))
+
+
+@app.route("/stats/compaction")
+def compaction_stats():
+    return jsonify(compactor.stats())
+
+
+@app.route("/stats/sessions")
+def session_stats():
+    return jsonify(sessions.stats())
+
+
+@app.route("/stats/upstream")
+def upstream_stats():
+    return jsonify({"pool": upstream_pool.stats(), "retries": upstream_retrier.stats()})
+
+
+@app.route("/stats/static")
+def static_stats():
+    return jsonify(static_bundle.stats())
+
+
+@app.route("/stats/validation")
+def validation_stats():
+    return jsonify(validator.stats())
+
+
+@app.route("/stats/router")
+def router_stats():
+    return jsonify(model_router.stats())
+
+
 if __name__ == "__main__":
+    if UPSTREAM_WARMUP:
+        upstream_pool.warm_up(UPSTREAM_WARMUP)
     app.run(debug=True, port=5000)
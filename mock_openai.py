@@ -0,0 +1,308 @@
+"""
+Local stand-in for the OpenAI chat-completions endpoint.
+
+Point the server at it to measure ChromeForge without paying for real
+GPT-5 calls:
+
+    python mock_openai.py --port 8900 --latency lognormal:1.5,0.5 --error-rate 0.02
+    OPENAI_API_URL=http://127.0.0.1:8900/v1/chat/completions OPENAI_API_KEY=x python main_ui.py
+
+Features:
+- configurable latency distribution (total time per answer; streamed
+  answers spread it over their chunks),
+- stream=True answers as server-sent events, with usage when asked for,
+- error injection (HTTP status codes and mid-stream disconnects),
+- broken answers (a JS syntax error) to exercise validation, and fixes
+  for them in fix mode,
+- record real upstream answers to a directory and replay them later.
+Without a recording the answer is a synthetic, valid extension.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def parse_latency(spec):
+    """
+    Latency spec -> zero-argument sampler returning seconds.
+      fixed:2            always 2 s
+      uniform:1,5        uniform between 1 and 5 s
+      normal:3,1         mean 3, stddev 1 (clamped at 0)
+      lognormal:1.5,0.5  exp(N(1.5, 0.5)) -- long tail like real generations
+      exp:4              exponential with mean 4 s
+    """
+    kind, _, args = (spec or "fixed:0").partition(":")
+    values = [float(v) for v in args.split(",") if v]
+    if kind == "fixed":
+        return lambda: values[0] if values else 0.0
+    if kind == "uniform":
+        return lambda: random.uniform(values[0], values[1])
+    if kind == "normal":
+        return lambda: max(0.0, random.gauss(values[0], values[1]))
+    if kind == "lognormal":
+        return lambda: random.lognormvariate(values[0], values[1])
+    if kind == "exp":
+        return lambda: random.expovariate(1.0 / values[0])
+    raise ValueError(f"Unknown latency distribution: {spec}")
+
+
+def request_key(body):
+    """Recording key: model + messages (sampling params don't matter here)."""
+    canonical = json.dumps({"model": body.get("model"), "messages": body.get("messages")},
+                           sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def synthetic_answer(body, files=5, file_size=2000, invalid=False):
+    """
+    A valid ChromeForge answer (or patch, in refinement / fix mode).
+    - invalid: leave a syntax error in popup.js.
+    """
+    messages = body.get("messages") or []
+    prompt = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+    salt = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:8]
+    filler = ("// " + "x" * 76 + "\n") * max(1, file_size // 80)
+
+    if messages and "REFINEMENT MODE" in messages[-1].get("content", ""):
+        return {
+            "analysis": f"Mock refinement {salt}",
+            "patch": {"files": {"popup.js": f"// refined {salt}\n{filler}"}},
+        }
+    if messages and "FIX MODE" in messages[-1].get("content", ""):
+        # Rewrite every file named in the PROBLEMS list ("- name:line: message").
+        problems = messages[-1]["content"].split("PROBLEMS:", 1)[-1].split("\n\n", 1)[0]
+        names = {line[2:].split(":", 1)[0] for line in problems.splitlines()
+                 if line.startswith("- ")}
+        return {
+            "analysis": f"Mock fix {salt}",
+            "patch": {"files": {name: f"// fixed {salt}\n{filler}"
+                                for name in sorted(names) if name != "manifest.json"}},
+        }
+
+    generated = {
+        "popup.html": "<!DOCTYPE html><html><head><link rel='stylesheet' href='styles.css'>"
+                      "</head><body><h1>Mock</h1><script src='popup.js'></script></body></html>",
+        "styles.css": ":root { --accent: #06b6d4; }\nbody { color: var(--accent); }\n",
+        "popup.js": f"// {salt}\n{filler}" + ("function broken() {\n" if invalid else ""),
+        "background.js": f"// background {salt}\n{filler}",
+        "icon.svg": "<svg xmlns='http://www.w3.org/2000/svg' width='16' height='16'/>",
+    }
+    for i in range(max(0, files - len(generated))):
+        generated[f"lib/extra{i}.js"] = f"// extra {i}\n{filler}"
+    return {
+        "analysis": f"Mock extension for: {prompt[:60]}",
+        "manifest": {
+            "manifest_version": 3,
+            "name": f"Mock {salt}",
+            "version": "1.0.0",
+            "action": {"default_popup": "popup.html"},
+            "background": {"service_worker": "background.js"},
+        },
+        "files": generated,
+        "readme": f"# Mock {salt}\n",
+    }
+
+
+class MockConfig:
+    def __init__(self, args):
+        self.latency = parse_latency(args.latency)
+        self.error_rate = args.error_rate
+        self.error_codes = [int(c) for c in args.error_codes.split(",") if c]
+        self.disconnect_rate = args.disconnect_rate
+        self.invalid_rate = args.invalid_rate
+        self.chunk_size = args.chunk_size
+        self.files = args.files
+        self.file_size = args.file_size
+        self.record_dir = args.record
+        self.replay_dir = args.replay
+        self.upstream = args.upstream
+        self.stats = {"requests": 0, "errors": 0, "disconnects": 0, "replayed": 0, "recorded": 0}
+        self.lock = threading.Lock()
+
+    def count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None  # set by make_server()
+
+    def log_message(self, fmt, *args):
+        pass
+
+    def _send_json(self, status, obj, headers=None):
+        data = json.dumps(obj).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            with self.config.lock:
+                self._send_json(200, dict(self.config.stats))
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        cfg = self.config
+        cfg.count("requests")
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+
+        if cfg.error_rate and random.random() < cfg.error_rate:
+            cfg.count("errors")
+            code = random.choice(cfg.error_codes or [500])
+            headers = {"Retry-After": "1"} if code == 429 else None
+            self._send_json(code, {"error": {"message": f"Injected {code}"}}, headers)
+            return
+
+        content, usage = self._answer(body)
+        delay = cfg.latency()
+
+        if body.get("stream"):
+            self._stream(body, content, usage, delay)
+            return
+
+        time.sleep(delay)
+        self._send_json(200, {
+            "id": "chatcmpl-mock",
+            "object": "chat.completion",
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content},
+                         "finish_reason": "stop"}],
+            "usage": usage,
+        })
+
+    def _answer(self, body):
+        """(content string, usage dict) from a recording, the upstream or synthesis."""
+        cfg = self.config
+        key = request_key(body)
+        if cfg.replay_dir:
+            path = os.path.join(cfg.replay_dir, key + ".json")
+            if os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    recorded = json.load(f)["response"]
+                cfg.count("replayed")
+                return recorded["choices"][0]["message"]["content"], recorded.get("usage", {})
+
+        if cfg.record_dir and cfg.upstream:
+            upstream_body = dict(body, stream=False)
+            upstream_body.pop("stream_options", None)
+            req = urllib.request.Request(
+                cfg.upstream,
+                data=json.dumps(upstream_body).encode("utf-8"),
+                headers={"Content-Type": "application/json",
+                         "Authorization": self.headers.get("Authorization", "")},
+            )
+            with urllib.request.urlopen(req, timeout=600) as resp:
+                recorded = json.loads(resp.read().decode("utf-8"))
+            os.makedirs(cfg.record_dir, exist_ok=True)
+            with open(os.path.join(cfg.record_dir, key + ".json"), "w", encoding="utf-8") as f:
+                json.dump({"request": body, "response": recorded}, f)
+            cfg.count("recorded")
+            return recorded["choices"][0]["message"]["content"], recorded.get("usage", {})
+
+        content = json.dumps(synthetic_answer(body, cfg.files, cfg.file_size,
+                                              random.random() < cfg.invalid_rate))
+        prompt_chars = sum(len(m.get("content", "")) for m in body.get("messages") or [])
+        usage = {
+            "prompt_tokens": prompt_chars // 4,
+            "completion_tokens": len(content) // 4,
+            "total_tokens": (prompt_chars + len(content)) // 4,
+            "prompt_tokens_details": {"cached_tokens": 0},
+        }
+        return content, usage
+
+    def _stream(self, body, content, usage, delay):
+        cfg = self.config
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def send(obj):
+            data = b"data: " + (obj if isinstance(obj, bytes) else json.dumps(obj).encode("utf-8"))
+            data += b"\n\n"
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+            self.wfile.flush()
+
+        pieces = [content[i:i + cfg.chunk_size] for i in range(0, len(content), cfg.chunk_size)]
+        pause = delay / max(len(pieces), 1)
+        drop_at = random.randrange(len(pieces)) if (
+            cfg.disconnect_rate and random.random() < cfg.disconnect_rate and pieces) else None
+
+        for i, piece in enumerate(pieces):
+            if i == drop_at:
+                cfg.count("disconnects")
+                self.close_connection = True
+                return
+            time.sleep(pause)
+            send({"id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                  "choices": [{"index": 0, "delta": {"content": piece}}]})
+
+        if (body.get("stream_options") or {}).get("include_usage"):
+            send({"id": "chatcmpl-mock", "object": "chat.completion.chunk",
+                  "choices": [], "usage": usage})
+        send(b"[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+
+class MockServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the async server opens connections by the thousand
+
+    def handle_error(self, request, client_address):
+        # Clients hanging up mid-answer (cancelled hedges, races) is normal here.
+        if isinstance(sys.exc_info()[1], (BrokenPipeError, ConnectionResetError)):
+            return
+        super().handle_error(request, client_address)
+
+
+def make_server(args, host="127.0.0.1"):
+    """Build (but don't start) the mock server for parsed CLI args."""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": MockConfig(args)})
+    return MockServer((host, args.port), handler)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Mock OpenAI chat-completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    parser.add_argument("--latency", default="fixed:0",
+                        help="fixed:S | uniform:A,B | normal:MU,SD | lognormal:MU,SIGMA | exp:MEAN")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="fraction of requests answered with an injected error")
+    parser.add_argument("--error-codes", default="429,500,503")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="fraction of streamed answers cut off mid-stream")
+    parser.add_argument("--invalid-rate", type=float, default=0.0,
+                        help="fraction of synthetic answers with a JS syntax error")
+    parser.add_argument("--chunk-size", type=int, default=64, help="characters per stream chunk")
+    parser.add_argument("--files", type=int, default=5, help="files in synthetic answers")
+    parser.add_argument("--file-size", type=int, default=2000, help="bytes per synthetic file")
+    parser.add_argument("--record", metavar="DIR", help="save upstream answers here")
+    parser.add_argument("--replay", metavar="DIR", help="serve recorded answers from here")
+    parser.add_argument("--upstream", default="https://api.openai.com/v1/chat/completions",
+                        help="real endpoint used with --record")
+    return parser
+
+
+if __name__ == "__main__":
+    cli_args = build_parser().parse_args()
+    srv = make_server(cli_args, cli_args.host)
+    print(f"Mock OpenAI listening on http://{cli_args.host}:{cli_args.port}/v1/chat/completions")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
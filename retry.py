@@ -0,0 +1,340 @@
+"""
+Retry and hedging policy for upstream calls.
+
+Retrier.call(fn) runs fn(timeout, cancel) until it succeeds, the error is
+not worth retrying, attempts run out, or the total deadline is spent:
+
+- 429 / 5xx / connection errors are retried with exponential backoff and
+  full jitter; a Retry-After (or retry-after-ms) header wins over the
+  computed backoff, and a wait that would overrun the deadline ends the
+  call right away instead of sleeping through it.
+- every attempt gets only what is left of the deadline as its timeout,
+  which bounds the whole attempt (a streamed answer included), not just
+  each read.
+- with hedging on, an attempt that is still running once it is slower
+  than the chosen percentile of recent calls gets an identical second
+  request; whichever answers first wins and the other is cancelled.
+
+call_async(fn) is the same for coroutines (the ASGI server's upstream
+client): attempts and hedges are tasks, and the losing one is cancelled.
+
+Retries, hedges and their outcomes are counted in stats().
+"""
+import asyncio
+import collections
+import email.utils
+import queue
+import random
+import threading
+import time
+
+from upstream import (CancelToken, DeadlineExceeded, UpstreamCancelled, UpstreamError,
+                      UpstreamHTTPError)
+
+RETRY_STATUSES = frozenset({408, 409, 429, 500, 502, 503, 504})
+
+
+def retry_after(exc, now=None):
+    """Seconds the server asked us to wait (Retry-After / retry-after-ms), or None."""
+    headers = {k.lower(): v for k, v in (getattr(exc, "headers", None) or {}).items()}
+    if "retry-after-ms" in headers:
+        try:
+            return max(0.0, float(headers["retry-after-ms"]) / 1000.0)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when.timestamp() - (now or time.time()))
+
+
+def retry_reason(exc):
+    """Label for a retryable error ("429", "503", "connection"), else None."""
+    if isinstance(exc, UpstreamCancelled):
+        return None
+    if isinstance(exc, UpstreamHTTPError):
+        return str(exc.status) if exc.status in RETRY_STATUSES else None
+    if isinstance(exc, UpstreamError) and not isinstance(exc, DeadlineExceeded):
+        return "connection"
+    return None
+
+
+class LatencyTracker:
+    """Sliding window of recent call latencies (seconds)."""
+
+    def __init__(self, window=200):
+        self._samples = collections.deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, pct, min_samples=1):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < max(1, min_samples):
+            return None
+        rank = min(len(samples) - 1, max(0, int(round(pct / 100.0 * len(samples))) - 1))
+        return samples[rank]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._samples)
+
+
+class RetryPolicy:
+    """
+    - max_attempts: total tries, the first included.
+    - base_delay / max_delay: backoff is uniform(0, min(max_delay, base_delay * 2**n)).
+    - deadline: total seconds for the whole call, retries and waits included.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=20.0, deadline=600.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = deadline
+
+    def backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+
+class HedgePolicy:
+    """
+    - percentile: hedge once an attempt is slower than this share of recent calls.
+    - min_samples: no hedging until this many latencies have been seen.
+    - min_delay: never hedge sooner than this many seconds in.
+    - after: fixed hedge delay in seconds (overrides the percentile).
+    """
+
+    def __init__(self, percentile=95.0, min_samples=20, min_delay=1.0, after=None,
+                 tracker=None):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.after = after
+        self.tracker = tracker or LatencyTracker()
+
+    def delay(self):
+        """Seconds to wait before hedging, or None while there's no basis yet."""
+        if self.after is not None:
+            return max(self.min_delay, self.after)
+        p = self.tracker.percentile(self.percentile, self.min_samples)
+        return None if p is None else max(self.min_delay, p)
+
+
+class Retrier:
+    """Runs upstream calls under a RetryPolicy and an optional HedgePolicy."""
+
+    def __init__(self, policy=None, hedge=None, sleep=time.sleep):
+        self.policy = policy or RetryPolicy()
+        self.hedge = hedge
+        self.latency = hedge.tracker if hedge else LatencyTracker()
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._stats = collections.Counter()
+        self._retries = collections.Counter()  # reason -> count
+
+    def _count(self, key, n=1):
+        with self._lock:
+            self._stats[key] += n
+
+    def call(self, fn, hedge=True, cancel=None):
+        """
+        Run fn(timeout, cancel) under the policy and return its result.
+        - hedge: allow a hedged second request (only safe for idempotent,
+          non-streaming calls). Only these calls feed the latency window
+          the hedge delay is computed from.
+        - cancel: a CancelToken the caller can use to abort the whole call
+          (every attempt runs under it; no hedging then).
+        """
+        deadline = time.monotonic() + self.policy.deadline
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded(
+                    f"OpenAI call gave up after {self.policy.deadline:.0f}s deadline")
+            self._count("attempts")
+            try:
+                if cancel is None and hedge and self.hedge is not None:
+                    return self._hedged(fn, remaining)
+                return self._timed(fn, remaining, cancel or CancelToken(), observe=hedge)
+            except UpstreamError as e:
+                attempt += 1
+                if cancel is not None and cancel.cancelled:
+                    raise UpstreamCancelled("OpenAI call cancelled") from e
+                wait = self._retry_wait(e, attempt, deadline)
+                if wait is None:
+                    raise
+                self._sleep(wait)
+
+    def _retry_wait(self, exc, attempt, deadline):
+        """Seconds to wait before retrying after `attempt` tries, or None to give up."""
+        reason = retry_reason(exc)
+        if reason is None or attempt >= self.policy.max_attempts:
+            if reason is not None:
+                self._count("exhausted")
+            return None
+        wait = retry_after(exc)
+        wait = self.policy.backoff(attempt - 1) if wait is None else wait
+        if time.monotonic() + wait >= deadline:
+            self._count("deadline_exceeded")
+            return None
+        with self._lock:
+            self._retries[reason] += 1
+        return wait
+
+    def _timed(self, fn, timeout, cancel, observe=True):
+        start = time.monotonic()
+        result = fn(timeout, cancel)
+        if observe:
+            self.latency.observe(time.monotonic() - start)
+        return result
+
+    def _hedged(self, fn, remaining):
+        delay = self.hedge.delay()
+        if delay is None or delay >= remaining:
+            return self._timed(fn, remaining, CancelToken())
+
+        deadline = time.monotonic() + remaining
+        results = queue.Queue()
+        tokens = []
+
+        def launch(is_hedge):
+            token = CancelToken()
+            tokens.append(token)
+            timeout = deadline - time.monotonic()
+
+            def run():
+                try:
+                    results.put((is_hedge, True, self._timed(fn, timeout, token)))
+                except BaseException as e:
+                    results.put((is_hedge, False, e))
+            threading.Thread(target=run, daemon=True, name="upstream-hedge").start()
+
+        launch(False)
+        running = 1
+        error = None
+        try:
+            try:
+                outcome = results.get(timeout=delay)
+            except queue.Empty:
+                self._count("hedges")
+                launch(True)
+                running += 1
+                outcome = None
+            while True:
+                if outcome is None:
+                    wait = deadline - time.monotonic()
+                    try:
+                        outcome = results.get(timeout=max(wait, 0))
+                    except queue.Empty:
+                        self._count("deadline_exceeded")
+                        raise DeadlineExceeded("OpenAI call gave up: deadline reached")
+                is_hedge, ok, value = outcome
+                running -= 1
+                if ok:
+                    if running:
+                        self._count("hedge_wins" if is_hedge else "primary_wins")
+                    return value
+                if not isinstance(value, UpstreamCancelled) or error is None:
+                    error = value
+                if not running:
+                    raise error
+                outcome = None
+        finally:
+            for token in tokens:
+                token.cancel()
+
+    async def call_async(self, fn, hedge=True):
+        """
+        call() for coroutines: awaits fn(timeout) under the same policy.
+        A hedge runs as a second task and the loser is cancelled; cancelling
+        the caller's task cancels every attempt.
+        """
+        deadline = time.monotonic() + self.policy.deadline
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self._count("deadline_exceeded")
+                raise DeadlineExceeded(
+                    f"OpenAI call gave up after {self.policy.deadline:.0f}s deadline")
+            self._count("attempts")
+            try:
+                if hedge and self.hedge is not None:
+                    return await self._hedged_async(fn, remaining)
+                return await self._timed_async(fn, remaining, observe=hedge)
+            except UpstreamError as e:
+                attempt += 1
+                wait = self._retry_wait(e, attempt, deadline)
+                if wait is None:
+                    raise
+                await asyncio.sleep(wait)
+
+    async def _timed_async(self, fn, timeout, observe=True):
+        start = time.monotonic()
+        result = await fn(timeout)
+        if observe:
+            self.latency.observe(time.monotonic() - start)
+        return result
+
+    async def _hedged_async(self, fn, remaining):
+        delay = self.hedge.delay()
+        if delay is None or delay >= remaining:
+            return await self._timed_async(fn, remaining)
+
+        deadline = time.monotonic() + remaining
+        primary = asyncio.ensure_future(self._timed_async(fn, remaining))
+        pending = {primary}
+        hedged = False
+        error = None
+        try:
+            while True:
+                wait = delay if not hedged else deadline - time.monotonic()
+                done, _ = await asyncio.wait(pending, timeout=max(wait, 0),
+                                             return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    if hedged:
+                        self._count("deadline_exceeded")
+                        raise DeadlineExceeded("OpenAI call gave up: deadline reached")
+                    self._count("hedges")
+                    pending.add(asyncio.ensure_future(
+                        self._timed_async(fn, deadline - time.monotonic())))
+                    hedged = True
+                    continue
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        if pending:
+                            self._count("primary_wins" if task is primary else "hedge_wins")
+                        return task.result()
+                    error = task.exception()
+                if not pending:
+                    raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["retries"] = dict(self._retries)
+        for key in ("attempts", "hedges", "hedge_wins", "primary_wins",
+                    "exhausted", "deadline_exceeded"):
+            stats.setdefault(key, 0)
+        stats["latency_samples"] = len(self.latency)
+        if self.hedge is not None:
+            stats["hedge_delay"] = self.hedge.delay()
+        return stats
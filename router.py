@@ -0,0 +1,477 @@
+"""
+Latency-aware model routing with a circuit breaker per model.
+
+ModelRouter keeps a rolling window of latencies and outcomes for each
+configured model and picks where the next call goes:
+
+- "priority" strategy: the first model (in configured order) whose
+  breaker is closed, i.e. the preferred model while it is healthy;
+- "latency" strategy: the model with the best latency, weighted by its
+  recent error rate (models without data are tried first).
+
+A breaker opens after `consecutive_failures` failures in a row, or once
+the error rate over the window passes `failure_rate` (with at least
+`min_requests` calls); it stays open for `cooldown` seconds, then lets a
+single probe through (half-open) which closes or re-opens it. Only
+model_failure() errors count: a bad request fails on any model, and
+mustn't open breakers for everyone else.
+
+run() calls the chosen model and, if it fails, the next one, and returns
+a RoutingDecision describing what happened. race() sends the same call
+to several models at once and keeps the first acceptable answer,
+cancelling the others. run_async() and race_async() do the same for
+coroutines (the ASGI server).
+"""
+import asyncio
+import collections
+import queue
+import threading
+import time
+
+from retry import retry_reason
+from upstream import CancelToken, DeadlineExceeded, UpstreamHTTPError
+
+CLOSED, HALF_OPEN, OPEN = "closed", "half_open", "open"
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class UnknownModel(ValueError):
+    """A per-request override named a model that isn't configured."""
+
+
+def model_failure(exc):
+    """
+    Whether an error says the model is unhealthy: one retry_reason() would
+    retry (rate limits, 5xx, dropped connections), any other 5xx, or a
+    timeout. Other 4xx answers, a missing API key or an answer that doesn't
+    parse are down to the request.
+    """
+    if retry_reason(exc) is not None or isinstance(exc, DeadlineExceeded):
+        return True
+    return isinstance(exc, UpstreamHTTPError) and exc.status >= 500
+
+
+class CircuitBreaker:
+    """Closed -> open on failures -> half-open after cooldown -> closed on success."""
+
+    def __init__(self, consecutive_failures=3, failure_rate=0.5, min_requests=10, cooldown=30.0):
+        self.consecutive_failures = consecutive_failures
+        self.failure_rate = failure_rate
+        self.min_requests = min_requests
+        self.cooldown = cooldown
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self.opens = 0
+        self._failures_in_row = 0
+        self._probe_in_flight = False
+
+    def allow(self, now):
+        """Whether a call may go to this model now (claims the half-open probe)."""
+        if self.state == OPEN and now - self.opened_at >= self.cooldown:
+            self.state = HALF_OPEN
+            self._probe_in_flight = False
+        if self.state == CLOSED:
+            return True
+        if self.state == HALF_OPEN and not self._probe_in_flight:
+            self._probe_in_flight = True
+            return True
+        return False
+
+    def available(self, now):
+        """Like allow() but without claiming anything."""
+        if self.state == CLOSED:
+            return True
+        if self.state == OPEN:
+            return now - self.opened_at >= self.cooldown
+        return not self._probe_in_flight
+
+    def record(self, ok, error_rate, samples, now):
+        if ok:
+            self._failures_in_row = 0
+            if self.state != CLOSED:
+                self.state = CLOSED
+            self._probe_in_flight = False
+            return
+        self._failures_in_row += 1
+        tripped = self._failures_in_row >= self.consecutive_failures or (
+            samples >= self.min_requests and error_rate >= self.failure_rate)
+        if self.state == HALF_OPEN or tripped:
+            if self.state != OPEN:
+                self.opens += 1
+            self.state = OPEN
+            self.opened_at = now
+            self._probe_in_flight = False
+
+    def release(self):
+        """Give back a half-open probe that ended without an outcome (cancelled)."""
+        if self.state == HALF_OPEN:
+            self._probe_in_flight = False
+
+
+class ModelHealth:
+    """Rolling window of (latency or None, ok) for one model."""
+
+    def __init__(self, window):
+        self.samples = collections.deque(maxlen=window)
+        self.calls = self.failures = 0
+
+    def observe(self, latency, ok):
+        self.samples.append((latency, ok))
+        self.calls += 1
+        self.failures += 0 if ok else 1
+
+    def error_rate(self):
+        if not self.samples:
+            return 0.0
+        return sum(1 for _, ok in self.samples if not ok) / len(self.samples)
+
+    def latency(self, pct=50.0):
+        values = sorted(lat for lat, ok in self.samples if ok and lat is not None)
+        if not values:
+            return None
+        rank = min(len(values) - 1, max(0, int(round(pct / 100.0 * len(values))) - 1))
+        return values[rank]
+
+
+class RoutingDecision:
+    """Which model answered a call, why it was picked, and every attempt made."""
+
+    def __init__(self, model, reason):
+        self.model = model
+        self.reason = reason  # "override", "priority", "latency", "fallback", "all_open", "race"
+        self.attempts = []    # [{"model", "ok", "elapsed_ms", "error"?, "cancelled"?}]
+
+    def to_dict(self):
+        return {"model": self.model, "reason": self.reason, "attempts": list(self.attempts)}
+
+
+class ModelRouter:
+    """
+    - models: candidate model names, in order of preference.
+    - strategy: "priority" or "latency" (see module docstring).
+    - window: calls per model kept for latency / error rate.
+    - error_penalty: under "latency", score = p50 * (1 + error_penalty * error_rate).
+    - fallback: on failure, try the next available model in the same call.
+    """
+
+    def __init__(self, models, strategy="priority", window=50, error_penalty=4.0,
+                 fallback=True, consecutive_failures=3, failure_rate=0.5,
+                 min_requests=10, cooldown=30.0, clock=time.monotonic):
+        if not models:
+            raise ValueError("ModelRouter needs at least one model")
+        if strategy not in ("priority", "latency"):
+            raise ValueError(f"Unknown routing strategy: {strategy}")
+        self.models = list(models)
+        self.strategy = strategy
+        self.error_penalty = error_penalty
+        self.fallback = fallback
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._health = {m: ModelHealth(window) for m in self.models}
+        self._breakers = {
+            m: CircuitBreaker(consecutive_failures, failure_rate, min_requests, cooldown)
+            for m in self.models
+        }
+        self._race_wins = collections.Counter()
+
+    def _score(self, model):
+        health = self._health[model]
+        latency = health.latency()
+        if latency is None:
+            return -1.0  # no data yet: explore
+        return latency * (1.0 + self.error_penalty * health.error_rate())
+
+    def plan(self, override=None):
+        """Models in the order they should be tried, each with the reason."""
+        if override:
+            if override not in self._health:
+                raise UnknownModel(f"Unknown model {override!r}; choose from {self.models}")
+            return [(override, "override")]
+        now = self._clock()
+        with self._lock:
+            ordered = list(self.models)
+            if self.strategy == "latency":
+                ordered.sort(key=self._score)
+            available = [m for m in ordered if self._breakers[m].available(now)]
+        if not available:
+            # Everything is open: still try, preferred order first.
+            plan = [(m, "all_open") for m in ordered]
+            return plan if self.fallback else plan[:1]
+        plan = [(available[0], self.strategy)]
+        if self.fallback:
+            plan += [(m, "fallback") for m in available[1:]]
+        return plan
+
+    def record(self, model, ok, latency=None):
+        now = self._clock()
+        with self._lock:
+            health = self._health[model]
+            health.observe(latency, ok)
+            self._breakers[model].record(ok, health.error_rate(), len(health.samples), now)
+
+    def _claim(self, model, reason):
+        """Whether a call to `model` may start (overrides and all_open always go)."""
+        if reason in ("override", "all_open"):
+            return True
+        with self._lock:
+            return self._breakers[model].allow(self._clock())
+
+    def _attempted(self, decision, model, start, error=None, timed=True, claimed=True):
+        """
+        Record one finished run() attempt in the health window and the
+        decision. An error that isn't a model_failure() only goes in the
+        decision (a half-open probe it used is freed for the next call).
+        """
+        elapsed = time.monotonic() - start
+        attempt = {"model": model, "ok": error is None, "elapsed_ms": round(elapsed * 1000.0, 1)}
+        if error is None:
+            self.record(model, True, elapsed if timed else None)
+        else:
+            if model_failure(error):
+                self.record(model, False)
+            elif claimed:
+                self._release(model)
+            attempt["error"] = str(error)[:200]
+        decision.attempts.append(attempt)
+
+    def run(self, fn, override=None, timed=True):
+        """
+        Call fn(model) on the planned models until one succeeds.
+        - timed: feed the call's duration into the latency window (off for
+          calls that return early, like opening a stream).
+        Returns (result, RoutingDecision); re-raises the last error if every
+        model failed (the decision is attached to it as .routing).
+        """
+        decision = None
+        error = None
+        for model, reason in self.plan(override):
+            if not self._claim(model, reason):
+                continue
+            if decision is None:
+                decision = RoutingDecision(model, reason)
+            else:
+                decision.model, decision.reason = model, reason
+            start = time.monotonic()
+            try:
+                result = fn(model)
+            except Exception as e:
+                self._attempted(decision, model, start, e,
+                                claimed=reason not in ("override", "all_open"))
+                error = e
+                continue
+            self._attempted(decision, model, start, timed=timed)
+            return result, decision
+        if error is None:
+            # Every breaker flipped between plan() and allow(): use the preferred one.
+            return self.run(fn, override=self.models[0], timed=timed)
+        error.routing = decision
+        raise error
+
+    async def run_async(self, fn, override=None, timed=True):
+        """run() for coroutines: awaits fn(model)."""
+        decision = None
+        error = None
+        for model, reason in self.plan(override):
+            if not self._claim(model, reason):
+                continue
+            if decision is None:
+                decision = RoutingDecision(model, reason)
+            else:
+                decision.model, decision.reason = model, reason
+            start = time.monotonic()
+            try:
+                result = await fn(model)
+            except asyncio.CancelledError:
+                if reason not in ("override", "all_open"):
+                    self._release(model)
+                raise
+            except Exception as e:
+                self._attempted(decision, model, start, e,
+                                claimed=reason not in ("override", "all_open"))
+                error = e
+                continue
+            self._attempted(decision, model, start, timed=timed)
+            return result, decision
+        if error is None:
+            return await self.run_async(fn, override=self.models[0], timed=timed)
+        error.routing = decision
+        raise error
+
+    def _race_order(self, models):
+        """Race candidates in the order they should start."""
+        candidates = models or self.models
+        for model in candidates:
+            if model not in self._health:
+                raise UnknownModel(f"Unknown model {model!r}; choose from {self.models}")
+        planned = [m for m, _ in self.plan() if m in candidates]
+        return planned + [m for m in candidates if m not in planned]
+
+    def _race_pick(self, pending, force=False):
+        """
+        Next candidate whose breaker lets it start (any, with force) as
+        (model, claimed), or (None, False); claimed says allow() let it in.
+        """
+        while pending:
+            model = pending.pop(0)
+            with self._lock:
+                claimed = self._breakers[model].allow(self._clock())
+            if claimed or force:
+                return model, claimed
+        return None, False
+
+    def _race_outcome(self, decision, model, start, claimed, result, exc, accept):
+        """
+        Record how one raced call ended. Returns None if its result is the
+        winner, else the error that ruled it out.
+        """
+        elapsed = time.monotonic() - start
+        attempt = {"model": model, "ok": False, "elapsed_ms": round(elapsed * 1000.0, 1)}
+        if exc is None:
+            self.record(model, True, elapsed)
+            try:
+                if accept is not None:
+                    accept(result)
+            except Exception as e:
+                exc = e  # answered, but unusable: not the model's fault
+            else:
+                attempt["ok"] = True
+                decision.attempts.append(attempt)
+                decision.model = model
+                with self._lock:
+                    self._race_wins[model] += 1
+                return None
+        elif model_failure(exc):
+            self.record(model, False)
+        elif claimed:
+            self._release(model)
+        attempt["error"] = str(exc)[:200]
+        decision.attempts.append(attempt)
+        return exc
+
+    def _release(self, model):
+        """A claimed call was cancelled: free its half-open probe, if it was one."""
+        with self._lock:
+            self._breakers[model].release()
+
+    def _race_cancelled(self, decision, model, start, claimed):
+        if claimed:
+            self._release(model)
+        decision.attempts.append({"model": model, "ok": False, "cancelled": True,
+                                  "elapsed_ms": round((time.monotonic() - start) * 1000.0, 1)})
+
+    def race(self, fn, models=None, parallelism=2, accept=None):
+        """
+        Call fn(model, cancel) on several models at once and return the first
+        result that accept(result) doesn't reject (raise on); the calls still
+        running are cancelled through their CancelToken.
+        - models: candidates (default: every configured model), started in
+          plan order; a failed or rejected one makes room for the next.
+        - parallelism: calls in flight at once.
+        Returns (result, RoutingDecision) with reason "race"; re-raises the
+        last error if no candidate gave an acceptable result.
+        """
+        pending = self._race_order(models)
+        first = pending[0]
+        decision = RoutingDecision(None, "race")
+        results = queue.Queue()
+        running = {}  # model -> (token, start, claimed)
+
+        def launch(force=False):
+            model, claimed = self._race_pick(pending, force)
+            if model is None:
+                return False
+            token = CancelToken()
+            running[model] = (token, time.monotonic(), claimed)
+
+            def run():
+                try:
+                    results.put((model, fn(model, token), None))
+                except BaseException as e:
+                    results.put((model, None, e))
+            threading.Thread(target=run, daemon=True, name="model-race").start()
+            return True
+
+        for _ in range(max(1, parallelism)):
+            if not launch():
+                break
+        if not running:
+            # Every breaker is open: race the preferred candidate anyway.
+            pending.append(first)
+            launch(force=True)
+
+        error = None
+        try:
+            while running:
+                model, result, exc = results.get()
+                _, start, claimed = running.pop(model)
+                error = self._race_outcome(decision, model, start, claimed, result, exc, accept)
+                if error is None:
+                    return result, decision
+                launch()
+        finally:
+            for model, (token, start, claimed) in running.items():
+                token.cancel()
+                self._race_cancelled(decision, model, start, claimed)
+        error.routing = decision
+        raise error
+
+    async def race_async(self, fn, models=None, parallelism=2, accept=None):
+        """race() for coroutines: fn(model) runs as a task; the losers are cancelled."""
+        pending = self._race_order(models)
+        first = pending[0]
+        decision = RoutingDecision(None, "race")
+        running = {}  # task -> (model, start, claimed)
+
+        def launch(force=False):
+            model, claimed = self._race_pick(pending, force)
+            if model is None:
+                return False
+            running[asyncio.ensure_future(fn(model))] = (model, time.monotonic(), claimed)
+            return True
+
+        for _ in range(max(1, parallelism)):
+            if not launch():
+                break
+        if not running:
+            pending.append(first)
+            launch(force=True)
+
+        error = None
+        try:
+            while running:
+                done, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    model, start, claimed = running.pop(task)
+                    exc = task.exception()
+                    error = self._race_outcome(decision, model, start, claimed,
+                                               None if exc else task.result(), exc, accept)
+                    if error is None:
+                        return task.result(), decision
+                    launch()
+        finally:
+            for task, (model, start, claimed) in running.items():
+                task.cancel()
+                self._race_cancelled(decision, model, start, claimed)
+        error.routing = decision
+        raise error
+
+    def stats(self):
+        now = self._clock()
+        with self._lock:
+            out = {"strategy": self.strategy, "models": {}}
+            for model in self.models:
+                health, breaker = self._health[model], self._breakers[model]
+                breaker.available(now)
+                p50 = health.latency(50)
+                p95 = health.latency(95)
+                out["models"][model] = {
+                    "state": breaker.state,
+                    "calls": health.calls,
+                    "failures": health.failures,
+                    "error_rate": round(health.error_rate(), 4),
+                    "p50_ms": None if p50 is None else round(p50 * 1000.0, 1),
+                    "p95_ms": None if p95 is None else round(p95 * 1000.0, 1),
+                    "breaker_opens": breaker.opens,
+                    "race_wins": self._race_wins[model],
+                }
+            return out
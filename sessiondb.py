@@ -0,0 +1,480 @@
+"""
+Session state in SQLite, shared by every worker process on one host.
+
+A drop-in replacement for sessions.SessionManager: sessions, their turns
+and the metadata of the generations they published live in one database
+file in WAL mode, so a restart loses nothing and any worker can serve any
+request. Readers never block the single writer; writes are short
+BEGIN IMMEDIATE transactions that wait up to `busy_timeout` for the file
+lock.
+
+    sessions     (id, created, last_seen, generation_id, lease_owner, lease_until)
+    turns        (session_id, seq, role, codec, content)   -- PK (session_id, seq)
+    generations  (id, session_id, created, files, meta)    -- index (session_id, created)
+
+Assistant turns (the extension JSON) are stored zlib-compressed. A
+session's lock is a thread lock plus a lease row, so one turn at a time
+runs per session across processes. The process holding a lease renews it
+every lease_ttl / 3 seconds for as long as the turn runs (however many
+upstream calls it makes); it lapses `lease_ttl` seconds after the holder
+stops renewing, or at once if that process is gone.
+"""
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+import zlib
+
+from sessions import new_session_id, valid_session_id
+
+SCHEMA_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    created REAL NOT NULL,
+    last_seen REAL NOT NULL,
+    generation_id TEXT,
+    lease_owner TEXT,
+    lease_until REAL
+);
+CREATE INDEX IF NOT EXISTS sessions_last_seen ON sessions (last_seen);
+CREATE TABLE IF NOT EXISTS turns (
+    session_id TEXT NOT NULL REFERENCES sessions (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    codec TEXT NOT NULL DEFAULT '',
+    content BLOB NOT NULL,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS generations (
+    id TEXT PRIMARY KEY,
+    session_id TEXT,
+    created REAL NOT NULL,
+    files TEXT NOT NULL,
+    meta TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS generations_session ON generations (session_id, created);
+"""
+
+COMPRESS_MIN_BYTES = 256  # shorter assistant turns are stored as is
+PRUNE_INTERVAL = 30.0  # seconds between eviction passes (per process)
+
+
+def encode_turn(role, content):
+    """(codec, bytes) for one turn; assistant turns are compressed."""
+    data = content.encode("utf-8")
+    if role == "assistant" and len(data) >= COMPRESS_MIN_BYTES:
+        return "zlib", zlib.compress(data, 6)
+    return "", data
+
+
+def decode_turn(codec, data):
+    if codec == "zlib":
+        data = zlib.decompress(data)
+    return bytes(data).decode("utf-8")
+
+
+def _owner_gone(owner):
+    """Whether the process named in a lease owner ("host:pid:token") has exited."""
+    host, _, rest = owner.partition(":")
+    pid = rest.partition(":")[0]
+    if host != socket.gethostname() or not pid.isdigit() or int(pid) == os.getpid():
+        return False
+    try:
+        os.kill(int(pid), 0)
+    except ProcessLookupError:
+        return True
+    except OSError:
+        pass
+    return False
+
+
+class SessionLock:
+    """
+    threading.Lock-alike over a session's lease row: acquire() takes the
+    in-process lock first, then the lease (polling while another process
+    holds it).
+    """
+
+    def __init__(self, db, session_id):
+        self._db = db
+        self._session_id = session_id
+        self._local = threading.Lock()
+        self._owner = None
+
+    def acquire(self, blocking=True, timeout=-1):
+        deadline = time.monotonic() + timeout if blocking and timeout >= 0 else None
+        if not self._local.acquire(blocking, timeout):
+            return False
+        owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        delay = 0.02
+        try:
+            while not self._db.acquire_lease(self._session_id, owner):
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    self._local.release()
+                    return False
+                time.sleep(delay if deadline is None
+                           else max(0.0, min(delay, deadline - time.monotonic())))
+                delay = min(delay * 2, 0.5)
+        except BaseException:
+            self._local.release()
+            raise
+        self._owner = owner
+        return True
+
+    def release(self):
+        owner, self._owner = self._owner, None
+        try:
+            self._db.release_lease(self._session_id, owner)
+        finally:
+            self._local.release()
+
+    def locked(self):
+        return self._local.locked() or self._db.lease_held(self._session_id)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class StoredSession:
+    """sessions.Session with its history and current generation in the database."""
+
+    def __init__(self, db, session_id):
+        self.db = db
+        self.id = session_id
+        self.max_turns = db.max_turns
+        self.lock = SessionLock(db, session_id)
+
+    @property
+    def generation_id(self):
+        return self.db.generation_id(self.id)
+
+    @generation_id.setter
+    def generation_id(self, gen_id):
+        self.db.set_generation_id(self.id, gen_id)
+
+    def append(self, role, content):
+        """Add one turn, dropping the oldest ones past max_turns."""
+        self.db.append_turn(self.id, role, content)
+
+    def messages(self):
+        return self.db.turns(self.id)
+
+    def reset(self):
+        self.db.clear_turns(self.id)
+
+    def is_busy(self):
+        return self.lock.locked()
+
+
+class SessionDB:
+    """
+    SQLite-backed, multi-process SessionManager.
+    - path: database file (created if missing; its directory too).
+    - max_sessions / max_turns / idle_ttl: as in SessionManager; sessions
+      holding a lease are never evicted.
+    - lease_ttl: how long a lease outlives its last renewal before other
+      workers may take the session over.
+    - busy_timeout: seconds a write waits for another process's transaction.
+    """
+
+    def __init__(self, path, max_sessions=1000, max_turns=20, idle_ttl=3600.0,
+                 lease_ttl=1800.0, busy_timeout=10.0):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self.lease_ttl = lease_ttl
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        self._sessions = weakref.WeakValueDictionary()  # id -> StoredSession (this process)
+        self._lock = threading.Lock()
+        self._evicted = 0
+        self._last_prune = 0.0
+        self._leases_lock = threading.Lock()
+        self._held = {}  # session_id -> owner: leases this process renews
+        self._renewer = None
+        self._renewals = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._migrate()
+
+    # ------------------------------------------------------------------
+    # Connections
+    # ------------------------------------------------------------------
+
+    def _conn(self):
+        """This thread's connection (sqlite3 connections can't be shared)."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+        return conn
+
+    def _write(self):
+        return _Transaction(self._conn())
+
+    def _migrate(self):
+        with self._write() as conn:
+            version = conn.execute("PRAGMA user_version").fetchone()[0]
+            if version > SCHEMA_VERSION:
+                raise RuntimeError(
+                    f"{self.path} has schema version {version}; this build knows {SCHEMA_VERSION}")
+            for statement in SCHEMA.split(";"):
+                if statement.strip():
+                    conn.execute(statement)
+            conn.execute(f"PRAGMA user_version={SCHEMA_VERSION}")
+
+    # ------------------------------------------------------------------
+    # SessionManager interface
+    # ------------------------------------------------------------------
+
+    def get(self, session_id=None):
+        """
+        Return (session, created). An unknown or missing id creates a new
+        session (with a fresh id if none, or an invalid one, was given).
+        """
+        if not valid_session_id(session_id):
+            session_id = new_session_id()
+        now = time.time()
+        with self._write() as conn:
+            created = conn.execute("UPDATE sessions SET last_seen = ? WHERE id = ?",
+                                   (now, session_id)).rowcount == 0
+            if created:
+                conn.execute("INSERT INTO sessions (id, created, last_seen) VALUES (?, ?, ?)",
+                             (session_id, now, now))
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = self._sessions[session_id] = StoredSession(self, session_id)
+            prune = now - self._last_prune >= PRUNE_INTERVAL
+            if prune:
+                self._last_prune = now
+        if prune:
+            self.prune()
+        return session, created
+
+    def drop(self, session_id):
+        with self._write() as conn:
+            return conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,)).rowcount > 0
+
+    def prune(self):
+        """Evict idle sessions past idle_ttl, then the least recently seen past max_sessions."""
+        now = time.time()
+        free = "(lease_until IS NULL OR lease_until < ?)"
+        with self._write() as conn:
+            removed = conn.execute(f"DELETE FROM sessions WHERE last_seen < ? AND {free}",
+                                   (now - self.idle_ttl, now)).rowcount
+            count = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+            if count > self.max_sessions:
+                removed += conn.execute(
+                    f"DELETE FROM sessions WHERE id IN (SELECT id FROM sessions WHERE {free} "
+                    "ORDER BY last_seen LIMIT ?)", (now, count - self.max_sessions)).rowcount
+        with self._lock:
+            self._evicted += removed
+        return removed
+
+    def ids(self):
+        return {row[0] for row in self._conn().execute("SELECT id FROM sessions")}
+
+    def generation_ids(self):
+        """Current generation of every session (kept by file store GC)."""
+        return {row[0] for row in self._conn().execute(
+            "SELECT generation_id FROM sessions WHERE generation_id IS NOT NULL")}
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+    def stats(self):
+        conn = self._conn()
+        now = time.time()
+        with self._lock:
+            evicted = self._evicted
+        with self._leases_lock:
+            held, renewals = len(self._held), self._renewals
+        return {
+            "sessions": conn.execute("SELECT COUNT(*) FROM sessions").fetchone()[0],
+            "turns": conn.execute("SELECT COUNT(*) FROM turns").fetchone()[0],
+            "leased": conn.execute("SELECT COUNT(*) FROM sessions WHERE lease_until >= ?",
+                                   (now,)).fetchone()[0],
+            "leases_held": held,
+            "lease_renewals": renewals,
+            "evicted": evicted,
+            "max_sessions": self.max_sessions,
+            "max_turns": self.max_turns,
+            "path": self.path,
+        }
+
+    # ------------------------------------------------------------------
+    # Turns and the current generation
+    # ------------------------------------------------------------------
+
+    def _ensure(self, conn, session_id):
+        # The row may have been evicted by another worker mid-request.
+        now = time.time()
+        conn.execute("INSERT OR IGNORE INTO sessions (id, created, last_seen) VALUES (?, ?, ?)",
+                     (session_id, now, now))
+
+    def append_turn(self, session_id, role, content):
+        codec, data = encode_turn(role, content)
+        with self._write() as conn:
+            self._ensure(conn, session_id)
+            last, count = conn.execute(
+                "SELECT MAX(seq), COUNT(*) FROM turns WHERE session_id = ?",
+                (session_id,)).fetchone()
+            conn.execute(
+                "INSERT INTO turns (session_id, seq, role, codec, content) VALUES (?, ?, ?, ?, ?)",
+                (session_id, (last or 0) + 1, role, codec, data))
+            overflow = count + 1 - self.max_turns
+            if overflow > 0:
+                # Keep the history starting on a user turn.
+                if overflow % 2:
+                    overflow += 1
+                conn.execute(
+                    "DELETE FROM turns WHERE session_id = ? AND seq IN "
+                    "(SELECT seq FROM turns WHERE session_id = ? ORDER BY seq LIMIT ?)",
+                    (session_id, session_id, overflow))
+
+    def turns(self, session_id):
+        rows = self._conn().execute(
+            "SELECT role, codec, content FROM turns WHERE session_id = ? ORDER BY seq",
+            (session_id,))
+        return [{"role": role, "content": decode_turn(codec, content)}
+                for role, codec, content in rows]
+
+    def clear_turns(self, session_id):
+        with self._write() as conn:
+            conn.execute("DELETE FROM turns WHERE session_id = ?", (session_id,))
+
+    def generation_id(self, session_id):
+        row = self._conn().execute("SELECT generation_id FROM sessions WHERE id = ?",
+                                   (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_generation_id(self, session_id, gen_id):
+        with self._write() as conn:
+            self._ensure(conn, session_id)
+            conn.execute("UPDATE sessions SET generation_id = ? WHERE id = ?", (gen_id, session_id))
+
+    # ------------------------------------------------------------------
+    # Leases (cross-process session locks)
+    # ------------------------------------------------------------------
+
+    def acquire_lease(self, session_id, owner):
+        now = time.time()
+        with self._write() as conn:
+            self._ensure(conn, session_id)
+            holder, until = conn.execute(
+                "SELECT lease_owner, lease_until FROM sessions WHERE id = ?",
+                (session_id,)).fetchone()
+            if holder and until >= now and not _owner_gone(holder):
+                return False
+            conn.execute("UPDATE sessions SET lease_owner = ?, lease_until = ? WHERE id = ?",
+                         (owner, now + self.lease_ttl, session_id))
+        with self._leases_lock:
+            self._held[session_id] = owner
+            if self._renewer is None:
+                self._renewer = threading.Thread(target=self._renew_leases,
+                                                 name="session-leases", daemon=True)
+                self._renewer.start()
+        return True
+
+    def release_lease(self, session_id, owner):
+        with self._leases_lock:
+            if self._held.get(session_id) == owner:
+                del self._held[session_id]
+        with self._write() as conn:
+            conn.execute("UPDATE sessions SET lease_owner = NULL, lease_until = NULL "
+                         "WHERE id = ? AND lease_owner = ?", (session_id, owner))
+
+    def renew_lease(self, session_id, owner):
+        """Push a lease's expiry lease_ttl seconds out; False if `owner` no longer holds it."""
+        with self._write() as conn:
+            return conn.execute("UPDATE sessions SET lease_until = ? "
+                                "WHERE id = ? AND lease_owner = ?",
+                                (time.time() + self.lease_ttl, session_id, owner)).rowcount > 0
+
+    def _renew_leases(self):
+        """The renewer thread: runs while this process holds any lease."""
+        while True:
+            time.sleep(self.lease_ttl / 3)
+            with self._leases_lock:
+                if not self._held:
+                    self._renewer = None
+                    return
+                held = list(self._held.items())
+            for session_id, owner in held:
+                try:
+                    renewed = self.renew_lease(session_id, owner)
+                except sqlite3.Error:
+                    continue  # (busy) next round
+                with self._leases_lock:
+                    if renewed:
+                        self._renewals += 1
+                    elif self._held.get(session_id) == owner:
+                        del self._held[session_id]  # taken over: stop renewing
+
+    def lease_held(self, session_id):
+        row = self._conn().execute("SELECT lease_until FROM sessions WHERE id = ?",
+                                   (session_id,)).fetchone()
+        return bool(row and row[0] and row[0] >= time.time())
+
+    # ------------------------------------------------------------------
+    # Generation metadata
+    # ------------------------------------------------------------------
+
+    def record_generation(self, generation):
+        """Remember a file store Generation (no-op if it's already known)."""
+        with self._write() as conn:
+            conn.execute(
+                "INSERT OR IGNORE INTO generations (id, session_id, created, files, meta) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (generation.id, generation.session_id, generation.created,
+                 json.dumps(generation.files), json.dumps(generation.meta)))
+
+    def generations(self, session_id):
+        """Generation records of one session, oldest first (filestore record format)."""
+        rows = self._conn().execute(
+            "SELECT id, session_id, created, files, meta FROM generations "
+            "WHERE session_id = ? ORDER BY created", (session_id,))
+        return [{"id": gen_id, "session_id": sid, "created": created,
+                 "files": json.loads(files), "meta": json.loads(meta)}
+                for gen_id, sid, created, files, meta in rows]
+
+    def forget_generations(self, gen_ids=(), before=None):
+        """Drop generation records by id and/or created before a timestamp."""
+        removed = 0
+        with self._write() as conn:
+            for gen_id in gen_ids:
+                removed += conn.execute("DELETE FROM generations WHERE id = ?",
+                                        (gen_id,)).rowcount
+            if before is not None:
+                removed += conn.execute("DELETE FROM generations WHERE created < ?",
+                                        (before,)).rowcount
+        return removed
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (ROLLBACK on error) on an autocommit connection."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
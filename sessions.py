@@ -0,0 +1,136 @@
+"""
+Per-session conversation state.
+
+Each browser (or API client) gets its own Session, looked up by an id sent
+as a cookie or header. A session serialises its own forge turns with a
+lock, keeps at most `max_turns` messages, and the manager evicts the
+least-recently-used idle sessions once `max_sessions` is exceeded or a
+session has been idle longer than `idle_ttl` seconds.
+
+Session ids end up in workspace paths, so an id the client sends that
+isn't 1-64 of [A-Za-z0-9_-] is ignored and a fresh one issued instead.
+"""
+import collections
+import re
+import threading
+import time
+import uuid
+
+
+_SESSION_ID = re.compile(r"[A-Za-z0-9_-]{1,64}")
+
+
+def new_session_id():
+    return uuid.uuid4().hex
+
+
+def valid_session_id(session_id):
+    """Whether a client-supplied session id is safe to use (as a path component too)."""
+    return isinstance(session_id, str) and _SESSION_ID.fullmatch(session_id) is not None
+
+
+class Session:
+    def __init__(self, session_id, max_turns):
+        self.id = session_id
+        self.max_turns = max_turns
+        self.lock = threading.Lock()
+        self.history = []  # list of {"role": "user"/"assistant", "content": "..."}
+        self.generation_id = None  # current generation in the file store
+        self.created = self.last_seen = time.time()
+
+    def touch(self):
+        self.last_seen = time.time()
+
+    def append(self, role, content):
+        """Add one turn, dropping the oldest ones past max_turns."""
+        self.history.append({"role": role, "content": content})
+        overflow = len(self.history) - self.max_turns
+        if overflow > 0:
+            # Keep the history starting on a user turn.
+            if overflow % 2:
+                overflow += 1
+            del self.history[:overflow]
+
+    def messages(self):
+        return list(self.history)
+
+    def reset(self):
+        self.history = []
+
+    def is_busy(self):
+        return self.lock.locked()
+
+
+class SessionManager:
+    """
+    Thread-safe, bounded registry of Session objects.
+    - max_sessions: LRU cap on live sessions (busy sessions are never evicted).
+    - max_turns: per-session cap on stored messages.
+    - idle_ttl: sessions untouched for this many seconds are dropped.
+    """
+
+    def __init__(self, max_sessions=1000, max_turns=20, idle_ttl=3600.0):
+        self.max_sessions = max_sessions
+        self.max_turns = max_turns
+        self.idle_ttl = idle_ttl
+        self._sessions = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._evicted = 0
+
+    def get(self, session_id=None):
+        """
+        Return (session, created). An unknown or missing id creates a new
+        session (with a fresh id if none, or an invalid one, was given).
+        """
+        if not valid_session_id(session_id):
+            session_id = None
+        with self._lock:
+            session = self._sessions.get(session_id) if session_id else None
+            created = session is None
+            if created:
+                session = Session(session_id or new_session_id(), self.max_turns)
+                self._sessions[session.id] = session
+            else:
+                self._sessions.move_to_end(session.id)
+            session.touch()
+            self._evict_locked()
+            return session, created
+
+    def drop(self, session_id):
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def _evict_locked(self):
+        now = time.time()
+        for sid, session in list(self._sessions.items()):
+            over_cap = len(self._sessions) > self.max_sessions
+            expired = now - session.last_seen > self.idle_ttl
+            if not (over_cap or expired):
+                break
+            if session.is_busy():
+                continue
+            del self._sessions[sid]
+            self._evicted += 1
+
+    def ids(self):
+        with self._lock:
+            return set(self._sessions)
+
+    def generation_ids(self):
+        """Current generation of every live session (kept by file store GC)."""
+        with self._lock:
+            return {s.generation_id for s in self._sessions.values() if s.generation_id}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "turns": sum(len(s.history) for s in self._sessions.values()),
+                "evicted": self._evicted,
+                "max_sessions": self.max_sessions,
+                "max_turns": self.max_turns,
+            }
@@ -0,0 +1,271 @@
+"""
+Local similarity index over past prompts, for warm-starting new ones.
+
+A prompt is normalised (lower case, punctuation dropped, stop words
+removed, plurals folded) into a set of word shingles, summarised by a
+MinHash signature and bucketed by LSH: the signature is cut into `bands`
+bands of `rows` values, and prompts that agree on a whole band share a
+bucket. query() gathers the prompts sharing any bucket with the new one
+and ranks them by the exact Jaccard similarity of their shingle sets, so
+a lookup touches a few dozen candidates however big the index gets.
+
+    "Block reddit.com during work hours"  -> {block, reddit, com, during, work, hour}
+    "block youtube.com in work hours"     -> {block, youtube, com, work, hour}   (J = 4/7)
+
+Entries are appended to a JSON-lines log ({"g": generation id, "p":
+prompt, "t": time}) that every worker process reads from: add() writes a
+line and query() first picks up lines other workers wrote since. The log
+is the only state; signatures are recomputed (in the background) when
+it's loaded.
+"""
+import collections
+import hashlib
+import json
+import os
+import re
+import struct
+import threading
+import time
+
+STOP_WORDS = frozenset("""
+a an and any are as at be but by can could do does for from have i in into is it its
+make me my need of on or our please should so some that the their them then there these
+this to up us want we when which while will with would you your
+""".split())
+
+_WORDS = re.compile(r"[a-z0-9]+")
+WORD_CACHE_SIZE = 200000
+LOAD_BATCH = 1000  # log lines indexed per hold of the lock
+_HASHES_PER_DIGEST = 16  # 32-bit values in one 64-byte blake2b digest
+
+
+def normalize(prompt):
+    """The set of normalised words of a prompt."""
+    words = set()
+    for word in _WORDS.findall(prompt.lower()):
+        if word in STOP_WORDS:
+            continue
+        if len(word) > 3 and word.endswith("s") and not word.endswith("ss"):
+            word = word[:-1]
+        words.add(word)
+    return words
+
+
+def jaccard(a, b):
+    if not a or not b:
+        return 0.0
+    common = len(a & b)
+    return common / (len(a) + len(b) - common)
+
+
+class Match:
+    def __init__(self, generation_id, prompt, similarity):
+        self.generation_id = generation_id
+        self.prompt = prompt
+        self.similarity = similarity
+
+    def to_dict(self):
+        return {"generation_id": self.generation_id, "prompt": self.prompt,
+                "similarity": round(self.similarity, 3)}
+
+
+class PromptIndex:
+    """
+    - path: JSON-lines log shared by worker processes (None = memory only).
+    - bands / rows: LSH shape; the signature has bands * rows values. More
+      bands find less similar prompts (at a higher lookup cost); the
+      default finds ~90% of pairs at J = 0.5 and half at J = 0.3.
+    - max_entries: newest prompts kept (older ones drop out of the index).
+    - bucket_size: newest entries kept per bucket, which bounds a lookup
+      even when thousands of prompts are near-duplicates.
+    """
+
+    def __init__(self, path=None, bands=8, rows=2, max_entries=100000, bucket_size=32):
+        self.path = path
+        self.bands = bands
+        self.rows = rows
+        self.max_entries = max_entries
+        self.bucket_size = bucket_size
+        # Each word is hashed once per 16 signature values (one blake2b
+        # digest, salted per group); value i of the signature is the
+        # minimum of hash i over the prompt's words.
+        size = bands * rows
+        self._salts = [i.to_bytes(16, "little") for i in range(-(-size // _HASHES_PER_DIGEST))]
+        self._unpack = struct.Struct(f"<{_HASHES_PER_DIGEST}I").unpack
+        self._word_hashes = {}  # prompts share most of their vocabulary
+        self._lock = threading.Lock()
+        self._entries = collections.OrderedDict()  # generation id -> (prompt, shingles, keys)
+        self._buckets = [{} for _ in range(bands)]  # band -> {key: [generation ids]}
+        self._offset = 0
+        self._tail_lock = threading.Lock()
+        self._stats = collections.Counter()
+        if path:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._compact_log()
+            # A big log takes seconds to index: do it in the background
+            # (lookups meanwhile just see fewer entries).
+            threading.Thread(target=self._tail, name="prompt-index-load", daemon=True).start()
+
+    # ------------------------------------------------------------------
+    # MinHash / LSH
+    # ------------------------------------------------------------------
+
+    def sketch(self, prompt):
+        """(shingles, band keys) of a prompt: its word hashes, and one bucket key per band."""
+        cache = self._word_hashes
+        hashes = []
+        for word in normalize(prompt):
+            values = cache.get(word)
+            if values is None:
+                data = word.encode("utf-8")
+                values = ()
+                for salt in self._salts:
+                    values += self._unpack(
+                        hashlib.blake2b(data, digest_size=64, salt=salt).digest())
+                if len(cache) >= WORD_CACHE_SIZE:
+                    cache.clear()
+                cache[word] = values
+            hashes.append(values)
+        if not hashes:
+            return frozenset(), ()
+        signature = list(map(min, zip(*hashes)))
+        rows = self.rows
+        keys = tuple(hash(tuple(signature[i:i + rows]))
+                     for i in range(0, self.bands * rows, rows))
+        return frozenset(values[0] for values in hashes), keys
+
+    def _insert_locked(self, generation_id, prompt):
+        if generation_id in self._entries:
+            return
+        words, keys = self.sketch(prompt)
+        self._entries[generation_id] = (prompt, words, keys)
+        for band, key in zip(self._buckets, keys):
+            bucket = band.setdefault(key, [])
+            bucket.append(generation_id)
+            if len(bucket) > self.bucket_size:
+                del bucket[0]
+        while len(self._entries) > self.max_entries:
+            self._remove_locked(next(iter(self._entries)))
+
+    def _remove_locked(self, generation_id):
+        entry = self._entries.pop(generation_id, None)
+        if entry is None:
+            return False
+        for band, key in zip(self._buckets, entry[2]):
+            bucket = band.get(key)
+            if bucket and generation_id in bucket:
+                bucket.remove(generation_id)
+                if not bucket:
+                    del band[key]
+        return True
+
+    # ------------------------------------------------------------------
+    # Shared log
+    # ------------------------------------------------------------------
+
+    def _tail(self):
+        """Index the log lines written (by any process) since the last look."""
+        try:
+            if os.path.getsize(self.path) <= self._offset:
+                return
+        except FileNotFoundError:
+            return
+        if not self._tail_lock.acquire(blocking=False):
+            return  # another thread is at it; lookups don't wait for it
+        try:
+            try:
+                with open(self.path, "rb") as f:
+                    f.seek(self._offset)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            end = data.rfind(b"\n") + 1  # a line still being written waits for next time
+            lines = data[:end].splitlines()
+            for start in range(0, len(lines), LOAD_BATCH):
+                with self._lock:
+                    for line in lines[start:start + LOAD_BATCH]:
+                        try:
+                            record = json.loads(line)
+                            self._insert_locked(record["g"], record["p"])
+                        except (ValueError, KeyError, TypeError):
+                            continue
+            self._offset += end
+        finally:
+            self._tail_lock.release()
+
+    def _compact_log(self):
+        """Rewrite the log with its newest max_entries lines once it has twice that."""
+        try:
+            with open(self.path, "rb") as f:
+                lines = f.read().splitlines(keepends=True)
+        except FileNotFoundError:
+            return
+        if len(lines) <= 2 * self.max_entries:
+            return
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.writelines(line for line in lines[-self.max_entries:] if line.endswith(b"\n"))
+        os.replace(tmp, self.path)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+
+    def add(self, prompt, generation_id):
+        """Index `prompt` as the one that produced `generation_id`."""
+        if not normalize(prompt):
+            return
+        if not self.path:
+            with self._lock:
+                self._insert_locked(generation_id, prompt)
+            return
+        line = json.dumps({"g": generation_id, "p": prompt, "t": round(time.time(), 3)})
+        with open(self.path, "ab") as f:
+            f.write(line.encode("utf-8") + b"\n")  # one O_APPEND write per line
+        self._tail()
+
+    def remove(self, generation_id):
+        """Forget a generation (e.g. one the file store has collected)."""
+        with self._lock:
+            return self._remove_locked(generation_id)
+
+    def query(self, prompt, threshold=0.5, limit=3):
+        """Up to `limit` Matches with similarity >= threshold, best first."""
+        if self.path:
+            self._tail()
+        words, keys = self.sketch(prompt)
+        with self._lock:
+            self._stats["queries"] += 1
+            seen = set()
+            scored = []
+            for band, key in zip(self._buckets, keys):
+                for generation_id in band.get(key, ()):
+                    if generation_id in seen:
+                        continue
+                    seen.add(generation_id)
+                    entry_prompt, entry_words, _ = self._entries[generation_id]
+                    similarity = jaccard(words, entry_words)
+                    if similarity >= threshold:
+                        scored.append(Match(generation_id, entry_prompt, similarity))
+            self._stats["candidates"] += len(seen)
+            if scored:
+                self._stats["hits"] += 1
+        # Ties go to the newest generation (ids sort by creation time).
+        scored.sort(key=lambda m: (m.similarity, m.generation_id), reverse=True)
+        return scored[:limit]
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+            stats["buckets"] = sum(len(band) for band in self._buckets)
+        for name in ("queries", "hits", "candidates"):
+            stats.setdefault(name, 0)
+        stats["bands"] = self.bands
+        stats["rows"] = self.rows
+        return stats
@@ -0,0 +1,200 @@
+"""
+Request coalescing: identical calls in flight at the same time share one.
+
+The first caller for a key runs the call (the leader); callers arriving
+with the same key before it finishes wait for that call instead of making
+their own, and each gets its own deep copy of the result, or the same
+exception. Once a call finishes its key is forgotten, so a later caller
+starts a new one (repeat answers are the response cache's job).
+
+A waiter that gives up (a timeout, or a cancelled task) only stops
+waiting: the call carries on for everyone else. In do_async() the call
+runs in its own task, so even the leader's cancellation doesn't stop it.
+
+A leader that makes the call itself (begin() / begin_async(), e.g. to
+stream the answer to its own client) can't hand it off like that: if it
+stops early it abandon()s the flight, and the callers waiting in do() /
+do_async() start over (one of them leading a new call).
+"""
+import asyncio
+import collections
+import copy
+import threading
+
+
+class Abandoned(Exception):
+    """The leader stopped before its call finished; waiters should start over."""
+
+
+class Flight:
+    """One call in progress and the callers waiting on it."""
+
+    def __init__(self, key):
+        self.key = key
+        self.waiters = 0
+        self.result = None
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """The result (a copy) once the call is done; raises its exception."""
+        if not self._done.wait(timeout):
+            raise TimeoutError(f"Gave up waiting for an identical request in flight ({timeout}s)")
+        if self.error is not None:
+            raise self.error
+        return copy.deepcopy(self.result)
+
+
+class SingleFlight:
+    """Coalesces concurrent calls by key, from threads (do) or coroutines (do_async)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}  # key -> Flight (threads)
+        self._tasks = {}    # key -> asyncio.Task (the event loop)
+        self._stats = collections.Counter()
+
+    # ------------------------------------------------------------------
+    # Threads
+    # ------------------------------------------------------------------
+
+    def begin(self, key):
+        """Return (flight, leader). The leader must call finish(); others wait()."""
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = Flight(key)
+                self._stats["leaders"] += 1
+                return flight, True
+            flight.waiters += 1
+            self._stats["coalesced"] += 1
+            self._stats["max_waiters"] = max(self._stats["max_waiters"], flight.waiters)
+            return flight, False
+
+    def finish(self, flight, result=None, error=None):
+        with self._lock:
+            self._flights.pop(flight.key, None)
+            if isinstance(error, Abandoned):
+                self._stats["leaders_abandoned"] += 1
+            elif error is not None:
+                self._stats["errors"] += 1
+        flight.result, flight.error = result, error
+        flight._done.set()
+
+    def abandon(self, flight):
+        """finish() for a leader that stops early: waiters start over."""
+        self.finish(flight, error=Abandoned("The identical request in flight stopped"))
+
+    def do(self, key, fn, timeout=None):
+        """
+        Return (fn(), shared): run fn() unless an identical call is already
+        in flight, in which case wait up to `timeout` seconds for its result.
+        """
+        while True:
+            flight, leader = self.begin(key)
+            if leader:
+                break
+            try:
+                return self._wait(flight, timeout), True
+            except Abandoned:
+                continue
+        try:
+            result = fn()
+        except BaseException as e:
+            self.finish(flight, error=e)
+            raise
+        self.finish(flight, result)
+        # Followers copy the stored result; the leader's copy is its own.
+        return (copy.deepcopy(result) if flight.waiters else result), False
+
+    def _wait(self, flight, timeout):
+        try:
+            return flight.wait(timeout)
+        except TimeoutError:
+            self._count("abandoned")
+            raise
+
+    # ------------------------------------------------------------------
+    # Coroutines (one event loop)
+    # ------------------------------------------------------------------
+
+    async def do_async(self, key, fn):
+        """
+        Return (await fn(), shared). fn() runs in a task of its own that
+        outlives any caller who is cancelled while waiting for it.
+        """
+        while True:
+            task = self._tasks.get(key)
+            shared = task is not None
+            if not shared:
+                task = self._tasks[key] = asyncio.ensure_future(fn())
+                task.add_done_callback(lambda t: self._task_done(key, t))
+            self._count("coalesced" if shared else "leaders")
+            try:
+                return await self.wait_async(task), shared
+            except Abandoned:
+                continue
+
+    def begin_async(self, key):
+        """
+        begin() for coroutines: (future, leader). The leader makes the call
+        itself and must end with finish_async() or abandon_async(); others
+        await wait_async(future).
+        """
+        future = self._tasks.get(key)
+        if future is not None:
+            self._count("coalesced")
+            return future, False
+        future = self._tasks[key] = asyncio.get_running_loop().create_future()
+        future.add_done_callback(lambda f: self._task_done(key, f))
+        self._count("leaders")
+        return future, True
+
+    def finish_async(self, future, result=None, error=None):
+        """finish() for coroutines."""
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def abandon_async(self, future):
+        """abandon() for coroutines (a no-op once the future is resolved)."""
+        if not future.done():
+            future.set_exception(Abandoned("The identical request in flight stopped"))
+
+    async def wait_async(self, task):
+        """The result (a copy) of a call in flight, from do_async() or begin_async()."""
+        try:
+            result = await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if not task.done():
+                self._count("abandoned")
+            raise
+        return copy.deepcopy(result)
+
+    def _task_done(self, key, task):
+        if self._tasks.get(key) is task:
+            del self._tasks[key]
+        if task.cancelled():
+            return
+        error = task.exception()  # (also marks it retrieved)
+        if isinstance(error, Abandoned):
+            self._count("leaders_abandoned")
+        elif error is not None:
+            self._count("errors")
+
+    # ------------------------------------------------------------------
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            in_flight = len(self._flights) + len(self._tasks)
+        for name in ("leaders", "coalesced", "abandoned", "leaders_abandoned", "errors",
+                     "max_waiters"):
+            stats.setdefault(name, 0)
+        stats["in_flight"] = in_flight
+        return stats
@@ -0,0 +1,434 @@
+"""
+Versioned, pre-validated skeleton files that generations reference
+instead of re-emitting.
+
+Every extension pays output tokens for the same boilerplate: the MV3
+manifest frame, the popup.html <head> that links styles.css, the dark
+glass theme (variables, controls, keyframes) and the chrome.storage
+wrappers. The skeletons/ library holds one copy of each; the system
+prompt lists them (prompt()) and the model writes a one-line reference
+where the boilerplate would go:
+
+    styles.css    /* @skeleton glass-theme@1 */      then only its own rules
+    popup.html    <!-- @skeleton popup-head@1 -->     then <title>, </head>, <body>...
+    background.js // @skeleton storage@1              then its own code
+    manifest      {"$skeleton": "manifest@1", "name": ..., "permissions": [...]}
+
+expand() puts the skeleton text in place of each reference line, and
+expands a manifest as a JSON merge patch (RFC 7386) over the skeleton
+manifest, so a key set to null removes it. collapse() goes back the
+other way for results rebuilt from a stored generation, so a refinement
+sees the same compact form the model wrote.
+
+A skeleton is `<name>@<version>.<ext>` in the library directory and is
+never edited once released: index.json pins its sha256, a library whose
+file no longer matches refuses to load, and a change is a new version
+(the old one stays, so older answers and cached responses still expand
+to the same bytes). `python skeletons.py` validates the library, and
+`--pin` records the hashes of new versions.
+"""
+import argparse
+import collections
+import copy
+import hashlib
+import json
+import os
+import re
+import sys
+import threading
+
+from validation import Validator, check_css, check_manifest
+
+INDEX = "index.json"
+MANIFEST_KEY = "$skeleton"
+
+# Per file kind: the file names it applies to and its reference line.
+KINDS = {
+    "css": ((".css",), "/* @skeleton {ref} */"),
+    "js": ((".js", ".mjs"), "// @skeleton {ref}"),
+    "html": ((".html", ".htm"), "<!-- @skeleton {ref} -->"),
+    "json": ((), None),  # the manifest: {"$skeleton": ref, ...}
+}
+
+_NAME = re.compile(r"^([a-z0-9][a-z0-9-]*)@(\d+)\.([a-z]+)$")
+# A reference is a line of its own, bare or in the file type's comment.
+_REFERENCE = re.compile(
+    r"^[ \t]*(?:/\*+|//|<!--)?[ \t]*@skeleton[ \t]+([a-z0-9][a-z0-9-]*@\d+)"
+    r"[ \t]*(?:\*+/|-->)?[ \t]*$", re.M)
+
+
+class SkeletonError(ValueError):
+    """An unknown or misplaced skeleton reference, or a tampered library."""
+
+
+def merge_patch(target, patch):
+    """RFC 7386: `patch` applied to `target` (neither is modified)."""
+    if not isinstance(patch, dict):
+        return copy.deepcopy(patch)
+    result = copy.deepcopy(target) if isinstance(target, dict) else {}
+    for key, value in patch.items():
+        if value is None:
+            result.pop(key, None)
+        else:
+            result[key] = merge_patch(result.get(key), value)
+    return result
+
+
+def diff_patch(base, value):
+    """
+    The merge patch that turns dict `base` into dict `value`, or None when
+    there is none (`value` holds a null, which a merge patch can't set).
+    """
+    patch = {}
+    for key, base_value in base.items():
+        if key not in value:
+            patch[key] = None
+        elif isinstance(base_value, dict) and isinstance(value[key], dict):
+            sub = diff_patch(base_value, value[key])
+            if sub is None:
+                return None
+            if sub:
+                patch[key] = sub
+        elif value[key] != base_value:
+            patch[key] = value[key]
+    for key, item in value.items():
+        if key not in base:
+            patch[key] = item
+    if any(item is None and key in value for key, item in patch.items()):
+        return None
+    return patch
+
+
+class Skeleton:
+    def __init__(self, name, version, kind, text, summary=""):
+        self.name = name
+        self.version = version
+        self.kind = kind
+        self.text = text
+        self.summary = summary
+        self.sha256 = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        # The text that replaces a reference line (its own line breaks kept,
+        # the reference line's break supplies the last one).
+        self.body = text[:-1] if text.endswith("\n") else text
+        self.data = json.loads(text) if kind == "json" else None
+
+    @property
+    def ref(self):
+        return f"{self.name}@{self.version}"
+
+    def reference(self):
+        """The canonical reference line (or manifest key) for this skeleton."""
+        template = KINDS[self.kind][1]
+        return template.format(ref=self.ref) if template else f'"{MANIFEST_KEY}": "{self.ref}"'
+
+    def applies_to(self, filename):
+        return filename.lower().endswith(KINDS[self.kind][0]) if KINDS[self.kind][0] else False
+
+
+class SkeletonLibrary:
+    """
+    - directory: the skeleton files plus index.json ({ref: {"summary",
+      "sha256"}}). A file must match its pinned hash; one not pinned yet
+      (a new version, before `--pin`) loads as it is.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._skeletons = {}  # ref -> Skeleton
+        self._lock = threading.Lock()
+        self._expansions = collections.Counter()  # ref -> references expanded
+        self._stats = {"files": 0, "manifests": 0, "collapsed": 0, "bytes_expanded": 0}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(os.path.join(self.directory, INDEX), "r", encoding="utf-8") as f:
+                index = json.load(f)
+        except FileNotFoundError:
+            index = {}
+        if not os.path.isdir(self.directory):
+            return
+        for filename in sorted(os.listdir(self.directory)):
+            match = _NAME.match(filename)
+            if not match:
+                continue
+            name, version, ext = match.group(1), int(match.group(2)), match.group(3)
+            if ext not in KINDS:  # a skeleton's extension is its kind
+                raise SkeletonError(f"{filename}: no skeleton kind for .{ext} files")
+            with open(os.path.join(self.directory, filename), "r", encoding="utf-8") as f:
+                text = f.read()
+            entry = index.get(f"{name}@{version}", {})
+            skeleton = Skeleton(name, version, ext, text, entry.get("summary", ""))
+            pinned = entry.get("sha256")
+            if pinned and pinned != skeleton.sha256:
+                raise SkeletonError(
+                    f"{filename} changed since it was released; add {name}@{version + 1} instead")
+            self._skeletons[skeleton.ref] = skeleton
+
+    # ------------------------------------------------------------------
+    # Lookup
+    # ------------------------------------------------------------------
+
+    def get(self, ref):
+        skeleton = self._skeletons.get(ref)
+        if skeleton is None:
+            raise SkeletonError(f"Unknown skeleton {ref!r}")
+        return skeleton
+
+    def latest(self):
+        """The newest version of each skeleton, by name."""
+        latest = {}
+        for skeleton in self._skeletons.values():
+            current = latest.get(skeleton.name)
+            if current is None or skeleton.version > current.version:
+                latest[skeleton.name] = skeleton
+        return [latest[name] for name in sorted(latest)]
+
+    def __len__(self):
+        return len(self._skeletons)
+
+    def prompt(self):
+        """The system-prompt section that tells the model what it can reference."""
+        latest = self.latest()
+        if not latest:
+            return ""
+        lines = [
+            "SKELETONS (pre-built, validated files the server expands):",
+            "Do NOT write out what a skeleton contains. Put its reference, exactly as shown, on",
+            "a line of its own where its content belongs, then write only what is specific",
+            "to this extension (your own rules, markup and code after it, never a copy).",
+        ]
+        for skeleton in latest:
+            where = "in \"manifest\"" if skeleton.kind == "json" else f"in {skeleton.kind.upper()} files"
+            lines.append(f"- {skeleton.reference()}  ({where}): {skeleton.summary}")
+        return "\n".join(lines) + "\n"
+
+    # ------------------------------------------------------------------
+    # Expansion
+    # ------------------------------------------------------------------
+
+    def expand_file(self, filename, content, count=True):
+        """
+        `content` with every reference line replaced by its skeleton.
+        - count: whether this is a write (stats count expansions written).
+        """
+        if not isinstance(content, str) or "@skeleton" not in content:
+            return content
+        expanded = []
+
+        def replace(match):
+            skeleton = self.get(match.group(1))
+            if not skeleton.applies_to(filename):
+                raise SkeletonError(f"{skeleton.ref} is a {skeleton.kind} skeleton, "
+                                    f"not for {filename}")
+            expanded.append(skeleton)
+            return skeleton.body
+
+        text = _REFERENCE.sub(replace, content)
+        if expanded and count:
+            self._count(expanded, "files", len(text) - len(content))
+        return text
+
+    def expand_manifest(self, manifest, count=True):
+        """The manifest merged over its "$skeleton" (unchanged if it has none)."""
+        if not isinstance(manifest, dict) or MANIFEST_KEY not in manifest:
+            return manifest
+        ref = manifest[MANIFEST_KEY]
+        skeleton = self.get(ref) if isinstance(ref, str) else None
+        if skeleton is None or skeleton.kind != "json":
+            raise SkeletonError(f"{ref!r} is not a manifest skeleton")
+        patch = {k: v for k, v in manifest.items() if k != MANIFEST_KEY}
+        if count:
+            self._count([skeleton], "manifests", len(skeleton.text))
+        return merge_patch(skeleton.data, patch)
+
+    def expand(self, result, problems=None):
+        """
+        Copy of a { manifest, files, readme } dict with its references
+        expanded. With a `problems` list, a bad reference is appended to it
+        as (file name, message) and left as it is instead of raising.
+        (For a look at what will be written: expansions aren't counted.)
+        """
+        if not isinstance(result, dict):
+            return result
+        out = dict(result)
+
+        def attempt(name, fn, value):
+            try:
+                return fn(value)
+            except SkeletonError as e:
+                if problems is None:
+                    raise
+                problems.append((name, str(e)))
+                return value
+
+        if "manifest" in result:
+            out["manifest"] = attempt("manifest.json", lambda m: self.expand_manifest(m, False),
+                                      result["manifest"])
+        if isinstance(result.get("files"), dict):
+            out["files"] = {name: attempt(name, lambda c, n=name: self.expand_file(n, c, False),
+                                         content)
+                            for name, content in result["files"].items()}
+        return out
+
+    def collapse(self, result):
+        """
+        expand() in reverse: a full result (e.g. rebuilt from a stored
+        generation) with skeleton text turned back into references.
+        """
+        if not isinstance(result, dict):
+            return result
+        out = dict(result)
+        collapsed = 0
+        manifest = result.get("manifest")
+        if isinstance(manifest, dict) and MANIFEST_KEY not in manifest:
+            for skeleton in self._newest_first("json"):
+                patch = diff_patch(skeleton.data, manifest)
+                # Worth it only while the manifest keeps most of the skeleton.
+                removed = sum(1 for item in (patch or {}).values() if item is None)
+                if patch is not None and 2 * removed <= len(skeleton.data):
+                    out["manifest"] = {MANIFEST_KEY: skeleton.ref, **patch}
+                    collapsed += 1
+                    break
+        files = {}
+        for name, content in (result.get("files") or {}).items():
+            if isinstance(content, str):
+                for skeleton in self._newest_first():
+                    if skeleton.kind != "json" and skeleton.applies_to(name):
+                        content, n = self._collapse_text(content, skeleton)
+                        collapsed += n
+            files[name] = content
+        if "files" in result:
+            out["files"] = files
+        if collapsed:
+            with self._lock:
+                self._stats["collapsed"] += collapsed
+        return out
+
+    def _newest_first(self, kind=None):
+        return sorted((s for s in self._skeletons.values() if kind in (None, s.kind)),
+                      key=lambda s: (s.name, -s.version))
+
+    @staticmethod
+    def _collapse_text(content, skeleton):
+        """Replace whole-line occurrences of the skeleton's body; (text, count)."""
+        body = skeleton.body
+        if not body or body not in content:
+            return content, 0
+        pattern = re.compile(r"(?m)^" + re.escape(body) + r"$")
+        return pattern.subn(lambda _: skeleton.reference(), content)
+
+    def _count(self, skeletons, kind, grown):
+        with self._lock:
+            for skeleton in skeletons:
+                self._expansions[skeleton.ref] += 1
+            self._stats[kind] += 1
+            self._stats["bytes_expanded"] += max(grown, 0)
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["expansions"] = dict(self._expansions)
+        stats["skeletons"] = {s.ref: {"kind": s.kind, "bytes": len(s.text.encode("utf-8")),
+                                      "sha256": s.sha256[:12]}
+                              for s in self._skeletons.values()}
+        stats["latest"] = [s.ref for s in self.latest()]
+        return stats
+
+
+# ----------------------------------------------------------------------
+# Library maintenance
+# ----------------------------------------------------------------------
+
+def sample_extension(library):
+    """A small extension built on the latest skeletons, for validating them."""
+    latest = {s.kind: s for s in library.latest()}
+    result = {"manifest": {"name": "Skeleton check", "permissions": ["storage"]}, "files": {}}
+    if "json" in latest:
+        result["manifest"][MANIFEST_KEY] = latest["json"].ref
+    else:
+        result["manifest"].update({"manifest_version": 3, "version": "1.0.0",
+                                   "action": {"default_popup": "popup.html"},
+                                   "background": {"service_worker": "background.js"}})
+    head = latest["html"].reference() if "html" in latest else \
+        "<!DOCTYPE html>\n<html>\n<head>\n<link rel=\"stylesheet\" href=\"styles.css\">"
+    result["files"]["popup.html"] = (head + "\n<title>Check</title>\n</head>\n<body>\n"
+                                     "<main class=\"glass slide-up\"></main>\n"
+                                     "<script src=\"popup.js\"></script>\n</body>\n</html>\n")
+    result["files"]["styles.css"] = "\n".join(
+        [latest["css"].reference()] if "css" in latest else []) + "\nmain { padding: 16px; }\n"
+    js = latest["js"].reference() + "\n" if "js" in latest else ""
+    result["files"]["popup.js"] = js + "storageGet([\"seen\"]).then(console.log);\n"
+    result["files"]["background.js"] = js + "chrome.runtime.onInstalled.addListener(() => {});\n"
+    result["files"]["icon.svg"] = "<svg xmlns=\"http://www.w3.org/2000/svg\"/>"
+    return result
+
+
+def check(library, validator):
+    """
+    Problems (as strings) with the library: each skeleton on its own, plus
+    a sample extension built on the latest ones.
+    """
+    problems = []
+    for skeleton in library._skeletons.values():
+        if skeleton.kind == "css":
+            found = check_css(skeleton.ref, skeleton.text)
+        elif skeleton.kind == "js":
+            found = validator.check_js(skeleton.ref + ".js", skeleton.text)
+        elif skeleton.kind == "json":
+            found = check_manifest(dict(skeleton.data, name="x"))
+        else:
+            found = []  # a fragment: checked inside the sample page below
+        problems += [f"{skeleton.ref}: {p}" for p in found]
+    sample = library.expand(sample_extension(library))
+    report = validator.validate(sample)
+    problems += [f"sample extension: {p}" for p in report.problems]
+    if library.expand(library.collapse(sample)) != sample:
+        problems.append("sample extension: collapse() + expand() doesn't give it back")
+    return problems
+
+
+def pin(library):
+    """Record the hash (and keep the summary) of every skeleton not yet in index.json."""
+    path = os.path.join(library.directory, INDEX)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+    except FileNotFoundError:
+        index = {}
+    added = []
+    for ref, skeleton in sorted(library._skeletons.items()):
+        entry = index.setdefault(ref, {"summary": ""})
+        if "sha256" not in entry:
+            entry["sha256"] = skeleton.sha256
+            added.append(ref)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+        f.write("\n")
+    return added
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Validate (and pin) the skeleton library")
+    parser.add_argument("--dir", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                      "skeletons"))
+    parser.add_argument("--pin", action="store_true",
+                        help="record the hashes of skeletons not pinned yet")
+    args = parser.parse_args(argv)
+
+    library = SkeletonLibrary(args.dir)
+    problems = check(library, Validator(workers=2))
+    for problem in problems:
+        print(problem, file=sys.stderr)
+    if problems:
+        return 1
+    for skeleton in library.latest():
+        print(f"{skeleton.ref}: {len(skeleton.text)} bytes, ok", file=sys.stderr)
+    if args.pin:
+        for ref in pin(library):
+            print(f"pinned {ref}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,45 @@
+// storage@1: promise wrappers around chrome.storage (needs the "storage" permission).
+function storageGet(keys, area = "local") {
+  return new Promise((resolve, reject) => {
+    chrome.storage[area].get(keys, (items) => {
+      const error = chrome.runtime.lastError;
+      if (error) reject(new Error(error.message));
+      else resolve(items);
+    });
+  });
+}
+
+function storageSet(items, area = "local") {
+  return new Promise((resolve, reject) => {
+    chrome.storage[area].set(items, () => {
+      const error = chrome.runtime.lastError;
+      if (error) reject(new Error(error.message));
+      else resolve(items);
+    });
+  });
+}
+
+function storageRemove(keys, area = "local") {
+  return new Promise((resolve, reject) => {
+    chrome.storage[area].remove(keys, () => {
+      const error = chrome.runtime.lastError;
+      if (error) reject(new Error(error.message));
+      else resolve();
+    });
+  });
+}
+
+// The stored values of defaults' keys, with defaults filling the gaps.
+async function storageGetWithDefaults(defaults, area = "local") {
+  const items = await storageGet(Object.keys(defaults), area);
+  return { ...defaults, ...items };
+}
+
+// Calls callback(changes) on every change in `area`; returns an unsubscribe function.
+function onStorageChange(callback, area = "local") {
+  const listener = (changes, areaName) => {
+    if (areaName === area) callback(changes);
+  };
+  chrome.storage.onChanged.addListener(listener);
+  return () => chrome.storage.onChanged.removeListener(listener);
+}
@@ -0,0 +1,165 @@
+"""
+Serving the prebuilt UI bundle (see build_static.py).
+
+StaticBundle loads static/manifest.json and every file it lists into
+memory once, at startup: a page is then served from bytes that were
+rendered and compressed ahead of time instead of being re-rendered per
+hit. Assets have content-hashed names, so they go out with a strong ETag
+and a year-long immutable Cache-Control; pages get an ETag and
+"no-cache" (always revalidated, usually a 304).
+
+Without a build (or when a template changed after the last build) a page
+falls back to its HTML_TEMPLATE as written, CDN links and all.
+"""
+import gzip
+import hashlib
+import json
+import logging
+import os
+
+STATIC_DIR = os.environ.get(
+    "STATIC_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "static"))
+STATIC_URL = "/static/"
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "no-cache"
+
+log = logging.getLogger(__name__)
+
+
+def source_hash(template):
+    """What the build records per page, to tell a stale build from a current one."""
+    return hashlib.sha256(template.encode("utf-8")).hexdigest()
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0), from an Accept-Encoding header."""
+    accepted = set()
+    for part in (header or "").split(","):
+        coding, _, params = part.strip().partition(";")
+        coding = coding.strip().lower()
+        q = 1.0
+        for param in params.split(";"):
+            key, _, value = param.strip().partition("=")
+            if key == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if coding and q > 0:
+            accepted.add(coding)
+    return accepted
+
+
+def etag_matches(if_none_match, etag):
+    """Whether an If-None-Match header covers `etag` (weak comparison, as for GET)."""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    tags = {t.strip() for t in if_none_match.split(",")}
+    return f'"{etag}"' in {t[2:] if t.startswith("W/") else t for t in tags}
+
+
+class Asset:
+    """
+    One servable file: its bytes, precompressed variants and headers.
+    - encoded: {"br": bytes, "gzip": bytes}, the ones worth sending.
+    """
+
+    def __init__(self, data, mimetype, cache_control, encoded=None, etag=None):
+        self.data = data
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+        self.encoded = encoded or {}
+        self.etag = etag or hashlib.sha256(data).hexdigest()
+
+    def select(self, accept_encoding):
+        """(coding or None, body) of the smallest variant the client accepts."""
+        accepted = accepted_encodings(accept_encoding)
+        for coding in ("br", "gzip"):
+            if coding in self.encoded and coding in accepted:
+                return coding, self.encoded[coding]
+        return None, self.data
+
+    def respond(self, accept_encoding=None, if_none_match=None):
+        """(status, headers, body) for a GET of this asset."""
+        coding, body = self.select(accept_encoding)
+        # Each coding is its own representation, so it gets its own ETag.
+        etag = f"{self.etag}-{coding}" if coding else self.etag
+        headers = {"Cache-Control": self.cache_control, "ETag": f'"{etag}"'}
+        if self.encoded:
+            headers["Vary"] = "Accept-Encoding"
+        if etag_matches(if_none_match, etag):
+            return 304, headers, b""
+        headers["Content-Type"] = self.mimetype
+        if coding:
+            headers["Content-Encoding"] = coding
+        headers["Content-Length"] = str(len(body))
+        return 200, headers, body
+
+
+class StaticBundle:
+    """The build output in `directory`; empty (every page falls back) without one."""
+
+    def __init__(self, directory=STATIC_DIR):
+        self.directory = directory
+        self.manifest = {}
+        self.assets = {}
+        path = os.path.join(directory, "manifest.json")
+        if not os.path.exists(path):
+            return
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.manifest = json.load(f)
+            for name, entry in self.manifest.get("files", {}).items():
+                self.assets[name] = Asset(
+                    self._read(name), entry["type"], IMMUTABLE,
+                    {coding: self._read(encoded_name)
+                     for coding, encoded_name in entry.get("encodings", {}).items()},
+                    entry.get("etag"))
+        except (OSError, ValueError, KeyError) as e:
+            log.warning("Ignoring the static bundle in %s: %s", directory, e)
+            self.manifest, self.assets = {}, {}
+
+    def _read(self, name):
+        with open(os.path.join(self.directory, name), "rb") as f:
+            return f.read()
+
+    def get(self, filename):
+        """The Asset served at STATIC_URL + filename, or None."""
+        return self.assets.get(filename)
+
+    def page(self, name, template):
+        """
+        Asset for page `name`: the built HTML when the build is current for
+        `template`, else the template itself.
+        """
+        entry = self.manifest.get("pages", {}).get(name)
+        data = None
+        if entry is None:
+            log.info("No static build for %s: serving the template with CDN assets", name)
+        elif entry.get("source_sha256") != source_hash(template):
+            log.warning("Static build for %s is stale (template changed since): "
+                        "serving the template; re-run build_static.py", name)
+        else:
+            try:
+                data = self._read(entry["html"])
+            except OSError as e:
+                log.warning("Static build for %s is unreadable: %s", name, e)
+        if data is None:
+            data = template.encode("utf-8")
+        compressed = gzip.compress(data, 9, mtime=0)
+        encoded = {"gzip": compressed} if len(compressed) < len(data) else {}
+        return Asset(data, "text/html; charset=utf-8", REVALIDATE, encoded)
+
+    def stats(self):
+        return {
+            "directory": self.directory,
+            "built": bool(self.manifest),
+            "built_at": self.manifest.get("built_at"),
+            "pages": {name: {k: v for k, v in entry.items() if k != "source_sha256"}
+                      for name, entry in self.manifest.get("pages", {}).items()},
+            "files": len(self.assets),
+            "bytes": sum(len(a.data) for a in self.assets.values()),
+        }
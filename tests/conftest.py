@@ -0,0 +1,75 @@
+import asyncio
+import json
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mock_openai  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def upstream():
+    """The mock OpenAI server (its MockConfig is upstream.config)."""
+    args = mock_openai.build_parser().parse_args(["--port", "0"])
+    server = mock_openai.make_server(args)
+    server.config = server.RequestHandlerClass.config
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield server
+    server.shutdown()
+
+
+@pytest.fixture(scope="session")
+def main_ui(upstream, tmp_path_factory):
+    """main_ui configured (once per run) against the mock, with a temporary store."""
+    root = tmp_path_factory.mktemp("forge")
+    os.environ.update(
+        OPENAI_API_URL=f"http://127.0.0.1:{upstream.server_address[1]}/v1/chat/completions",
+        OPENAI_API_KEY="test", CACHE_ENABLED="0", SIMILARITY="0",
+        FORGE_STORE_DIR=str(root / "store"), CACHE_DIR=str(root / "cache"))
+    import main_ui
+    return main_ui
+
+
+@pytest.fixture(scope="session")
+def main_asgi(main_ui):
+    import main_asgi
+    return main_asgi
+
+
+async def asgi_call(app, method, path, body=b"", headers=(), chunk=None, stall_after=None):
+    """
+    One request through an ASGI app: (status, headers, body). The body is
+    sent in `chunk`-sized messages; with stall_after=n the client goes quiet
+    after n of them.
+    """
+    if isinstance(body, dict):
+        body = json.dumps(body).encode()
+        headers = [("Content-Type", "application/json"), *headers]
+    size = chunk or max(len(body), 1)
+    parts = [body[i:i + size] for i in range(0, len(body), size)] or [b""]
+    sent = 0
+
+    async def receive():
+        nonlocal sent
+        if sent >= len(parts) or sent == stall_after:
+            await asyncio.sleep(3600)
+        sent += 1
+        return {"type": "http.request", "body": parts[sent - 1], "more_body": sent < len(parts)}
+
+    out = {"body": b""}
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            out["status"] = message["status"]
+            out["headers"] = {k.decode(): v.decode() for k, v in message["headers"]}
+        else:
+            out["body"] += message.get("body", b"")
+
+    scope = {"type": "http", "method": method, "path": path,
+             "headers": [(k.lower().encode(), v.encode()) for k, v in headers]}
+    await app(scope, receive, send)
+    return out["status"], out["headers"], out["body"]
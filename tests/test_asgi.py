@@ -0,0 +1,93 @@
+import asyncio
+import base64
+import json
+import os
+
+from conftest import asgi_call
+from filestore import INDEX_NAME
+from sessions import new_session_id
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 64
+
+
+def upload(**files):
+    return {"manifest": {"manifest_version": 3, "name": "Upload", "version": "1.0"},
+            "files": {"popup.js": "console.log(1);\n", **files}}
+
+
+def test_save_streams_a_body_over_asgi_max_body(main_ui, main_asgi, monkeypatch):
+    monkeypatch.setattr(main_asgi, "ASGI_MAX_BODY", 1024)
+    body = upload(**{"icon.png": "data:image/png;base64," + base64.b64encode(PNG).decode()})
+    status, _, out = asyncio.run(asgi_call(main_asgi.app, "POST", "/save", body, chunk=1000))
+    assert status == 200, out
+    generation = main_ui.file_store.get(json.loads(out)["generation_id"])
+    assert generation.read("icon.png") == PNG
+
+
+def test_stalled_uploads_time_out_without_blocking_other_routes(main_asgi, monkeypatch):
+    monkeypatch.setattr(main_asgi, "ASGI_BODY_READ_TIMEOUT", 0.5)
+    body = json.dumps(upload()).encode()
+    headers = [("Content-Type", "application/json")]
+
+    async def run():
+        stalled = [asyncio.ensure_future(asgi_call(main_asgi.app, "POST", "/save", body, headers,
+                                                   chunk=16, stall_after=1))
+                   for _ in range(main_asgi.ASGI_EXECUTOR_WORKERS + main_asgi.ASGI_INGEST_WORKERS)]
+        await asyncio.sleep(0.1)
+        other = await asyncio.wait_for(asgi_call(main_asgi.app, "GET", "/generations"), 0.4)
+        return other, await asyncio.gather(*stalled)
+
+    other, stalled = asyncio.run(run())
+    assert other[0] == 200
+    assert {status for status, _, _ in stalled} == {408}
+
+
+def test_forge_then_download_and_launch_in_one_session(main_ui, main_asgi, monkeypatch):
+    launched = []
+    monkeypatch.setattr(main_asgi, "launch_chrome_with_extension", launched.append)
+
+    async def run():
+        status, _, out = await asgi_call(main_asgi.app, "POST", "/forge",
+                                         {"prompt": "an asgi word counter"})
+        assert status == 200, out
+        forged = json.loads(out)
+        session = [(main_ui.SESSION_HEADER, forged["session_id"])]
+
+        status, headers, archive = await asgi_call(main_asgi.app, "GET", "/download",
+                                                   headers=session)
+        assert status == 200 and headers["content-type"] == "application/zip"
+        assert archive.startswith(b"PK")
+        status, _, body = await asgi_call(main_asgi.app, "GET", "/download",
+                                          headers=[*session, ("If-None-Match", headers["etag"])])
+        assert (status, body) == (304, b"")
+
+        status, _, out = await asgi_call(main_asgi.app, "POST", "/launch", headers=session)
+        assert status == 200, out
+        return forged
+
+    forged = asyncio.run(run())
+    [workspace] = launched
+    assert sorted(os.listdir(workspace)) == sorted(
+        [*main_ui.file_store.get(forged["generation_id"]).files, INDEX_NAME])
+
+
+def test_launch_errors_are_client_errors(main_ui, main_asgi, monkeypatch):
+    monkeypatch.setattr(main_ui, "find_chrome_executable", lambda: None)
+
+    async def run():
+        session = [(main_ui.SESSION_HEADER, new_session_id())]
+        first = await asgi_call(main_asgi.app, "POST", "/launch", headers=session)
+        await asgi_call(main_asgi.app, "POST", "/save", upload(), headers=session)
+        return first, await asgi_call(main_asgi.app, "POST", "/launch", headers=session)
+
+    (status, _, out), (chromeless, _, message) = asyncio.run(run())
+    assert status == 400 and "Generate first" in json.loads(out)["message"]
+    assert chromeless == 400 and "Chrome" in json.loads(message)["message"]
+
+
+def test_streamed_forge_sends_files_before_done(main_asgi):
+    status, headers, out = asyncio.run(asgi_call(main_asgi.app, "POST", "/forge",
+                                                 {"prompt": "an asgi stream", "stream": True}))
+    assert status == 200 and headers["content-type"].startswith("text/event-stream")
+    text = out.decode()
+    assert "event: file" in text and text.index("event: file") < text.index("event: done")
@@ -0,0 +1,29 @@
+import io
+import json
+import zipfile
+
+
+def batch(client, **payload):
+    r = client.post("/forge/batch", json=payload)
+    assert r.status_code == 200
+    return zipfile.ZipFile(io.BytesIO(r.get_data()))
+
+
+def test_batch_zip_has_a_folder_per_prompt(main_ui):
+    archive = batch(main_ui.app.test_client(),
+                    prompts=["a clock", {"prompt": "a timer", "name": "timer"}])
+    statuses = json.loads(archive.read("batch_manifest.json"))["items"]
+    assert sorted(s["status"] for s in statuses) == ["success", "success"]
+    names = archive.namelist()
+    for status in statuses:
+        assert f"{status['name']}/manifest.json" in names
+
+
+def test_batch_answers_are_validated_and_fixed(main_ui, upstream):
+    upstream.config.invalid_rate = 1.0
+    try:
+        archive = batch(main_ui.app.test_client(), prompts=["a broken thing"], no_cache=True)
+    finally:
+        upstream.config.invalid_rate = 0.0
+    [status] = json.loads(archive.read("batch_manifest.json"))["items"]
+    assert status["validation"]["fix_rounds"] >= 1
@@ -0,0 +1,30 @@
+import os
+
+from cache import ResponseCache, cache_key
+
+
+def keys(n):
+    return [cache_key({"n": i}) for i in range(n)]
+
+
+def test_disk_tier_evicts_oldest_entries(tmp_path):
+    cache = ResponseCache(max_memory_bytes=0, directory=str(tmp_path), max_disk_entries=3)
+    for i, key in enumerate(keys(5)):
+        cache.put(key, {"answer": i})
+    assert [cache.get(k) is not None for k in keys(5)] == [False, False, True, True, True]
+    assert cache.stats()["disk_entries"] == 3
+    assert cache.stats()["disk_evictions"] == 2
+
+
+def test_disk_byte_cap_counts_files_from_earlier_runs(tmp_path):
+    first = ResponseCache(directory=str(tmp_path), max_disk_bytes=0, ttl=0)
+    for i, key in enumerate(keys(4)):
+        first.put(key, {"answer": "x" * 100, "i": i})
+    size = os.path.getsize(first._path(keys(4)[0]))
+
+    second = ResponseCache(max_memory_bytes=0, directory=str(tmp_path), ttl=0,
+                           max_disk_bytes=2 * size)
+    assert second.stats()["disk_entries"] == 2
+    second.put(cache_key({"n": "new"}), {"answer": "y" * 100, "i": 9})
+    assert second.stats()["disk_entries"] == 2
+    assert second.stats()["disk_bytes"] <= 2 * size
@@ -0,0 +1,45 @@
+import json
+
+from compaction import Compactor, prompt_tokens
+
+SYSTEM = {"role": "system", "content": "You build Chrome extensions."}
+
+
+def answer(turn):
+    files = {"manifest.json": '{"manifest_version": 3}',
+             "popup.js": f"// turn {turn}\n" + "console.log('x');\n" * 40}
+    return json.dumps({"analysis": f"Version {turn}", "files": files})
+
+
+def history(turns):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"change number {turn}"})
+        messages.append({"role": "assistant", "content": answer(turn)})
+    return messages
+
+
+def test_only_the_latest_extension_is_kept_verbatim():
+    out = Compactor(budget=10 ** 6).compact(history(3), reserved=[SYSTEM])
+    assert [m["role"] for m in out] == ["user", "assistant"] * 3
+    assert out[-1]["content"] == answer(2)
+    for m in out[1:-1:2]:
+        assert m["content"].startswith("[Earlier version ")
+        assert "popup.js" in m["content"] and "console.log" not in m["content"]
+
+
+def test_prefix_is_stable_from_turn_to_turn():
+    compactor = Compactor(budget=1200, cut_every=4)
+    prompts = [compactor.compact(history(turns), reserved=[SYSTEM]) for turns in range(1, 30)]
+
+    starts = set()
+    for before, after in zip(prompts, prompts[1:]):
+        assert prompt_tokens([SYSTEM] + after) <= 1200
+        if before[0] == after[0]:
+            # Same window start: the new prompt extends the old one, whose
+            # latest answer has become a reference.
+            assert after[:len(before) - 1] == before[:-1]
+        starts.add(before[0]["content"])
+    # The window moved in a few steps, not on every turn.
+    assert compactor.stats()["dropped"] > 0
+    assert len(starts) < len(prompts) // 2
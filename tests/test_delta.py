@@ -0,0 +1,28 @@
+import pytest
+
+from delta import PatchError, apply_unified_diff
+
+
+def test_applies_hunk():
+    diff = "--- a/x\n+++ b/x\n@@ -1,3 +1,3 @@\n a\n-b\n+B\n c\n"
+    assert apply_unified_diff("a\nb\nc\n", diff) == "a\nB\nc\n"
+
+
+def test_tolerates_shifted_line_numbers():
+    diff = "@@ -1,2 +1,2 @@\n c\n-d\n+D\n"
+    assert apply_unified_diff("a\nb\nc\nd\n", diff) == "a\nb\nc\nD\n"
+
+
+def test_zero_length_old_range_inserts_after_line():
+    diff = "@@ -3,0 +4,1 @@\n+X\n"
+    assert apply_unified_diff("a\nb\nc\nd\n", diff) == "a\nb\nc\nX\nd\n"
+
+
+def test_zero_length_old_range_at_top():
+    diff = "@@ -0,0 +1,1 @@\n+X\n"
+    assert apply_unified_diff("a\nb\n", diff) == "X\na\nb\n"
+
+
+def test_rejects_hunk_that_does_not_apply():
+    with pytest.raises(PatchError):
+        apply_unified_diff("a\nb\n", "@@ -1,1 +1,1 @@\n-z\n+Z\n")
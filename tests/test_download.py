@@ -0,0 +1,54 @@
+import io
+import json
+import zipfile
+
+from archive import ArchiveCache, iter_zip
+
+UPLOAD = {"manifest": {"manifest_version": 3, "name": "Zipped", "version": "1.0"},
+          "files": {"popup.js": "console.log('zip');\n", "icon.png": {"base64": "iVBORw0KGgo="}}}
+
+
+def save(client, upload):
+    r = client.post("/save", data=json.dumps(upload), content_type="application/json")
+    assert r.status_code == 200, r.get_json()
+
+
+def test_download_etag_answers_if_none_match_with_304(main_ui):
+    client = main_ui.app.test_client()
+    save(client, UPLOAD)
+
+    r = client.get("/download")
+    assert r.status_code == 200
+    etag = r.headers["ETag"]
+    archive = zipfile.ZipFile(io.BytesIO(r.data))
+    assert sorted(archive.namelist()) == ["icon.png", "manifest.json", "popup.js"]
+    assert archive.getinfo("icon.png").compress_type == zipfile.ZIP_STORED
+    assert archive.read("popup.js") == b"console.log('zip');\n"
+
+    again = client.get("/download", headers={"If-None-Match": etag})
+    assert again.status_code == 304
+    assert again.data == b""
+    assert again.headers["ETag"] == etag
+
+    save(client, dict(UPLOAD, files={"popup.js": "console.log('changed');\n"}))
+    changed = client.get("/download", headers={"If-None-Match": etag})
+    assert changed.status_code == 200
+    assert changed.headers["ETag"] != etag
+
+
+def test_archives_are_deterministic():
+    entries = [("a.js", b"a" * 1000), ("b/c.png", b"\x89PNG")]
+    assert b"".join(iter_zip(entries)) == b"".join(iter_zip(list(entries)))
+
+
+def test_archive_cache_evicts_least_recently_used():
+    cache = ArchiveCache(max_bytes=10)
+    cache.put("a", b"aaaa")
+    cache.put("b", b"bbbb")
+    assert cache.get("a") == b"aaaa"
+    cache.put("c", b"cccc")
+    assert cache.get("b") is None
+    assert cache.get("a") == b"aaaa" and cache.get("c") == b"cccc"
+    cache.put("huge", b"x" * 11)
+    assert cache.get("huge") is None
+    assert cache.stats()["bytes"] == 8
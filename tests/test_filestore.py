@@ -0,0 +1,116 @@
+import json
+import os
+import shutil
+import time
+
+from filestore import INDEX_NAME, FileStore
+
+
+def age(path, seconds):
+    then = time.time() - seconds
+    os.utime(path, (then, then))
+
+
+def test_storing_a_blob_again_leaves_workspace_mtime_alone(tmp_path):
+    store = FileStore(str(tmp_path), blob_grace=3600)
+    sha = store.put_blob(b"same bytes")
+    workspace = str(tmp_path / "ws")
+    store.sync(workspace, {"a.txt": sha})
+    age(os.path.join(workspace, "a.txt"), 600)
+    before = os.stat(os.path.join(workspace, "a.txt"))
+
+    assert store.put_blob(b"same bytes") == sha
+    writer = store.open_blob()
+    writer.write(b"same bytes")
+    assert writer.close() == sha
+
+    after = os.stat(os.path.join(workspace, "a.txt"))
+    assert (after.st_ino, after.st_mtime) == (before.st_ino, before.st_mtime)
+
+
+def test_gc_spares_unreferenced_blob_stored_again_within_grace(tmp_path):
+    store = FileStore(str(tmp_path), blob_grace=3600)
+    sha = store.put_blob(b"orphan")
+    age(store.blob_path(sha), 7200)
+    store.put_blob(b"orphan")
+    assert store.gc()["blobs"] == 0
+    assert os.path.exists(store.blob_path(sha))
+
+    age(store.blob_path(sha) + ".stored", 7200)
+    assert store.gc()["blobs"] == 1
+    assert os.listdir(os.path.dirname(store.blob_path(sha))) == []
+
+
+def generation(store, files, session_id=None):
+    writer = store.begin(session_id)
+    for name, data in files.items():
+        writer.add(name, data)
+    return writer.commit()
+
+
+def test_generations_share_blobs_for_unchanged_files(tmp_path):
+    store = FileStore(str(tmp_path))
+    first = generation(store, {"manifest.json": b"{}", "js/popup.js": b"1;"})
+    second = generation(store, {"manifest.json": b"{}", "js/popup.js": b"2;"})
+
+    assert first.files["manifest.json"] == second.files["manifest.json"]
+    same = [os.stat(os.path.join(g.path, "manifest.json")).st_ino for g in (first, second)]
+    assert same[0] == same[1]
+    assert second.read("js/popup.js") == b"2;"
+
+    shutil.rmtree(first.path)
+    assert store.materialize(first.id).read("js/popup.js") == b"1;"
+    assert open(os.path.join(first.path, "js", "popup.js"), "rb").read() == b"1;"
+
+
+def test_gc_drops_oldest_generations_over_quota_but_keeps_pinned(tmp_path):
+    store = FileStore(str(tmp_path), max_bytes=10)
+    oldest = generation(store, {"a.js": b"a" * 8})
+    older = generation(store, {"b.js": b"b" * 8})
+    newest = generation(store, {"c.js": b"c" * 8})
+
+    result = store.gc(keep={oldest.id})
+    assert result["generations"] == 2
+    assert [g.id for g in store.list()] == [oldest.id]
+    assert result["blobs"] == 2
+    assert not os.path.exists(store.blob_path(newest.files["c.js"]))
+    assert not os.path.exists(older.path)
+
+
+def test_gc_drops_generations_past_max_age(tmp_path):
+    store = FileStore(str(tmp_path), max_age=60)
+    old = generation(store, {"a.js": b"old"})
+    record = store.record_path(old.id)
+    with open(record) as f:
+        data = json.load(f)
+    data["created"] -= 120
+    with open(record, "w") as f:
+        json.dump(data, f)
+    new = generation(store, {"a.js": b"new"})
+
+    assert store.gc()["generations"] == 1
+    assert [g.id for g in store.list()] == [new.id]
+    assert not os.path.exists(store.blob_path(old.files["a.js"]))
+
+
+def test_sync_touches_only_what_changed(tmp_path):
+    store = FileStore(str(tmp_path))
+    workspace = store.workspace_path("session")
+    keep, old = store.put_blob(b"keep"), store.put_blob(b"old")
+    store.sync(workspace, {"keep.js": keep, "lib/old.js": old, "gone/deep/x.js": old})
+    kept = os.stat(os.path.join(workspace, "keep.js"))
+    os.remove(os.path.join(workspace, "lib", "old.js"))  # deleted by hand
+
+    new = store.put_blob(b"new")
+    changes = store.sync(workspace, {"keep.js": keep, "lib/old.js": old, "new.js": new})
+
+    assert changes["added"] == ["new.js"] and changes["removed"] == ["gone/deep/x.js"]
+    after = os.stat(os.path.join(workspace, "keep.js"))
+    assert (after.st_ino, after.st_mtime) == (kept.st_ino, kept.st_mtime)
+    assert open(os.path.join(workspace, "lib", "old.js"), "rb").read() == b"old"
+    assert not os.path.exists(os.path.join(workspace, "gone"))
+
+    changes = store.sync(workspace, {"keep.js": new})
+    assert changes["changed"] == ["keep.js"]
+    assert open(os.path.join(workspace, "keep.js"), "rb").read() == b"new"
+    assert sorted(os.listdir(workspace)) == sorted([INDEX_NAME, "keep.js"])
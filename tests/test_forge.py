@@ -0,0 +1,27 @@
+import json
+
+
+def sse(text):
+    """[(event, data)] of a server-sent event stream."""
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines())
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+def test_streamed_forge_writes_files_before_it_is_done(main_ui):
+    client = main_ui.app.test_client()
+    r = client.post("/forge", json={"prompt": "a streamed word counter", "stream": True})
+    assert r.mimetype == "text/event-stream"
+    events = sse(r.get_data(as_text=True))
+
+    names = [event[0] for event in events]
+    assert names[-1] == "done"
+    streamed = [data["file"] for event, data in events if event == "file"]
+    assert "manifest.json" in streamed and "popup.js" in streamed
+
+    done = events[-1][1]
+    generation = main_ui.file_store.get(done["generation_id"])
+    assert set(streamed) <= set(generation.files)
+    assert json.loads(generation.read("manifest.json"))["manifest_version"] == 3
@@ -0,0 +1,33 @@
+import json
+
+UPLOAD = {"manifest": {"manifest_version": 3, "name": "Mine", "version": "1.0"},
+          "files": {"popup.js": "console.log('mine');\n"}}
+
+
+def saved(client):
+    r = client.post("/save", data=json.dumps(UPLOAD), content_type="application/json")
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()["generation_id"]
+
+
+def test_rollback_to_an_earlier_generation(main_ui):
+    client = main_ui.app.test_client()
+    first = saved(client)
+    second = client.post("/forge", json={"prompt": "change it"}).get_json()["generation_id"]
+    listed = [g["generation_id"] for g in client.get("/generations").get_json()["generations"]]
+    assert listed[-2:] == [first, second]
+
+    r = client.post(f"/generations/{first}/rollback")
+    assert r.status_code == 200
+    assert r.get_json()["generation_id"] == first
+    assert client.get("/generations").get_json()["current"] == first
+
+
+def test_rollback_to_another_sessions_generation_is_not_found(main_ui):
+    theirs = saved(main_ui.app.test_client())
+    client = main_ui.app.test_client()
+    mine = saved(client)
+
+    r = client.post(f"/generations/{theirs}/rollback")
+    assert r.status_code == 404
+    assert client.get("/generations").get_json()["current"] == mine
@@ -0,0 +1,66 @@
+import threading
+import time
+
+import pytest
+
+from jobs import DONE, FAILED, RUNNING, JobQueue, QueueFull
+
+
+def wait(job, timeout=5):
+    deadline = time.time() + timeout
+    while job.state not in (DONE, FAILED) and time.time() < deadline:
+        time.sleep(0.01)
+    return job
+
+
+def test_job_result_and_failure():
+    jobs = JobQueue(workers=1)
+    ok = wait(jobs.submit(lambda a, b: a + b, 2, b=3))
+    assert (ok.state, ok.result) == (DONE, 5)
+
+    def boom():
+        raise ValueError("no")
+
+    failed = wait(jobs.submit(boom))
+    assert failed.to_dict()["state"] == FAILED
+    assert failed.to_dict()["error"] == "no"
+    assert jobs.get(ok.id) is ok
+    assert jobs.stats()[DONE] == 1 and jobs.stats()[FAILED] == 1
+
+
+def test_submit_beyond_max_queue_raises_queue_full():
+    jobs = JobQueue(workers=1, max_queue=1)
+    release = threading.Event()
+    running = jobs.submit(release.wait)
+    while running.state != RUNNING:
+        time.sleep(0.01)
+    waiting = jobs.submit(release.wait)
+    try:
+        with pytest.raises(QueueFull):
+            jobs.submit(release.wait)
+        assert jobs.stats()["rejected"] == 1
+    finally:
+        release.set()
+    assert wait(waiting).state == DONE
+
+
+def test_async_forge_is_polled_to_its_result(main_ui):
+    client = main_ui.app.test_client()
+    r = client.post("/forge", json={"prompt": "a word counter", "async": True})
+    assert r.status_code == 202
+    queued = r.get_json()
+    assert queued["result_url"] == f"/jobs/{queued['job_id']}/result"
+
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        r = client.get(queued["result_url"])
+        if r.status_code != 202:
+            break
+        assert r.headers["Retry-After"] == "1"
+        time.sleep(0.05)
+    assert r.status_code == 200
+    assert r.get_json()["status"] == "success"
+
+    status = client.get(queued["status_url"]).get_json()
+    assert status["state"] == DONE
+    assert client.get("/jobs/nope/result").status_code == 404
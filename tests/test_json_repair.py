@@ -0,0 +1,38 @@
+import json
+
+import pytest
+
+from json_repair import JSONRepairError, parse_answer
+
+FILES = {"manifest.json": '{"manifest_version": 3}', "popup.js": "console.log(1);\n"}
+
+
+def test_valid_answer_with_fenced_readme_is_untouched():
+    answer = {"files": FILES, "readme": '# A\n\n```json\n{"a": 1}\n```\n'}
+    result, report = parse_answer(json.dumps(answer))
+    assert result == answer
+    assert not report.repairs
+
+
+def test_strips_fence_around_the_object():
+    answer = {"files": FILES, "readme": "```js\nrun()\n```"}
+    result, report = parse_answer("```json\n" + json.dumps(answer) + "\n```")
+    assert result == answer
+    assert set(report.repairs) == {"leading_text"}
+
+
+def test_repairs_trailing_comma_after_fenced_string():
+    text = '{"files": {"a.js": "x"}, "readme": "```sh\\nnpm i\\n```",}'
+    result, _ = parse_answer(text)
+    assert result == {"files": {"a.js": "x"}, "readme": "```sh\nnpm i\n```"}
+
+
+def test_closes_truncated_answer():
+    result, report = parse_answer('{"files": {"a.js": "x", "b.js": "unfinish')
+    assert result == {"files": {"a.js": "x"}}
+    assert report.incomplete
+
+
+def test_rejects_text_without_object():
+    with pytest.raises(JSONRepairError):
+        parse_answer("no json here")
@@ -0,0 +1,51 @@
+import json
+
+import pytest
+
+from json_stream import ExtensionStreamParser
+
+ANSWER = {
+    "analysis": "Counts tabs",
+    "manifest": {"manifest_version": 3, "name": "Tabs \"{count}\""},
+    "files": {
+        "popup.js": 'const s = "}\\\\"; // {not} [json]\nconsole.log(s);\n',
+        "popup.html": "<p>é✓</p>",
+    },
+    "readme": "# Tabs\n\n```json\n{\"a\": [1, 2]}\n```\n",
+}
+TEXT = "```json\n" + json.dumps(ANSWER, indent=2) + "\n```"
+
+
+def feed_all(chunks):
+    parser = ExtensionStreamParser()
+    completed = []
+    for chunk in chunks:
+        completed += parser.feed(chunk)
+    return parser, completed
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(TEXT)])
+def test_values_survive_any_chunk_boundary(size):
+    parser, completed = feed_all(TEXT[i:i + size] for i in range(0, len(TEXT), size))
+    assert parser.done
+    assert dict(completed) == {
+        ("analysis",): ANSWER["analysis"],
+        ("manifest",): ANSWER["manifest"],
+        ("files", "popup.js"): ANSWER["files"]["popup.js"],
+        ("files", "popup.html"): ANSWER["files"]["popup.html"],
+        ("readme",): ANSWER["readme"],
+    }
+
+
+def test_files_are_emitted_as_soon_as_they_close():
+    parser = ExtensionStreamParser()
+    head = '{"files": {"a.js": "1;", "b.js": "2'
+    assert parser.feed(head) == [(("files", "a.js"), "1;")]
+    assert parser.feed(';"}}') == [(("files", "b.js"), "2;")]
+    assert parser.done
+
+
+def test_text_after_the_root_object_is_ignored():
+    parser, completed = feed_all(['{"readme": "x"}', ' trailing {"readme": "y"}'])
+    assert completed == [(("readme",), "x")]
+    assert parser.text.endswith("trailing {\"readme\": \"y\"}")
@@ -0,0 +1,35 @@
+import json
+
+import pytest
+
+import main
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    return main.app.test_client()
+
+
+def save(client, body, content_type="application/json"):
+    return client.post("/save", data=body, content_type=content_type)
+
+
+def test_rejected_upload_keeps_the_saved_extension(client, tmp_path):
+    body = {"manifest": {"name": "Kept", "manifest_version": 3}, "files": {"popup.js": "1;"}}
+    assert save(client, json.dumps(body)).status_code == 200
+
+    assert save(client, "{not json").status_code == 400
+    assert save(client, json.dumps({"files": {"a.png": {"base64": "%%%"}}})).status_code == 400
+
+    out = tmp_path / main.OUTPUT_DIR
+    assert json.loads((out / "manifest.json").read_text())["name"] == "Kept"
+    assert (out / "popup.js").read_text() == "1;"
+    assert [p.name for p in tmp_path.iterdir()] == [main.OUTPUT_DIR]
+
+
+def test_save_replaces_the_previous_extension(client, tmp_path):
+    save(client, json.dumps({"manifest": {"name": "A"}, "files": {"old.js": "1;"}}))
+    save(client, json.dumps({"manifest": {"name": "B"}, "files": {"new.js": "2;"}}))
+    out = tmp_path / main.OUTPUT_DIR
+    assert sorted(p.name for p in out.iterdir()) == ["manifest.json", "new.js"]
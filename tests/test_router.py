@@ -0,0 +1,86 @@
+import asyncio
+import threading
+
+import pytest
+
+from router import CLOSED, HALF_OPEN, OPEN, ModelRouter
+from upstream import UpstreamHTTPError
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def half_open_router():
+    """Router whose preferred model "a" has tripped and cooled down."""
+    clock = Clock()
+    router = ModelRouter(["a", "b"], consecutive_failures=1, cooldown=10.0, clock=clock)
+    router.record("a", False)
+    clock.now += 11.0
+    return router
+
+
+def test_probe_cancelled_in_race_is_released():
+    router = half_open_router()
+    release = threading.Event()
+
+    def call(model, cancel):
+        if model == "a":
+            release.wait(5)
+        return model
+
+    try:
+        result, decision = router.race(call, parallelism=2)
+    finally:
+        release.set()
+    assert result == "b"
+    assert any(a["model"] == "a" and a.get("cancelled") for a in decision.attempts)
+    assert router._breakers["a"].state == HALF_OPEN
+    assert router.plan()[0][0] == "a"
+
+    result, decision = router.run(lambda model: model)
+    assert result == "a" and decision.model == "a"
+    assert router._breakers["a"].state == CLOSED
+
+
+def test_probe_cancelled_in_async_race_is_released():
+    router = half_open_router()
+
+    async def call(model):
+        if model == "a":
+            await asyncio.sleep(5)
+        return model
+
+    result, _ = asyncio.run(router.race_async(call, parallelism=2))
+    assert result == "b"
+    assert router.plan()[0][0] == "a"
+
+
+def test_bad_requests_do_not_trip_breakers():
+    router = ModelRouter(["a", "b"], consecutive_failures=1)
+
+    def bad_request(model):
+        raise UpstreamHTTPError(400, "context_length_exceeded")
+
+    for _ in range(3):
+        with pytest.raises(UpstreamHTTPError):
+            router.run(bad_request)
+    assert router._breakers["a"].state == CLOSED
+    assert router.plan()[0] == ("a", "priority")
+
+
+def test_upstream_failures_trip_the_breaker_and_fall_back():
+    router = ModelRouter(["a", "b"], consecutive_failures=1)
+
+    def call(model):
+        if model == "a":
+            raise UpstreamHTTPError(503, "overloaded")
+        return model
+
+    result, decision = router.run(call)
+    assert (result, decision.reason) == ("b", "fallback")
+    assert router._breakers["a"].state == OPEN
@@ -0,0 +1,41 @@
+import base64
+import json
+
+PNG = b"\x89PNG\r\n\x1a\n" + bytes(range(256)) * 8
+
+
+def save(client, **files):
+    body = {
+        "manifest": {"manifest_version": 3, "name": "Upload", "version": "1.0",
+                     "action": {"default_popup": "popup.html"}},
+        "files": {"popup.html": "<html><body><script src='popup.js'></script></body></html>",
+                  "popup.js": "console.log('hi');\n", **files},
+    }
+    r = client.post("/save", data=json.dumps(body), content_type="application/json")
+    assert r.status_code == 200, r.get_json()
+    return r.get_json()
+
+
+def test_uploaded_png_survives_refinement(main_ui):
+    client = main_ui.app.test_client()
+    saved = save(client, **{"icon.png": "data:image/png;base64," + base64.b64encode(PNG).decode()})
+    assert main_ui.file_store.get(saved["generation_id"]).read("icon.png") == PNG
+
+    r = client.post("/forge", json={"prompt": "make the popup say hello"})
+    body = r.get_json()
+    assert r.status_code == 200, body
+    assert body["refinement"] == "delta"
+    generation = main_ui.file_store.get(body["generation_id"])
+    assert generation.read("icon.png") == PNG
+    assert generation.read("popup.js").startswith(b"// refined")
+
+
+def test_uploaded_png_survives_rollback_and_refinement(main_ui):
+    client = main_ui.app.test_client()
+    saved = save(client, **{"logo.png": {"base64": base64.b64encode(PNG).decode()}})
+    client.post("/forge", json={"prompt": "first change"})
+    r = client.post(f"/generations/{saved['generation_id']}/rollback")
+    assert r.status_code == 200
+
+    body = client.post("/forge", json={"prompt": "second change"}).get_json()
+    assert main_ui.file_store.get(body["generation_id"]).read("logo.png") == PNG
@@ -0,0 +1,42 @@
+import time
+
+from sessiondb import SessionDB
+
+
+def test_lease_is_renewed_while_the_turn_runs(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    here, other = SessionDB(path, lease_ttl=0.3), SessionDB(path, lease_ttl=0.3)
+    session, _ = here.get()
+    with session.lock:
+        time.sleep(1.0)
+        assert not other.acquire_lease(session.id, "otherhost:1:x")
+        assert here.stats()["lease_renewals"] >= 2
+    assert other.acquire_lease(session.id, "otherhost:1:x")
+
+
+def test_lease_lapses_once_renewals_stop(tmp_path):
+    db = SessionDB(str(tmp_path / "sessions.db"), lease_ttl=0.3)
+    session, _ = db.get()
+    with db._write() as conn:  # a worker on another host that stopped renewing
+        conn.execute("UPDATE sessions SET lease_owner = ?, lease_until = ? WHERE id = ?",
+                     ("otherhost:1:x", time.time() + 0.3, session.id))
+    assert not session.lock.acquire(blocking=False)
+    assert session.lock.acquire(timeout=2)
+    session.lock.release()
+    assert not session.is_busy()
+
+
+def test_turns_and_generation_survive_a_reopen(tmp_path):
+    path = str(tmp_path / "sessions.db")
+    db = SessionDB(path)
+    session, created = db.get()
+    assert created
+    session.append("user", "make a thing")
+    session.append("assistant", '{"files": {}}')
+    session.generation_id = "gen-1"
+
+    again, created = SessionDB(path).get(session.id)
+    assert not created
+    assert again.messages() == [{"role": "user", "content": "make a thing"},
+                                {"role": "assistant", "content": '{"files": {}}'}]
+    assert again.generation_id == "gen-1"
@@ -0,0 +1,33 @@
+from similarity import PromptIndex, jaccard, normalize
+
+
+def test_normalize_drops_stop_words_and_folds_plurals():
+    assert normalize("Block reddit.com during work hours") == \
+        {"block", "reddit", "com", "during", "work", "hour"}
+    assert jaccard(normalize("block youtube.com in work hours"),
+                   normalize("Block reddit.com during work hours")) == 4 / 7
+
+
+def test_query_ranks_similar_prompts_and_skips_unrelated_ones():
+    index = PromptIndex()
+    index.add("block reddit.com during work hours", "0001")
+    index.add("block reddit.com and twitter.com during work hours", "0002")
+    index.add("a pomodoro timer in the toolbar", "0003")
+
+    matches = index.query("Block Reddit.com during working hours!", threshold=0.5)
+    assert [m.generation_id for m in matches][:1] == ["0001"]
+    assert "0003" not in [m.generation_id for m in matches]
+    assert index.query("translate the selected text to french") == []
+
+    index.remove("0001")
+    assert "0001" not in [m.generation_id for m in index.query("block reddit during work hours")]
+
+
+def test_workers_share_the_log(tmp_path):
+    path = str(tmp_path / "prompts.jsonl")
+    one, two = PromptIndex(path), PromptIndex(path)
+    one.add("dark mode for every website", "0001")
+
+    [match] = two.query("dark mode for every website")
+    assert (match.generation_id, match.similarity) == ("0001", 1.0)
+    assert len(two) == 1
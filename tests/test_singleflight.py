@@ -0,0 +1,44 @@
+import threading
+import time
+
+from singleflight import SingleFlight
+
+
+def test_followers_of_an_abandoned_flight_start_over():
+    flights = SingleFlight()
+    flight, leading = flights.begin("k")
+    assert leading
+    results = []
+    follower = threading.Thread(target=lambda: results.append(flights.do("k", lambda: "own")))
+    follower.start()
+    time.sleep(0.05)
+    flights.abandon(flight)
+    follower.join(5)
+    assert results == [("own", False)]
+    assert flights.stats()["leaders_abandoned"] == 1
+
+
+def test_identical_streamed_forges_share_one_upstream_call(main_ui, upstream):
+    config = upstream.config
+    before = config.stats["requests"]
+    latency, config.latency = config.latency, lambda: 0.5
+    bodies = {}
+
+    def forge(i):
+        client = main_ui.app.test_client()  # a session each
+        r = client.post("/forge", json={"prompt": "a tab counter", "stream": True})
+        bodies[i] = r.get_data(as_text=True)
+
+    try:
+        threads = [threading.Thread(target=forge, args=(i,)) for i in range(2)]
+        for t in threads:
+            t.start()
+            time.sleep(0.1)
+        for t in threads:
+            t.join(30)
+    finally:
+        config.latency = latency
+
+    assert config.stats["requests"] - before == 1
+    assert all("event: done" in body for body in bodies.values())
+    assert '"message": "coalesced"' in bodies[1]
@@ -0,0 +1,67 @@
+import os
+
+import pytest
+
+from skeletons import SkeletonError, SkeletonLibrary, check, merge_patch, sample_extension
+from validation import Validator
+
+LIBRARY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "skeletons")
+
+
+@pytest.fixture
+def library():
+    return SkeletonLibrary(LIBRARY)
+
+
+def test_references_expand_to_the_skeleton_text(library):
+    theme = library.get("glass-theme@1")
+    css = library.expand_file("styles.css", "/* @skeleton glass-theme@1 */\nmain { margin: 0; }\n")
+    assert css == theme.text + "main { margin: 0; }\n"
+
+    manifest = library.expand_manifest({"$skeleton": "manifest@1", "name": "Mine",
+                                        "permissions": ["tabs"]})
+    base = library.get("manifest@1").data
+    assert manifest == merge_patch(base, {"name": "Mine", "permissions": ["tabs"]})
+    assert manifest["manifest_version"] == 3
+
+
+def test_misplaced_or_unknown_references_are_errors(library):
+    with pytest.raises(SkeletonError):
+        library.expand_file("popup.js", "/* @skeleton glass-theme@1 */\n")
+    problems = []
+    result = {"files": {"a.css": "/* @skeleton nope@9 */\n"}}
+    assert library.expand(result, problems) == result
+    assert [name for name, _ in problems] == ["a.css"]
+
+
+def test_merge_patch_null_removes_a_key():
+    assert merge_patch({"a": 1, "b": {"c": 2, "d": 3}}, {"a": None, "b": {"d": None}}) == \
+        {"b": {"c": 2}}
+
+
+def test_library_is_valid_and_collapse_round_trips(library):
+    assert check(library, Validator(js_checker="")) == []
+    expanded = library.expand(sample_extension(library))
+    collapsed = library.collapse(expanded)
+    assert collapsed["manifest"]["$skeleton"] == "manifest@1"
+    assert library.expand(collapsed) == expanded
+
+
+def test_a_released_skeleton_may_not_change(tmp_path):
+    for name in os.listdir(LIBRARY):
+        with open(os.path.join(LIBRARY, name), "rb") as f:
+            (tmp_path / name).write_bytes(f.read())
+    (tmp_path / "storage@1.js").write_text("// edited\n")
+    with pytest.raises(SkeletonError):
+        SkeletonLibrary(str(tmp_path))
+
+
+def test_generations_are_written_expanded(main_ui):
+    client = main_ui.app.test_client()
+    upload = {"manifest": {"$skeleton": "manifest@1", "name": "Skel"},
+              "files": {"styles.css": "/* @skeleton glass-theme@1 */\nmain { margin: 0; }\n"}}
+    r = client.post("/save", json=upload)
+    assert r.status_code == 200, r.get_json()
+    generation = main_ui.file_store.get(r.get_json()["generation_id"])
+    assert b"@skeleton" not in generation.read("styles.css")
+    assert b"$skeleton" not in generation.read("manifest.json")
@@ -0,0 +1,36 @@
+import gzip
+import os
+import re
+
+import build_static
+from static_assets import StaticBundle
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_built_page_is_served_with_hashed_precompressed_assets(tmp_path):
+    assert build_static.main(["--out", str(tmp_path), "--page", "main_ui"]) == 0
+    template = build_static.read_template(os.path.join(HERE, "main_ui.py"))
+    bundle = StaticBundle(str(tmp_path))
+
+    html = bundle.page("main_ui", template).data.decode("utf-8")
+    assert "cdn.tailwindcss.com" not in html
+    names = re.findall(r'/static/([^"]+)', html)
+    assert any(n.endswith(".css") for n in names)
+
+    css = bundle.get(next(n for n in names if n.endswith(".css")))
+    status, headers, body = css.respond("gzip, br;q=0")
+    assert status == 200 and headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(body) == css.data
+    assert headers["Cache-Control"] == "public, max-age=31536000, immutable"
+
+    status, _, body = css.respond("gzip", headers["ETag"])
+    assert (status, body) == (304, b"")
+
+
+def test_stale_build_falls_back_to_the_template(tmp_path):
+    build_static.main(["--out", str(tmp_path), "--page", "main_ui"])
+    bundle = StaticBundle(str(tmp_path))
+    page = bundle.page("main_ui", "<html>edited since the build</html>")
+    assert page.data == b"<html>edited since the build</html>"
+    assert StaticBundle(str(tmp_path / "missing")).page("main_ui", "<p>x</p>").data == b"<p>x</p>"
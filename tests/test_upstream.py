@@ -0,0 +1,83 @@
+import asyncio
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+from aupstream import AsyncUpstreamPool
+from upstream import DeadlineExceeded, UpstreamPool
+
+
+class Trickle(http.server.BaseHTTPRequestHandler):
+    """Answers with a line every 50ms for two seconds, well inside any read timeout."""
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.send_response(200)
+        self.send_header("Content-Length", str(40 * 6))
+        self.end_headers()
+        try:
+            for _ in range(40):
+                self.wfile.write(b"data:\n")
+                self.wfile.flush()
+                time.sleep(0.05)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def trickle_url():
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Trickle)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v1/chat/completions"
+    server.shutdown()
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_timeout_bounds_the_whole_call(trickle_url, stream):
+    pool = UpstreamPool(trickle_url, read_timeout=5.0)
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        if stream:
+            for _ in pool.stream_lines(b"{}", {}, timeout=0.5):
+                pass
+        else:
+            pool.post(b"{}", {}, timeout=0.5)
+    assert time.monotonic() - start < 1.5
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_async_timeout_bounds_the_whole_call(trickle_url, stream):
+    async def call():
+        pool = AsyncUpstreamPool(trickle_url, read_timeout=5.0)
+        if stream:
+            async for _ in pool.stream_lines(b"{}", {}, timeout=0.5):
+                pass
+        else:
+            await pool.post(b"{}", {}, timeout=0.5)
+
+    start = time.monotonic()
+    with pytest.raises(DeadlineExceeded):
+        asyncio.run(call())
+    assert time.monotonic() - start < 1.5
+
+
+@pytest.mark.parametrize("stream", [False, True])
+def test_connection_is_reused_after_a_full_read(upstream, stream):
+    url = f"http://127.0.0.1:{upstream.server_address[1]}/v1/chat/completions"
+    pool = UpstreamPool(url)
+    body = json.dumps({"model": "m", "stream": stream,
+                       "messages": [{"role": "user", "content": "reuse"}]}).encode()
+    for _ in range(3):
+        if stream:
+            assert list(pool.stream_lines(body, {}, timeout=10))
+        else:
+            assert pool.post(body, {}, timeout=10)
+    stats = pool.stats()
+    assert (stats["connections_opened"], stats["hits"]) == (1, 2)
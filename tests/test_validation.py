@@ -0,0 +1,57 @@
+import pytest
+
+from delta import PatchError
+from validation import Validator, apply_fix
+
+MANIFEST = {"manifest_version": 3, "name": "V", "version": "1.0",
+            "action": {"default_popup": "popup.html"}}
+HTML = "<!DOCTYPE html><html><body><script src='popup.js'></script></body></html>"
+
+
+def extension(popup_js, **files):
+    files = dict({"popup.html": HTML, "popup.js": popup_js, "icon.png": ""}, **files)
+    return {"manifest": MANIFEST, "files": files}
+
+
+def test_reports_broken_js_and_missing_references():
+    validator = Validator(js_checker="")
+    assert validator.validate(extension("console.log(1);\n")).ok
+
+    report = validator.validate(extension("function broken() {\n"))
+    assert report.failing_files() == ["popup.js"]
+
+    missing = dict(extension("1;"), manifest=dict(MANIFEST, background={"service_worker": "bg.js"}))
+    assert not validator.validate(missing).ok
+
+
+def test_fix_may_only_touch_failing_or_new_files():
+    result = extension("function broken() {\n", **{"util.js": "1;"})
+    report = Validator(js_checker="").validate(result)
+
+    fixed = apply_fix(result, {"patch": {"files": {
+        "popup.js": "2;", "util.js": "changed", "new.js": "3;"}}}, report)
+    assert fixed["files"]["popup.js"] == "2;"
+    assert fixed["files"]["util.js"] == "1;"
+    assert fixed["files"]["new.js"] == "3;"
+    assert result["files"]["popup.js"] == "function broken() {\n"
+
+    with pytest.raises(PatchError):
+        apply_fix(result, {"patch": {"files": {"util.js": "changed"}}}, report)
+
+
+def test_forge_sends_only_failing_files_back_to_be_fixed(main_ui, upstream):
+    config = upstream.config
+    config.invalid_rate = 1.0
+    before = config.stats["requests"]
+    try:
+        r = main_ui.app.test_client().post("/forge", json={"prompt": "a fixable thing",
+                                                            "no_cache": True})
+    finally:
+        config.invalid_rate = 0.0
+    body = r.get_json()
+    assert body["validation"]["ok"] and body["validation"]["fix_rounds"] == 1
+    assert config.stats["requests"] - before == 2
+
+    generation = main_ui.file_store.get(body["generation_id"])
+    assert generation.read("popup.js").startswith(b"// fixed")
+    assert generation.read("background.js").startswith(b"// background")
@@ -0,0 +1,357 @@
+"""
+Pooled keep-alive HTTP(S) client for the OpenAI endpoint.
+
+One UpstreamPool is shared by every request the server handles, so a forge
+reuses an already-open TCP+TLS connection instead of paying a new handshake
+per call. The pool is bounded, connect and read timeouts are separate, idle
+connections are recycled after a while, and hits / misses are counted.
+"""
+import collections
+import http.client
+import socket
+import ssl
+import threading
+import time
+import urllib.parse
+
+
+class UpstreamError(RuntimeError):
+    """Connection-level failure talking to the upstream API."""
+
+
+class UpstreamHTTPError(UpstreamError):
+    """Non-2xx answer from the upstream API."""
+
+    def __init__(self, status, body, headers=None):
+        super().__init__(f"OpenAI HTTPError {status}: {body}")
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+
+
+class UpstreamCancelled(UpstreamError):
+    """The caller gave up on the call (e.g. a losing hedged request)."""
+
+
+class DeadlineExceeded(UpstreamError):
+    """The call's total time budget ran out."""
+
+
+class CancelToken:
+    """
+    Lets another thread abort an in-flight call: cancel() shuts the socket
+    down, so the blocked read fails at once and the call raises
+    UpstreamCancelled. The connection is discarded, never pooled.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._conn = None
+        self.cancelled = False
+
+    def attach(self, conn):
+        with self._lock:
+            if self.cancelled:
+                raise UpstreamCancelled("OpenAI call cancelled")
+            self._conn = conn
+
+    def detach(self):
+        with self._lock:
+            self._conn = None
+
+    def cancel(self):
+        with self._lock:
+            self.cancelled = True
+            conn, self._conn = self._conn, None
+        if conn is not None and conn.sock is not None:
+            try:
+                conn.sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+# Errors that mean "the server closed our idle keep-alive connection".
+_STALE_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+    ConnectionAbortedError,
+)
+
+
+class _Budget:
+    """
+    Total time one call may take. arm() runs before every socket read: it
+    caps the read timeout at what is left, so a response that trickles in
+    can't outlive the call's timeout, and raises once nothing is left.
+    """
+
+    def __init__(self, timeout, read_timeout):
+        self.read_timeout = read_timeout
+        self.timeout = timeout
+        self.deadline = time.monotonic() + timeout if timeout else None
+        self.sock = None
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def exceeded(self):
+        return DeadlineExceeded(f"OpenAI call ran past its {self.timeout:.0f}s deadline")
+
+    def arm(self):
+        timeout = self.read_timeout
+        if self.deadline is not None:
+            left = self.deadline - time.monotonic()
+            if left <= 0:
+                raise self.exceeded()
+            timeout = min(timeout, left)
+        if self.sock is not None:
+            self.sock.settimeout(timeout)
+
+
+class _PooledConnection:
+    __slots__ = ("conn", "created", "last_used")
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.created = self.last_used = time.monotonic()
+
+
+class UpstreamPool:
+    """
+    Bounded pool of persistent connections to one upstream base URL.
+    - max_connections: hard cap on concurrent connections (callers block up
+      to acquire_timeout seconds for a free slot).
+    - connect_timeout / read_timeout: TCP+TLS setup vs. waiting for bytes.
+    - idle_timeout: idle connections older than this are closed, not reused.
+    """
+
+    def __init__(self, url, max_connections=8, connect_timeout=10.0,
+                 read_timeout=600.0, idle_timeout=60.0, acquire_timeout=30.0):
+        parts = urllib.parse.urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == "https" else 80)
+        self.path = parts.path or "/"
+        if parts.query:
+            self.path += "?" + parts.query
+
+        self.max_connections = max_connections
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.idle_timeout = idle_timeout
+        self.acquire_timeout = acquire_timeout
+
+        self._ssl_context = ssl.create_default_context() if self.scheme == "https" else None
+        self._idle = collections.deque()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(max_connections)
+        self._stats = collections.Counter()
+
+    # ------------------------------------------------------------------
+    # Connection management
+    # ------------------------------------------------------------------
+
+    def _open(self):
+        if self._ssl_context is not None:
+            conn = http.client.HTTPSConnection(
+                self.host, self.port, timeout=self.connect_timeout,
+                context=self._ssl_context,
+            )
+        else:
+            conn = http.client.HTTPConnection(
+                self.host, self.port, timeout=self.connect_timeout,
+            )
+        try:
+            conn.connect()
+        except (OSError, http.client.HTTPException) as e:
+            conn.close()
+            raise UpstreamError(f"OpenAI URLError: {e}") from e
+        conn.sock.settimeout(self.read_timeout)
+        conn.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._lock:
+            self._stats["connections_opened"] += 1
+        return _PooledConnection(conn)
+
+    def _acquire(self):
+        """Return (pooled_connection, reused)."""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self._stats["acquire_timeouts"] += 1
+            raise UpstreamError(
+                f"Upstream pool exhausted ({self.max_connections} connections busy)"
+            )
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                pooled = self._idle.pop()
+                if now - pooled.last_used <= self.idle_timeout:
+                    self._stats["hits"] += 1
+                    return pooled, True
+                pooled.conn.close()
+                self._stats["expired"] += 1
+            self._stats["misses"] += 1
+        try:
+            return self._open(), False
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, pooled, reusable):
+        try:
+            if reusable:
+                pooled.last_used = time.monotonic()
+                with self._lock:
+                    self._idle.append(pooled)
+            else:
+                pooled.conn.close()
+                with self._lock:
+                    self._stats["discarded"] += 1
+        finally:
+            self._slots.release()
+
+    def warm_up(self, count=None):
+        """Open up to `count` connections ahead of time and park them idle."""
+        count = min(count or self.max_connections, self.max_connections)
+        opened = 0
+        for _ in range(count):
+            if not self._slots.acquire(blocking=False):
+                break
+            try:
+                pooled = self._open()
+            except UpstreamError:
+                self._slots.release()
+                break
+            self._release(pooled, True)
+            opened += 1
+        with self._lock:
+            self._stats["warmed"] += opened
+        return opened
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().conn.close()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+            stats["idle"] = len(self._idle)
+        stats.setdefault("hits", 0)
+        stats.setdefault("misses", 0)
+        stats["max_connections"] = self.max_connections
+        return stats
+
+    # ------------------------------------------------------------------
+    # Requests
+    # ------------------------------------------------------------------
+
+    def _give_back(self, pooled, reusable, cancel):
+        """Unbind the cancel token (so it can't reach the next user), then release."""
+        if cancel is not None:
+            cancel.detach()
+            reusable = reusable and not cancel.cancelled
+        self._release(pooled, reusable)
+
+    def _failed(self, e, cancel, budget=None):
+        if cancel is not None and cancel.cancelled:
+            return UpstreamCancelled("OpenAI call cancelled")
+        if budget is not None and budget.expired():
+            return budget.exceeded()
+        return UpstreamError(f"OpenAI URLError: {e}")
+
+    def _send(self, body, headers, timeout=None, cancel=None):
+        """
+        Send a POST and return (pooled, response, budget) with the status
+        already checked. A reused connection that turns out to be stale is
+        retried once on a fresh one.
+        - timeout: total seconds for this call, from sending the request to
+          reading the last byte (each socket read waits at most read_timeout).
+          Readers call budget.arm() before each read; past the deadline the
+          call raises DeadlineExceeded.
+        - cancel: optional CancelToken bound to the connection while in use.
+        """
+        budget = _Budget(timeout, self.read_timeout)
+        for attempt in range(2):
+            pooled, reused = self._acquire()
+            try:
+                if cancel is not None:
+                    cancel.attach(pooled.conn)
+                budget.sock = pooled.conn.sock
+                budget.arm()
+                pooled.conn.request("POST", self.path, body=body, headers=headers)
+                resp = pooled.conn.getresponse()
+            except _STALE_ERRORS as e:
+                self._give_back(pooled, False, cancel)
+                if reused and attempt == 0 and not (cancel is not None and cancel.cancelled):
+                    with self._lock:
+                        self._stats["stale_retries"] += 1
+                    continue
+                raise self._failed(e, cancel, budget) from e
+            except (OSError, http.client.HTTPException) as e:
+                self._give_back(pooled, False, cancel)
+                raise self._failed(e, cancel, budget) from e
+            except BaseException:
+                self._give_back(pooled, False, cancel)
+                raise
+
+            if resp.status >= 400:
+                try:
+                    err_body = resp.read().decode("utf-8", errors="ignore")
+                    reusable = not resp.will_close
+                except (OSError, http.client.HTTPException):
+                    err_body, reusable = "", False
+                self._give_back(pooled, reusable, cancel)
+                raise UpstreamHTTPError(resp.status, err_body, dict(resp.getheaders()))
+            return pooled, resp, budget
+        raise UpstreamError("OpenAI URLError: connection lost")  # pragma: no cover
+
+    def post(self, body, headers, timeout=None, cancel=None):
+        """
+        POST body (bytes) and return the full response body as bytes.
+        See _send() for timeout / cancel.
+        """
+        pooled, resp, budget = self._send(body, headers, timeout, cancel)
+        chunks = []
+        try:
+            while True:
+                budget.arm()
+                chunk = resp.read1(65536)
+                if not chunk:
+                    break
+                chunks.append(chunk)
+            # read1() / readline() stop at Content-Length without marking the
+            # response closed, and http.client won't send on the connection
+            # until it is.
+            resp.close()
+        except (OSError, http.client.HTTPException) as e:
+            self._give_back(pooled, False, cancel)
+            raise self._failed(e, cancel, budget) from e
+        except BaseException:
+            self._give_back(pooled, False, cancel)
+            raise
+        self._give_back(pooled, not resp.will_close, cancel)
+        return b"".join(chunks)
+
+    def stream_lines(self, body, headers, timeout=None, cancel=None):
+        """
+        POST body and yield the response line by line (bytes) as it arrives.
+        The connection goes back to the pool only if the body was read to
+        the end; abandoning the generator early closes it.
+        """
+        pooled, resp, budget = self._send(body, headers, timeout, cancel)
+        finished = False
+        try:
+            while True:
+                budget.arm()
+                line = resp.readline()
+                if not line:
+                    break
+                yield line
+            resp.close()  # (see post())
+            finished = True
+        except (OSError, http.client.HTTPException) as e:
+            raise self._failed(e, cancel, budget) from e
+        finally:
+            self._give_back(pooled, finished and not resp.will_close, cancel)
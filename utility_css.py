@@ -0,0 +1,755 @@
+"""
+Build-time CSS for the utility classes the UI templates use.
+
+The pages were written against the Tailwind Play CDN, which compiles the
+stylesheet in the browser on every load. compile_css() produces the same
+rules ahead of time for the subset of Tailwind utilities (and the hover: /
+focus: / group-hover: / selection: / md: / lg: variants) the templates
+actually use, plus Tailwind's preflight reset, so the page can ship one
+small static stylesheet. Tokens it can't compile are returned, so the
+build can say which classes got no CSS.
+
+The `tailwind.config = {...}` object in a template (theme.extend colors,
+fontFamily, animation, keyframes) is honoured: see parse_config().
+"""
+import json
+import re
+
+from json_repair import JSONRepairError, parse_answer
+
+SPACING_KEYS = frozenset(
+    "0 0.5 1 1.5 2 2.5 3 3.5 4 5 6 7 8 9 10 11 12 14 16 20 24 28 32 36 40 44 48 52 56 60 64 72 80 96"
+    .split())
+
+PALETTE = {
+    "slate": "f8fafc f1f5f9 e2e8f0 cbd5e1 94a3b8 64748b 475569 334155 1e293b 0f172a 020617",
+    "gray": "f9fafb f3f4f6 e5e7eb d1d5db 9ca3af 6b7280 4b5563 374151 1f2937 111827 030712",
+    "zinc": "fafafa f4f4f5 e4e4e7 d4d4d8 a1a1aa 71717a 52525b 3f3f46 27272a 18181b 09090b",
+    "red": "fef2f2 fee2e2 fecaca fca5a5 f87171 ef4444 dc2626 b91c1c 991b1b 7f1d1d 450a0a",
+    "orange": "fff7ed ffedd5 fed7aa fdba74 fb923c f97316 ea580c c2410c 9a3412 7c2d12 431407",
+    "amber": "fffbeb fef3c7 fde68a fcd34d fbbf24 f59e0b d97706 b45309 92400e 78350f 451a03",
+    "yellow": "fefce8 fef9c3 fef08a fde047 facc15 eab308 ca8a04 a16207 854d0e 713f12 422006",
+    "green": "f0fdf4 dcfce7 bbf7d0 86efac 4ade80 22c55e 16a34a 15803d 166534 14532d 052e16",
+    "emerald": "ecfdf5 d1fae5 a7f3d0 6ee7b7 34d399 10b981 059669 047857 065f46 064e3b 022c22",
+    "teal": "f0fdfa ccfbf1 99f6e4 5eead4 2dd4bf 14b8a6 0d9488 0f766e 115e59 134e4a 042f2e",
+    "cyan": "ecfeff cffafe a5f3fc 67e8f9 22d3ee 06b6d4 0891b2 0e7490 155e75 164e63 083344",
+    "sky": "f0f9ff e0f2fe bae6fd 7dd3fc 38bdf8 0ea5e9 0284c7 0369a1 075985 0c4a6e 082f49",
+    "blue": "eff6ff dbeafe bfdbfe 93c5fd 60a5fa 3b82f6 2563eb 1d4ed8 1e40af 1e3a8a 172554",
+    "indigo": "eef2ff e0e7ff c7d2fe a5b4fc 818cf8 6366f1 4f46e5 4338ca 3730a3 312e81 1e1b4b",
+    "violet": "f5f3ff ede9fe ddd6fe c4b5fd a78bfa 8b5cf6 7c3aed 6d28d9 5b21b6 4c1d95 2e1065",
+    "purple": "faf5ff f3e8ff e9d5ff d8b4fe c084fc a855f7 9333ea 7e22ce 6b21a8 581c87 3b0764",
+    "pink": "fdf2f8 fce7f3 fbcfe8 f9a8d4 f472b6 ec4899 db2777 be185d 9d174d 831843 500724",
+    "rose": "fff1f2 ffe4e6 fecdd3 fda4af fb7185 f43f5e e11d48 be123c 9f1239 881337 4c0519",
+}
+SHADES = "50 100 200 300 400 500 600 700 800 900 950".split()
+SPECIAL_COLORS = {"black": "#000", "white": "#fff", "transparent": "transparent",
+                  "current": "currentColor", "inherit": "inherit"}
+
+FONT_SIZES = {
+    "xs": (".75rem", "1rem"), "sm": (".875rem", "1.25rem"), "base": ("1rem", "1.5rem"),
+    "lg": ("1.125rem", "1.75rem"), "xl": ("1.25rem", "1.75rem"), "2xl": ("1.5rem", "2rem"),
+    "3xl": ("1.875rem", "2.25rem"), "4xl": ("2.25rem", "2.5rem"), "5xl": ("3rem", "1"),
+    "6xl": ("3.75rem", "1"), "7xl": ("4.5rem", "1"),
+}
+FONT_WEIGHTS = {"thin": 100, "extralight": 200, "light": 300, "normal": 400, "medium": 500,
+                "semibold": 600, "bold": 700, "extrabold": 800, "black": 900}
+FONT_FAMILIES = {
+    "sans": 'ui-sans-serif,system-ui,sans-serif,"Apple Color Emoji","Segoe UI Emoji",'
+            '"Segoe UI Symbol","Noto Color Emoji"',
+    "serif": 'ui-serif,Georgia,Cambria,"Times New Roman",Times,serif',
+    "mono": 'ui-monospace,SFMono-Regular,Menlo,Monaco,Consolas,"Liberation Mono",'
+            '"Courier New",monospace',
+}
+TRACKING = {"tighter": "-.05em", "tight": "-.025em", "normal": "0em", "wide": ".025em",
+            "wider": ".05em", "widest": ".1em"}
+LEADING = {"none": "1", "tight": "1.25", "snug": "1.375", "normal": "1.5", "relaxed": "1.625",
+           "loose": "2"}
+RADIUS = {"none": "0px", "sm": ".125rem", "": ".25rem", "md": ".375rem", "lg": ".5rem",
+          "xl": ".75rem", "2xl": "1rem", "3xl": "1.5rem", "full": "9999px"}
+SHADOWS = {
+    "sm": "0 1px 2px 0 {c05}",
+    "": "0 1px 3px 0 {c10},0 1px 2px -1px {c10}",
+    "md": "0 4px 6px -1px {c10},0 2px 4px -2px {c10}",
+    "lg": "0 10px 15px -3px {c10},0 4px 6px -4px {c10}",
+    "xl": "0 20px 25px -5px {c10},0 8px 10px -6px {c10}",
+    "2xl": "0 25px 50px -12px {c25}",
+    "inner": "inset 0 2px 4px 0 {c05}",
+    "none": "0 0 #0000",
+}
+BLUR = {"none": "0", "sm": "4px", "": "8px", "md": "12px", "lg": "16px", "xl": "24px",
+        "2xl": "40px", "3xl": "64px"}
+MAX_WIDTHS = {"none": "none", "xs": "20rem", "sm": "24rem", "md": "28rem", "lg": "32rem",
+              "xl": "36rem", "2xl": "42rem", "3xl": "48rem", "4xl": "56rem", "5xl": "64rem",
+              "6xl": "72rem", "7xl": "80rem", "full": "100%", "prose": "65ch"}
+BREAKPOINTS = {"sm": "640px", "md": "768px", "lg": "1024px", "xl": "1280px", "2xl": "1536px"}
+GRADIENT_DIRECTIONS = {"t": "top", "tr": "top right", "r": "right", "br": "bottom right",
+                       "b": "bottom", "bl": "bottom left", "l": "left", "tl": "top left"}
+TRANSITIONS = {
+    "": "color,background-color,border-color,text-decoration-color,fill,stroke,opacity,"
+        "box-shadow,transform,filter,backdrop-filter",
+    "all": "all", "colors": "color,background-color,border-color,text-decoration-color,fill,stroke",
+    "opacity": "opacity", "shadow": "box-shadow", "transform": "transform",
+}
+ANIMATIONS = {
+    "spin": "spin 1s linear infinite",
+    "ping": "ping 1s cubic-bezier(0,0,.2,1) infinite",
+    "pulse": "pulse 2s cubic-bezier(.4,0,.6,1) infinite",
+    "bounce": "bounce 1s infinite",
+}
+KEYFRAMES = {
+    "spin": "to{transform:rotate(360deg)}",
+    "ping": "75%,to{transform:scale(2);opacity:0}",
+    "pulse": "50%{opacity:.5}",
+    "bounce": "0%,to{transform:translateY(-25%);animation-timing-function:cubic-bezier(.8,0,1,1)}"
+              "50%{transform:none;animation-timing-function:cubic-bezier(0,0,.2,1)}",
+}
+TRANSFORM = ("transform:translate(var(--tw-translate-x),var(--tw-translate-y)) "
+             "rotate(var(--tw-rotate)) skewX(var(--tw-skew-x)) skewY(var(--tw-skew-y)) "
+             "scaleX(var(--tw-scale-x)) scaleY(var(--tw-scale-y))")
+BOX_SHADOW = "box-shadow:var(--tw-ring-offset-shadow),var(--tw-ring-shadow),var(--tw-shadow)"
+
+# Emission order of the utility groups (Tailwind's plugin order, abridged):
+# later groups win over earlier ones on the same element.
+ORDER = [
+    "container", "pointer-events", "visibility", "position", "inset", "z", "margin", "display",
+    "height", "max-height", "min-height", "width", "min-width", "max-width", "flex", "flex-grow",
+    "transform", "animation", "cursor", "select", "resize", "appearance", "grid-cols",
+    "flex-direction", "flex-wrap", "items", "justify", "gap", "space", "overflow",
+    "scroll", "truncate", "whitespace", "rounded", "border-width", "border-style",
+    "border-color", "bg-color", "bg-image", "gradient", "bg-clip", "padding", "text-align",
+    "font-family", "font-size", "font-weight", "text-transform", "font-style", "leading",
+    "tracking", "text-color", "underline", "placeholder", "opacity", "shadow", "shadow-color",
+    "outline", "ring", "filter", "backdrop", "transition", "duration", "ease",
+]
+_RANK = {group: i for i, group in enumerate(ORDER)}
+
+VARIANTS = {
+    "first": ":first-child", "last": ":last-child", "focus-within": ":focus-within",
+    "hover": ":hover", "focus": ":focus", "focus-visible": ":focus-visible",
+    "active": ":active", "disabled": ":disabled",
+}
+_VARIANT_RANK = {"selection": 1, "placeholder": 1, **{v: 2 + i for i, v in enumerate(VARIANTS)}}
+
+PREFLIGHT = """
+*,::before,::after{box-sizing:border-box;border:0 solid #e5e7eb}
+::before,::after{--tw-content:''}
+html,:host{line-height:1.5;-webkit-text-size-adjust:100%;tab-size:4;font-family:{sans};
+font-feature-settings:normal;font-variation-settings:normal;-webkit-tap-highlight-color:transparent}
+body{margin:0;line-height:inherit}
+hr{height:0;color:inherit;border-top-width:1px}
+h1,h2,h3,h4,h5,h6{font-size:inherit;font-weight:inherit}
+a{color:inherit;text-decoration:inherit}
+b,strong{font-weight:bolder}
+code,kbd,samp,pre{font-family:{mono};font-size:1em}
+small{font-size:80%}
+table{text-indent:0;border-color:inherit;border-collapse:collapse}
+button,input,optgroup,select,textarea{font-family:inherit;font-feature-settings:inherit;
+font-variation-settings:inherit;font-size:100%;font-weight:inherit;line-height:inherit;
+letter-spacing:inherit;color:inherit;margin:0;padding:0}
+button,select{text-transform:none}
+button,input:where([type=button]),input:where([type=reset]),input:where([type=submit])
+{-webkit-appearance:button;background-color:transparent;background-image:none}
+:-moz-focusring{outline:auto}
+progress{vertical-align:baseline}
+summary{display:list-item}
+blockquote,dl,dd,h1,h2,h3,h4,h5,h6,hr,figure,p,pre{margin:0}
+fieldset{margin:0;padding:0}
+ol,ul,menu{list-style:none;margin:0;padding:0}
+textarea{resize:vertical}
+input::placeholder,textarea::placeholder{opacity:1;color:#9ca3af}
+button,[role=button]{cursor:pointer}
+:disabled{cursor:default}
+img,svg,video,canvas,audio,iframe,embed,object{display:block;vertical-align:middle}
+img,video{max-width:100%;height:auto}
+[hidden]{display:none}
+*,::before,::after,::backdrop{--tw-translate-x:0;--tw-translate-y:0;--tw-rotate:0;
+--tw-skew-x:0;--tw-skew-y:0;--tw-scale-x:1;--tw-scale-y:1;--tw-ring-offset-shadow:0 0 #0000;
+--tw-ring-shadow:0 0 #0000;--tw-shadow:0 0 #0000;--tw-shadow-colored:0 0 #0000}
+"""
+
+
+def parse_config(script):
+    """
+    The theme.extend part of a `tailwind.config = {...}` script, as a dict
+    ({} when there is none). The object is JavaScript, not JSON: keys are
+    bare, strings single-quoted, trailing commas allowed.
+    """
+    start = script.find("{")
+    if "tailwind.config" not in script or start < 0:
+        return {}
+    text = script[start:]
+    text = re.sub(r"'((?:[^'\\]|\\.)*)'", lambda m: json.dumps(m.group(1)), text)
+    text = re.sub(r'([{,]\s*)([A-Za-z_$][\w$]*)\s*:', r'\1"\2":', text)
+    try:
+        config, _ = parse_answer(text)
+    except JSONRepairError:
+        return {}
+    return ((config.get("theme") or {}).get("extend")) or {}
+
+
+def candidates(text):
+    """Every token in `text` that could be a class name."""
+    return set(re.findall(r"[^\s'\"`<>={};\\]+", text))
+
+
+def class_attributes(html):
+    """Class names written in class="..." attributes (the ones worth reporting)."""
+    names = set()
+    for value in re.findall(r'class="([^"]*)"', html):
+        names.update(n for n in value.split() if "${" not in n)
+    return names
+
+
+def escape(cls):
+    return re.sub(r"([^A-Za-z0-9_-])", r"\\\1", cls)
+
+
+def _hex_rgb(value):
+    value = value.lstrip("#")
+    if len(value) == 3:
+        value = "".join(c * 2 for c in value)
+    return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+
+
+def _arbitrary(value):
+    if value.startswith("[") and value.endswith("]"):
+        return value[1:-1].replace("_", " ")
+    return None
+
+
+class Theme:
+    def __init__(self, extend=None):
+        extend = extend or {}
+        self.colors = {}
+        for name, hexes in PALETTE.items():
+            for shade, value in zip(SHADES, hexes.split()):
+                self.colors[f"{name}-{shade}"] = "#" + value
+        self.colors.update(SPECIAL_COLORS)
+        for name, value in (extend.get("colors") or {}).items():
+            if isinstance(value, dict):
+                for shade, v in value.items():
+                    self.colors[name if shade == "DEFAULT" else f"{name}-{shade}"] = v
+            else:
+                self.colors[name] = value
+        self.fonts = dict(FONT_FAMILIES)
+        for name, stack in (extend.get("fontFamily") or {}).items():
+            if isinstance(stack, list):
+                stack = ",".join(f'"{f}"' if " " in f else f for f in stack)
+            self.fonts[name] = stack
+        self.animations = dict(ANIMATIONS)
+        self.animations.update(extend.get("animation") or {})
+        self.keyframes = dict(KEYFRAMES)
+        for name, frames in (extend.get("keyframes") or {}).items():
+            self.keyframes[name] = "".join(
+                f"{step}{{{';'.join(f'{k}:{v}' for k, v in props.items())}}}"
+                for step, props in frames.items())
+
+    def color(self, token):
+        """CSS color for "violet-500", "violet-500/20", "[#123456]"; None if not a color."""
+        name, _, alpha = token.partition("/")
+        value = _arbitrary(name)
+        if value is None:
+            value = self.colors.get(name)
+        if value is None:
+            return None
+        if not alpha:
+            return value
+        opacity = _arbitrary(alpha) or (f"{int(alpha) / 100:g}" if alpha.isdigit() else None)
+        if opacity is None:
+            return None
+        if value.startswith("#") and len(value) in (4, 7):
+            r, g, b = _hex_rgb(value)
+            return f"rgb({r} {g} {b} / {opacity})"
+        return None
+
+    def transparent(self, color):
+        """The same color at zero alpha (the far end of a one-color gradient)."""
+        if color.startswith("#") and len(color) in (4, 7):
+            r, g, b = _hex_rgb(color)
+            return f"rgb({r} {g} {b} / 0)"
+        m = re.match(r"rgb\((\d+) (\d+) (\d+) /", color)
+        if m:
+            return f"rgb({m.group(1)} {m.group(2)} {m.group(3)} / 0)"
+        return "transparent"
+
+
+def _spacing(key, negative=False):
+    value = _arbitrary(key)
+    if value is None:
+        if key == "px":
+            value = "1px"
+        elif key in SPACING_KEYS:
+            value = "0px" if key == "0" else f"{float(key) / 4:g}rem"
+        else:
+            return None
+    return f"-{value}" if negative else value
+
+
+def _size(key, axis):
+    if key in ("full", "auto", "min", "max", "fit"):
+        return {"full": "100%", "auto": "auto", "min": "min-content", "max": "max-content",
+                "fit": "fit-content"}[key]
+    if key == "screen":
+        return "100vw" if axis == "w" else "100vh"
+    m = re.fullmatch(r"(\d+)/(\d+)", key)
+    if m:
+        return f"{int(m.group(1)) / int(m.group(2)) * 100:g}%"
+    return _spacing(key)
+
+
+_SIDES = {"t": ["top"], "r": ["right"], "b": ["bottom"], "l": ["left"],
+          "x": ["left", "right"], "y": ["top", "bottom"], "": [None]}
+_BOX = {"p": "padding", "m": "margin"}
+
+
+def _box(prop, side, value):
+    return [(f"{prop}-{s}" if s else prop, value) for s in _SIDES[side]]
+
+
+def utility(util, theme):
+    """
+    (group, sub_rank, declarations, selector_suffix) for one utility, or
+    None. declarations is a list of (property, value) or raw "prop:value"
+    strings.
+    """
+    negative = util.startswith("-")
+    body = util[1:] if negative else util
+
+    simple = {
+        "block": ("display", [("display", "block")]),
+        "inline-block": ("display", [("display", "inline-block")]),
+        "inline": ("display", [("display", "inline")]),
+        "flex": ("display", [("display", "flex")]),
+        "inline-flex": ("display", [("display", "inline-flex")]),
+        "grid": ("display", [("display", "grid")]),
+        "hidden": ("display", [("display", "none")]),
+        "contents": ("display", [("display", "contents")]),
+        "static": ("position", [("position", "static")]),
+        "fixed": ("position", [("position", "fixed")]),
+        "absolute": ("position", [("position", "absolute")]),
+        "relative": ("position", [("position", "relative")]),
+        "sticky": ("position", [("position", "sticky")]),
+        "visible": ("visibility", [("visibility", "visible")]),
+        "invisible": ("visibility", [("visibility", "hidden")]),
+        "pointer-events-none": ("pointer-events", [("pointer-events", "none")]),
+        "pointer-events-auto": ("pointer-events", [("pointer-events", "auto")]),
+        "flex-1": ("flex", [("flex", "1 1 0%")]),
+        "flex-auto": ("flex", [("flex", "1 1 auto")]),
+        "flex-none": ("flex", [("flex", "none")]),
+        "flex-grow": ("flex-grow", [("flex-grow", "1")]),
+        "grow": ("flex-grow", [("flex-grow", "1")]),
+        "flex-shrink-0": ("flex-grow", [("flex-shrink", "0")]),
+        "shrink-0": ("flex-grow", [("flex-shrink", "0")]),
+        "flex-row": ("flex-direction", [("flex-direction", "row")]),
+        "flex-col": ("flex-direction", [("flex-direction", "column")]),
+        "flex-wrap": ("flex-wrap", [("flex-wrap", "wrap")]),
+        "flex-nowrap": ("flex-wrap", [("flex-wrap", "nowrap")]),
+        "cursor-pointer": ("cursor", [("cursor", "pointer")]),
+        "cursor-default": ("cursor", [("cursor", "default")]),
+        "cursor-not-allowed": ("cursor", [("cursor", "not-allowed")]),
+        "select-none": ("select", [("-webkit-user-select", "none"), ("user-select", "none")]),
+        "resize-none": ("resize", [("resize", "none")]),
+        "resize": ("resize", [("resize", "both")]),
+        "appearance-none": ("appearance", [("-webkit-appearance", "none"),
+                                           ("appearance", "none")]),
+        "scroll-smooth": ("scroll", [("scroll-behavior", "smooth")]),
+        "truncate": ("truncate", [("overflow", "hidden"), ("text-overflow", "ellipsis"),
+                                  ("white-space", "nowrap")]),
+        "bg-clip-text": ("bg-clip", [("-webkit-background-clip", "text"),
+                                     ("background-clip", "text")]),
+        "bg-none": ("bg-image", [("background-image", "none")]),
+        "uppercase": ("text-transform", [("text-transform", "uppercase")]),
+        "lowercase": ("text-transform", [("text-transform", "lowercase")]),
+        "capitalize": ("text-transform", [("text-transform", "capitalize")]),
+        "normal-case": ("text-transform", [("text-transform", "none")]),
+        "italic": ("font-style", [("font-style", "italic")]),
+        "not-italic": ("font-style", [("font-style", "normal")]),
+        "underline": ("underline", [("text-decoration-line", "underline")]),
+        "no-underline": ("underline", [("text-decoration-line", "none")]),
+        "outline-none": ("outline", [("outline", "2px solid transparent"),
+                                     ("outline-offset", "2px")]),
+        "border-none": ("border-style", [("border-style", "none")]),
+        "border-solid": ("border-style", [("border-style", "solid")]),
+        "border-dashed": ("border-style", [("border-style", "dashed")]),
+        "mx-auto": ("margin", [("margin-left", "auto"), ("margin-right", "auto")]),
+        "ease-linear": ("ease", [("transition-timing-function", "linear")]),
+        "ease-in-out": ("ease", [("transition-timing-function", "cubic-bezier(.4,0,.2,1)")]),
+    }
+    if util in simple:
+        group, decls = simple[util]
+        return group, 0, decls, ""
+
+    if util == "container":
+        return "container", 0, [("width", "100%")], ""
+    if util == "group":
+        return "marker", 0, [], ""
+
+    m = re.fullmatch(r"(items|justify)-(\w+)", util)
+    if m:
+        values = {"start": "flex-start", "end": "flex-end", "center": "center",
+                  "baseline": "baseline", "stretch": "stretch", "between": "space-between",
+                  "around": "space-around", "evenly": "space-evenly"}
+        if m.group(2) in values:
+            prop = "align-items" if m.group(1) == "items" else "justify-content"
+            return m.group(1), 0, [(prop, values[m.group(2)])], ""
+        return None
+
+    m = re.fullmatch(r"overflow(?:-([xy]))?-(hidden|auto|scroll|visible|clip)", util)
+    if m:
+        prop = f"overflow-{m.group(1)}" if m.group(1) else "overflow"
+        return "overflow", 1 if m.group(1) else 0, [(prop, m.group(2))], ""
+
+    m = re.fullmatch(r"whitespace-(normal|nowrap|pre|pre-line|pre-wrap|break-spaces)", util)
+    if m:
+        return "whitespace", 0, [("white-space", m.group(1))], ""
+
+    m = re.fullmatch(r"text-(left|center|right|justify)", util)
+    if m:
+        return "text-align", 0, [("text-align", m.group(1))], ""
+
+    m = re.fullmatch(r"z-(\d+|auto)", util)
+    if m:
+        return "z", 0, [("z-index", m.group(1))], ""
+
+    m = re.fullmatch(r"(inset(?:-[xy])?|top|right|bottom|left)-(.+)", body)
+    if m:
+        value = _size(m.group(2), "w") if not negative else _spacing(m.group(2), True)
+        if value is None:
+            return None
+        name = m.group(1)
+        props = {"inset": ["inset"], "inset-x": ["left", "right"],
+                 "inset-y": ["top", "bottom"]}.get(name, [name])
+        rank = 0 if name == "inset" else (1 if name.startswith("inset") else 2)
+        return "inset", rank, [(p, value) for p in props], ""
+
+    m = re.fullmatch(r"([pm])([trblxy]?)-(.+)", body)
+    if m and (m.group(1) == "m" or not negative):
+        value = "auto" if m.group(1) == "m" and m.group(3) == "auto" else \
+            _spacing(m.group(3), negative)
+        if value is None:
+            return None
+        side = m.group(2)
+        rank = 0 if not side else (1 if side in "xy" else 2)
+        group = "padding" if m.group(1) == "p" else "margin"
+        return group, rank, _box(_BOX[m.group(1)], side, value), ""
+
+    m = re.fullmatch(r"(min-w|min-h|max-w|max-h|w|h)-(.+)", util)
+    if m:
+        kind, key = m.groups()
+        if kind == "max-w":
+            value = _arbitrary(key) or MAX_WIDTHS.get(key)
+        elif kind in ("min-w", "min-h"):
+            value = _arbitrary(key) or {"0": "0px", "full": "100%", "min": "min-content",
+                                        "max": "max-content", "fit": "fit-content",
+                                        "screen": "100vh" if kind == "min-h" else "100vw"
+                                        }.get(key)
+        else:
+            value = _size(key, kind[-1])
+        if value is None:
+            return None
+        prop = {"w": "width", "h": "height", "min-w": "min-width", "min-h": "min-height",
+                "max-w": "max-width", "max-h": "max-height"}[kind]
+        group = {"w": "width", "h": "height", "min-w": "min-width", "min-h": "min-height",
+                 "max-w": "max-width", "max-h": "max-height"}[kind]
+        return group, 0, [(prop, value)], ""
+
+    m = re.fullmatch(r"gap(?:-([xy]))?-(.+)", util)
+    if m:
+        value = _spacing(m.group(2))
+        if value is None:
+            return None
+        prop = {"x": "column-gap", "y": "row-gap", None: "gap"}[m.group(1)]
+        return "gap", 1 if m.group(1) else 0, [(prop, value)], ""
+
+    m = re.fullmatch(r"space-([xy])-(.+)", body)
+    if m:
+        value = _spacing(m.group(2), negative)
+        if value is None:
+            return None
+        start, end = ("margin-left", "margin-right") if m.group(1) == "x" else \
+            ("margin-top", "margin-bottom")
+        return "space", 0, [(start, value), (end, "0")], \
+            ">:not([hidden])~:not([hidden])"
+
+    m = re.fullmatch(r"grid-cols-(\d+|none)", util)
+    if m:
+        value = "none" if m.group(1) == "none" else f"repeat({m.group(1)},minmax(0,1fr))"
+        return "grid-cols", 0, [("grid-template-columns", value)], ""
+
+    m = re.fullmatch(r"rounded(?:-([trbl]{1,2}))?(?:-(.+))?", util)
+    if m and (m.group(2) or "") in RADIUS:
+        value = RADIUS[m.group(2) or ""]
+        corners = {"t": ["top-left", "top-right"], "r": ["top-right", "bottom-right"],
+                   "b": ["bottom-right", "bottom-left"], "l": ["top-left", "bottom-left"]}
+        side = m.group(1)
+        if not side:
+            return "rounded", 0, [("border-radius", value)], ""
+        names = corners.get(side) or [{"tl": "top-left", "tr": "top-right",
+                                       "br": "bottom-right", "bl": "bottom-left"}.get(side)]
+        if None in names:
+            return None
+        return "rounded", 1 if len(names) == 2 else 2, \
+            [(f"border-{c}-radius", value) for c in names], ""
+
+    m = re.fullmatch(r"border(?:-([trblxy]))?(?:-(0|2|4|8))?", util)
+    if m:
+        value = f"{m.group(2) or 1}px"
+        side = m.group(1) or ""
+        rank = 0 if not side else (1 if side in "xy" else 2)
+        props = [(f"border-{s}-width" if s else "border-width", value) for s in _SIDES[side]]
+        return "border-width", rank, props, ""
+
+    m = re.fullmatch(r"border-([trblxy]-)?(.+)", util)
+    if m:
+        color = theme.color(m.group(2))
+        if color is None:
+            return None
+        side = (m.group(1) or "").rstrip("-")
+        props = [(f"border-{s}-color" if s else "border-color", color) for s in _SIDES[side]]
+        return "border-color", 1 if side else 0, props, ""
+
+    m = re.fullmatch(r"bg-gradient-to-(\w+)", util)
+    if m and m.group(1) in GRADIENT_DIRECTIONS:
+        return "bg-image", 0, [("background-image", f"linear-gradient(to "
+                                f"{GRADIENT_DIRECTIONS[m.group(1)]},var(--tw-gradient-stops))")], ""
+
+    m = re.fullmatch(r"(from|via|to)-(.+)", util)
+    if m:
+        color = theme.color(m.group(2))
+        if color is None:
+            return None
+        stop = m.group(1)
+        if stop == "from":
+            decls = [("--tw-gradient-from", color), ("--tw-gradient-to", theme.transparent(color)),
+                     ("--tw-gradient-stops", "var(--tw-gradient-from),var(--tw-gradient-to)")]
+        elif stop == "via":
+            decls = [("--tw-gradient-to", theme.transparent(color)),
+                     ("--tw-gradient-stops",
+                      f"var(--tw-gradient-from),{color},var(--tw-gradient-to)")]
+        else:
+            decls = [("--tw-gradient-to", color)]
+        return "gradient", ("from", "via", "to").index(stop), decls, ""
+
+    m = re.fullmatch(r"bg-(.+)", util)
+    if m:
+        color = theme.color(m.group(1))
+        if color is None:
+            return None
+        return "bg-color", 0, [("background-color", color)], ""
+
+    m = re.fullmatch(r"font-(\w+)", util)
+    if m:
+        if m.group(1) in FONT_WEIGHTS:
+            return "font-weight", 0, [("font-weight", str(FONT_WEIGHTS[m.group(1)]))], ""
+        if m.group(1) in theme.fonts:
+            return "font-family", 0, [("font-family", theme.fonts[m.group(1)])], ""
+        return None
+
+    m = re.fullmatch(r"text-(.+)", util)
+    if m:
+        key = m.group(1)
+        if key in FONT_SIZES:
+            size, line = FONT_SIZES[key]
+            return "font-size", 0, [("font-size", size), ("line-height", line)], ""
+        value = _arbitrary(key)
+        if value is not None and re.fullmatch(r"[\d.]+(px|rem|em|%|vw|vh)", value):
+            return "font-size", 0, [("font-size", value)], ""
+        color = theme.color(key)
+        if color is None:
+            return None
+        return "text-color", 0, [("color", color)], ""
+
+    m = re.fullmatch(r"placeholder-(.+)", util)
+    if m:
+        color = theme.color(m.group(1))
+        if color is None:
+            return None
+        return "placeholder", 0, [("color", color)], "::placeholder"
+
+    m = re.fullmatch(r"tracking-(\w+)", util)
+    if m and m.group(1) in TRACKING:
+        return "tracking", 0, [("letter-spacing", TRACKING[m.group(1)])], ""
+
+    m = re.fullmatch(r"leading-(\w+)", util)
+    if m:
+        value = LEADING.get(m.group(1)) or _spacing(m.group(1))
+        if value is None:
+            return None
+        return "leading", 0, [("line-height", value)], ""
+
+    m = re.fullmatch(r"opacity-(\d+)", util)
+    if m:
+        return "opacity", 0, [("opacity", f"{int(m.group(1)) / 100:g}")], ""
+
+    m = re.fullmatch(r"shadow(?:-(.+))?", util)
+    if m:
+        key = m.group(1) or ""
+        if key in SHADOWS:
+            plain = SHADOWS[key].format(c05="rgb(0 0 0 / .05)", c10="rgb(0 0 0 / .1)",
+                                        c25="rgb(0 0 0 / .25)")
+            colored = SHADOWS[key].format(c05="var(--tw-shadow-color)",
+                                          c10="var(--tw-shadow-color)",
+                                          c25="var(--tw-shadow-color)")
+            return "shadow", 0, [("--tw-shadow", plain), ("--tw-shadow-colored", colored),
+                                 BOX_SHADOW], ""
+        value = _arbitrary(key)
+        if value is not None:
+            return "shadow", 0, [("--tw-shadow", value), ("--tw-shadow-colored", value),
+                                 BOX_SHADOW], ""
+        color = theme.color(key)
+        if color is None:
+            return None
+        return "shadow-color", 0, [("--tw-shadow-color", color),
+                                   ("--tw-shadow", "var(--tw-shadow-colored)")], ""
+
+    m = re.fullmatch(r"ring(?:-(\d+))?", util)
+    if m:
+        width = f"{m.group(1) or 3}px"
+        return "ring", 0, [
+            ("--tw-ring-offset-shadow", "var(--tw-ring-inset,) 0 0 0 "
+             "var(--tw-ring-offset-width,0px) var(--tw-ring-offset-color,#fff)"),
+            ("--tw-ring-shadow", f"var(--tw-ring-inset,) 0 0 0 calc({width} + "
+             "var(--tw-ring-offset-width,0px)) var(--tw-ring-color,rgb(59 130 246 / .5))"),
+            BOX_SHADOW], ""
+
+    m = re.fullmatch(r"(backdrop-)?blur(?:-(\w+))?", util)
+    if m and (m.group(2) or "") in BLUR:
+        value = f"blur({BLUR[m.group(2) or '']})"
+        if m.group(1):
+            return "backdrop", 0, [("-webkit-backdrop-filter", value),
+                                   ("backdrop-filter", value)], ""
+        return "filter", 0, [("filter", value)], ""
+
+    m = re.fullmatch(r"scale-(\d+)", util)
+    if m:
+        value = f"{int(m.group(1)) / 100:g}"
+        return "transform", 0, [("--tw-scale-x", value), ("--tw-scale-y", value), TRANSFORM], ""
+
+    m = re.fullmatch(r"rotate-(\d+)", body)
+    if m:
+        return "transform", 1, [("--tw-rotate", f"{'-' if negative else ''}{m.group(1)}deg"),
+                                TRANSFORM], ""
+
+    m = re.fullmatch(r"transition(?:-(\w+))?", util)
+    if m and (m.group(1) or "") in TRANSITIONS:
+        return "transition", 0, [("transition-property", TRANSITIONS[m.group(1) or ""]),
+                                 ("transition-timing-function", "cubic-bezier(.4,0,.2,1)"),
+                                 ("transition-duration", "150ms")], ""
+
+    m = re.fullmatch(r"duration-(\d+)", util)
+    if m:
+        return "duration", 0, [("transition-duration", f"{m.group(1)}ms")], ""
+
+    m = re.fullmatch(r"animate-(.+)", util)
+    if m:
+        if m.group(1) == "none":
+            return "animation", 0, [("animation", "none")], ""
+        value = theme.animations.get(m.group(1))
+        if value is None:
+            return None
+        return "animation", 0, [("animation", value)], ""
+
+    return None
+
+
+def _split_variants(cls):
+    parts, depth, current = [], 0, ""
+    for c in cls:
+        if c == "[":
+            depth += 1
+        elif c == "]":
+            depth -= 1
+        if c == ":" and depth == 0:
+            parts.append(current)
+            current = ""
+        else:
+            current += c
+    parts.append(current)
+    return parts[:-1], parts[-1]
+
+
+def compile_class(cls, theme):
+    """(sort_key, media, rule) for one class, or None if it isn't a known utility."""
+    variants, util = _split_variants(cls.lstrip("!"))
+    resolved = utility(util, theme)
+    if resolved is None:
+        return None
+    group, sub_rank, decls, suffix = resolved
+    if group == "marker":
+        return "marker"
+
+    selector = "." + escape(cls)
+    media = None
+    variant_rank = 0
+    prefix = ""
+    pseudo = ""
+    selection = False
+    for variant in variants:
+        if variant in BREAKPOINTS:
+            media = variant
+        elif variant in VARIANTS:
+            pseudo += VARIANTS[variant]
+            variant_rank = max(variant_rank, _VARIANT_RANK[variant])
+        elif variant.startswith("group-") and variant[6:] in VARIANTS:
+            prefix = f".group{VARIANTS[variant[6:]]} "
+            variant_rank = max(variant_rank, len(_VARIANT_RANK) + 1)
+        elif variant == "selection":
+            selection = True
+            variant_rank = max(variant_rank, 1)
+        elif variant == "placeholder":
+            suffix = "::placeholder"
+            variant_rank = max(variant_rank, 1)
+        else:
+            return None
+
+    body = ";".join(d if isinstance(d, str) else f"{d[0]}:{d[1]}" for d in decls)
+    base = prefix + selector + pseudo
+    if selection:
+        selectors = f"{base} *::selection,{base}::selection"
+    elif suffix.startswith(">"):
+        selectors = f"{base}{suffix}"
+    else:
+        selectors = base + suffix
+    rule = f"{selectors}{{{body}}}"
+    if group == "container":
+        rule += "".join(f"@media (min-width:{bp}){{{selector}{{max-width:{bp}}}}}"
+                        for bp in BREAKPOINTS.values())
+    media_rank = list(BREAKPOINTS).index(media) + 1 if media else 0
+    key = (media_rank, variant_rank, _RANK[group], sub_rank, cls)
+    return key, media, rule
+
+
+def compile_css(classes, config=None):
+    """
+    Stylesheet (preflight + utilities) for the given class candidates.
+    Returns (css, compiled_classes, unknown) where unknown are the
+    candidates that produced no rule.
+    """
+    theme = Theme(config)
+    rules = []
+    compiled, unknown = set(), set()
+    animations = set()
+    for cls in sorted(classes):
+        result = compile_class(cls, theme)
+        if result is None:
+            unknown.add(cls)
+            continue
+        compiled.add(cls)
+        if result == "marker":
+            continue
+        rules.append(result)
+        _, util = _split_variants(cls)
+        if util.startswith("animate-"):
+            animations.add(theme.animations.get(util[8:], "").split(" ")[0])
+    rules.sort(key=lambda r: r[0])
+
+    out = [PREFLIGHT.replace("{sans}", theme.fonts["sans"]).replace("{mono}", theme.fonts["mono"])]
+    for name in sorted(animations):
+        if name in theme.keyframes:
+            out.append(f"@keyframes {name}{{{theme.keyframes[name]}}}")
+    for _, media, rule in rules:
+        if media:
+            out.append(f"@media (min-width:{BREAKPOINTS[media]}){{{rule}}}")
+        else:
+            out.append(rule)
+    return "\n".join(out), compiled, unknown
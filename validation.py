@@ -0,0 +1,820 @@
+"""
+Post-generation checks on an extension, before it is written.
+
+Validator.validate(result) runs, concurrently on a small thread pool:
+
+- the manifest against what Chrome accepts for Manifest V3 (required
+  keys, MV2-only keys, the shape of the keys that changed in MV3);
+- cross-file references: every file the manifest, an HTML page or a
+  service worker's importScripts() names must be in the result;
+- a syntax check per JS file (`node --check` when node is around, else a
+  scanner for unbalanced brackets and unterminated strings / comments),
+  per CSS file (braces, strings, comments) and per HTML page (tag
+  nesting, plus the inline / remote scripts MV3's CSP blocks).
+
+Errors are what keeps Chrome from loading the extension (or a page from
+working); warnings are reported but never acted on. When there are
+errors, fix_messages() builds a small request naming only the offending
+files and their errors, and apply_fix() merges the answer (a delta.py
+patch) back, so a broken file costs one short call, not a regeneration.
+"""
+import concurrent.futures
+import copy
+import html.parser
+import json
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+
+from delta import PatchError, apply_patch
+
+ERROR = "error"
+WARNING = "warning"
+
+# Top-level keys Chrome knows in a Manifest V3 manifest.
+MANIFEST_KEYS = frozenset({
+    "manifest_version", "name", "version", "description", "icons", "action", "author",
+    "background", "chrome_settings_overrides", "chrome_url_overrides", "commands",
+    "content_scripts", "content_security_policy", "cross_origin_embedder_policy",
+    "cross_origin_opener_policy", "declarative_net_request", "default_locale",
+    "devtools_page", "export", "externally_connectable", "file_browser_handlers",
+    "file_system_provider_capabilities", "homepage_url", "host_permissions", "import",
+    "incognito", "input_components", "key", "minimum_chrome_version", "oauth2",
+    "offline_enabled", "omnibox", "optional_host_permissions", "optional_permissions",
+    "options_page", "options_ui", "permissions", "requirements", "sandbox", "short_name",
+    "side_panel", "storage", "tts_engine", "update_url", "version_name",
+    "web_accessible_resources",
+})
+
+# MV2 keys Chrome rejects in MV3, with what replaced them.
+MV2_KEYS = {
+    "browser_action": 'use "action"',
+    "page_action": 'use "action"',
+    "background_page": 'use "background": {"service_worker": ...}',
+}
+
+PERMISSIONS = frozenset({
+    "activeTab", "alarms", "audio", "background", "bookmarks", "browsingData",
+    "certificateProvider", "clipboardRead", "clipboardWrite", "contentSettings",
+    "contextMenus", "cookies", "debugger", "declarativeContent", "declarativeNetRequest",
+    "declarativeNetRequestFeedback", "declarativeNetRequestWithHostAccess",
+    "desktopCapture", "dns", "documentScan", "downloads", "downloads.open",
+    "downloads.shelf", "downloads.ui", "enterprise.deviceAttributes",
+    "enterprise.hardwarePlatform", "enterprise.networkingAttributes",
+    "enterprise.platformKeys", "favicon", "fileBrowserHandler", "fileSystemProvider",
+    "fontSettings", "gcm", "geolocation", "history", "identity", "identity.email", "idle",
+    "loginState", "management", "nativeMessaging", "notifications", "offscreen",
+    "pageCapture", "platformKeys", "power", "printerProvider", "printing",
+    "printingMetrics", "privacy", "processes", "proxy", "readingList", "runtime",
+    "scripting", "search", "sessions", "sidePanel", "storage", "system.cpu",
+    "system.display", "system.memory", "system.storage", "tabCapture", "tabGroups",
+    "tabs", "topSites", "tts", "ttsEngine", "unlimitedStorage", "userScripts",
+    "vpnProvider", "wallpaper", "webAuthenticationProxy", "webNavigation", "webRequest",
+    "webRequestAuthProvider",
+})
+
+_VERSION = re.compile(r"^\d{1,5}(\.\d{1,5}){0,3}$")
+_MATCH_PATTERN = re.compile(r"^(<all_urls>|(\*|https?|wss?|ftp|file|urn)://[^/]*(/.*)?)$")
+_REMOTE = re.compile(r"^([a-z][a-z0-9+.-]*:|//|#)", re.I)
+_IMPORT_SCRIPTS = re.compile(r"\bimportScripts\s*\(([^)]*)\)")
+_ES_IMPORT = re.compile(r"""^\s*(?:import|export)\b[^'"`]*?\bfrom\s*['"]([^'"]+)['"]"""
+                        r"""|^\s*import\s*['"]([^'"]+)['"]""", re.M)
+_STRING_ARG = re.compile(r"""['"]([^'"]+)['"]""")
+
+
+class Problem:
+    """One finding: which file, which check, what's wrong."""
+
+    def __init__(self, file, check, message, severity=ERROR, line=None):
+        self.file = file
+        self.check = check
+        self.message = message
+        self.severity = severity
+        self.line = line
+
+    def __str__(self):
+        where = f"{self.file}:{self.line}" if self.line else self.file
+        return f"{where}: {self.message}"
+
+    def to_dict(self):
+        info = {"file": self.file, "check": self.check, "severity": self.severity,
+                "message": self.message}
+        if self.line:
+            info["line"] = self.line
+        return info
+
+
+class ValidationReport:
+    def __init__(self, problems, elapsed=0.0, checks=0):
+        self.problems = sorted(problems, key=lambda p: (p.file, p.line or 0, p.check))
+        self.elapsed = elapsed
+        self.checks = checks
+
+    @property
+    def errors(self):
+        return [p for p in self.problems if p.severity == ERROR]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def failing_files(self):
+        """Names of the files with errors, sorted."""
+        return sorted({p.file for p in self.errors})
+
+    def to_dict(self):
+        return {
+            "ok": self.ok,
+            "errors": len(self.errors),
+            "warnings": len(self.problems) - len(self.errors),
+            "problems": [p.to_dict() for p in self.problems],
+            "checks": self.checks,
+            "elapsed_ms": round(self.elapsed * 1000.0, 1),
+        }
+
+
+# ------------------------------------------------------------------
+# Manifest
+# ------------------------------------------------------------------
+
+def _files(result):
+    files = result.get("files") if isinstance(result, dict) else None
+    return files if isinstance(files, dict) else {}
+
+
+def _is_string_list(value):
+    return isinstance(value, list) and all(isinstance(v, str) for v in value)
+
+
+def check_manifest(manifest):
+    """Problems with a manifest dict as Chrome would load it (MV3)."""
+    def problem(message, severity=ERROR):
+        problems.append(Problem("manifest.json", "manifest", message, severity))
+
+    problems = []
+    if not isinstance(manifest, dict) or not manifest:
+        problem("manifest is missing or not an object")
+        return problems
+
+    if manifest.get("manifest_version") != 3:
+        problem(f"manifest_version must be 3 (got {manifest.get('manifest_version')!r})")
+    name = manifest.get("name")
+    if not isinstance(name, str) or not name.strip():
+        problem('"name" is required')
+    elif len(name) > 75:
+        problem('"name" is longer than 75 characters')
+    version = manifest.get("version")
+    if not isinstance(version, str) or not _VERSION.match(version) or \
+            any(int(part) > 65535 for part in version.split(".")):
+        problem(f'"version" must be 1-4 dot-separated integers (got {version!r})')
+    description = manifest.get("description")
+    if description is not None and (not isinstance(description, str) or len(description) > 132):
+        problem('"description" must be a string of at most 132 characters')
+
+    for key in manifest:
+        if key in MV2_KEYS:
+            problem(f'"{key}" is Manifest V2 only: {MV2_KEYS[key]}')
+        elif key not in MANIFEST_KEYS:
+            problem(f'unknown key "{key}" (Chrome ignores it)', WARNING)
+
+    background = manifest.get("background")
+    if background is not None:
+        if not isinstance(background, dict):
+            problem('"background" must be an object')
+        else:
+            for key in ("scripts", "page", "persistent"):
+                if key in background:
+                    problem(f'"background.{key}" is Manifest V2 only: '
+                            'use "background.service_worker"')
+            worker = background.get("service_worker")
+            if worker is not None and not isinstance(worker, str):
+                problem('"background.service_worker" must be a file name')
+            if background.get("type") not in (None, "module"):
+                problem('"background.type" can only be "module"')
+
+    csp = manifest.get("content_security_policy")
+    if csp is not None:
+        if not isinstance(csp, dict):
+            problem('"content_security_policy" must be an object '
+                    '({"extension_pages": "..."}) in Manifest V3')
+        else:
+            for policy in csp.values():
+                if isinstance(policy, str) and re.search(r"'unsafe-eval'|https?://", policy):
+                    problem("content_security_policy can't allow unsafe-eval or remote "
+                            "scripts in Manifest V3")
+
+    for key in ("permissions", "optional_permissions"):
+        value = manifest.get(key)
+        if value is None:
+            continue
+        if not _is_string_list(value):
+            problem(f'"{key}" must be a list of strings')
+            continue
+        for perm in value:
+            if _MATCH_PATTERN.match(perm):
+                problem(f'host pattern "{perm}" belongs in "host_permissions" in Manifest V3')
+            elif perm == "webRequestBlocking":
+                problem('"webRequestBlocking" is not available in Manifest V3: '
+                        "use declarativeNetRequest")
+            elif perm not in PERMISSIONS:
+                problem(f'unknown permission "{perm}"', WARNING)
+
+    for key in ("host_permissions", "optional_host_permissions"):
+        value = manifest.get(key)
+        if value is None:
+            continue
+        if not _is_string_list(value):
+            problem(f'"{key}" must be a list of strings')
+            continue
+        for pattern in value:
+            if not _MATCH_PATTERN.match(pattern):
+                problem(f'"{pattern}" in "{key}" is not a valid match pattern')
+
+    scripts = manifest.get("content_scripts")
+    if scripts is not None:
+        if not isinstance(scripts, list):
+            problem('"content_scripts" must be a list')
+        else:
+            for i, entry in enumerate(scripts):
+                if not isinstance(entry, dict):
+                    problem(f"content_scripts[{i}] must be an object")
+                    continue
+                if not _is_string_list(entry.get("matches")) or not entry["matches"]:
+                    problem(f'content_scripts[{i}] needs a "matches" list')
+                if not entry.get("js") and not entry.get("css"):
+                    problem(f'content_scripts[{i}] has neither "js" nor "css"')
+                for key in ("js", "css", "matches", "exclude_matches"):
+                    if key in entry and not _is_string_list(entry[key]):
+                        problem(f"content_scripts[{i}].{key} must be a list of strings")
+
+    resources = manifest.get("web_accessible_resources")
+    if resources is not None:
+        if not isinstance(resources, list) or \
+                not all(isinstance(r, dict) and _is_string_list(r.get("resources"))
+                        for r in resources):
+            problem('"web_accessible_resources" must be a list of '
+                    '{"resources": [...], "matches": [...]} objects in Manifest V3')
+
+    action = manifest.get("action")
+    if action is not None and not isinstance(action, dict):
+        problem('"action" must be an object')
+    return problems
+
+
+# ------------------------------------------------------------------
+# Cross-file references
+# ------------------------------------------------------------------
+
+def _local(ref):
+    """The in-extension path a reference points at, or None if it's remote / inline."""
+    if not isinstance(ref, str) or not ref.strip() or _REMOTE.match(ref.strip()):
+        return None
+    path = ref.strip().split("#", 1)[0].split("?", 1)[0]
+    return path.lstrip("/") or None
+
+
+def manifest_references(manifest):
+    """(path, where) for every file the manifest points at."""
+    refs = []
+
+    def add(value, where):
+        if isinstance(value, str):
+            refs.append((value, where))
+        elif isinstance(value, dict):
+            for key, v in value.items():
+                add(v, f"{where}.{key}")
+        elif isinstance(value, list):
+            for i, v in enumerate(value):
+                add(v, f"{where}[{i}]")
+
+    def section(key):
+        value = manifest.get(key)
+        return value if isinstance(value, dict) else {}
+
+    add(section("background").get("service_worker"), "background.service_worker")
+    add(section("action").get("default_popup"), "action.default_popup")
+    add(section("action").get("default_icon"), "action.default_icon")
+    add(manifest.get("icons"), "icons")
+    add(manifest.get("options_page"), "options_page")
+    add(section("options_ui").get("page"), "options_ui.page")
+    add(section("side_panel").get("default_path"), "side_panel.default_path")
+    add(manifest.get("devtools_page"), "devtools_page")
+    add(manifest.get("chrome_url_overrides"), "chrome_url_overrides")
+    for i, entry in enumerate(manifest.get("content_scripts") or []):
+        if isinstance(entry, dict):
+            add(entry.get("js"), f"content_scripts[{i}].js")
+            add(entry.get("css"), f"content_scripts[{i}].css")
+    for i, entry in enumerate(manifest.get("web_accessible_resources") or []):
+        if isinstance(entry, dict):
+            add([r for r in entry.get("resources") or [] if isinstance(r, str) and "*" not in r],
+                f"web_accessible_resources[{i}].resources")
+    rules = section("declarative_net_request").get("rule_resources")
+    for i, entry in enumerate(rules if isinstance(rules, list) else []):
+        if isinstance(entry, dict):
+            add(entry.get("path"), f"declarative_net_request.rule_resources[{i}].path")
+    if isinstance(manifest.get("default_locale"), str):
+        refs.append((f"_locales/{manifest['default_locale']}/messages.json", "default_locale"))
+    return refs
+
+
+class _ReferenceParser(html.parser.HTMLParser):
+    """Collects src / href references of an HTML page."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.refs = []
+
+    def handle_starttag(self, tag, attrs):
+        attrs = dict(attrs)
+        if tag in ("script", "img", "iframe", "audio", "video", "source") and attrs.get("src"):
+            self.refs.append((attrs["src"], self.getpos()[0]))
+        elif tag == "link" and attrs.get("href") and \
+                (attrs.get("rel") or "").lower() in ("stylesheet", "icon", "modulepreload"):
+            self.refs.append((attrs["href"], self.getpos()[0]))
+
+
+def check_references(result, available):
+    """Files named by the manifest, HTML pages or importScripts() that don't exist."""
+    problems = []
+    files = _files(result)
+    manifest = result.get("manifest") if isinstance(result.get("manifest"), dict) else {}
+
+    for ref, where in manifest_references(manifest):
+        path = _local(ref)
+        if path is not None and path not in available:
+            problems.append(Problem("manifest.json", "references",
+                                    f'{where} names "{ref}", which is not among the files'))
+
+    worker = _local((manifest.get("background") or {}).get("service_worker")) \
+        if isinstance(manifest.get("background"), dict) else None
+    for name, content in files.items():
+        if not isinstance(content, str):
+            continue
+        base = os.path.dirname(name)
+        if name.endswith((".html", ".htm")):
+            parser = _ReferenceParser()
+            try:
+                parser.feed(content)
+                parser.close()
+            except Exception:
+                continue  # check_html reports it
+            found = parser.refs
+        elif name.endswith((".js", ".mjs")):
+            found = []
+            if name == worker:
+                for m in _IMPORT_SCRIPTS.finditer(content):
+                    line = content.count("\n", 0, m.start()) + 1
+                    found += [(arg, line) for arg in _STRING_ARG.findall(m.group(1))]
+            for m in _ES_IMPORT.finditer(content):
+                spec = m.group(1) or m.group(2)
+                if spec.startswith((".", "/")):
+                    found.append((spec, content.count("\n", 0, m.start()) + 1))
+        else:
+            continue
+        for ref, line in found:
+            path = _local(ref)
+            if path is None:
+                continue
+            path = os.path.normpath(os.path.join(base, path)).replace(os.sep, "/") \
+                if not ref.startswith("/") else path
+            if path not in available:
+                problems.append(Problem(name, "references",
+                                        f'references "{ref}", which is not among the files',
+                                        line=line))
+    return problems
+
+
+# ------------------------------------------------------------------
+# Syntax
+# ------------------------------------------------------------------
+
+_CLOSERS = {")": "(", "]": "[", "}": "{"}
+
+
+def scan_js(source):
+    """
+    Stdlib fallback for `node --check`: unbalanced brackets and
+    unterminated strings, template literals, comments and regexes.
+    Returns [(line, message)].
+    """
+    stack = []       # (char, line)
+    templates = []   # per open template literal: None in its text, else brace depth
+    last = ""
+    word = ""
+    line = 1
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if templates and templates[-1] is None:
+            if c == "\\":
+                i += 2
+                continue
+            if c == "\n":
+                line += 1
+            elif c == "`":
+                templates.pop()
+                last = c
+            elif source.startswith("${", i):
+                templates[-1] = 0
+                i += 2
+                continue
+            i += 1
+            continue
+        if c == "\n":
+            line += 1
+        elif c in " \t\r":
+            pass
+        elif c in "'\"":
+            j = i + 1
+            while j < n and source[j] != c:
+                if source[j] == "\n":
+                    return [(line, "unterminated string literal")]
+                j += 2 if source[j] == "\\" else 1
+            if j >= n:
+                return [(line, "unterminated string literal")]
+            i, last, word = j + 1, c, ""
+            continue
+        elif c == "`":
+            templates.append(None)
+            i += 1
+            continue
+        elif source.startswith("//", i):
+            end = source.find("\n", i)
+            i = n if end < 0 else end
+            continue
+        elif source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            if end < 0:
+                return [(line, "unterminated comment")]
+            line += source.count("\n", i, end)
+            i = end + 2
+            continue
+        elif c == "/" and (not last or last in "(,=:[!&|?{};+-*%<>~^" or
+                           word in ("return", "typeof", "case", "in", "of", "void", "yield")):
+            j = i + 1
+            in_class = False
+            while j < n and source[j] != "\n":
+                if source[j] == "\\":
+                    j += 2
+                    continue
+                if source[j] == "[":
+                    in_class = True
+                elif source[j] == "]":
+                    in_class = False
+                elif source[j] == "/" and not in_class:
+                    break
+                j += 1
+            if j >= n or source[j] != "/":
+                return [(line, "unterminated regular expression")]
+            i, last, word = j + 1, "/", ""
+            continue
+        else:
+            if c in "([{":
+                if templates and c == "{":
+                    templates[-1] += 1
+                stack.append((c, line))
+            elif c in ")]}":
+                if templates and c == "}" and templates[-1] == 0:
+                    templates[-1] = None  # back in the template text
+                    last = c
+                    i += 1
+                    continue
+                if templates and c == "}":
+                    templates[-1] -= 1
+                if not stack or stack[-1][0] != _CLOSERS[c]:
+                    return [(line, f'unexpected "{c}"')]
+                stack.pop()
+            if c.isalnum() or c in "_$":
+                word = word + c if last.isalnum() or last in "_$" else c
+            else:
+                word = ""
+            last = c
+        i += 1
+    if templates:
+        return [(line, "unterminated template literal")]
+    if stack:
+        c, opened = stack[-1]
+        return [(opened, f'"{c}" is never closed')]
+    return []
+
+
+def scan_css(source):
+    """Unbalanced braces / parentheses, unterminated strings and comments: [(line, message)]."""
+    stack = []
+    line = 1
+    i, n = 0, len(source)
+    while i < n:
+        c = source[i]
+        if c == "\n":
+            line += 1
+        elif source.startswith("/*", i):
+            end = source.find("*/", i + 2)
+            if end < 0:
+                return [(line, "unterminated comment")]
+            line += source.count("\n", i, end)
+            i = end + 2
+            continue
+        elif c in "'\"":
+            j = i + 1
+            while j < n and source[j] != c:
+                if source[j] == "\n":
+                    return [(line, "unterminated string")]
+                j += 2 if source[j] == "\\" else 1
+            if j >= n:
+                return [(line, "unterminated string")]
+            i = j + 1
+            continue
+        elif c in "{(":
+            stack.append((c, line))
+        elif c in "})":
+            if not stack or stack[-1][0] != _CLOSERS[c]:
+                return [(line, f'unexpected "{c}"')]
+            stack.pop()
+        i += 1
+    if stack:
+        c, opened = stack[-1]
+        return [(opened, f'"{c}" is never closed')]
+    return []
+
+
+VOID_TAGS = frozenset({"area", "base", "br", "col", "embed", "hr", "img", "input", "link",
+                       "meta", "source", "track", "wbr"})
+# Elements whose end tag HTML lets you leave out.
+OPTIONAL_END_TAGS = frozenset({"html", "head", "body", "p", "li", "dt", "dd", "option",
+                               "optgroup", "tr", "td", "th", "thead", "tbody", "tfoot",
+                               "colgroup", "caption", "rb", "rt", "rp"})
+
+
+class _HTMLChecker(html.parser.HTMLParser):
+    """Tag nesting, plus what MV3's CSP blocks (inline scripts / handlers, remote scripts)."""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.stack = []
+        self.problems = []  # (line, message, severity)
+        self._script_line = None
+        self._script_text = []
+
+    def handle_starttag(self, tag, attrs):
+        line = self.getpos()[0]
+        attrs = dict(attrs)
+        handlers = sorted(a for a in attrs if a.startswith("on"))
+        if handlers:
+            self.problems.append((line, f"inline event handler {handlers[0]}= on <{tag}> "
+                                        "is blocked by the extension CSP; use addEventListener",
+                                  ERROR))
+        if tag == "script":
+            src = attrs.get("src")
+            if src and _REMOTE.match(src) and not src.startswith("#"):
+                self.problems.append((line, f'remote script "{src}" is not allowed in '
+                                            "Manifest V3; bundle it", ERROR))
+            elif not src:
+                self._script_line = line
+                self._script_text = []
+        if tag not in VOID_TAGS:
+            self.stack.append((tag, line))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+        if tag not in VOID_TAGS and self.stack and self.stack[-1][0] == tag:
+            self.stack.pop()
+
+    def handle_data(self, data):
+        if self._script_line is not None:
+            self._script_text.append(data)
+
+    def handle_endtag(self, tag):
+        line = self.getpos()[0]
+        if tag == "script" and self._script_line is not None:
+            if "".join(self._script_text).strip():
+                self.problems.append((self._script_line, "inline <script> is blocked by the "
+                                                         "extension CSP; move it to a .js file",
+                                      ERROR))
+            self._script_line = None
+        if tag in VOID_TAGS:
+            return
+        open_tags = [t for t, _ in self.stack]
+        if tag not in open_tags:
+            self.problems.append((line, f"</{tag}> has no matching <{tag}>", ERROR))
+            return
+        while self.stack:
+            open_tag, opened = self.stack.pop()
+            if open_tag == tag:
+                break
+            if open_tag not in OPTIONAL_END_TAGS:
+                self.problems.append((opened, f"<{open_tag}> is never closed", ERROR))
+
+    def finish(self):
+        self.close()
+        for tag, opened in self.stack:
+            if tag not in OPTIONAL_END_TAGS:
+                self.problems.append((opened, f"<{tag}> is never closed", ERROR))
+        return self.problems
+
+
+def check_html(name, source):
+    checker = _HTMLChecker()
+    try:
+        checker.feed(source)
+        found = checker.finish()
+    except Exception as e:
+        found = [(None, f"unparsable HTML: {e}", ERROR)]
+    return [Problem(name, "html", message, severity, line) for line, message, severity in found]
+
+
+def check_css(name, source):
+    return [Problem(name, "css", message, line=line) for line, message in scan_css(source)]
+
+
+def check_json(name, source):
+    try:
+        json.loads(source)
+    except ValueError as e:
+        return [Problem(name, "json", str(e), line=getattr(e, "lineno", None))]
+    return []
+
+
+_NODE_ERROR_LINE = re.compile(r":(\d+)\s*$")
+
+
+def node_check(command, name, source, timeout=10.0):
+    """
+    `node --check` on one file: [(line, message)], or None when the checker
+    can't run (the caller falls back to scan_js()).
+    """
+    module = name.endswith(".mjs") or bool(re.search(r"^\s*(import|export)\b", source, re.M))
+    fd, path = tempfile.mkstemp(suffix=".mjs" if module else ".js")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(source)
+        proc = subprocess.run([command, "--check", path], capture_output=True, text=True,
+                              timeout=timeout)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    finally:
+        os.unlink(path)
+    if proc.returncode == 0:
+        return []
+    lines = proc.stderr.splitlines()
+    line = None
+    if lines:
+        m = _NODE_ERROR_LINE.search(lines[0])
+        line = int(m.group(1)) if m else None
+    message = next((l.strip() for l in lines if re.match(r"\s*\w*Error\b", l)),
+                   (lines[-1].strip() if lines else "syntax error"))
+    return [(line, message)]
+
+
+# ------------------------------------------------------------------
+# Running it all
+# ------------------------------------------------------------------
+
+def available_files(result):
+    """Names the written extension will contain (see main_ui.write_result)."""
+    files = _files(result)
+    names = set(files) | {"manifest.json"}
+    if "readme" in result:
+        names.add("README.md")
+    if any(name.endswith(".svg") for name in files):
+        names.add("icon.png")  # the placeholder written next to an .svg icon
+    return names
+
+
+def effective_manifest(manifest):
+    """The manifest as write_manifest() will write it (default icons added)."""
+    if not isinstance(manifest, dict):
+        return manifest
+    if "icons" not in manifest:
+        return dict(manifest, icons={"16": "icon.png", "48": "icon.png", "128": "icon.png"})
+    return manifest
+
+
+class Validator:
+    """
+    - workers: checks running at once (JS checks are subprocesses, so they
+      really do run in parallel).
+    - js_checker: command used as `<js_checker> --check file.js`; empty or
+      not installed -> the built-in scanner.
+    """
+
+    def __init__(self, workers=4, js_checker="node", timeout=10.0):
+        self.workers = max(1, workers)
+        self.js_checker = shutil.which(js_checker) if js_checker else None
+        self.timeout = timeout
+        self._pool = concurrent.futures.ThreadPoolExecutor(
+            max_workers=self.workers, thread_name_prefix="validate")
+        self._lock = threading.Lock()
+        self._stats = {"runs": 0, "failed_runs": 0, "problems": {}}
+
+    def check_js(self, name, source):
+        found = node_check(self.js_checker, name, source, self.timeout) \
+            if self.js_checker else None
+        if found is None:
+            found = scan_js(source)
+        return [Problem(name, "js", message, line=line) for line, message in found]
+
+    def validate(self, result):
+        """ValidationReport for a full { manifest, files, readme } dict."""
+        start = time.monotonic()
+        result = result if isinstance(result, dict) else {}
+        result = dict(result, manifest=effective_manifest(result.get("manifest")))
+        jobs = [(check_manifest, result.get("manifest")),
+                (check_references, result, available_files(result))]
+        for name, content in _files(result).items():
+            if not isinstance(content, str):
+                continue
+            if name.endswith((".js", ".mjs")):
+                jobs.append((self.check_js, name, content))
+            elif name.endswith(".css"):
+                jobs.append((check_css, name, content))
+            elif name.endswith((".html", ".htm")):
+                jobs.append((check_html, name, content))
+            elif name.endswith(".json"):
+                jobs.append((check_json, name, content))
+
+        futures = [self._pool.submit(fn, *args) for fn, *args in jobs]
+        problems = []
+        for future in futures:
+            problems += future.result()
+        report = ValidationReport(problems, time.monotonic() - start, len(jobs))
+
+        with self._lock:
+            self._stats["runs"] += 1
+            self._stats["failed_runs"] += 0 if report.ok else 1
+            for p in report.problems:
+                key = f"{p.check}:{p.severity}"
+                self._stats["problems"][key] = self._stats["problems"].get(key, 0) + 1
+        return report
+
+    def stats(self):
+        with self._lock:
+            stats = copy.deepcopy(self._stats)
+        stats["workers"] = self.workers
+        stats["js_checker"] = self.js_checker or "builtin"
+        return stats
+
+
+
+# ------------------------------------------------------------------
+# Targeted fixes
+# ------------------------------------------------------------------
+
+FIX_PROMPT = """
+FIX MODE:
+The Chrome extension described below failed validation. Fix ONLY the
+problems listed, in ONLY the files listed (create a missing file if
+something references it, or change the reference). Keep everything else
+exactly as it is. Return a single JSON object:
+{
+    "analysis": "One line on what you fixed.",
+    "patch": {
+        "files": { "<name>": "<full fixed content>" },
+        "manifest": { ...full Manifest V3, ONLY if manifest.json is listed... }
+    }
+}
+"""
+
+
+def fix_messages(system_prompt, result, report):
+    """Messages asking the model to fix the files that failed `report`."""
+    failing = report.failing_files()
+    files = _files(result)
+    parts = [FIX_PROMPT.strip(), "", "PROBLEMS:"]
+    parts += [f"- {p}" for p in report.errors]
+    parts += ["", "ALL FILES: " + ", ".join(sorted(available_files(result))), "",
+              "manifest.json:", json.dumps(result.get("manifest"), indent=2)]
+    for name in failing:
+        if name in files:
+            parts += ["", f"{name}:", files[name]]
+    return [{"role": "system", "content": system_prompt},
+            {"role": "user", "content": "\n".join(parts)}]
+
+
+def apply_fix(result, answer, report):
+    """
+    Merge a fix answer onto `result` and return the new dict (`result` is
+    untouched). Only files that failed, or don't exist yet, may change;
+    nothing is deleted. Raises PatchError for an unusable answer.
+    """
+    if not isinstance(answer, dict) or not isinstance(answer.get("patch"), dict):
+        raise PatchError("Fix answer has no patch")
+    failing = set(report.failing_files())
+    existing = set(_files(result))
+
+    def allowed(name):
+        return name in failing or name not in existing
+
+    patch = answer["patch"]
+    patch = {
+        "files": {n: c for n, c in (patch.get("files") or {}).items() if allowed(n)},
+        "diffs": {n: d for n, d in (patch.get("diffs") or {}).items() if n in failing},
+        **({"manifest": patch["manifest"]}
+           if "manifest" in patch and "manifest.json" in failing else {}),
+    }
+    if not (patch["files"] or patch["diffs"] or "manifest" in patch):
+        raise PatchError("Fix answer changes none of the failing files")
+    return apply_patch(result, patch)